@@ -13,17 +13,30 @@ from app.middlewares.throttling import ThrottlingMiddleware
 from app.middlewares.subscription_checker import SubscriptionStatusMiddleware
 from app.middlewares.maintenance import MaintenanceMiddleware  
 from app.services.maintenance_service import maintenance_service
+from app.services.app_config_service import app_config_service
 from app.utils.cache import cache 
+from app.localization.texts import load_rules_cache
 from app.handlers import fortune_wheel
 from app.middlewares.channel_checker import ChannelCheckerMiddleware
+from app.middlewares.request_metrics import RequestMetricsMiddleware
+from app.services.metrics_service import metrics_service
+from app.services.payment_inbox_service import payment_inbox_service
+from app.services.payment_reconciliation_service import payment_reconciliation_service
+from app.external.yookassa_api import yookassa_api
+from app.services.notification_queue_service import notification_queue
+from app.services.delivery_health_service import delivery_health_service
+from app.services.referral_stats_service import referral_stats_service
+from app.services.node_metrics_service import node_metrics_service
+from app.services.server_catalogue_service import server_catalogue_service
+from app.services.update_queue_service import update_queue_service
+from app.services.coordination_service import coordination_service
 
 from app.handlers import promocode_handlers
 from app.handlers.admin import admin_create_task
 from app.states import PromoCodeStates
 from app.handlers import tasks_handlers
 from app.handlers import profile_handlers
-from app.database.database import create_tables
-from app.handlers.admin.admin_create_task import delete_task_callback
+from app.database.database import engine
 from app.handlers import download
 from app.handlers import balance, withdraw
 
@@ -35,16 +48,9 @@ from app.handlers import (
     fortune_wheel
 )
 
-from app.handlers.admin import (
-    main as admin_main, users as admin_users, subscriptions as admin_subscriptions,
-    promocodes as admin_promocodes, messages as admin_messages,
-    monitoring as admin_monitoring, referrals as admin_referrals,
-    rules as admin_rules, remnawave as admin_remnawave,
-    statistics as admin_statistics, user_messages as admin_user_messages,
-    version as admin_version, servers as admin_servers,
-    maintenance as admin_maintenance,
-    admin_create_task as admin_tasks
-)
+from app.handlers import admin as admin_handlers
+from app.middlewares.admin_handlers_loader import AdminHandlersLoaderMiddleware
+from app.utils.deferred_handlers import DeferredHandlers
 from app.handlers.stars_payments import register_stars_handlers
 
 logger = logging.getLogger(__name__)
@@ -65,17 +71,49 @@ async def setup_bot() -> tuple[Bot, Dispatcher]:
     except Exception as e:
         logger.warning(f"Кеш не инициализирован: {e}")
     
+    try:
+        await coordination_service.start()
+    except Exception as e:
+        logger.error(f"Ошибка запуска координации реплик: {e}")
+    
+    try:
+        await load_rules_cache()
+    except Exception as e:
+        logger.warning(f"Не удалось загрузить правила в кеш: {e}")
+    
+    try:
+        await app_config_service.start_watching()
+    except Exception as e:
+        logger.warning(f"Не удалось запустить отслеживание конфига приложений: {e}")
+    
     from aiogram.client.default import DefaultBotProperties
     from aiogram.enums import ParseMode
 
+    session = None
+    if settings.TELEGRAM_API_URL:
+        from aiogram.client.session.aiohttp import AiohttpSession
+        from aiogram.client.telegram import TelegramAPIServer
+
+        session = AiohttpSession(api=TelegramAPIServer.from_base(settings.TELEGRAM_API_URL))
+        logger.info(f"Bot API: {settings.TELEGRAM_API_URL}")
+
     bot = Bot(
         token=settings.BOT_TOKEN, 
+        session=session,
         default=DefaultBotProperties(parse_mode=ParseMode.HTML)
     )
+    bot.session.middleware(RequestMetricsMiddleware())
+    metrics_service.instrument_engine(engine)
     
     maintenance_service.set_bot(bot)
     logger.info("Бот установлен в maintenance_service")
     
+    notification_queue.set_bot(bot)
+    try:
+        await notification_queue.start()
+    except Exception as e:
+        logger.error(f"Ошибка запуска очереди уведомлений: {e}")
+    
     try:
         redis_client = redis.from_url(settings.REDIS_URL)
         await redis_client.ping()
@@ -109,20 +147,12 @@ async def setup_bot() -> tuple[Bot, Dispatcher]:
     balance.register_handlers(dp)
     referral.register_handlers(dp)
     support.register_handlers(dp)
-    admin_main.register_handlers(dp)
-    admin_users.register_handlers(dp)
-    admin_subscriptions.register_handlers(dp)
-    admin_servers.register_handlers(dp)
-    admin_promocodes.register_handlers(dp)
-    admin_messages.register_handlers(dp)
-    admin_monitoring.register_handlers(dp)
-    admin_referrals.register_handlers(dp)
-    admin_rules.register_handlers(dp)
-    admin_remnawave.register_handlers(dp)
-    admin_statistics.register_handlers(dp)
-    admin_maintenance.register_handlers(dp)
-    admin_user_messages.register_handlers(dp)
-    admin_version.register_handlers(dp)
+    if settings.LAZY_ADMIN_HANDLERS:
+        deferred_admin = DeferredHandlers(dp, admin_handlers.module_names(), name="admin")
+        dp.update.outer_middleware(AdminHandlersLoaderMiddleware(deferred_admin))
+        logger.info("⏳ Обработчики админки загрузятся по первому апдейту администратора")
+    else:
+        admin_handlers.register_handlers(dp)
     fortune_wheel.register_handlers(dp)
     common.register_handlers(dp)
     profile_handlers.register_handlers(dp)
@@ -132,6 +162,23 @@ async def setup_bot() -> tuple[Bot, Dispatcher]:
 
     register_stars_handlers(dp)
     logger.info("🌟 Зарегистрированы обработчики Telegram Stars платежей")
+
+    update_queue_service.set_dispatcher(bot, dp)
+    if settings.TELEGRAM_WEBHOOK_ENABLED:
+        try:
+            await update_queue_service.start()
+            webhook_url = settings.get_telegram_webhook_url()
+            if webhook_url:
+                await bot.set_webhook(
+                    webhook_url,
+                    secret_token=settings.get_telegram_webhook_secret(),
+                    allowed_updates=dp.resolve_used_update_types()
+                )
+                logger.info(f"🎯 Telegram webhook установлен: {webhook_url}")
+            else:
+                logger.warning("⚠️ TELEGRAM_WEBHOOK_URL не задан, вебхук в Telegram не установлен")
+        except Exception as e:
+            logger.error(f"Ошибка запуска приема апдейтов через вебхук: {e}")
     
     try:
         await maintenance_service.start_monitoring()
@@ -139,12 +186,91 @@ async def setup_bot() -> tuple[Bot, Dispatcher]:
     except Exception as e:
         logger.error(f"Ошибка запуска мониторинга техработ: {e}")
     
+    payment_inbox_service.set_bot(bot)
+    try:
+        await payment_inbox_service.start()
+    except Exception as e:
+        logger.error(f"Ошибка запуска очереди платежных событий: {e}")
+    
+    payment_reconciliation_service.set_bot(bot)
+    try:
+        await payment_reconciliation_service.start()
+    except Exception as e:
+        logger.error(f"Ошибка запуска сверки платежей: {e}")
+    
+    try:
+        await referral_stats_service.start()
+    except Exception as e:
+        logger.error(f"Ошибка запуска сверки реферальных агрегатов: {e}")
+    
+    delivery_health_service.set_bot(bot)
+    try:
+        await delivery_health_service.start()
+    except Exception as e:
+        logger.error(f"Ошибка запуска проверки недоступных пользователей: {e}")
+    
+    node_metrics_service.set_bot(bot)
+    try:
+        await node_metrics_service.start()
+    except Exception as e:
+        logger.error(f"Ошибка запуска сбора метрик нод: {e}")
+    
+    try:
+        await server_catalogue_service.start()
+    except Exception as e:
+        logger.error(f"Ошибка запуска синхронизации каталога серверов: {e}")
+    
     logger.info("Бот успешно настроен")
     
     return bot, dp
 
 
 async def shutdown_bot():
+    try:
+        await update_queue_service.stop()
+    except Exception as e:
+        logger.error(f"Ошибка остановки очереди апдейтов: {e}")
+    
+    try:
+        await payment_reconciliation_service.stop()
+    except Exception as e:
+        logger.error(f"Ошибка остановки сверки платежей: {e}")
+    
+    try:
+        await payment_inbox_service.stop()
+    except Exception as e:
+        logger.error(f"Ошибка остановки очереди платежных событий: {e}")
+    
+    try:
+        await referral_stats_service.stop()
+    except Exception as e:
+        logger.error(f"Ошибка остановки сверки реферальных агрегатов: {e}")
+    
+    try:
+        await delivery_health_service.stop()
+    except Exception as e:
+        logger.error(f"Ошибка остановки проверки недоступных пользователей: {e}")
+    
+    try:
+        await node_metrics_service.stop()
+    except Exception as e:
+        logger.error(f"Ошибка остановки сбора метрик нод: {e}")
+    
+    try:
+        await server_catalogue_service.stop()
+    except Exception as e:
+        logger.error(f"Ошибка остановки синхронизации каталога серверов: {e}")
+    
+    try:
+        await yookassa_api.close()
+    except Exception as e:
+        logger.error(f"Ошибка закрытия соединений YooKassa: {e}")
+    
+    try:
+        await app_config_service.stop_watching()
+    except Exception as e:
+        logger.error(f"Ошибка остановки отслеживания конфига приложений: {e}")
+    
     try:
         await maintenance_service.stop_monitoring()
         logger.info("Мониторинг техработ остановлен")
@@ -152,7 +278,18 @@ async def shutdown_bot():
         logger.error(f"Ошибка остановки мониторинга: {e}")
     
     try:
-        await cache.close()
+        await notification_queue.stop()
+        logger.info("Очередь уведомлений остановлена")
+    except Exception as e:
+        logger.error(f"Ошибка остановки очереди уведомлений: {e}")
+    
+    try:
+        await coordination_service.stop()
+    except Exception as e:
+        logger.error(f"Ошибка остановки координации реплик: {e}")
+    
+    try:
+        await cache.disconnect()
         logger.info("Соединения с кешем закрыты")
     except Exception as e:
         logger.error(f"Ошибка закрытия кеша: {e}")
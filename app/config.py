@@ -1,5 +1,6 @@
+import hashlib
 import os
-from typing import List, Optional, Union, Dict
+from typing import List, Optional, Union, Dict, Tuple
 from pydantic_settings import BaseSettings
 from pydantic import field_validator, Field
 from pathlib import Path
@@ -19,10 +20,29 @@ class Settings(BaseSettings):
     WHEEL_OF_FORTUNE_COOLDOWN_HOURS: int = 24
     WHEEL_OF_FORTUNE_REWARDS: str = "0:30,5:40,10:20,20:8,50:2"
 
+    PROMOCODE_CACHE_TTL: int = 300
+    PROMOCODE_NEGATIVE_CACHE_TTL: int = 600
+    PROMOCODE_MAX_FAILED_ATTEMPTS: int = 10
+    PROMOCODE_FAILED_ATTEMPTS_WINDOW: int = 900
+
     ADMIN_NOTIFICATIONS_ENABLED: bool = False
     ADMIN_NOTIFICATIONS_CHAT_ID: Optional[str] = None
     ADMIN_NOTIFICATIONS_TOPIC_ID: Optional[int] = None
 
+    NOTIFICATION_QUEUE_WORKERS: int = 4
+    NOTIFICATION_GLOBAL_RATE: float = 25.0
+    NOTIFICATION_CHAT_INTERVAL: float = 1.0
+    NOTIFICATION_GROUP_INTERVAL: float = 3.0
+    NOTIFICATION_MAX_ATTEMPTS: int = 5
+    NOTIFICATION_RETRY_BASE_DELAY: float = 5.0
+    NOTIFICATION_DIGEST_WINDOW: int = 60
+    NOTIFICATION_STREAM_MAXLEN: int = 100000
+
+    DELIVERY_UNREACHABLE_THRESHOLD: int = 2
+    DELIVERY_REPROBE_INTERVAL_HOURS: int = 72
+    DELIVERY_REPROBE_CHECK_INTERVAL: int = 600
+    DELIVERY_REPROBE_BATCH_SIZE: int = 30
+
     CRYPTO_BOT_TOKEN: str
 
     model_config = SettingsConfigDict(env_file='.env', env_file_encoding='utf-8')
@@ -31,6 +51,21 @@ class Settings(BaseSettings):
     CHANNEL_LINK: Optional[str] = None
     CHANNEL_IS_REQUIRED_SUB: bool = False
     CHANNEL_IS_SUB_REQUIRED: bool = False
+    CHANNEL_MEMBERSHIP_CACHE_TTL: int = 600
+    CHANNEL_MEMBERSHIP_NEGATIVE_CACHE_TTL: int = 30
+    CHANNEL_MEMBERSHIP_LRU_SIZE: int = 50000
+    TASKS_CACHE_TTL: int = 60
+    SERVER_CAPACITY_CACHE_TTL: int = 30
+    PLACEMENT_ENABLED: bool = True
+    PLACEMENT_WEIGHT_USERS: float = 0.5
+    PLACEMENT_WEIGHT_BANDWIDTH: float = 0.3
+    PLACEMENT_WEIGHT_HEALTH: float = 0.2
+    PLACEMENT_MIN_GAIN: float = 0.05
+    PLACEMENT_TOPOLOGY_CACHE_TTL: int = 600
+    SERVER_CATALOGUE_SYNC_INTERVAL: int = 900
+    LAZY_ADMIN_HANDLERS: bool = False
+    INSTANCE_ID: Optional[str] = None
+    LEASE_TTL: int = 60
     
     DATABASE_URL: str
     REDIS_URL: str = "redis://localhost:6379/0"
@@ -76,6 +111,15 @@ class Settings(BaseSettings):
     REMNAWAVE_API_URL: str
     REMNAWAVE_API_KEY: str
     REMNAWAVE_SECRET_KEY: Optional[str] = None
+    REMNAWAVE_STATS_CALL_TIMEOUT: float = 10.0
+    REMNAWAVE_STATS_FRESH_SECONDS: int = 30
+    REMNAWAVE_STATS_MAX_AGE_SECONDS: int = 900
+    
+    NODE_METRICS_INTERVAL: int = 60
+    NODE_METRICS_RAW_RETENTION_HOURS: int = 24
+    NODE_METRICS_5M_RETENTION_DAYS: int = 7
+    NODE_METRICS_1H_RETENTION_DAYS: int = 90
+    NODE_METRICS_ALERT_CONFIRM_SAMPLES: int = 2
     
     TRIAL_DURATION_DAYS: int = 3
     TRIAL_TRAFFIC_LIMIT_GB: int = 10
@@ -83,6 +127,7 @@ class Settings(BaseSettings):
     DEFAULT_TRAFFIC_LIMIT_GB: int = 100
     DEFAULT_DEVICE_LIMIT: int = 1
     TRIAL_SQUAD_UUID: str
+    TRIAL_SQUAD_POOL: str = ""
     DEFAULT_TRAFFIC_RESET_STRATEGY: str = "MONTH"
     MAX_DEVICES_LIMIT: int = 20
     
@@ -128,6 +173,9 @@ class Settings(BaseSettings):
 
     REFERRAL_NOTIFICATIONS_ENABLED: bool = True
     REFERRAL_NOTIFICATION_RETRY_ATTEMPTS: int = 3
+    REFERRAL_LINK_CACHE_TTL: int = 600
+    REFERRAL_LINK_CACHE_SIZE: int = 10000
+    REFERRAL_STATS_VERIFY_INTERVAL: int = 3600
     REFERRED_USER_REWARD: int = 0 
     
     AUTOPAY_WARNING_DAYS: str = "3,24"
@@ -135,6 +183,11 @@ class Settings(BaseSettings):
     DEFAULT_AUTOPAY_DAYS_BEFORE: int = 3 
     MIN_BALANCE_FOR_AUTOPAY_KOPEKS: int = 10000  
     
+    THROTTLING_RATE_LIMIT: float = 0.5
+    THROTTLING_BURST: int = 1
+    RATE_LIMIT_BACKEND: str = "memory"
+    RATE_LIMIT_ACTIONS: str = "purchase:3:10,panel:10:60,fortune_wheel:2:10"
+    
     MONITORING_INTERVAL: int = 60
     INACTIVE_USER_DELETE_MONTHS: int = 3
 
@@ -163,6 +216,21 @@ class Settings(BaseSettings):
     YOOKASSA_WEBHOOK_PATH: str = "/yookassa-webhook"
     YOOKASSA_WEBHOOK_PORT: int = 8082
     YOOKASSA_WEBHOOK_SECRET: Optional[str] = None
+    YOOKASSA_API_URL: str = "https://api.yookassa.ru/v3"
+    YOOKASSA_REQUEST_TIMEOUT: float = 15.0
+    YOOKASSA_MAX_RETRIES: int = 3
+    YOOKASSA_POOL_SIZE: int = 20
+    PAYMENT_INBOX_WORKERS: int = 2
+    PAYMENT_INBOX_POLL_INTERVAL: float = 5.0
+    PAYMENT_INBOX_MAX_ATTEMPTS: int = 8
+    PAYMENT_INBOX_RETRY_BASE_DELAY: int = 15
+    PAYMENT_INBOX_RETRY_MAX_DELAY: int = 3600
+    PAYMENT_INBOX_STALE_TIMEOUT: int = 600
+    RECONCILIATION_ENABLED: bool = True
+    RECONCILIATION_FAST_INTERVAL: int = 10
+    RECONCILIATION_IDLE_INTERVAL: int = 300
+    RECONCILIATION_HOT_WINDOW: int = 900
+    RECONCILIATION_MAX_AGE_HOURS: int = 24
     PAYMENT_BALANCE_DESCRIPTION: str = "Пополнение баланса"
     PAYMENT_SUBSCRIPTION_DESCRIPTION: str = "Оплата подписки"
     PAYMENT_SERVICE_NAME: str = "Интернет-сервис"
@@ -177,12 +245,27 @@ class Settings(BaseSettings):
     AVAILABLE_LANGUAGES: str = "ru,en"
     
     LOG_LEVEL: str = "INFO"
+    SLOW_UPDATE_THRESHOLD: float = 1.0
+    PROFILING_SAMPLE_RATE: float = 0.0
+    PROFILING_KEEP_SLOWEST: int = 5
+    METRICS_ENABLED: bool = True
+    METRICS_TOKEN: Optional[str] = None
     LOG_FILE: str = "logs/bot.log"
     
     DEBUG: bool = False
     WEBHOOK_URL: Optional[str] = None
     WEBHOOK_PATH: str = "/webhook"
-    
+
+    TELEGRAM_WEBHOOK_ENABLED: bool = False
+    TELEGRAM_WEBHOOK_URL: Optional[str] = None
+    TELEGRAM_WEBHOOK_PATH: str = "/telegram-webhook"
+    TELEGRAM_WEBHOOK_SECRET: Optional[str] = None
+    TELEGRAM_API_URL: Optional[str] = None
+    UPDATE_WORKERS: int = 16
+    UPDATE_BULK_WORKERS: int = 2
+    UPDATE_QUEUE_SIZE: int = 5000
+    UPDATE_DRAIN_TIMEOUT: float = 20.0
+
     APP_CONFIG_PATH: str = "app-config.json"
     ENABLE_DEEP_LINKS: bool = True
     APP_CONFIG_CACHE_TTL: int = 3600
@@ -234,6 +317,28 @@ class Settings(BaseSettings):
             {"amount": 50, "chance": 2}
         ]
 
+    def get_rate_limits(self) -> Dict[str, Dict]:
+        """Возвращает лимиты действий в формате {action: {limit, period}}"""
+        limits = {}
+        try:
+            for action_config in self.RATE_LIMIT_ACTIONS.split(','):
+                parts = action_config.strip().split(':')
+                if len(parts) != 3:
+                    continue
+
+                try:
+                    limit = int(parts[1])
+                    period = float(parts[2])
+                except ValueError:
+                    continue
+
+                if limit > 0 and period > 0:
+                    limits[parts[0].strip()] = {"limit": limit, "period": period}
+        except AttributeError:
+            pass
+
+        return limits
+
     def is_wheel_of_fortune_enabled(self) -> bool:
         return self.WHEEL_OF_FORTUNE_ENABLED
 
@@ -284,6 +389,12 @@ class Settings(BaseSettings):
         except (ValueError, AttributeError):
             return [3, 1]
     
+    def get_trial_squad_pool(self) -> List[str]:
+        pool = [x.strip() for x in (self.TRIAL_SQUAD_POOL or "").split(',') if x.strip()]
+        if not pool and self.TRIAL_SQUAD_UUID:
+            pool = [self.TRIAL_SQUAD_UUID]
+        return pool
+    
     def get_available_languages(self) -> List[str]:
         try:
             langs = self.AVAILABLE_LANGUAGES
@@ -345,6 +456,19 @@ class Settings(BaseSettings):
             return f"{self.WEBHOOK_URL}/payment-success"
         return "https://t.me/"
 
+    def get_telegram_webhook_url(self) -> Optional[str]:
+        base_url = self.TELEGRAM_WEBHOOK_URL or self.WEBHOOK_URL
+        if not base_url:
+            return None
+        return f"{base_url.rstrip('/')}{self.TELEGRAM_WEBHOOK_PATH}"
+
+    def get_telegram_webhook_secret(self) -> str:
+        # Без явного секрета берем производный от токена бота: он одинаков на всех
+        # репликах, а вебхук без секрета принял бы поддельные апдейты от кого угодно
+        if self.TELEGRAM_WEBHOOK_SECRET:
+            return self.TELEGRAM_WEBHOOK_SECRET
+        return hashlib.sha256(f"telegram-webhook:{self.BOT_TOKEN}".encode()).hexdigest()
+
     def is_maintenance_mode(self) -> bool:
         return self.MAINTENANCE_MODE
     
@@ -449,6 +573,13 @@ class Settings(BaseSettings):
         return self.REFERRAL_NOTIFICATIONS_ENABLED
     
     def get_traffic_packages(self) -> List[Dict]:
+        # Строка разбирается один раз; повторно - только если ее поменяли
+        config_str = self.TRAFFIC_PACKAGES_CONFIG
+        if self._traffic_packages is None or self._traffic_packages[0] != config_str:
+            self._traffic_packages = (config_str, self._parse_traffic_packages())
+        return [dict(package) for package in self._traffic_packages[1]]
+    
+    def _parse_traffic_packages(self) -> List[Dict]:
         import logging
         logger = logging.getLogger(__name__)
         
@@ -570,6 +701,8 @@ class Settings(BaseSettings):
         
         return 0
     
+    _traffic_packages: Optional[Tuple[str, List[Dict]]] = None
+    
     model_config = {
         "env_file": ".env",
         "env_file_encoding": "utf-8"
@@ -599,5 +732,3 @@ TRAFFIC_PRICES = get_traffic_prices()
 def refresh_traffic_prices():
     global TRAFFIC_PRICES
     TRAFFIC_PRICES = get_traffic_prices()
-
-refresh_traffic_prices()
@@ -2,12 +2,12 @@ import logging
 from typing import Optional, Dict, Any
 from datetime import datetime
 from aiogram import Bot
-from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.config import settings
 from app.database.models import User, Subscription, Transaction
 from app.database.crud.user import get_user_by_id
+from app.services.notification_queue_service import notification_queue
 
 logger = logging.getLogger(__name__)
 
@@ -222,35 +222,18 @@ class AdminNotificationService:
             logger.error(f"Ошибка отправки уведомления о продлении: {e}")
             return False
     
-    async def _send_message(self, text: str) -> bool:
+    async def _send_message(self, text: str, digest_key: Optional[str] = None) -> bool:
         if not self.chat_id:
             logger.warning("ADMIN_NOTIFICATIONS_CHAT_ID не настроен")
             return False
-        
-        try:
-            message_kwargs = {
-                'chat_id': self.chat_id,
-                'text': text,
-                'parse_mode': 'HTML',
-                'disable_web_page_preview': True
-            }
-            
-            if self.topic_id:
-                message_kwargs['message_thread_id'] = self.topic_id
-            
-            await self.bot.send_message(**message_kwargs)
-            logger.info(f"Уведомление отправлено в чат {self.chat_id}")
-            return True
-            
-        except TelegramForbiddenError:
-            logger.error(f"Бот не имеет прав для отправки в чат {self.chat_id}")
-            return False
-        except TelegramBadRequest as e:
-            logger.error(f"Ошибка отправки уведомления: {e}")
-            return False
-        except Exception as e:
-            logger.error(f"Неожиданная ошибка при отправке уведомления: {e}")
-            return False
+
+        return await notification_queue.enqueue(
+            self.chat_id,
+            text,
+            message_thread_id=self.topic_id,
+            disable_web_page_preview=True,
+            digest_key=digest_key
+        )
     
     def _is_enabled(self) -> bool:
         return self.enabled and bool(self.chat_id)
@@ -438,12 +421,52 @@ class AdminNotificationService:
             
             message = "\n".join(message_parts)
             
-            return await self._send_message(message)
+            return await self._send_message(message, digest_key=f"maintenance:{event_type}:{status}")
             
         except Exception as e:
             logger.error(f"Ошибка отправки уведомления о техработах: {e}")
             return False
     
+    async def send_node_status_notification(
+        self,
+        node: Dict[str, Any],
+        previous_status: str,
+        status: str
+    ) -> bool:
+        if not self._is_enabled():
+            return False
+        
+        try:
+            status_config = {
+                "online": ("🟢", "НОДА СНОВА В СЕТИ"),
+                "offline": ("🔴", "НОДА НЕДОСТУПНА"),
+                "xray_down": ("🟠", "XRAY НА НОДЕ ОСТАНОВЛЕН")
+            }
+            icon, title = status_config.get(status, status_config["offline"])
+            
+            message_parts = [
+                f"{icon} <b>{title}</b>",
+                "",
+                f"🖥️ <b>Нода:</b> {node.get('name')}",
+                f"🌍 <b>Адрес:</b> {node.get('country_code')} • {node.get('address')}",
+                f"🔁 <b>Статус:</b> {previous_status} → {status}"
+            ]
+            
+            if status == "online":
+                message_parts.append(f"👥 <b>Пользователей онлайн:</b> {node.get('users_online') or 0}")
+            
+            message_parts.append("")
+            message_parts.append(f"⏰ <i>{datetime.now().strftime('%d.%m.%Y %H:%M:%S')}</i>")
+            
+            return await self._send_message(
+                "\n".join(message_parts),
+                digest_key=f"node_status:{node.get('uuid')}:{status}"
+            )
+            
+        except Exception as e:
+            logger.error(f"Ошибка отправки уведомления о статусе ноды: {e}")
+            return False
+    
     async def send_remnawave_panel_status_notification(
         self,
         status: str,
@@ -532,7 +555,7 @@ class AdminNotificationService:
             
             message = "\n".join(message_parts)
             
-            return await self._send_message(message)
+            return await self._send_message(message, digest_key=f"panel_status:{status}")
             
         except Exception as e:
             logger.error(f"Ошибка отправки уведомления о статусе панели Remnawave: {e}")
@@ -629,7 +652,7 @@ class AdminNotificationService:
             
             message = "\n".join(message_parts)
             
-            return await self._send_message(message)
+            return await self._send_message(message, digest_key=f"panel_status:{status}")
             
         except Exception as e:
             logger.error(f"Ошибка отправки уведомления о статусе панели Remnawave: {e}")
@@ -0,0 +1,326 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Optional, Dict, Any, List, Tuple
+
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+from app.config import settings
+
+try:
+    from watchfiles import awatch
+except ImportError:
+    awatch = None
+
+logger = logging.getLogger(__name__)
+
+
+DEVICE_PLATFORM_MAPPING = {
+    'ios': 'ios',
+    'android': 'android',
+    'windows': 'pc',
+    'mac': 'pc',
+    'tv': 'tv'
+}
+
+
+def _localize(values: Optional[Dict[str, str]], language: str) -> str:
+    if not values:
+        return ""
+    return values.get(language) or values.get("en") or next(iter(values.values()), "")
+
+
+def _build_button_rows(
+    buttons: List[Dict[str, Any]],
+    language: str,
+    prefix: str = "",
+    per_row: int = 1
+) -> List[List[InlineKeyboardButton]]:
+    rows = []
+    row = []
+    for button in buttons:
+        row.append(
+            InlineKeyboardButton(
+                text=f"{prefix}{_localize(button.get('buttonText'), language)}",
+                url=button['buttonLink']
+            )
+        )
+        if len(row) == per_row:
+            rows.append(row)
+            row = []
+
+    if row:
+        rows.append(row)
+    return rows
+
+
+@dataclass
+class LocalizedApp:
+    id: str
+    name: str
+    is_featured: bool
+    installation: str
+    add_subscription: str
+    connect_and_use: str
+    additional_title: Optional[str] = None
+    additional_description: Optional[str] = None
+    install_rows: List[List[InlineKeyboardButton]] = field(default_factory=list)
+    additional_rows: List[List[InlineKeyboardButton]] = field(default_factory=list)
+
+
+@dataclass
+class AppConfigSnapshot:
+    platforms: Dict[str, List[Dict[str, Any]]]
+    apps: Dict[Tuple[str, str], List[LocalizedApp]]
+    apps_by_id: Dict[Tuple[str, str, str], LocalizedApp]
+    featured: Dict[Tuple[str, str], LocalizedApp]
+    app_selection_keyboards: Dict[Tuple[str, str], InlineKeyboardMarkup]
+    mtime: float
+    loaded_at: float
+
+
+class AppConfigService:
+    """Кеш app-config.json с горячей перезагрузкой при изменении файла"""
+
+    def __init__(self, watch_interval: int = 5):
+        self._snapshot: Optional[AppConfigSnapshot] = None
+        self._watch_task: Optional[asyncio.Task] = None
+        self._watch_interval = watch_interval
+
+    def _read_config(self) -> Tuple[Dict[str, Any], float]:
+        config_path = settings.get_app_config_path()
+        mtime = os.stat(config_path).st_mtime
+
+        with open(config_path, 'r', encoding='utf-8') as f:
+            return json.load(f), mtime
+
+    def _build_snapshot(self, config: Dict[str, Any], mtime: float) -> AppConfigSnapshot:
+        apps: Dict[Tuple[str, str], List[LocalizedApp]] = {}
+        apps_by_id: Dict[Tuple[str, str, str], LocalizedApp] = {}
+        featured: Dict[Tuple[str, str], LocalizedApp] = {}
+
+        languages = set(settings.get_available_languages()) | {settings.DEFAULT_LANGUAGE}
+
+        for platform, platform_apps in config.items():
+            if not isinstance(platform_apps, list):
+                continue
+
+            for language in languages:
+                localized_apps = []
+
+                for app in platform_apps:
+                    additional = app.get('additionalAfterAddSubscriptionStep')
+                    localized = LocalizedApp(
+                        id=app['id'],
+                        name=app['name'],
+                        is_featured=app.get('isFeatured', False),
+                        installation=_localize(app.get('installationStep', {}).get('description'), language),
+                        add_subscription=_localize(app.get('addSubscriptionStep', {}).get('description'), language),
+                        connect_and_use=_localize(app.get('connectAndUseStep', {}).get('description'), language),
+                        additional_title=_localize(additional.get('title'), language) if additional else None,
+                        additional_description=_localize(additional.get('description'), language) if additional else None,
+                        install_rows=_build_button_rows(
+                            app.get('installationStep', {}).get('buttons', []),
+                            language, prefix="📥 ", per_row=2
+                        ),
+                        additional_rows=_build_button_rows(
+                            additional.get('buttons', []) if additional else [],
+                            language
+                        )
+                    )
+                    localized_apps.append(localized)
+                    apps_by_id[(platform, language, localized.id)] = localized
+
+                apps[(platform, language)] = localized_apps
+                if localized_apps:
+                    featured[(platform, language)] = next(
+                        (app for app in localized_apps if app.is_featured), localized_apps[0]
+                    )
+
+        app_selection_keyboards = {}
+        for device_type, platform in DEVICE_PLATFORM_MAPPING.items():
+            for language in languages:
+                localized_apps = apps.get((platform, language))
+                if localized_apps:
+                    app_selection_keyboards[(device_type, language)] = self._build_app_selection_keyboard(
+                        device_type, localized_apps
+                    )
+
+        return AppConfigSnapshot(
+            platforms={k: v for k, v in config.items() if isinstance(v, list)},
+            apps=apps,
+            apps_by_id=apps_by_id,
+            featured=featured,
+            app_selection_keyboards=app_selection_keyboards,
+            mtime=mtime,
+            loaded_at=time.monotonic()
+        )
+
+    @staticmethod
+    def _build_app_selection_keyboard(device_type: str, apps: List[LocalizedApp]) -> InlineKeyboardMarkup:
+        keyboard = []
+
+        for app in apps:
+            app_name = f"⭐ {app.name}" if app.is_featured else app.name
+            keyboard.append([
+                InlineKeyboardButton(text=app_name, callback_data=f"app_{device_type}_{app.id}")
+            ])
+
+        keyboard.extend([
+            [
+                InlineKeyboardButton(text="📱 Выбрать другое устройство", callback_data="subscription_connect")
+            ],
+            [
+                InlineKeyboardButton(text="⬅️ К подписке", callback_data="menu_subscription")
+            ]
+        ])
+
+        return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+    def reload(self) -> bool:
+        try:
+            config, mtime = self._read_config()
+            self._snapshot = self._build_snapshot(config, mtime)
+            logger.info(f"📱 Конфиг приложений загружен: {len(self._snapshot.platforms)} платформ")
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка загрузки конфига приложений: {e}")
+            if self._snapshot is None:
+                self._snapshot = self._build_snapshot({}, 0.0)
+            return False
+
+    def _get_snapshot(self) -> AppConfigSnapshot:
+        snapshot = self._snapshot
+        if snapshot is None:
+            self.reload()
+        elif not self.is_watching() and time.monotonic() - snapshot.loaded_at > settings.get_app_config_cache_ttl():
+            self.reload()
+        return self._snapshot
+
+    def get_apps(self, device_type: str, language: str = "ru") -> List[LocalizedApp]:
+        platform = DEVICE_PLATFORM_MAPPING.get(device_type, device_type)
+        apps = self._get_snapshot().apps
+        return apps.get((platform, language)) or apps.get((platform, settings.DEFAULT_LANGUAGE), [])
+
+    def get_app(self, device_type: str, app_id: str, language: str = "ru") -> Optional[LocalizedApp]:
+        platform = DEVICE_PLATFORM_MAPPING.get(device_type, device_type)
+        apps_by_id = self._get_snapshot().apps_by_id
+        return (
+            apps_by_id.get((platform, language, app_id)) or
+            apps_by_id.get((platform, settings.DEFAULT_LANGUAGE, app_id))
+        )
+
+    def get_featured_app(self, device_type: str, language: str = "ru") -> Optional[LocalizedApp]:
+        platform = DEVICE_PLATFORM_MAPPING.get(device_type, device_type)
+        featured = self._get_snapshot().featured
+        return featured.get((platform, language)) or featured.get((platform, settings.DEFAULT_LANGUAGE))
+
+    def get_app_selection_keyboard(self, device_type: str, language: str = "ru") -> Optional[InlineKeyboardMarkup]:
+        keyboards = self._get_snapshot().app_selection_keyboards
+        return keyboards.get((device_type, language)) or keyboards.get((device_type, settings.DEFAULT_LANGUAGE))
+
+    def get_connection_guide_keyboard(self, subscription_url: str, app: LocalizedApp) -> InlineKeyboardMarkup:
+        keyboard = list(app.install_rows)
+        keyboard.extend([
+            [
+                InlineKeyboardButton(text="📋 Скопировать ссылку подписки", url=subscription_url)
+            ],
+            [
+                InlineKeyboardButton(text="📱 Выбрать другое устройство", callback_data="subscription_connect")
+            ],
+            [
+                InlineKeyboardButton(text="↩️ К подписке", callback_data="menu_subscription")
+            ]
+        ])
+        return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+    def get_specific_app_keyboard(
+        self,
+        subscription_url: str,
+        app: LocalizedApp,
+        device_type: str
+    ) -> InlineKeyboardMarkup:
+        keyboard = list(app.install_rows)
+        keyboard.append([
+            InlineKeyboardButton(text="📋 Скопировать ссылку подписки", url=subscription_url)
+        ])
+        keyboard.extend(app.additional_rows)
+        keyboard.extend([
+            [
+                InlineKeyboardButton(text="📋 Другие приложения", callback_data=f"app_list_{device_type}")
+            ],
+            [
+                InlineKeyboardButton(text="📱 Выбрать другое устройство", callback_data="subscription_connect")
+            ],
+            [
+                InlineKeyboardButton(text="⬅️ К подписке", callback_data="menu_subscription")
+            ]
+        ])
+        return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+    def is_watching(self) -> bool:
+        return self._watch_task is not None and not self._watch_task.done()
+
+    async def start_watching(self):
+        if self.is_watching():
+            return
+
+        await asyncio.to_thread(self.reload)
+        self._watch_task = asyncio.create_task(self._watch_loop())
+        logger.info(
+            f"🔄 Запущено отслеживание {settings.get_app_config_path()} "
+            f"({'inotify' if awatch else f'опрос mtime каждые {self._watch_interval}с'})"
+        )
+
+    async def stop_watching(self):
+        if self._watch_task and not self._watch_task.done():
+            self._watch_task.cancel()
+            try:
+                await self._watch_task
+            except asyncio.CancelledError:
+                pass
+        self._watch_task = None
+
+    async def _watch_loop(self):
+        if awatch is not None:
+            try:
+                await self._watch_inotify()
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"inotify недоступен для конфига приложений, переходим на опрос: {e}")
+
+        await self._watch_polling()
+
+    async def _watch_inotify(self):
+        config_path = settings.get_app_config_path()
+        ttl_ms = settings.get_app_config_cache_ttl() * 1000
+
+        async for _changes in awatch(config_path, rust_timeout=ttl_ms, yield_on_timeout=True):
+            await asyncio.to_thread(self.reload)
+
+    async def _watch_polling(self):
+        config_path = settings.get_app_config_path()
+
+        while True:
+            await asyncio.sleep(self._watch_interval)
+            try:
+                mtime = (await asyncio.to_thread(os.stat, config_path)).st_mtime
+                snapshot = self._snapshot
+                expired = (
+                    snapshot is None or
+                    time.monotonic() - snapshot.loaded_at > settings.get_app_config_cache_ttl()
+                )
+                if expired or mtime != snapshot.mtime:
+                    await asyncio.to_thread(self.reload)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка проверки конфига приложений: {e}")
+
+
+app_config_service = AppConfigService()
@@ -0,0 +1,137 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Optional, List, Dict, Tuple, Union
+
+from aiogram import Bot
+from aiogram.enums import ChatMemberStatus
+from aiogram.exceptions import TelegramForbiddenError, TelegramBadRequest
+
+from app.config import settings
+from app.utils.cache import cache, cache_key
+
+logger = logging.getLogger(__name__)
+
+
+MEMBER_STATUSES = (
+    ChatMemberStatus.MEMBER,
+    ChatMemberStatus.ADMINISTRATOR,
+    ChatMemberStatus.CREATOR
+)
+
+
+def is_member_status(member) -> bool:
+    if member.status in MEMBER_STATUSES:
+        return True
+    return member.status == ChatMemberStatus.RESTRICTED and getattr(member, "is_member", False)
+
+
+class ChannelMembershipService:
+    """Кеш подписок пользователей на каналы: LRU в процессе + Redis"""
+
+    def __init__(self):
+        self._local: "OrderedDict[Tuple[str, int], Tuple[bool, float]]" = OrderedDict()
+
+    @staticmethod
+    def _key(chat_id: Union[str, int], user_id: int) -> Tuple[str, int]:
+        return str(chat_id), user_id
+
+    @staticmethod
+    def _redis_key(chat_id: Union[str, int], user_id: int) -> str:
+        return cache_key("channel_member", chat_id, user_id)
+
+    @staticmethod
+    def _ttl(is_member: bool) -> int:
+        if is_member:
+            return settings.CHANNEL_MEMBERSHIP_CACHE_TTL
+        return settings.CHANNEL_MEMBERSHIP_NEGATIVE_CACHE_TTL
+
+    def get_cached(self, chat_id: Union[str, int], user_id: int) -> Optional[bool]:
+        key = self._key(chat_id, user_id)
+        entry = self._local.get(key)
+        if entry is None:
+            return None
+
+        is_member, expires_at = entry
+        if expires_at < time.monotonic():
+            self._local.pop(key, None)
+            return None
+
+        self._local.move_to_end(key)
+        return is_member
+
+    def _store_local(self, chat_id: Union[str, int], user_id: int, is_member: bool):
+        key = self._key(chat_id, user_id)
+        self._local[key] = (is_member, time.monotonic() + self._ttl(is_member))
+        self._local.move_to_end(key)
+
+        while len(self._local) > settings.CHANNEL_MEMBERSHIP_LRU_SIZE:
+            self._local.popitem(last=False)
+
+    async def _store(self, chat_id: Union[str, int], user_id: int, is_member: bool):
+        self._store_local(chat_id, user_id, is_member)
+        await cache.set(self._redis_key(chat_id, user_id), is_member, self._ttl(is_member))
+
+    async def set_status(self, chat_id: Union[str, int], user_id: int, is_member: bool):
+        await self._store(chat_id, user_id, is_member)
+
+    async def invalidate(self, chat_id: Union[str, int], user_id: int):
+        self._local.pop(self._key(chat_id, user_id), None)
+        await cache.delete(self._redis_key(chat_id, user_id))
+
+    async def is_member(
+        self,
+        bot: Bot,
+        chat_id: Union[str, int],
+        user_id: int,
+        force: bool = False,
+        trust_negative: bool = True
+    ) -> bool:
+        if not force:
+            cached = self.get_cached(chat_id, user_id)
+            if cached is None:
+                cached = await cache.get(self._redis_key(chat_id, user_id))
+                if cached is not None:
+                    cached = bool(cached)
+                    self._store_local(chat_id, user_id, cached)
+
+            if cached or (cached is not None and trust_negative):
+                return cached
+
+        try:
+            member = await bot.get_chat_member(chat_id=chat_id, user_id=user_id)
+            is_member = is_member_status(member)
+        except (TelegramForbiddenError, TelegramBadRequest) as e:
+            logger.warning(f"Не удалось проверить подписку {user_id} на канал {chat_id}: {e}")
+            is_member = False
+
+        await self._store(chat_id, user_id, is_member)
+        return is_member
+
+    async def check_channels(
+        self,
+        bot: Bot,
+        chat_ids: List[Union[str, int]],
+        user_id: int,
+        force: bool = False,
+        trust_negative: bool = True
+    ) -> Dict[str, bool]:
+        results = await asyncio.gather(
+            *(
+                self.is_member(bot, chat_id, user_id, force=force, trust_negative=trust_negative)
+                for chat_id in chat_ids
+            ),
+            return_exceptions=True
+        )
+
+        statuses = {}
+        for chat_id, result in zip(chat_ids, results):
+            if isinstance(result, Exception):
+                logger.error(f"Ошибка проверки подписки {user_id} на канал {chat_id}: {result}")
+                result = False
+            statuses[str(chat_id)] = result
+        return statuses
+
+
+channel_membership_service = ChannelMembershipService()
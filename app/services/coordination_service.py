@@ -0,0 +1,266 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from app.config import settings
+from app.utils.cache import cache
+
+logger = logging.getLogger(__name__)
+
+
+LEASE_PREFIX = "lease:"
+
+# Новый владелец получает следующий номер из счетчика - токен ограждения.
+# Токен растет при каждой смене владельца, поэтому бывший лидер, у которого
+# истекла аренда, не пройдет проверку check() даже если еще работает
+ACQUIRE_SCRIPT = """
+local current = redis.call('GET', KEYS[1])
+if not current then
+    local token = redis.call('INCR', KEYS[2])
+    redis.call('SET', KEYS[1], ARGV[1] .. '|' .. token, 'PX', ARGV[2])
+    return token
+end
+local owner, token = string.match(current, '^(.*)|(%d+)$')
+if owner == ARGV[1] then
+    redis.call('PEXPIRE', KEYS[1], ARGV[2])
+    return tonumber(token)
+end
+return 0
+"""
+
+RENEW_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+MessageHandler = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+class Lease:
+    """
+    Аренда фоновой задачи: из всех реплик задачу выполняет только владелец.
+    acquire() захватывает свободную аренду или продлевает свою, дальше ее
+    продлевает coordination_service, пока процесс жив. Перед побочным
+    эффектом (списание, рассылка) задача сверяет токен через check().
+    Без Redis процесс считается единственным и аренда всегда его.
+    """
+
+    def __init__(self, coordinator: "CoordinationService", name: str):
+        self.coordinator = coordinator
+        self.name = name
+        self.token: Optional[int] = None
+
+    @property
+    def key(self) -> str:
+        return f"{LEASE_PREFIX}{self.name}"
+
+    @property
+    def value(self) -> str:
+        return f"{self.coordinator.instance_id}|{self.token}"
+
+    @property
+    def is_held(self) -> bool:
+        return self.token is not None
+
+    async def acquire(self) -> bool:
+        if not cache.is_connected:
+            self.token = 0
+            return True
+
+        token = await cache.run_script(
+            ACQUIRE_SCRIPT, [self.key, f"{self.key}:token"],
+            [self.coordinator.instance_id, self.coordinator.ttl_ms]
+        )
+        if not token:
+            if self.token is not None:
+                logger.warning(f"⚠️ Аренда {self.name} перешла к другой реплике")
+            self.token = None
+            return False
+
+        if self.token != token:
+            logger.info(f"👑 Реплика {self.coordinator.instance_id} получила аренду {self.name} (токен {token})")
+        self.token = int(token)
+        return True
+
+    async def renew(self) -> bool:
+        if self.token is None or not cache.is_connected:
+            return self.is_held
+
+        renewed = await cache.run_script(RENEW_SCRIPT, [self.key], [self.value, self.coordinator.ttl_ms])
+        if renewed is None:
+            # Redis недоступен - не теряем аренду, пока ее не продлит кто-то другой
+            return True
+        if not renewed:
+            logger.warning(f"⚠️ Аренда {self.name} потеряна (токен {self.token})")
+            self.token = None
+        return self.is_held
+
+    async def check(self) -> bool:
+        """Токен ограждения: аренда все еще наша и не переходила к другой реплике"""
+        if self.token is None:
+            return False
+        if not cache.is_connected:
+            return True
+
+        try:
+            current = await cache.redis_client.get(self.key)
+        except Exception as e:
+            logger.error(f"Ошибка проверки аренды {self.name}: {e}")
+            return False
+
+        if current is None or current.decode() != self.value:
+            logger.warning(f"⚠️ Аренда {self.name} больше не принадлежит этой реплике")
+            self.token = None
+            return False
+        return True
+
+    async def release(self):
+        if self.token is None:
+            return
+        if cache.is_connected:
+            await cache.run_script(RELEASE_SCRIPT, [self.key], [self.value])
+        self.token = None
+
+
+class CoordinationService:
+    """
+    Координация нескольких реплик бота через Redis: аренды фоновых задач
+    (выбор лидера на каждую задачу) и широковещательные события pub/sub
+    для сброса локальных копий общего состояния.
+    """
+
+    def __init__(self):
+        self.instance_id = settings.INSTANCE_ID or f"{socket.gethostname()}-{os.getpid()}"
+        self._leases: Dict[str, Lease] = {}
+        self._handlers: Dict[str, List[MessageHandler]] = {}
+        self._tasks: List[asyncio.Task] = []
+
+    @property
+    def ttl_ms(self) -> int:
+        return int(settings.LEASE_TTL * 1000)
+
+    @property
+    def is_running(self) -> bool:
+        return any(not task.done() for task in self._tasks)
+
+    def lease(self, name: str) -> Lease:
+        lease = self._leases.get(name)
+        if lease is None:
+            lease = self._leases[name] = Lease(self, name)
+        return lease
+
+    def subscribe(self, channel: str, handler: MessageHandler):
+        self._handlers.setdefault(channel, []).append(handler)
+
+    async def publish(self, channel: str, payload: Optional[Dict[str, Any]] = None) -> bool:
+        if not cache.is_connected:
+            return False
+
+        message = {"instance": self.instance_id, **(payload or {})}
+        try:
+            await cache.redis_client.publish(channel, json.dumps(message))
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка публикации в {channel}: {e}")
+            return False
+
+    async def start(self):
+        if self.is_running:
+            return
+
+        if not cache.is_connected:
+            logger.warning("⚠️ Redis недоступен: координация реплик отключена, фоновые задачи выполняет этот процесс")
+            return
+
+        self._tasks = [
+            asyncio.create_task(self._renew_loop(), name="coordination-renew"),
+            asyncio.create_task(self._listen_loop(), name="coordination-pubsub"),
+        ]
+        logger.info(f"✅ Координация реплик запущена: {self.instance_id}, аренда {settings.LEASE_TTL}с")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+        for lease in self._leases.values():
+            try:
+                await lease.release()
+            except Exception as e:
+                logger.error(f"Ошибка освобождения аренды {lease.name}: {e}")
+
+    async def _renew_loop(self):
+        while True:
+            await asyncio.sleep(settings.LEASE_TTL / 3)
+            for lease in list(self._leases.values()):
+                try:
+                    await lease.renew()
+                except Exception as e:
+                    logger.error(f"Ошибка продления аренды {lease.name}: {e}")
+
+    async def _listen_loop(self):
+        while True:
+            if not self._handlers:
+                await asyncio.sleep(1)
+                continue
+
+            pubsub = cache.redis_client.pubsub()
+            try:
+                await pubsub.subscribe(*self._handlers)
+                # После переподключения события могли быть пропущены
+                await self._dispatch_all({"instance": None, "resync": True})
+
+                while True:
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    if message is not None:
+                        await self._dispatch(message)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка подписки на события реплик: {e}")
+                await asyncio.sleep(5)
+            finally:
+                try:
+                    await pubsub.close()
+                except Exception:
+                    pass
+
+    async def _dispatch(self, message: Dict[str, Any]):
+        channel = message["channel"].decode() if isinstance(message["channel"], bytes) else message["channel"]
+        try:
+            payload = json.loads(message["data"])
+        except (TypeError, ValueError):
+            return
+
+        if payload.get("instance") == self.instance_id:
+            return
+
+        for handler in self._handlers.get(channel, []):
+            try:
+                await handler(payload)
+            except Exception as e:
+                logger.error(f"Ошибка обработки события {channel}: {e}")
+
+    async def _dispatch_all(self, payload: Dict[str, Any]):
+        for channel, handlers in self._handlers.items():
+            for handler in handlers:
+                try:
+                    await handler(payload)
+                except Exception as e:
+                    logger.error(f"Ошибка обработки события {channel}: {e}")
+
+
+coordination_service = CoordinationService()
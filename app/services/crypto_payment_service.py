@@ -1,21 +1,45 @@
-import httpx
 import logging
+from typing import List
 from app.config import settings
 
 TON_TO_RUB_EXCHANGE_RATE = 200
+GET_INVOICES_MAX_COUNT = 1000
 
 logger = logging.getLogger(__name__)
 
 
 class CryptoPaymentService:
+    # httpx.AsyncClient; сам httpx импортируется при первом запросе, а не при старте бота
+    _client = None
+
     def __init__(self):
         self.api_url = "https://pay.crypt.bot/api/"
         self.headers = {
             'Crypto-Pay-API-Token': settings.CRYPTO_BOT_TOKEN
         }
 
+    @classmethod
+    def _get_client(cls):
+        import httpx
+
+        # Один клиент на процесс: соединение и TLS-сессия переиспользуются
+        if cls._client is None or cls._client.is_closed:
+            cls._client = httpx.AsyncClient(
+                timeout=10.0,
+                limits=httpx.Limits(max_connections=10, max_keepalive_connections=5)
+            )
+        return cls._client
+
+    @classmethod
+    async def close(cls):
+        if cls._client is not None and not cls._client.is_closed:
+            await cls._client.aclose()
+        cls._client = None
+
     async def create_invoice(self, amount: float, user_id: int) -> dict | None:
         """Создает счет для оплаты в TON (можно изменить на USDT)."""
+        import httpx
+
         url = f"{self.api_url}createInvoice"
         payload = {
             'asset': 'TON',  # Или 'USDT'
@@ -25,16 +49,15 @@ class CryptoPaymentService:
         }
 
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(url, headers=self.headers, json=payload, timeout=10.0)
-                response.raise_for_status()
-                result = response.json()
+            response = await self._get_client().post(url, headers=self.headers, json=payload)
+            response.raise_for_status()
+            result = response.json()
 
-                if result.get('ok'):
-                    return result.get('result')
-                else:
-                    logger.error(f"Ошибка при создании счета: {result.get('error', 'Unknown error')}")
-                    return None
+            if result.get('ok'):
+                return result.get('result')
+            else:
+                logger.error(f"Ошибка при создании счета: {result.get('error', 'Unknown error')}")
+                return None
         except httpx.HTTPStatusError as e:
             logger.error(f"Ошибка HTTP при создании счета: {e}")
             return None
@@ -42,26 +65,42 @@ class CryptoPaymentService:
             logger.error(f"Исключение при создании счета: {e}")
             return None
 
-    async def check_invoice_status(self, invoice_id: int) -> str | None:
-        """Проверяет статус счета."""
+    async def get_invoices(self, invoice_ids: List[int]) -> List[dict] | None:
+        """Получает счета пачками одним запросом на каждые 1000 id."""
+        import httpx
+
         url = f"{self.api_url}getInvoices"
-        params = {
-            'invoice_ids': str(invoice_id)
-        }
+        items = []
 
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(url, headers=self.headers, params=params, timeout=10.0)
+            for start in range(0, len(invoice_ids), GET_INVOICES_MAX_COUNT):
+                chunk = invoice_ids[start:start + GET_INVOICES_MAX_COUNT]
+                params = {
+                    'invoice_ids': ','.join(str(invoice_id) for invoice_id in chunk),
+                    'count': len(chunk)
+                }
+                response = await self._get_client().get(url, headers=self.headers, params=params)
                 response.raise_for_status()
                 result = response.json()
 
-                if result.get('ok') and result['result']['items']:
-                    return result['result']['items'][0].get('status', 'unknown')
-                else:
+                if not result.get('ok'):
+                    logger.error(f"Ошибка при получении счетов: {result.get('error', 'Unknown error')}")
                     return None
+                items.extend(result['result']['items'])
+
+            return items
         except httpx.HTTPStatusError as e:
-            logger.error(f"Ошибка HTTP при проверке счета: {e}")
+            logger.error(f"Ошибка HTTP при получении счетов: {e}")
             return None
         except Exception as e:
-            logger.error(f"Исключение при проверке счета: {e}")
-            return None
\ No newline at end of file
+            logger.error(f"Исключение при получении счетов: {e}")
+            return None
+
+    async def get_invoice(self, invoice_id: int) -> dict | None:
+        items = await self.get_invoices([invoice_id])
+        return items[0] if items else None
+
+    async def check_invoice_status(self, invoice_id: int) -> str | None:
+        """Проверяет статус счета."""
+        invoice = await self.get_invoice(invoice_id)
+        return invoice.get('status', 'unknown') if invoice else None
\ No newline at end of file
@@ -0,0 +1,137 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Optional, Dict, Any
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+
+from app.config import settings
+from app.database.database import AsyncSessionLocal
+from app.database.crud.user import (
+    record_delivery_failure, mark_user_unreachable, reset_delivery_health,
+    get_users_for_delivery_probe, touch_delivery_probe
+)
+from app.services.coordination_service import coordination_service
+
+logger = logging.getLogger(__name__)
+
+
+class DeliveryHealthService:
+    """
+    Учет доставляемости сообщений: пользователи, заблокировавшие бота,
+    помечаются недоступными и исключаются из рассылок и уведомлений.
+    Фоновая проверка редко пробует достучаться до них снова.
+    """
+
+    def __init__(self):
+        self._bot: Optional[Bot] = None
+        self._task: Optional[asyncio.Task] = None
+        self._lease = coordination_service.lease("delivery-reprobe")
+        self.last_probe: Optional[datetime] = None
+        self.last_result: Dict[str, Any] = {}
+
+    def set_bot(self, bot: Bot):
+        self._bot = bot
+
+    async def record_failure(self, telegram_id: int):
+        try:
+            async with AsyncSessionLocal() as db:
+                reachable = await record_delivery_failure(
+                    db, telegram_id, settings.DELIVERY_UNREACHABLE_THRESHOLD
+                )
+            if reachable is False:
+                logger.info(f"🚫 Пользователь {telegram_id} помечен недоступным для рассылок")
+        except Exception as e:
+            logger.error(f"Ошибка учета недоставки пользователю {telegram_id}: {e}")
+
+    async def record_success(self, telegram_id: int):
+        try:
+            async with AsyncSessionLocal() as db:
+                if await reset_delivery_health(db, telegram_id):
+                    logger.info(f"✅ Пользователь {telegram_id} снова доступен для рассылок")
+        except Exception as e:
+            logger.error(f"Ошибка сброса недоставки пользователю {telegram_id}: {e}")
+
+    async def set_reachable(self, telegram_id: int, reachable: bool):
+        """Обновление по my_chat_member: пользователь заблокировал или разблокировал бота"""
+        if reachable:
+            await self.record_success(telegram_id)
+            return
+
+        try:
+            async with AsyncSessionLocal() as db:
+                if await mark_user_unreachable(db, telegram_id, settings.DELIVERY_UNREACHABLE_THRESHOLD):
+                    logger.info(f"🚫 Пользователь {telegram_id} заблокировал бота")
+        except Exception as e:
+            logger.error(f"Ошибка отметки блокировки бота пользователем {telegram_id}: {e}")
+
+    async def start(self):
+        if settings.DELIVERY_REPROBE_INTERVAL_HOURS <= 0:
+            logger.info("ℹ️ Повторная проверка недоступных пользователей отключена")
+            return
+        if self._task and not self._task.done():
+            return
+
+        self._task = asyncio.create_task(self._loop(), name="delivery-reprobe")
+        logger.info("✅ Проверка недоступных пользователей запущена")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self._lease.release()
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(settings.DELIVERY_REPROBE_CHECK_INTERVAL)
+            try:
+                if await self._lease.acquire():
+                    await self.probe_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка проверки недоступных пользователей: {e}", exc_info=True)
+
+    async def probe_once(self) -> Dict[str, Any]:
+        """
+        Проверяет пачку недоступных пользователей через send_chat_action:
+        пользователь ничего не получает, а Telegram отвечает Forbidden,
+        пока бот заблокирован.
+        """
+        if not self._bot:
+            return {}
+
+        probed_before = datetime.utcnow() - timedelta(hours=settings.DELIVERY_REPROBE_INTERVAL_HOURS)
+        async with AsyncSessionLocal() as db:
+            telegram_ids = await get_users_for_delivery_probe(db, probed_before, settings.DELIVERY_REPROBE_BATCH_SIZE)
+            # Отмечаем пачку заранее: при ошибке посередине ее не начнут проверять повторно сразу же
+            await touch_delivery_probe(db, telegram_ids)
+
+        restored = 0
+        for telegram_id in telegram_ids:
+            try:
+                await self._bot.send_chat_action(telegram_id, "typing")
+            except TelegramForbiddenError:
+                continue
+            except TelegramRetryAfter as e:
+                await asyncio.sleep(e.retry_after)
+                continue
+            except Exception as e:
+                logger.debug(f"Проверка доступности пользователя {telegram_id} не удалась: {e}")
+                continue
+            else:
+                await self.record_success(telegram_id)
+                restored += 1
+            finally:
+                await asyncio.sleep(1)
+
+        self.last_probe = datetime.utcnow()
+        self.last_result = {"probed": len(telegram_ids), "restored": restored}
+        if telegram_ids:
+            logger.info(f"🔎 Проверено недоступных пользователей: {len(telegram_ids)}, восстановлено: {restored}")
+        return self.last_result
+
+
+delivery_health_service = DeliveryHealthService()
@@ -1,108 +1,165 @@
 import random
 import asyncio
 import logging
-from datetime import datetime, timedelta
-from typing import Optional
+from datetime import timedelta
+from typing import List, Optional, Set, Tuple
 from aiogram import types
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database.crud.user import add_user_balance, get_user_by_telegram_id
+from app.database.crud.user import BalanceChange, apply_balance_change, get_remaining_cooldown
 from app.database.crud.fortune_wheel import (
+    claim_wheel_spin,
     create_fortune_wheel_spin,
-    get_last_spin_time,
     get_fortune_wheel_stats,
     get_user_total_winnings
 )
+from app.database.models import TransactionType
 from app.config import settings
 from app.localization.texts import get_texts
 
 logger = logging.getLogger(__name__)
 
+SPIN_ANIMATION_TEXT = "🎡 Колесо вращается..."
+SPIN_ANIMATION_SECONDS = 2
+
+
+class _AliasTable:
+    """
+    Таблица псевдонимов (метод Воза): выбор исхода за O(1) - один
+    случайный индекс и одно сравнение вместо прохода по весам.
+    """
+
+    def __init__(self, amounts: List[int], weights: List[float]):
+        count = len(amounts)
+        total = sum(weights)
+        scaled = [weight * count / total for weight in weights]
+
+        self.amounts = amounts
+        self.prob = [1.0] * count
+        self.alias = list(range(count))
+
+        small = [index for index, value in enumerate(scaled) if value < 1.0]
+        large = [index for index, value in enumerate(scaled) if value >= 1.0]
+
+        while small and large:
+            less, more = small.pop(), large.pop()
+            self.prob[less] = scaled[less]
+            self.alias[less] = more
+            scaled[more] -= 1.0 - scaled[less]
+            (small if scaled[more] < 1.0 else large).append(more)
+
+    def sample(self) -> int:
+        index = random.randrange(len(self.amounts))
+        if random.random() < self.prob[index]:
+            return self.amounts[index]
+        return self.amounts[self.alias[index]]
+
 
 class FortuneWheelService:
+
+    def __init__(self):
+        self._table: Optional[_AliasTable] = None
+        self._table_source: Optional[str] = None
+        self._animations: Set[asyncio.Task] = set()
+
+    def _get_table(self) -> _AliasTable:
+        # Перестраиваем таблицу только при смене WHEEL_OF_FORTUNE_REWARDS
+        source = settings.WHEEL_OF_FORTUNE_REWARDS
+        if self._table is None or source != self._table_source:
+            rewards: List[Tuple[int, int]] = [
+                (reward["amount"] * 100, reward["chance"])
+                for reward in settings.get_wheel_of_fortune_rewards()
+                if reward["chance"] > 0
+            ]
+            if not rewards:
+                rewards = [(0, 1)]
+            self._table = _AliasTable([amount for amount, _ in rewards], [chance for _, chance in rewards])
+            self._table_source = source
+        return self._table
+
+    @property
+    def max_prize_rubles(self) -> int:
+        return max(self._get_table().amounts) // 100
+
     async def spin_wheel(
             self,
             db: AsyncSession,
-            user: types.User,
-            message: types.Message
+            user: types.User
     ) -> dict:
         """
         Обрабатывает спин колеса фортуны для пользователя.
+        Кулдаун, запись спина и начисление выигрыша - одна транзакция;
+        анимацию показывает вызывающий уже после коммита.
         Возвращает словарь с результатом.
         """
-        # Проверяем, когда пользователь последний раз крутил колесо
-        last_spin = await get_last_spin_time(db, user.id)
-
-        # Проверяем, прошло ли 24 часа с последнего спина
-        if last_spin and last_spin > datetime.utcnow() - timedelta(hours=24):
-            time_left = last_spin + timedelta(hours=24) - datetime.utcnow()
-            hours = time_left.seconds // 3600
-            minutes = (time_left.seconds % 3600) // 60
-
+        if not settings.is_wheel_of_fortune_enabled():
             return {
                 "success": False,
-                "message": f"⏳ Вы сможете крутить колесо снова через {hours}ч {minutes}м"
+                "message": "🎡 Колесо фортуны временно недоступно"
             }
 
-        # Отправляем анимацию вращения
-        animation_message = await message.answer("🎡 Колесо вращается...")
-
-        # Задержка для имитации вращения
-        await asyncio.sleep(2)
+        cooldown = timedelta(hours=settings.get_wheel_cooldown_hours())
+        win_amount = self._get_table().sample()
 
-        # Удаляем сообщение с анимацией, оборачиваем в try-except на случай ошибки
         try:
-            await animation_message.delete()
-        except Exception as e:
-            logger.warning(f"Не удалось удалить сообщение анимации: {e}")
-
-        # Определяем выигрыш
-        win_amount = self._get_random_win_amount()
-
-        # Записываем результат спина в базу данных
-        spin = await create_fortune_wheel_spin(
-            db,
-            user_id=user.id,
-            amount_kopeks=win_amount,
-            is_win=win_amount > 0
-        )
+            user_id = await claim_wheel_spin(db, user.id, cooldown)
+
+            if user_id is None:
+                remaining = await get_remaining_cooldown(db, user.id)
+                if not remaining:
+                    return {"success": False, "message": "❌ Не удалось прокрутить колесо, попробуйте позже"}
+
+                hours, minutes = remaining // 3600, (remaining % 3600) // 60
+                return {
+                    "success": False,
+                    "message": f"⏳ Вы сможете крутить колесо снова через {hours}ч {minutes}м"
+                }
+
+            spin = await create_fortune_wheel_spin(
+                db,
+                user_id=user_id,
+                amount_kopeks=win_amount,
+                is_win=win_amount > 0,
+                commit=False
+            )
+
+            if win_amount > 0:
+                entry = await apply_balance_change(db, BalanceChange(
+                    user_id=user_id,
+                    amount_kopeks=win_amount,
+                    description=f"Выигрыш в колесе фортуны #{spin.id}",
+                    transaction_type=TransactionType.DEPOSIT
+                ), commit=False)
+                if entry is None:
+                    raise RuntimeError(f"пользователь {user_id} не найден при начислении выигрыша")
+
+            await db.commit()
+
+        except Exception:
+            await db.rollback()
+            raise
 
-        # Начисляем выигрыш на баланс, если он есть
         if win_amount > 0:
-            # Получаем актуальный объект пользователя из БД
-            user_db = await get_user_by_telegram_id(db, user.id)
-            if user_db:
-                await add_user_balance(
-                    db,
-                    user_db,
-                    win_amount,
-                    f"Выигрыш в колесе фортуны #{spin.id}"
-                )
-            else:
-                logger.error(f"Пользователь с ID {user.id} не найден при начислении выигрыша.")
-
-        win_text = self._get_win_text(win_amount)
+            logger.info(f"🎡 Пользователь {user.id} выиграл в колесе фортуны {win_amount / 100}₽ (спин #{spin.id})")
 
         return {
             "success": True,
             "amount": win_amount,
-            "message": win_text
+            "message": self._get_win_text(win_amount)
         }
 
-    def _get_random_win_amount(self) -> int:
-        """
-        Определяет случайный выигрыш на основе вероятностей.
-        Выигрыш в копейках.
-        """
-        outcomes = settings.FORTUNE_WHEEL_OUTCOMES
-        weights = [outcome['weight'] for outcome in outcomes]
-
-        selected_outcome = random.choices(outcomes, weights=weights, k=1)[0]
+    def schedule_reveal(self, message: types.Message, text: str, delay: float = SPIN_ANIMATION_SECONDS):
+        """Через delay секунд заменяет сообщение с анимацией результатом, не задерживая обработчик"""
+        task = asyncio.create_task(self._reveal(message, text, delay))
+        self._animations.add(task)
+        task.add_done_callback(self._animations.discard)
 
-        min_amount = selected_outcome['min_amount_kopeks']
-        max_amount = selected_outcome['max_amount_kopeks']
-
-        return random.randint(min_amount, max_amount)
+    async def _reveal(self, message: types.Message, text: str, delay: float):
+        await asyncio.sleep(delay)
+        try:
+            await message.edit_text(text)
+        except Exception as e:
+            logger.warning(f"Не удалось показать результат колеса фортуны: {e}")
 
     def _get_win_text(self, amount_kopeks: int) -> str:
         """
@@ -127,4 +184,7 @@ class FortuneWheelService:
             "total_spins": stats.total_spins if stats else 0,
             "wins": stats.wins if stats else 0,
             "total_winnings": total_winnings if total_winnings else 0
-        }
\ No newline at end of file
+        }
+
+
+fortune_wheel_service = FortuneWheelService()
\ No newline at end of file
@@ -7,9 +7,14 @@ from dataclasses import dataclass
 from app.config import settings
 from app.external.remnawave_api import RemnaWaveAPI, test_api_connection
 from app.utils.cache import cache
+from app.services.coordination_service import coordination_service
+from app.services.notification_queue_service import notification_queue
 
 logger = logging.getLogger(__name__)
 
+STATUS_KEY = "maintenance_status"
+STATUS_CHANNEL = "maintenance:changed"
+
 
 @dataclass
 class MaintenanceStatus:
@@ -31,6 +36,8 @@ class MaintenanceService:
         self._max_consecutive_failures = 3
         self._bot = None 
         self._last_notification_sent = None 
+        self._lease = coordination_service.lease("maintenance-monitoring")
+        coordination_service.subscribe(STATUS_CHANNEL, self._on_status_changed)
         
     def set_bot(self, bot):
         self._bot = bot
@@ -81,7 +88,9 @@ class MaintenanceService:
             
             formatted_message = f"{emoji} <b>ТЕХНИЧЕСКИЕ РАБОТЫ</b>\n\n{message}\n\n⏰ <i>{datetime.now().strftime('%d.%m.%Y %H:%M:%S')}</i>"
             
-            return await notification_service._send_message(formatted_message)
+            return await notification_service._send_message(
+                formatted_message, digest_key=f"maintenance_service:{alert_type}"
+            )
             
         except Exception as e:
             logger.error(f"Ошибка отправки уведомления через AdminNotificationService: {e}")
@@ -95,14 +104,10 @@ class MaintenanceService:
         notification_sent = await self._send_admin_notification(message, alert_type)
         
         if notification_sent:
-            logger.info("Уведомление успешно отправлено через AdminNotificationService")
+            logger.info("Уведомление поставлено в очередь через AdminNotificationService")
             return
         
-        logger.info("Отправляем уведомление напрямую администраторам")
-        
-        cache_key = f"maintenance_notification_{alert_type}"
-        if await cache.get(cache_key):
-            return
+        logger.info("Отправляем уведомление администраторам в личные сообщения")
         
         admin_ids = settings.get_admin_ids()
         if not admin_ids:
@@ -119,25 +124,14 @@ class MaintenanceService:
         
         formatted_message = f"{emoji} <b>Maintenance Service</b>\n\n{message}"
         
-        success_count = 0
+        queued_count = 0
         for admin_id in admin_ids:
-            try:
-                await self._bot.send_message(
-                    chat_id=admin_id,
-                    text=formatted_message,
-                    parse_mode="HTML"
-                )
-                success_count += 1
-                await asyncio.sleep(0.1) 
-                
-            except Exception as e:
-                logger.error(f"Ошибка отправки уведомления админу {admin_id}: {e}")
+            if await notification_queue.enqueue(
+                admin_id, formatted_message, digest_key=f"maintenance_service:{alert_type}"
+            ):
+                queued_count += 1
         
-        if success_count > 0:
-            logger.info(f"Уведомление отправлено {success_count} администраторам")
-            await cache.set(cache_key, True, expire=300)
-        else:
-            logger.error("Не удалось отправить уведомления ни одному администратору")
+        logger.info(f"Уведомление поставлено в очередь для {queued_count} администраторов")
     
     async def enable_maintenance(self, reason: Optional[str] = None, auto: bool = False) -> bool:
         try:
@@ -225,14 +219,6 @@ class MaintenanceService:
             self._check_task = asyncio.create_task(self._monitoring_loop())
             logger.info(f"🔄 Запущен мониторинг API Remnawave (интервал: {settings.get_maintenance_check_interval()}с)")
             
-            await self._notify_admins(f"""Мониторинг технических работ запущен
-
-🔄 <b>Интервал проверки:</b> {settings.get_maintenance_check_interval()} секунд
-🤖 <b>Автовключение:</b> {'Включено' if settings.is_maintenance_auto_enable() else 'Отключено'}
-🎯 <b>Порог ошибок:</b> {self._max_consecutive_failures}
-
-Система будет следить за доступностью API.""", "info")
-            
             return True
             
         except Exception as e:
@@ -248,7 +234,9 @@ class MaintenanceService:
                 except asyncio.CancelledError:
                     pass
             
-            await self._notify_admins("Мониторинг технических работ остановлен", "info")
+            if self._lease.is_held:
+                await self._lease.release()
+                await self._notify_admins("Мониторинг технических работ остановлен", "info")
             logger.info("ℹ️ Мониторинг API остановлен")
             return True
             
@@ -328,12 +316,27 @@ API снова отвечает на запросы.""", "success")
             return False
         finally:
             self._is_checking = False
-            await self._save_status_to_cache()
+            await self._save_check_to_cache()
     
     async def _monitoring_loop(self):
         while True:
             try:
-                await self.check_api_status()
+                # Проверяет API одна реплика, остальные перечитывают общее
+                # состояние - на случай пропущенного события pub/sub
+                was_leader = self._lease.is_held
+                if await self._lease.acquire():
+                    if not was_leader:
+                        await self._notify_admins(f"""Мониторинг технических работ запущен
+
+🔄 <b>Интервал проверки:</b> {settings.get_maintenance_check_interval()} секунд
+🤖 <b>Автовключение:</b> {'Включено' if settings.is_maintenance_auto_enable() else 'Отключено'}
+🎯 <b>Порог ошибок:</b> {self._max_consecutive_failures}
+🖥 <b>Реплика:</b> {coordination_service.instance_id}
+
+Система будет следить за доступностью API.""", "info")
+                    await self.check_api_status()
+                else:
+                    await self._load_status_from_cache()
                 await asyncio.sleep(settings.get_maintenance_check_interval())
                 
             except asyncio.CancelledError:
@@ -351,36 +354,65 @@ API снова отвечает на запросы.""", "success")
                 "reason": self._status.reason,
                 "auto_enabled": self._status.auto_enabled,
                 "consecutive_failures": self._status.consecutive_failures,
+                "api_status": self._status.api_status,
                 "last_check": self._status.last_check.isoformat() if self._status.last_check else None
             }
             
-            await cache.set("maintenance_status", status_data, expire=3600)
+            # Общее состояние реплик: без срока жизни, иначе техработы,
+            # включенные администратором, сами выключатся у остальных
+            await cache.set(STATUS_KEY, status_data)
+            await coordination_service.publish(STATUS_CHANNEL)
             
         except Exception as e:
             logger.error(f"Ошибка сохранения состояния в кеш: {e}")
     
+    async def _save_check_to_cache(self):
+        # Результат проверки дописывается к общему состоянию, не затирая
+        # техработы, которые администратор мог включить на другой реплике
+        try:
+            status_data = await cache.get(STATUS_KEY)
+            if not status_data:
+                await self._save_status_to_cache()
+                return
+            
+            status_data.update({
+                "api_status": self._status.api_status,
+                "consecutive_failures": self._status.consecutive_failures,
+                "last_check": self._status.last_check.isoformat() if self._status.last_check else None
+            })
+            await cache.set(STATUS_KEY, status_data)
+            
+        except Exception as e:
+            logger.error(f"Ошибка сохранения результата проверки в кеш: {e}")
+    
     async def _load_status_from_cache(self):
         try:
-            status_data = await cache.get("maintenance_status")
+            status_data = await cache.get(STATUS_KEY)
             if not status_data:
                 return
             
+            was_active = self._status.is_active
             self._status.is_active = status_data.get("is_active", False)
             self._status.reason = status_data.get("reason")
             self._status.auto_enabled = status_data.get("auto_enabled", False)
             self._status.consecutive_failures = status_data.get("consecutive_failures", 0)
-            
-            if status_data.get("enabled_at"):
-                self._status.enabled_at = datetime.fromisoformat(status_data["enabled_at"])
+            self._status.api_status = status_data.get("api_status", self._status.api_status)
+            self._status.enabled_at = (
+                datetime.fromisoformat(status_data["enabled_at"]) if status_data.get("enabled_at") else None
+            )
             
             if status_data.get("last_check"):
                 self._status.last_check = datetime.fromisoformat(status_data["last_check"])
             
-            logger.info(f"🔥 Состояние техработ загружено из кеша: активен={self._status.is_active}")
+            if was_active != self._status.is_active:
+                logger.info(f"🔥 Состояние техработ загружено из кеша: активен={self._status.is_active}")
             
         except Exception as e:
             logger.error(f"Ошибка загрузки состояния из кеша: {e}")
     
+    async def _on_status_changed(self, payload: Dict[str, Any]):
+        await self._load_status_from_cache()
+    
     def get_status_info(self) -> Dict[str, Any]:
         return {
             "is_active": self._status.is_active,
@@ -391,6 +423,7 @@ API снова отвечает на запросы.""", "success")
             "api_status": self._status.api_status,
             "consecutive_failures": self._status.consecutive_failures,
             "monitoring_active": self._check_task is not None and not self._check_task.done(),
+            "monitoring_leader": self._lease.is_held,
             "auto_enable_configured": settings.is_maintenance_auto_enable(),
             "check_interval": settings.get_maintenance_check_interval(),
             "bot_connected": self._bot is not None
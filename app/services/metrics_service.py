@@ -0,0 +1,344 @@
+import cProfile
+import heapq
+import io
+import logging
+import pstats
+import random
+import re
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional, Dict, Any, List, Tuple
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_ID_SEGMENT = re.compile(
+    r"/(?:[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}|\d+|[A-Za-z0-9_-]{16,})(?=/|$)"
+)
+
+
+class Histogram:
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        index = 0
+        while index < len(LATENCY_BUCKETS) and value > LATENCY_BUCKETS[index]:
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    @property
+    def avg(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+
+        threshold = q * self.count
+        cumulative = 0
+        for index, bucket_count in enumerate(self.counts):
+            cumulative += bucket_count
+            if cumulative >= threshold:
+                return LATENCY_BUCKETS[index] if index < len(LATENCY_BUCKETS) else self.max
+        return self.max
+
+
+@dataclass
+class UpdateStats:
+    db_queries: int = 0
+    db_time: float = 0.0
+
+
+@dataclass
+class ProfileSample:
+    duration: float
+    handler: str
+    captured_at: datetime
+    report: str
+
+
+current_update: ContextVar[Optional[UpdateStats]] = ContextVar("current_update", default=None)
+
+
+def normalize_endpoint(endpoint: str) -> str:
+    return _ID_SEGMENT.sub("/{id}", endpoint.split("?")[0])
+
+
+class MetricsService:
+    """Сбор метрик горячего пути: обработчики, БД, панель, внешние провайдеры, Telegram API"""
+
+    def __init__(self):
+        self.started_at = datetime.utcnow()
+        self.handlers: Dict[str, Histogram] = defaultdict(Histogram)
+        self.handler_errors: Dict[str, int] = defaultdict(int)
+        self.handler_db_queries: Dict[str, int] = defaultdict(int)
+        self.handler_db_time: Dict[str, float] = defaultdict(float)
+        self.panel: Dict[Tuple[str, str], Histogram] = defaultdict(Histogram)
+        self.panel_errors: Dict[Tuple[str, str], int] = defaultdict(int)
+        self.external: Dict[Tuple[str, str, str], Histogram] = defaultdict(Histogram)
+        self.external_errors: Dict[Tuple[str, str, str], int] = defaultdict(int)
+        self.telegram: Dict[str, Histogram] = defaultdict(Histogram)
+        self.telegram_errors: Dict[str, int] = defaultdict(int)
+        self.db_queries_total = 0
+        self.db_time_total = 0.0
+        self._profiles: List[Tuple[float, int, ProfileSample]] = []
+        self._profile_seq = 0
+        self._profiler_busy = False
+        self._db_instrumented = False
+
+    def instrument_engine(self, engine):
+        if self._db_instrumented:
+            return
+
+        from sqlalchemy import event
+
+        sync_engine = getattr(engine, "sync_engine", engine)
+        event.listen(sync_engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(sync_engine, "after_cursor_execute", self._after_cursor_execute)
+        self._db_instrumented = True
+
+    @staticmethod
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get("query_started")
+        if not started:
+            return
+
+        elapsed = time.perf_counter() - started.pop()
+        self.db_queries_total += 1
+        self.db_time_total += elapsed
+
+        stats = current_update.get()
+        if stats is not None:
+            stats.db_queries += 1
+            stats.db_time += elapsed
+
+    def start_update(self) -> UpdateStats:
+        stats = UpdateStats()
+        current_update.set(stats)
+        return stats
+
+    def should_profile(self) -> bool:
+        rate = settings.PROFILING_SAMPLE_RATE
+        return rate > 0 and not self._profiler_busy and random.random() < rate
+
+    def start_profile(self) -> cProfile.Profile:
+        # cProfile глобален для потока: одновременно профилируем только одно событие
+        self._profiler_busy = True
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+
+    def finish_profile(self, profiler: cProfile.Profile, handler: str, duration: float):
+        profiler.disable()
+        self._profiler_busy = False
+
+        keep = settings.PROFILING_KEEP_SLOWEST
+        if len(self._profiles) >= keep and duration <= self._profiles[0][0]:
+            return
+
+        stream = io.StringIO()
+        pstats.Stats(profiler, stream=stream).sort_stats("cumulative").print_stats(25)
+        sample = ProfileSample(duration, handler, datetime.utcnow(), stream.getvalue())
+
+        self._profile_seq += 1
+        if len(self._profiles) >= keep:
+            heapq.heapreplace(self._profiles, (duration, self._profile_seq, sample))
+        else:
+            heapq.heappush(self._profiles, (duration, self._profile_seq, sample))
+
+    def get_slowest_profiles(self) -> List[ProfileSample]:
+        return [sample for _, _, sample in sorted(self._profiles, reverse=True)]
+
+    def observe_handler(self, handler: str, duration: float, stats: Optional[UpdateStats], failed: bool = False):
+        self.handlers[handler].observe(duration)
+        if failed:
+            self.handler_errors[handler] += 1
+        if stats is not None:
+            self.handler_db_queries[handler] += stats.db_queries
+            self.handler_db_time[handler] += stats.db_time
+
+    def observe_panel(self, method: str, endpoint: str, duration: float, failed: bool = False):
+        key = (method, normalize_endpoint(endpoint))
+        self.panel[key].observe(duration)
+        if failed:
+            self.panel_errors[key] += 1
+
+    def observe_external(self, provider: str, method: str, endpoint: str, duration: float, failed: bool = False):
+        key = (provider, method, normalize_endpoint(endpoint))
+        self.external[key].observe(duration)
+        if failed:
+            self.external_errors[key] += 1
+
+    def observe_telegram(self, method: str, duration: float, failed: bool = False):
+        self.telegram[method].observe(duration)
+        if failed:
+            self.telegram_errors[method] += 1
+
+    def get_top_handlers(self, limit: int = 10) -> List[Dict[str, Any]]:
+        rows = []
+        for handler, histogram in self.handlers.items():
+            rows.append({
+                "handler": handler,
+                "count": histogram.count,
+                "avg": histogram.avg,
+                "p95": histogram.quantile(0.95),
+                "max": histogram.max,
+                "errors": self.handler_errors.get(handler, 0),
+                "db_queries_avg": self.handler_db_queries.get(handler, 0) / histogram.count,
+                "db_time_avg": self.handler_db_time.get(handler, 0.0) / histogram.count,
+            })
+        rows.sort(key=lambda row: row["avg"] * row["count"], reverse=True)
+        return rows[:limit]
+
+    def get_panel_summary(self, limit: int = 10) -> List[Dict[str, Any]]:
+        rows = [
+            {
+                "endpoint": f"{method} {endpoint}",
+                "count": histogram.count,
+                "avg": histogram.avg,
+                "p95": histogram.quantile(0.95),
+                "errors": self.panel_errors.get((method, endpoint), 0),
+            }
+            for (method, endpoint), histogram in self.panel.items()
+        ]
+        rows.sort(key=lambda row: row["avg"] * row["count"], reverse=True)
+        return rows[:limit]
+
+    def get_external_summary(self, limit: int = 10) -> List[Dict[str, Any]]:
+        rows = [
+            {
+                "endpoint": f"{provider} {method} {endpoint}",
+                "count": histogram.count,
+                "avg": histogram.avg,
+                "p95": histogram.quantile(0.95),
+                "errors": self.external_errors.get((provider, method, endpoint), 0),
+            }
+            for (provider, method, endpoint), histogram in self.external.items()
+        ]
+        rows.sort(key=lambda row: row["avg"] * row["count"], reverse=True)
+        return rows[:limit]
+
+    def get_telegram_summary(self, limit: int = 10) -> List[Dict[str, Any]]:
+        rows = [
+            {
+                "method": method,
+                "count": histogram.count,
+                "avg": histogram.avg,
+                "p95": histogram.quantile(0.95),
+                "errors": self.telegram_errors.get(method, 0),
+            }
+            for method, histogram in self.telegram.items()
+        ]
+        rows.sort(key=lambda row: row["avg"] * row["count"], reverse=True)
+        return rows[:limit]
+
+    @staticmethod
+    def _escape(value: str) -> str:
+        return value.replace("\\", "\\\\").replace('"', '\\"')
+
+    def _render_histogram(self, lines: List[str], name: str, labels: str, histogram: Histogram):
+        cumulative = 0
+        for bucket, bucket_count in zip(LATENCY_BUCKETS, histogram.counts):
+            cumulative += bucket_count
+            lines.append(f'{name}_bucket{{{labels},le="{bucket}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+        lines.append(f"{name}_sum{{{labels}}} {histogram.total:.6f}")
+        lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+
+    def render_prometheus(self) -> str:
+        from app.services.update_queue_service import update_queue_service
+        from app.utils.rate_limiter import rate_limiter
+
+        lines = [
+            "# TYPE bot_handler_duration_seconds histogram",
+        ]
+        for handler, histogram in self.handlers.items():
+            self._render_histogram(
+                lines, "bot_handler_duration_seconds", f'handler="{self._escape(handler)}"', histogram
+            )
+
+        lines.append("# TYPE bot_handler_errors_total counter")
+        for handler, errors in self.handler_errors.items():
+            lines.append(f'bot_handler_errors_total{{handler="{self._escape(handler)}"}} {errors}')
+
+        lines.append("# TYPE bot_handler_db_queries_total counter")
+        for handler, queries in self.handler_db_queries.items():
+            lines.append(f'bot_handler_db_queries_total{{handler="{self._escape(handler)}"}} {queries}')
+
+        lines.append("# TYPE bot_db_queries_total counter")
+        lines.append(f"bot_db_queries_total {self.db_queries_total}")
+        lines.append("# TYPE bot_db_query_seconds_total counter")
+        lines.append(f"bot_db_query_seconds_total {self.db_time_total:.6f}")
+
+        lines.append("# TYPE bot_panel_request_duration_seconds histogram")
+        for (method, endpoint), histogram in self.panel.items():
+            self._render_histogram(
+                lines, "bot_panel_request_duration_seconds",
+                f'method="{method}",endpoint="{self._escape(endpoint)}"', histogram
+            )
+
+        lines.append("# TYPE bot_external_request_duration_seconds histogram")
+        for (provider, method, endpoint), histogram in self.external.items():
+            self._render_histogram(
+                lines, "bot_external_request_duration_seconds",
+                f'provider="{provider}",method="{method}",endpoint="{self._escape(endpoint)}"', histogram
+            )
+
+        lines.append("# TYPE bot_external_request_errors_total counter")
+        for (provider, method, endpoint), errors in self.external_errors.items():
+            lines.append(
+                f'bot_external_request_errors_total{{provider="{provider}",method="{method}",'
+                f'endpoint="{self._escape(endpoint)}"}} {errors}'
+            )
+
+        lines.append("# TYPE bot_telegram_request_duration_seconds histogram")
+        for method, histogram in self.telegram.items():
+            self._render_histogram(
+                lines, "bot_telegram_request_duration_seconds", f'method="{method}"', histogram
+            )
+
+        lines.append("# TYPE bot_throttled_updates_total counter")
+        for action, counters in rate_limiter.get_stats().items():
+            lines.append(f'bot_throttled_updates_total{{action="{action}"}} {counters["throttled"]}')
+
+        if update_queue_service.is_running:
+            lines.append("# TYPE bot_update_queue_depth gauge")
+            for lane, depth in update_queue_service.depth().items():
+                lines.append(f'bot_update_queue_depth{{lane="{lane}"}} {depth}')
+
+            lines.append("# TYPE bot_update_queue_wait_seconds histogram")
+            for lane, histogram in update_queue_service.wait_time.items():
+                self._render_histogram(lines, "bot_update_queue_wait_seconds", f'lane="{lane}"', histogram)
+
+            lines.append("# TYPE bot_update_queue_rejected_total counter")
+            lines.append(f"bot_update_queue_rejected_total {update_queue_service.stats['rejected']}")
+
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        db_instrumented = self._db_instrumented
+        self.__init__()
+        self._db_instrumented = db_instrumented
+
+
+metrics_service = MetricsService()
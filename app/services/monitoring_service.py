@@ -20,7 +20,10 @@ from app.database.crud.user import (
 from app.database.models import MonitoringLog, SubscriptionStatus, Subscription, User
 from app.services.subscription_service import SubscriptionService
 from app.services.payment_service import PaymentService
+from app.services.notification_queue_service import notification_queue
+from app.services.coordination_service import coordination_service
 from app.localization.texts import get_texts
+from app.utils.cache import cache
 
 from app.external.remnawave_api import (
     RemnaWaveUser, UserStatus, TrafficLimitStrategy, RemnaWaveAPIError
@@ -28,6 +31,8 @@ from app.external.remnawave_api import (
 
 logger = logging.getLogger(__name__)
 
+NOTIFIED_PREFIX = "monitoring:notified:"
+
 
 class MonitoringService:
     
@@ -38,6 +43,7 @@ class MonitoringService:
         self.bot = bot
         self._notified_users: Set[str] = set() 
         self._last_cleanup = datetime.utcnow()
+        self._lease = coordination_service.lease("subscription-monitoring")
     
     async def start_monitoring(self):
         if self.is_running:
@@ -49,12 +55,17 @@ class MonitoringService:
         
         while self.is_running:
             try:
-                await self._monitoring_cycle()
+                if await self._lease.acquire():
+                    await self._monitoring_cycle()
+                else:
+                    logger.debug("Мониторинг подписок выполняет другая реплика")
                 await asyncio.sleep(settings.MONITORING_INTERVAL * 60) 
                 
             except Exception as e:
                 logger.error(f"Ошибка в цикле мониторинга: {e}")
                 await asyncio.sleep(60) 
+        
+        await self._lease.release()
     
     def stop_monitoring(self):
         self.is_running = False
@@ -65,12 +76,19 @@ class MonitoringService:
             try:
                 await self._cleanup_notification_cache()
                 
-                await self._check_expired_subscriptions(db)
-                await self._check_expiring_subscriptions(db)
-                await self._check_trial_expiring_soon(db)  
-                await self._process_autopayments(db)
-                await self._cleanup_inactive_users(db)
-                await self._sync_with_remnawave(db)
+                steps = (
+                    self._check_expired_subscriptions,
+                    self._check_expiring_subscriptions,
+                    self._check_trial_expiring_soon,
+                    self._process_autopayments,
+                    self._cleanup_inactive_users,
+                    self._sync_with_remnawave,
+                )
+                for step in steps:
+                    if not await self._lease.check():
+                        logger.warning("⚠️ Цикл мониторинга прерван: аренда перешла к другой реплике")
+                        return
+                    await step(db)
                 
                 await self._log_monitoring_event(
                     db, "monitoring_cycle_completed", 
@@ -98,6 +116,19 @@ class MonitoringService:
             self._last_cleanup = current_time
             logger.info(f"🧹 Очищен кеш уведомлений ({old_count} записей)")
     
+    async def _is_notified(self, key: str) -> bool:
+        if key in self._notified_users:
+            return True
+        # Отметки общие для реплик: новый лидер не повторит уведомления предыдущего
+        if await cache.exists(f"{NOTIFIED_PREFIX}{key}"):
+            self._notified_users.add(key)
+            return True
+        return False
+    
+    async def _remember_notified(self, key: str):
+        self._notified_users.add(key)
+        await cache.set(f"{NOTIFIED_PREFIX}{key}", 1, expire=86400)
+    
     async def _check_expired_subscriptions(self, db: AsyncSession):
         try:
             expired_subscriptions = await get_expired_subscriptions(db)
@@ -110,12 +141,18 @@ class MonitoringService:
                 if user and user.remnawave_uuid:
                     await self.subscription_service.disable_remnawave_user(user.remnawave_uuid)
                 
-                if user and self.bot:
+                if user and self.bot and user.is_reachable:
                     await self._send_subscription_expired_notification(user)
                 
                 logger.info(f"🔴 Подписка пользователя {subscription.user_id} истекла и статус изменен на 'expired'")
             
             if expired_subscriptions:
+                # Истекшие подписки освобождают места на серверах
+                from app.database.crud.server_squad import sync_server_user_counts
+                from app.services.server_capacity_service import server_capacity_service
+                await sync_server_user_counts(db)
+                await server_capacity_service.invalidate()
+                
                 await self._log_monitoring_event(
                     db, "expired_subscriptions_processed",
                     f"Обработано {len(expired_subscriptions)} истёкших подписок",
@@ -190,7 +227,7 @@ class MonitoringService:
                     notification_key = f"expiring_{user.telegram_id}_{days}d_{subscription.id}"
                     user_key = f"user_{user.telegram_id}_today"
                     
-                    if (notification_key in self._notified_users or 
+                    if (await self._is_notified(notification_key) or 
                         user_key in all_processed_users):
                         logger.debug(f"🔄 Пропускаем дублирование для пользователя {user.telegram_id} на {days} дней")
                         continue
@@ -210,7 +247,7 @@ class MonitoringService:
                     if self.bot:
                         success = await self._send_subscription_expiring_notification(user, subscription, days)
                         if success:
-                            self._notified_users.add(notification_key)
+                            await self._remember_notified(notification_key)
                             all_processed_users.add(user_key)
                             sent_count += 1
                             logger.info(f"✅ Пользователю {user.telegram_id} отправлено уведомление об истечении подписки через {days} дней")
@@ -233,9 +270,11 @@ class MonitoringService:
             
             result = await db.execute(
                 select(Subscription)
+                .join(User, User.id == Subscription.user_id)
                 .options(selectinload(Subscription.user))
                 .where(
                     and_(
+                        User.is_reachable.is_(True),
                         Subscription.status == SubscriptionStatus.ACTIVE.value,
                         Subscription.is_trial == True,
                         Subscription.end_date <= threshold_time,
@@ -251,13 +290,13 @@ class MonitoringService:
                     continue
                 
                 notification_key = f"trial_2h_{user.telegram_id}_{subscription.id}"
-                if notification_key in self._notified_users:
+                if await self._is_notified(notification_key):
                     continue  
                 
                 if self.bot:
                     success = await self._send_trial_ending_notification(user, subscription)
                     if success:
-                        self._notified_users.add(notification_key)
+                        await self._remember_notified(notification_key)
                         logger.info(f"🎁 Пользователю {user.telegram_id} отправлено уведомление об окончании тестовой подписки через 2 часа")
             
             if trial_expiring:
@@ -276,9 +315,11 @@ class MonitoringService:
         
         result = await db.execute(
             select(Subscription)
+            .join(User, User.id == Subscription.user_id)
             .options(selectinload(Subscription.user))
             .where(
                 and_(
+                    User.is_reachable.is_(True),
                     Subscription.status == SubscriptionStatus.ACTIVE.value,
                     Subscription.is_trial == False, 
                     Subscription.end_date > current_time,
@@ -330,9 +371,13 @@ class MonitoringService:
                 renewal_cost = settings.PRICE_30_DAYS
                 
                 autopay_key = f"autopay_{user.telegram_id}_{subscription.id}"
-                if autopay_key in self._notified_users:
+                if await self._is_notified(autopay_key):
                     continue
                 
+                if not await self._lease.check():
+                    logger.warning("⚠️ Автоплатежи прерваны: аренда перешла к другой реплике")
+                    break
+                
                 if user.balance_kopeks >= renewal_cost:
                     success = await subtract_user_balance(
                         db, user, renewal_cost,
@@ -343,20 +388,20 @@ class MonitoringService:
                         await extend_subscription(db, subscription, 30)
                         await self.subscription_service.update_remnawave_user(db, subscription)
                         
-                        if self.bot:
+                        if self.bot and user.is_reachable:
                             await self._send_autopay_success_notification(user, renewal_cost, 30)
                         
                         processed_count += 1
-                        self._notified_users.add(autopay_key)
+                        await self._remember_notified(autopay_key)
                         logger.info(f"💳 Автопродление подписки пользователя {user.telegram_id} успешно")
                     else:
                         failed_count += 1
-                        if self.bot:
+                        if self.bot and user.is_reachable:
                             await self._send_autopay_failed_notification(user, user.balance_kopeks, renewal_cost)
                         logger.warning(f"💳 Ошибка списания средств для автопродления пользователя {user.telegram_id}")
                 else:
                     failed_count += 1
-                    if self.bot:
+                    if self.bot and user.is_reachable:
                         await self._send_autopay_failed_notification(user, user.balance_kopeks, renewal_cost)
                     logger.warning(f"💳 Недостаточно средств для автопродления у пользователя {user.telegram_id}")
             
@@ -387,12 +432,7 @@ class MonitoringService:
                 [InlineKeyboardButton(text="💳 Пополнить баланс", callback_data="balance_topup")]
             ])
             
-            await self.bot.send_message(
-                user.telegram_id, 
-                message, 
-                parse_mode="HTML",
-                reply_markup=keyboard
-            )
+            await notification_queue.enqueue(user.telegram_id, message, reply_markup=keyboard)
             return True
             
         except Exception as e:
@@ -431,12 +471,7 @@ class MonitoringService:
                 [InlineKeyboardButton(text="📱 Моя подписка", callback_data="menu_subscription")]
             ])
 
-            await self.bot.send_message(
-                user.telegram_id,
-                message,
-                parse_mode="HTML",
-                reply_markup=keyboard
-            )
+            await notification_queue.enqueue(user.telegram_id, message, reply_markup=keyboard)
             return True
 
         except Exception as e:
@@ -471,12 +506,7 @@ class MonitoringService:
                 [InlineKeyboardButton(text="💰 Пополнить баланс", callback_data="balance_topup")]
             ])
             
-            await self.bot.send_message(
-                user.telegram_id, 
-                message, 
-                parse_mode="HTML",
-                reply_markup=keyboard
-            )
+            await notification_queue.enqueue(user.telegram_id, message, reply_markup=keyboard)
             return True
             
         except Exception as e:
@@ -490,7 +520,7 @@ class MonitoringService:
                 days=days,
                 amount=settings.format_price(amount)
             )
-            await self.bot.send_message(user.telegram_id, message, parse_mode="HTML")
+            await notification_queue.enqueue(user.telegram_id, message)
         except Exception as e:
             logger.error(f"Ошибка отправки уведомления об автоплатеже пользователю {user.telegram_id}: {e}")
     
@@ -509,12 +539,7 @@ class MonitoringService:
                 [InlineKeyboardButton(text="📱 Моя подписка", callback_data="menu_subscription")]
             ])
             
-            await self.bot.send_message(
-                user.telegram_id, 
-                message, 
-                parse_mode="HTML",
-                reply_markup=keyboard
-            )
+            await notification_queue.enqueue(user.telegram_id, message, reply_markup=keyboard)
             
         except Exception as e:
             logger.error(f"Ошибка отправки уведомления о неудачном автоплатеже пользователю {user.telegram_id}: {e}")
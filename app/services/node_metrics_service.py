@@ -0,0 +1,257 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Optional, Dict, List, Any, Tuple
+
+from aiogram import Bot
+
+from app.config import settings
+from app.database.database import AsyncSessionLocal
+from app.database.crud.node_metrics import (
+    RAW_RESOLUTION, floor_bucket, add_node_samples, rollup_node_metrics,
+    delete_node_metrics_before, get_node_metrics
+)
+from app.external.remnawave_api import RemnaWaveAPI
+from app.services.remnawave_service import node_to_dict
+from app.services.coordination_service import coordination_service
+from app.utils.cache import SystemCache
+
+logger = logging.getLogger(__name__)
+
+FIVE_MINUTES = 300
+ONE_HOUR = 3600
+
+
+def node_status(node: Dict[str, Any]) -> str:
+    if node.get("is_disabled"):
+        return "disabled"
+    if not (node.get("is_connected") and node.get("is_node_online")):
+        return "offline"
+    if not node.get("is_xray_running"):
+        return "xray_down"
+    return "online"
+
+
+class NodeMetricsService:
+    """
+    Фоновый сбор состояния нод Remnawave раз в NODE_METRICS_INTERVAL секунд:
+    последнее состояние каждой ноды по uuid, временной ряд в node_metrics со
+    сверткой raw → 5 мин → 1 ч и уведомления о падении и восстановлении нод.
+    """
+
+    def __init__(self):
+        self._bot: Optional[Bot] = None
+        self._task: Optional[asyncio.Task] = None
+        self._lease = coordination_service.lease("node-metrics")
+        self._states: Dict[str, Dict[str, Any]] = {}
+        self._confirmed: Dict[str, str] = {}
+        self._pending: Dict[str, Tuple[str, int]] = {}
+        self._rolled_up_until: Optional[datetime] = None
+        self.last_sample: Optional[datetime] = None
+
+    def set_bot(self, bot: Bot):
+        self._bot = bot
+
+    async def start(self):
+        if settings.NODE_METRICS_INTERVAL <= 0:
+            logger.info("ℹ️ Сбор метрик нод отключен")
+            return
+        if self._task and not self._task.done():
+            return
+
+        self._task = asyncio.create_task(self._loop(), name="node-metrics")
+        logger.info("✅ Сбор метрик нод запущен")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self._lease.release()
+
+    async def _loop(self):
+        while True:
+            try:
+                if await self._lease.acquire():
+                    await self.sample_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка сбора метрик нод: {e}", exc_info=True)
+
+            await asyncio.sleep(settings.NODE_METRICS_INTERVAL)
+
+    def _is_fresh(self) -> bool:
+        if not self.last_sample or settings.NODE_METRICS_INTERVAL <= 0:
+            return False
+        return datetime.utcnow() - self.last_sample < timedelta(seconds=settings.NODE_METRICS_INTERVAL * 3)
+
+    def get_nodes_state(self) -> Optional[List[Dict[str, Any]]]:
+        """Последнее состояние всех нод или None, если данных сборщика нет или они устарели"""
+        if not self._is_fresh():
+            return None
+        return list(self._states.values())
+
+    def get_node_state(self, node_uuid: str) -> Optional[Dict[str, Any]]:
+        if not self._is_fresh():
+            return None
+        return self._states.get(node_uuid)
+
+    def invalidate(self):
+        # После действий админа над нодами экраны до следующего замера берут живые данные
+        self.last_sample = None
+
+    async def sample_once(self) -> int:
+        api = RemnaWaveAPI(
+            base_url=settings.REMNAWAVE_API_URL,
+            api_key=settings.REMNAWAVE_API_KEY,
+            secret_key=settings.REMNAWAVE_SECRET_KEY
+        )
+        async with api:
+            nodes, realtime = await asyncio.gather(
+                api.get_all_nodes(), api.get_nodes_realtime_usage(), return_exceptions=True
+            )
+
+        if isinstance(nodes, Exception):
+            logger.warning(f"⚠️ Не удалось получить список нод: {nodes}")
+            return 0
+        if isinstance(realtime, Exception):
+            logger.warning(f"⚠️ Не удалось получить реалтайм статистику нод: {realtime}")
+            realtime = []
+
+        realtime_by_uuid = {item.get("nodeUuid"): item for item in realtime}
+        sampled_at = datetime.utcnow().replace(microsecond=0)
+
+        states: Dict[str, Dict[str, Any]] = {}
+        samples = []
+        for node in nodes:
+            state = node_to_dict(node)
+            state["realtime"] = realtime_by_uuid.get(node.uuid)
+            state["status"] = node_status(state)
+            state["sampled_at"] = sampled_at.isoformat()
+            states[node.uuid] = state
+
+            usage = state["realtime"] or {}
+            samples.append({
+                "uuid": node.uuid,
+                "healthy": state["status"] == "online",
+                "users_online": state["users_online"],
+                "download_bps": int(usage.get("downloadSpeedBps") or 0),
+                "upload_bps": int(usage.get("uploadSpeedBps") or 0),
+                "traffic_used_bytes": state["traffic_used_bytes"]
+            })
+
+        self._states = states
+        self.last_sample = sampled_at
+        await SystemCache.set_nodes_state(states, expire=settings.NODE_METRICS_INTERVAL * 3)
+
+        async with AsyncSessionLocal() as db:
+            if samples:
+                await add_node_samples(db, samples, sampled_at)
+            await self._rollup(db, sampled_at)
+
+        await self._detect_transitions(states)
+        return len(samples)
+
+    async def _rollup(self, db, now: datetime):
+        bucket = floor_bucket(now, FIVE_MINUTES)
+        if self._rolled_up_until == bucket:
+            return
+
+        created = await rollup_node_metrics(db, RAW_RESOLUTION, FIVE_MINUTES, now)
+        created += await rollup_node_metrics(db, FIVE_MINUTES, ONE_HOUR, now)
+
+        removed = await delete_node_metrics_before(
+            db, RAW_RESOLUTION, now - timedelta(hours=settings.NODE_METRICS_RAW_RETENTION_HOURS)
+        )
+        removed += await delete_node_metrics_before(
+            db, FIVE_MINUTES, now - timedelta(days=settings.NODE_METRICS_5M_RETENTION_DAYS)
+        )
+        removed += await delete_node_metrics_before(
+            db, ONE_HOUR, now - timedelta(days=settings.NODE_METRICS_1H_RETENTION_DAYS)
+        )
+
+        self._rolled_up_until = bucket
+        if created or removed:
+            logger.debug(f"Метрики нод: свернуто корзин {created}, удалено устаревших строк {removed}")
+
+    async def _detect_transitions(self, states: Dict[str, Dict[str, Any]]):
+        """
+        Смена статуса подтверждается NODE_METRICS_ALERT_CONFIRM_SAMPLES замерами
+        подряд, чтобы одиночный сбой опроса не давал пару уведомлений.
+        """
+        for node_uuid in list(self._confirmed):
+            if node_uuid not in states:
+                self._confirmed.pop(node_uuid, None)
+                self._pending.pop(node_uuid, None)
+
+        for node_uuid, state in states.items():
+            status = state["status"]
+            confirmed = self._confirmed.get(node_uuid)
+
+            if confirmed is None:
+                self._confirmed[node_uuid] = status
+                if status in ("offline", "xray_down"):
+                    logger.warning(f"⚠️ Нода {state['name']} при запуске сбора в статусе {status}")
+                continue
+
+            if status == confirmed:
+                self._pending.pop(node_uuid, None)
+                continue
+
+            pending_status, count = self._pending.get(node_uuid, (status, 0))
+            count = count + 1 if pending_status == status else 1
+            if count < settings.NODE_METRICS_ALERT_CONFIRM_SAMPLES:
+                self._pending[node_uuid] = (status, count)
+                continue
+
+            self._pending.pop(node_uuid, None)
+            self._confirmed[node_uuid] = status
+            logger.warning(f"🖥️ Нода {state['name']}: {confirmed} → {status}")
+
+            # Включение и отключение ноды - действие админа, о нем не уведомляем
+            if "disabled" in (confirmed, status) or not self._bot:
+                continue
+
+            from app.services.admin_notification_service import AdminNotificationService
+            await AdminNotificationService(self._bot).send_node_status_notification(state, confirmed, status)
+
+    async def get_node_history(self, node_uuid: str, hours: int = 24, points: int = 24) -> Dict[str, Any]:
+        """
+        История ноды из локального ряда: онлайн пользователей и скорость по
+        points интервалам за hours часов, доступность за сутки и за неделю.
+        """
+        now = datetime.utcnow()
+        since = now - timedelta(hours=hours)
+        step = timedelta(hours=hours) / points
+
+        async with AsyncSessionLocal() as db:
+            recent = await get_node_metrics(db, node_uuid, since, FIVE_MINUTES)
+            weekly = await get_node_metrics(db, node_uuid, now - timedelta(days=7), ONE_HOUR)
+
+        users: List[List[float]] = [[0.0, 0] for _ in range(points)]
+        bandwidth: List[List[float]] = [[0.0, 0] for _ in range(points)]
+        for row in recent:
+            index = min(points - 1, int((row.bucket_at - since) / step))
+            users[index][0] += row.users_online_avg * row.samples
+            users[index][1] += row.samples
+            bandwidth[index][0] += (row.download_bps + row.upload_bps) * row.samples
+            bandwidth[index][1] += row.samples
+
+        def availability(rows) -> Optional[float]:
+            samples = sum(row.samples for row in rows)
+            if not samples:
+                return None
+            return sum(row.online_samples for row in rows) / samples * 100
+
+        return {
+            "users_online": [total / count if count else None for total, count in users],
+            "bandwidth_bps": [total / count if count else None for total, count in bandwidth],
+            "users_online_max": max((row.users_online_max for row in recent), default=0),
+            "availability_day": availability(recent),
+            "availability_week": availability(weekly),
+            "samples": sum(row.samples for row in recent)
+        }
+
+
+node_metrics_service = NodeMetricsService()
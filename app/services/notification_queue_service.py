@@ -0,0 +1,452 @@
+import asyncio
+import heapq
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass, field, asdict
+from typing import Optional, Dict, Any, List, Tuple, Union
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter, TelegramForbiddenError, TelegramBadRequest
+from aiogram.types import InlineKeyboardMarkup
+
+from app.config import settings
+from app.services.delivery_health_service import delivery_health_service
+from app.utils.cache import cache
+
+logger = logging.getLogger(__name__)
+
+
+STREAM_KEY = "notifications:stream"
+DELAYED_KEY = "notifications:delayed"
+GROUP_NAME = "notification-workers"
+RECLAIM_IDLE_MS = 60_000
+
+
+@dataclass
+class OutboundMessage:
+    chat_id: Union[int, str]
+    text: str
+    parse_mode: Optional[str] = "HTML"
+    reply_markup: Optional[Dict[str, Any]] = None
+    message_thread_id: Optional[int] = None
+    disable_web_page_preview: Optional[bool] = None
+    max_attempts: int = 0
+    attempts: int = 0
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+
+    def dumps(self) -> str:
+        return json.dumps(asdict(self), ensure_ascii=False)
+
+    @classmethod
+    def loads(cls, raw: Union[str, bytes]) -> "OutboundMessage":
+        return cls(**json.loads(raw))
+
+
+@dataclass
+class _Digest:
+    until: float
+    message: OutboundMessage
+    suppressed: int = 0
+
+
+class NotificationQueueService:
+    """
+    Очередь исходящих сообщений: бизнес-код ставит сообщение и сразу
+    возвращается, отправкой занимаются воркеры с глобальным и поштучным
+    по чату лимитом Telegram. Очередь хранится в Redis Stream, при
+    недоступности Redis - в памяти процесса.
+    """
+
+    def __init__(self):
+        self._bot: Optional[Bot] = None
+        self._tasks: List[asyncio.Task] = []
+        self._local: asyncio.Queue = asyncio.Queue()
+        self._delayed: List[Tuple[float, str, OutboundMessage]] = []
+        self._digests: Dict[str, _Digest] = {}
+        self._rate_lock = asyncio.Lock()
+        self._next_global = 0.0
+        self._next_chat: Dict[Union[int, str], float] = {}
+        self._failing: set = set()
+        self._consumer = f"{socket.gethostname()}-{os.getpid()}"
+        self._group_ready = False
+        self.stats = Counter()
+
+    def set_bot(self, bot: Bot):
+        self._bot = bot
+
+    @property
+    def is_running(self) -> bool:
+        return any(not task.done() for task in self._tasks)
+
+    @property
+    def _redis(self):
+        return cache.redis_client if cache.is_connected else None
+
+    async def enqueue(
+        self,
+        chat_id: Union[int, str],
+        text: str,
+        parse_mode: Optional[str] = "HTML",
+        reply_markup: Optional[InlineKeyboardMarkup] = None,
+        message_thread_id: Optional[int] = None,
+        disable_web_page_preview: Optional[bool] = None,
+        max_attempts: Optional[int] = None,
+        digest_key: Optional[str] = None
+    ) -> bool:
+        """
+        Ставит сообщение в очередь. С digest_key одинаковые уведомления в
+        пределах NOTIFICATION_DIGEST_WINDOW отправляются один раз, а
+        повторы сворачиваются в одно сводное сообщение в конце окна.
+        """
+        if not chat_id:
+            return False
+
+        message = OutboundMessage(
+            chat_id=chat_id,
+            text=text,
+            parse_mode=parse_mode,
+            reply_markup=reply_markup.model_dump(exclude_none=True) if reply_markup else None,
+            message_thread_id=message_thread_id,
+            disable_web_page_preview=disable_web_page_preview,
+            max_attempts=max_attempts or settings.NOTIFICATION_MAX_ATTEMPTS
+        )
+
+        if digest_key:
+            digest_key = f"{chat_id}:{digest_key}"
+            digest = self._digests.get(digest_key)
+            if digest and digest.until > time.monotonic():
+                digest.suppressed += 1
+                digest.message = message
+                self.stats["collapsed"] += 1
+                return True
+            self._digests[digest_key] = _Digest(
+                until=time.monotonic() + settings.NOTIFICATION_DIGEST_WINDOW, message=message
+            )
+
+        await self._push(message)
+        self.stats["enqueued"] += 1
+        return True
+
+    async def enqueue_admin(self, text: str, digest_key: Optional[str] = None) -> bool:
+        """Уведомление в чат администраторов (ADMIN_NOTIFICATIONS_CHAT_ID и топик)"""
+        chat_id = settings.get_admin_notifications_chat_id()
+        if not chat_id:
+            return False
+
+        return await self.enqueue(
+            chat_id, text,
+            message_thread_id=settings.ADMIN_NOTIFICATIONS_TOPIC_ID,
+            disable_web_page_preview=True,
+            digest_key=digest_key
+        )
+
+    async def _push(self, message: OutboundMessage):
+        redis = self._redis
+        if redis is not None:
+            try:
+                await redis.xadd(
+                    STREAM_KEY, {"data": message.dumps()},
+                    maxlen=settings.NOTIFICATION_STREAM_MAXLEN, approximate=True
+                )
+                return
+            except Exception as e:
+                logger.warning(f"⚠️ Redis недоступен для очереди уведомлений, используем память: {e}")
+
+        self._local.put_nowait((message, None))
+
+    async def _schedule_retry(self, message: OutboundMessage, delay: float):
+        due = time.time() + delay
+        redis = self._redis
+        if redis is not None:
+            try:
+                await redis.zadd(DELAYED_KEY, {message.dumps(): due})
+                return
+            except Exception as e:
+                logger.warning(f"⚠️ Не удалось отложить уведомление в Redis: {e}")
+
+        heapq.heappush(self._delayed, (due, message.id, message))
+
+    async def start(self):
+        if self.is_running:
+            return
+
+        await self._ensure_group()
+        self._tasks = [
+            asyncio.create_task(self._worker_loop(index), name=f"notification-worker-{index}")
+            for index in range(settings.NOTIFICATION_QUEUE_WORKERS)
+        ]
+        self._tasks.append(asyncio.create_task(self._maintenance_loop(), name="notification-maintenance"))
+        logger.info(f"✅ Очередь уведомлений запущена: {settings.NOTIFICATION_QUEUE_WORKERS} воркеров")
+
+    async def stop(self, timeout: float = 10.0):
+        if not self._tasks:
+            return
+
+        deadline = time.monotonic() + timeout
+        while not self._local.empty() and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        if not self._local.empty():
+            logger.warning(f"⚠️ Не отправлено уведомлений из памяти: {self._local.qsize()}")
+
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _ensure_group(self):
+        redis = self._redis
+        if redis is None or self._group_ready:
+            return
+        try:
+            await redis.xgroup_create(STREAM_KEY, GROUP_NAME, id="0", mkstream=True)
+        except Exception as e:
+            if "BUSYGROUP" not in str(e):
+                logger.warning(f"⚠️ Не удалось создать группу очереди уведомлений: {e}")
+                return
+        self._group_ready = True
+
+    async def _next_item(self, consumer: str) -> Optional[Tuple[OutboundMessage, Optional[str]]]:
+        try:
+            return self._local.get_nowait()
+        except asyncio.QueueEmpty:
+            pass
+
+        redis = self._redis
+        if redis is not None and self._group_ready:
+            try:
+                response = await redis.xreadgroup(GROUP_NAME, consumer, {STREAM_KEY: ">"}, count=1, block=1000)
+            except Exception as e:
+                if "NOGROUP" in str(e):
+                    self._group_ready = False
+                logger.warning(f"⚠️ Ошибка чтения очереди уведомлений: {e}")
+                await asyncio.sleep(1)
+                return None
+
+            for _, entries in response or []:
+                for entry_id, fields in entries:
+                    return OutboundMessage.loads(fields[b"data"]), entry_id
+            return None
+
+        try:
+            return await asyncio.wait_for(self._local.get(), timeout=1.0)
+        except asyncio.TimeoutError:
+            return None
+
+    async def _ack(self, entry_id: Optional[str]):
+        if entry_id is None or self._redis is None:
+            return
+        try:
+            await self._redis.xack(STREAM_KEY, GROUP_NAME, entry_id)
+            await self._redis.xdel(STREAM_KEY, entry_id)
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось подтвердить уведомление {entry_id}: {e}")
+
+    async def _worker_loop(self, index: int):
+        consumer = f"{self._consumer}-{index}"
+        while True:
+            try:
+                item = await self._next_item(consumer)
+                if item is None:
+                    continue
+
+                message, entry_id = item
+                try:
+                    await self._deliver(message)
+                finally:
+                    await self._ack(entry_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка воркера очереди уведомлений: {e}", exc_info=True)
+                await asyncio.sleep(1)
+
+    async def _acquire_slot(self, chat_id: Union[int, str]) -> float:
+        """
+        Резервирует время отправки под общим лимитом бота и лимитом чата.
+        Если чат занят дольше секунды, возвращает задержку вместо ожидания,
+        чтобы воркер не простаивал из-за одного чата.
+        """
+        is_group = isinstance(chat_id, str) or chat_id < 0
+        chat_interval = settings.NOTIFICATION_GROUP_INTERVAL if is_group else settings.NOTIFICATION_CHAT_INTERVAL
+
+        async with self._rate_lock:
+            now = time.monotonic()
+            chat_ready = self._next_chat.get(chat_id, 0.0)
+            if chat_ready - now > 1.0:
+                return chat_ready - now
+
+            slot = max(now, self._next_global, chat_ready)
+            self._next_global = slot + 1 / settings.NOTIFICATION_GLOBAL_RATE
+            self._next_chat[chat_id] = slot + chat_interval
+
+        if slot > now:
+            await asyncio.sleep(slot - now)
+        return 0.0
+
+    async def _deliver(self, message: OutboundMessage):
+        if not self._bot:
+            await self._schedule_retry(message, settings.NOTIFICATION_RETRY_BASE_DELAY)
+            return
+
+        defer = await self._acquire_slot(message.chat_id)
+        if defer:
+            self.stats["deferred"] += 1
+            await self._schedule_retry(message, defer)
+            return
+
+        message.attempts += 1
+
+        try:
+            kwargs = {
+                "chat_id": message.chat_id,
+                "text": message.text,
+                "parse_mode": message.parse_mode,
+            }
+            if message.reply_markup:
+                kwargs["reply_markup"] = InlineKeyboardMarkup.model_validate(message.reply_markup)
+            if message.message_thread_id:
+                kwargs["message_thread_id"] = message.message_thread_id
+            if message.disable_web_page_preview is not None:
+                kwargs["disable_web_page_preview"] = message.disable_web_page_preview
+
+            await self._bot.send_message(**kwargs)
+            self.stats["sent"] += 1
+            if message.chat_id in self._failing:
+                self._failing.discard(message.chat_id)
+                await delivery_health_service.record_success(message.chat_id)
+
+        except TelegramRetryAfter as e:
+            # Flood control действует на весь бот: сдвигаем общий лимит и не считаем попытку
+            async with self._rate_lock:
+                self._next_global = max(self._next_global, time.monotonic() + e.retry_after)
+            message.attempts -= 1
+            self.stats["flood_wait"] += 1
+            await self._schedule_retry(message, e.retry_after)
+
+        except TelegramForbiddenError as e:
+            self.stats["blocked"] += 1
+            await self._mark_blocked(message.chat_id)
+            logger.info(f"🚫 Чат {message.chat_id} недоступен для бота: {e.message}")
+
+        except TelegramBadRequest as e:
+            self.stats["rejected"] += 1
+            logger.error(f"❌ Telegram отклонил уведомление в чат {message.chat_id}: {e.message}")
+
+        except Exception as e:
+            if message.attempts >= message.max_attempts:
+                self.stats["failed"] += 1
+                logger.error(
+                    f"❌ Уведомление в чат {message.chat_id} не отправлено после {message.attempts} попыток: {e}"
+                )
+                return
+
+            delay = settings.NOTIFICATION_RETRY_BASE_DELAY * 2 ** (message.attempts - 1)
+            self.stats["retried"] += 1
+            logger.warning(
+                f"⚠️ Ошибка отправки в чат {message.chat_id} "
+                f"(попытка {message.attempts}/{message.max_attempts}), повтор через {delay:.1f}с: {e}"
+            )
+            await self._schedule_retry(message, delay)
+
+    async def _mark_blocked(self, chat_id: Union[int, str]):
+        """Пользователь заблокировал бота: учитываем отказ, чтобы исключать его из рассылок"""
+        if isinstance(chat_id, int) and chat_id > 0:
+            self._failing.add(chat_id)
+            await delivery_health_service.record_failure(chat_id)
+
+    async def _maintenance_loop(self):
+        last_reclaim = 0.0
+        while True:
+            try:
+                await self._move_due_retries()
+                await self._flush_digests()
+
+                if time.monotonic() - last_reclaim >= RECLAIM_IDLE_MS / 1000:
+                    last_reclaim = time.monotonic()
+                    await self._ensure_group()
+                    await self._reclaim_stale()
+                    self._prune_rate_state()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка обслуживания очереди уведомлений: {e}", exc_info=True)
+
+            await asyncio.sleep(1)
+
+    async def _move_due_retries(self):
+        now = time.time()
+        while self._delayed and self._delayed[0][0] <= now:
+            _, _, message = heapq.heappop(self._delayed)
+            await self._push(message)
+
+        redis = self._redis
+        if redis is None:
+            return
+
+        due = await redis.zrangebyscore(DELAYED_KEY, 0, now, start=0, num=100)
+        for raw in due:
+            # ZREM возвращает 1 только одному процессу, поэтому повтор не задвоится между репликами
+            if await redis.zrem(DELAYED_KEY, raw):
+                await self._push(OutboundMessage.loads(raw))
+
+    async def _flush_digests(self):
+        now = time.monotonic()
+        for key, digest in list(self._digests.items()):
+            if digest.until > now:
+                continue
+
+            del self._digests[key]
+            if digest.suppressed:
+                message = digest.message
+                message.text += (
+                    f"\n\n🔁 <i>Похожих уведомлений за {settings.NOTIFICATION_DIGEST_WINDOW} с: {digest.suppressed}</i>"
+                    if message.parse_mode == "HTML" else
+                    f"\n\n🔁 Похожих уведомлений за {settings.NOTIFICATION_DIGEST_WINDOW} с: {digest.suppressed}"
+                )
+                await self._push(message)
+
+    async def _reclaim_stale(self):
+        """Забираем сообщения, которые взял и не подтвердил упавший процесс"""
+        redis = self._redis
+        if redis is None or not self._group_ready:
+            return
+
+        _, entries, *_ = await redis.xautoclaim(
+            STREAM_KEY, GROUP_NAME, f"{self._consumer}-reclaim", RECLAIM_IDLE_MS, start_id="0-0", count=100
+        )
+        for entry_id, fields in entries:
+            if fields and b"data" in fields:
+                self._local.put_nowait((OutboundMessage.loads(fields[b"data"]), entry_id))
+        if entries:
+            logger.info(f"♻️ Возвращено в очередь неподтвержденных уведомлений: {len(entries)}")
+
+    def _prune_rate_state(self):
+        now = time.monotonic()
+        self._next_chat = {chat_id: slot for chat_id, slot in self._next_chat.items() if slot > now}
+
+    async def get_stats(self) -> Dict[str, Any]:
+        stream_length = delayed = None
+        if self._redis is not None:
+            try:
+                stream_length = await self._redis.xlen(STREAM_KEY)
+                delayed = await self._redis.zcard(DELAYED_KEY)
+            except Exception:
+                pass
+
+        return {
+            "running": self.is_running,
+            "backend": "redis" if self._redis is not None else "memory",
+            "stream_length": stream_length,
+            "delayed": delayed if delayed is not None else len(self._delayed),
+            "local_queue": self._local.qsize(),
+            "digests_open": len(self._digests),
+            **dict(self.stats),
+        }
+
+
+notification_queue = NotificationQueueService()
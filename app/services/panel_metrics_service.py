@@ -0,0 +1,97 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Optional
+
+from app.config import settings
+from app.services.remnawave_service import RemnaWaveService
+from app.utils.cache import SystemCache
+
+logger = logging.getLogger(__name__)
+
+
+class PanelMetricsService:
+    """
+    Снимок системной статистики Remnawave для админского дашборда.
+    Свежий снимок отдается сразу, устаревший - тоже сразу, но с фоновым
+    обновлением (stale-while-revalidate). Одновременные запросы ждут одно
+    общее обновление, а источники, не ответившие в этот раз, берутся из
+    прошлого снимка.
+    """
+
+    def __init__(self):
+        self._snapshot: Optional[Dict[str, Any]] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    async def get_system_statistics(self) -> Dict[str, Any]:
+        snapshot = await self._load_snapshot()
+
+        if snapshot:
+            age = time.time() - snapshot["collected_at"]
+            if age < settings.REMNAWAVE_STATS_FRESH_SECONDS:
+                return self._present(snapshot)
+            if age < settings.REMNAWAVE_STATS_MAX_AGE_SECONDS:
+                self._start_refresh()
+                return self._present(snapshot)
+
+        # Снимка нет или он слишком старый - ждем общее обновление
+        refreshed = await asyncio.shield(self._start_refresh())
+        if refreshed:
+            return self._present(refreshed)
+        if snapshot:
+            return self._present(snapshot)
+        return {"error": "Remnawave API не ответил ни на один запрос статистики"}
+
+    async def _load_snapshot(self) -> Optional[Dict[str, Any]]:
+        # В Redis может лежать снимок новее локального, если его обновил другой процесс
+        shared = await SystemCache.get_system_stats()
+        if shared and (not self._snapshot or shared["collected_at"] > self._snapshot["collected_at"]):
+            self._snapshot = shared
+        return self._snapshot
+
+    def _start_refresh(self) -> asyncio.Task:
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh(), name="panel-metrics-refresh")
+        return self._refresh_task
+
+    async def _refresh(self) -> Optional[Dict[str, Any]]:
+        service = RemnaWaveService()
+        started = time.monotonic()
+
+        try:
+            fetched = await service.fetch_system_sources()
+        except Exception as e:
+            logger.error(f"Ошибка обновления статистики Remnawave: {e}")
+            return None
+
+        if not fetched:
+            logger.warning("⚠️ Remnawave не ответил ни на один запрос статистики, остается прежний снимок")
+            return None
+
+        sources = dict(self._snapshot["sources"]) if self._snapshot else {}
+        sources.update(fetched)
+
+        stats = service.build_system_statistics(sources)
+        stats["missing_sources"] = [name for name in service.STATISTICS_SOURCES if name not in sources]
+        stats["stale_sources"] = [name for name in sources if name not in fetched]
+
+        snapshot = {"stats": stats, "sources": sources, "collected_at": time.time()}
+        self._snapshot = snapshot
+
+        await SystemCache.set_system_stats(snapshot, expire=settings.REMNAWAVE_STATS_MAX_AGE_SECONDS)
+        if "realtime_usage" in fetched:
+            await SystemCache.set_nodes_status(fetched["realtime_usage"], expire=settings.REMNAWAVE_STATS_MAX_AGE_SECONDS)
+
+        logger.info(
+            f"📊 Снимок статистики Remnawave обновлен за {time.monotonic() - started:.2f} с"
+            + (f", без ответа: {', '.join(stats['stale_sources'])}" if stats["stale_sources"] else "")
+        )
+        return snapshot
+
+    def _present(self, snapshot: Dict[str, Any]) -> Dict[str, Any]:
+        stats = dict(snapshot["stats"])
+        stats["snapshot_age"] = int(time.time() - snapshot["collected_at"])
+        return stats
+
+
+panel_metrics_service = PanelMetricsService()
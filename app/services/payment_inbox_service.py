@@ -0,0 +1,247 @@
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import time
+import weakref
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Optional, Dict, Any, List, Tuple, Callable, Awaitable
+
+from app.config import settings
+from app.database.database import AsyncSessionLocal
+from app.database.models import PaymentEvent
+from app.database.crud.payment_event import (
+    store_payment_event, claim_next_payment_event, mark_payment_event_processed,
+    mark_payment_event_failed, release_stale_payment_events
+)
+
+logger = logging.getLogger(__name__)
+
+
+YOOKASSA_PROVIDER = "yookassa"
+TRIBUTE_PROVIDER = "tribute"
+
+
+def yookassa_event_key(webhook_data: Dict[str, Any]) -> Tuple[str, Optional[str]]:
+    # YooKassa не присылает id уведомления, но пара (событие, платеж) уникальна:
+    # повторные доставки одного уведомления совпадают по ней
+    payment_id = (webhook_data.get("object") or {}).get("id")
+    event_type = webhook_data.get("event", "unknown")
+    return f"{event_type}:{payment_id}", payment_id
+
+
+def tribute_event_key(webhook_data: Dict[str, Any], payload: str) -> Tuple[str, Optional[str]]:
+    # donation_request_id повторяется у регулярных донатов, поэтому ключом
+    # дедупликации служит хеш тела: ретраи Tribute присылают его без изменений
+    data = webhook_data.get("payload") or {}
+    object_id = (
+        webhook_data.get("id") or webhook_data.get("payment_id")
+        or data.get("donation_request_id") or data.get("id")
+    )
+    digest = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    return f"sha256:{digest}", str(object_id) if object_id is not None else None
+
+
+class PaymentInboxService:
+    """Входящая очередь платежных событий: вебхук только сохраняет событие, воркеры его обрабатывают"""
+
+    def __init__(self):
+        self._bot = None
+        self._workers: List[asyncio.Task] = []
+        self._wakeup = asyncio.Event()
+        self._locks: "weakref.WeakValueDictionary[Tuple[str, str], asyncio.Lock]" = weakref.WeakValueDictionary()
+        self._last_stale_check = 0.0
+        self._processors: Dict[str, Callable[[PaymentEvent], Awaitable[None]]] = {
+            YOOKASSA_PROVIDER: self._process_yookassa,
+            TRIBUTE_PROVIDER: self._process_tribute,
+        }
+        self.received = Counter()
+        self.duplicates = Counter()
+        self.processed = Counter()
+        self.retried = Counter()
+        self.dead = Counter()
+
+    def set_bot(self, bot):
+        self._bot = bot
+
+    @property
+    def is_running(self) -> bool:
+        return any(not worker.done() for worker in self._workers)
+
+    def wake(self):
+        self._wakeup.set()
+
+    async def enqueue(
+        self,
+        provider: str,
+        event_id: str,
+        payload: str,
+        event_type: Optional[str] = None,
+        object_id: Optional[str] = None
+    ) -> bool:
+        async with AsyncSessionLocal() as db:
+            stored = await store_payment_event(
+                db, provider, event_id, payload, event_type=event_type, object_id=object_id
+            )
+
+        if stored:
+            self.received[provider] += 1
+            self.wake()
+            logger.info(f"📥 Платежное событие {provider}:{event_type or 'unknown'} поставлено в очередь")
+        else:
+            self.duplicates[provider] += 1
+            logger.info(f"🔁 Повторная доставка события {provider}:{event_id} проигнорирована")
+
+        return stored
+
+    async def start(self):
+        if self.is_running:
+            return
+
+        self._wakeup = asyncio.Event()
+        await self._release_stale()
+
+        self._workers = [
+            asyncio.create_task(self._worker_loop(index), name=f"payment-inbox-{index}")
+            for index in range(max(1, settings.PAYMENT_INBOX_WORKERS))
+        ]
+        logger.info(f"✅ Запущено воркеров очереди платежей: {len(self._workers)}")
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+
+        if self._workers:
+            await asyncio.gather(*self._workers, return_exceptions=True)
+            logger.info("✅ Воркеры очереди платежей остановлены")
+        self._workers = []
+
+    async def _release_stale(self):
+        self._last_stale_check = time.monotonic()
+        try:
+            async with AsyncSessionLocal() as db:
+                await release_stale_payment_events(
+                    db, timedelta(seconds=settings.PAYMENT_INBOX_STALE_TIMEOUT)
+                )
+        except Exception as e:
+            logger.error(f"Ошибка возврата зависших платежных событий: {e}")
+
+    async def _worker_loop(self, index: int):
+        while True:
+            self._wakeup.clear()
+
+            try:
+                handled = await self._process_next()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка воркера очереди платежей #{index}: {e}", exc_info=True)
+                handled = False
+
+            if handled:
+                continue
+
+            if index == 0 and time.monotonic() - self._last_stale_check > settings.PAYMENT_INBOX_STALE_TIMEOUT / 2:
+                await self._release_stale()
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=settings.PAYMENT_INBOX_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _process_next(self) -> bool:
+        async with AsyncSessionLocal() as db:
+            event = await claim_next_payment_event(db)
+        if event is None:
+            return False
+
+        # События одного платежа обрабатываем последовательно, разные - параллельно
+        lock_key = (event.provider, event.object_id or event.event_id)
+        lock = self._locks.get(lock_key)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._locks[lock_key] = lock
+
+        async with lock:
+            processor = self._processors.get(event.provider)
+            try:
+                if processor is None:
+                    raise ValueError(f"Нет обработчика для провайдера {event.provider}")
+                await processor(event)
+            except Exception as e:
+                await self._handle_failure(event, e)
+                return True
+
+            async with AsyncSessionLocal() as db:
+                await mark_payment_event_processed(db, event.id)
+
+        self.processed[event.provider] += 1
+        logger.info(f"✅ Платежное событие #{event.id} ({event.provider}:{event.event_type}) обработано")
+        return True
+
+    def _retry_delay(self, attempts: int) -> float:
+        delay = min(
+            settings.PAYMENT_INBOX_RETRY_BASE_DELAY * 2 ** (attempts - 1),
+            settings.PAYMENT_INBOX_RETRY_MAX_DELAY
+        )
+        return delay * random.uniform(0.8, 1.2)
+
+    async def _handle_failure(self, event: PaymentEvent, error: Exception):
+        error_text = f"{type(error).__name__}: {error}"
+
+        if event.attempts >= settings.PAYMENT_INBOX_MAX_ATTEMPTS:
+            retry_at = None
+            self.dead[event.provider] += 1
+            logger.error(
+                f"☠️ Платежное событие #{event.id} ({event.provider}:{event.event_type}) "
+                f"перемещено в dead-letter после {event.attempts} попыток: {error_text}"
+            )
+        else:
+            delay = self._retry_delay(event.attempts)
+            retry_at = datetime.utcnow() + timedelta(seconds=delay)
+            self.retried[event.provider] += 1
+            logger.warning(
+                f"⚠️ Ошибка обработки платежного события #{event.id} "
+                f"(попытка {event.attempts}/{settings.PAYMENT_INBOX_MAX_ATTEMPTS}), "
+                f"повтор через {delay:.0f}с: {error_text}"
+            )
+
+        async with AsyncSessionLocal() as db:
+            await mark_payment_event_failed(db, event.id, error_text, retry_at)
+
+    async def _process_yookassa(self, event: PaymentEvent):
+        from app.services.payment_service import PaymentService
+
+        webhook_data = json.loads(event.payload)
+        payment_service = PaymentService(self._bot)
+
+        async with AsyncSessionLocal() as db:
+            success = await payment_service.process_yookassa_webhook(db, webhook_data)
+
+        if not success:
+            raise RuntimeError("process_yookassa_webhook вернул ошибку")
+
+    async def _process_tribute(self, event: PaymentEvent):
+        from app.services.tribute_service import TributeService
+
+        result = await TributeService(self._bot).process_webhook(event.payload)
+        if result.get("status") == "error":
+            raise RuntimeError(f"Tribute: {result.get('reason')}")
+
+    def get_stats(self) -> Dict[str, Dict[str, int]]:
+        providers = set(self.received) | set(self.duplicates) | set(self.processed) | set(self.dead)
+        return {
+            provider: {
+                "received": self.received[provider],
+                "duplicates": self.duplicates[provider],
+                "processed": self.processed[provider],
+                "retried": self.retried[provider],
+                "dead": self.dead[provider],
+            }
+            for provider in providers
+        }
+
+
+payment_inbox_service = PaymentInboxService()
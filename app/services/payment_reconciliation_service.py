@@ -0,0 +1,271 @@
+import asyncio
+import json
+import logging
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Optional, Dict, Any
+
+from aiogram import Bot
+
+from app.config import settings
+from app.database.database import AsyncSessionLocal
+from app.database.models import TransactionType, PaymentMethod, CryptoInvoice
+from app.database.crud.crypto_invoice import (
+    get_crypto_invoice, get_active_crypto_invoices, claim_crypto_invoice_payment,
+    update_crypto_invoice_status
+)
+from app.database.crud.user import apply_balance_change, BalanceChange, LedgerEntry, get_user_by_id
+from app.database.crud.yookassa import get_pending_yookassa_payments, update_yookassa_payment_status
+from app.services.crypto_payment_service import CryptoPaymentService
+from app.services.coordination_service import coordination_service
+from app.services.payment_inbox_service import payment_inbox_service, yookassa_event_key, YOOKASSA_PROVIDER
+
+logger = logging.getLogger(__name__)
+
+
+YOOKASSA_MAX_PAGES = 10
+WAKE_CHANNEL = "reconciliation:wake"
+
+
+class PaymentReconciliationService:
+    """Фоновая сверка неоплаченных счетов с провайдерами пачечными запросами"""
+
+    def __init__(self):
+        self._bot: Optional[Bot] = None
+        self._task: Optional[asyncio.Task] = None
+        self._lease = coordination_service.lease("payment-reconciliation")
+        self._wakeup = asyncio.Event()
+        self._crypto = CryptoPaymentService()
+        self._yookassa = None
+        self.api_calls = Counter()
+        self.credited = Counter()
+        self.last_run: Optional[datetime] = None
+        self._wake_publish: Optional[asyncio.Task] = None
+        coordination_service.subscribe(WAKE_CHANNEL, self._on_wake)
+
+    def set_bot(self, bot: Bot):
+        self._bot = bot
+
+    def wake(self):
+        """Новый счет: переходим на частый опрос, не дожидаясь текущей паузы"""
+        self._wakeup.set()
+        if not self._lease.is_held:
+            # Сверку ведет другая реплика - будим ее
+            self._wake_publish = asyncio.create_task(coordination_service.publish(WAKE_CHANNEL))
+
+    async def _on_wake(self, payload: Dict[str, Any]):
+        if not payload.get("resync"):
+            self._wakeup.set()
+
+    async def start(self):
+        if not settings.RECONCILIATION_ENABLED:
+            logger.info("ℹ️ Сверка платежей отключена")
+            return
+        if self._task and not self._task.done():
+            return
+
+        if settings.is_yookassa_enabled():
+            from app.services.yookassa_service import YooKassaService
+            self._yookassa = YooKassaService()
+
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._loop(), name="payment-reconciliation")
+        logger.info("✅ Сверка платежей запущена")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self._lease.release()
+        await CryptoPaymentService.close()
+
+    async def _loop(self):
+        while True:
+            self._wakeup.clear()
+
+            try:
+                hot = await self.reconcile_once() if await self._lease.acquire() else False
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка сверки платежей: {e}", exc_info=True)
+                hot = False
+
+            interval = settings.RECONCILIATION_FAST_INTERVAL if hot else settings.RECONCILIATION_IDLE_INTERVAL
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def reconcile_once(self) -> bool:
+        """Возвращает True, если есть свежие неоплаченные счета и опрашивать нужно часто"""
+        self.last_run = datetime.utcnow()
+        crypto_hot = await self._reconcile_crypto()
+        yookassa_hot = await self._reconcile_yookassa()
+        return crypto_hot or yookassa_hot
+
+    @staticmethod
+    def _is_hot(created_at: Optional[datetime]) -> bool:
+        return bool(created_at) and created_at >= datetime.utcnow() - timedelta(
+            seconds=settings.RECONCILIATION_HOT_WINDOW
+        )
+
+    async def _reconcile_crypto(self) -> bool:
+        created_after = datetime.utcnow() - timedelta(hours=settings.RECONCILIATION_MAX_AGE_HOURS)
+
+        async with AsyncSessionLocal() as db:
+            invoices = await get_active_crypto_invoices(db, created_after)
+        if not invoices:
+            return False
+
+        self.api_calls["cryptobot"] += 1
+        items = await self._crypto.get_invoices([invoice.invoice_id for invoice in invoices])
+        if items is None:
+            return any(self._is_hot(invoice.created_at) for invoice in invoices)
+
+        expired = []
+        for item in items:
+            status = item.get("status")
+            if status == "paid":
+                await self.credit_crypto_invoice(int(item["invoice_id"]), notify=True)
+            elif status == "expired":
+                expired.append(int(item["invoice_id"]))
+
+        if expired:
+            async with AsyncSessionLocal() as db:
+                await update_crypto_invoice_status(db, expired, "expired")
+
+        paid_or_expired = {int(item["invoice_id"]) for item in items if item.get("status") != "active"}
+        return any(
+            self._is_hot(invoice.created_at)
+            for invoice in invoices if invoice.invoice_id not in paid_or_expired
+        )
+
+    async def credit_crypto_invoice(self, invoice_id: int, notify: bool = False) -> Optional[LedgerEntry]:
+        """Идемпотентное зачисление счета: повторные вызовы для оплаченного счета ничего не делают"""
+        async with AsyncSessionLocal() as db:
+            if not await claim_crypto_invoice_payment(db, invoice_id):
+                return None
+
+            invoice = await get_crypto_invoice(db, invoice_id)
+            entry = await apply_balance_change(db, BalanceChange(
+                user_id=invoice.user_id,
+                amount_kopeks=invoice.amount_kopeks,
+                description=f"Пополнение через CryptoBot ({invoice.amount} {invoice.asset})",
+                transaction_type=TransactionType.DEPOSIT,
+                payment_method=PaymentMethod.CRYPTOBOT,
+                external_id=f"cryptobot_{invoice_id}"
+            ), commit=False)
+            if entry is None:
+                # Оплату не теряем: счет остается в БД со статусом failed для ручного разбора
+                invoice.status = "failed"
+                await db.commit()
+                logger.error(f"❌ Счет CryptoBot {invoice_id} оплачен, но пользователь {invoice.user_id} не найден")
+                return None
+
+            invoice.transaction_id = entry.transaction.id
+            await db.commit()
+
+            self.credited["cryptobot"] += 1
+            logger.info(f"✅ Зачислен счет CryptoBot {invoice_id}: {invoice.amount_kopeks/100}₽ пользователю {invoice.user_id}")
+
+            await self._after_topup(db, invoice, notify)
+            return entry
+
+    async def _after_topup(self, db, invoice: CryptoInvoice, notify: bool):
+        try:
+            from app.services.referral_service import process_referral_topup
+            await process_referral_topup(
+                db, invoice.user_id, invoice.amount_kopeks, self._bot, invoice.transaction_id
+            )
+        except Exception as e:
+            logger.error(f"Ошибка обработки реферального пополнения CryptoBot: {e}")
+
+        if not (notify and self._bot):
+            return
+
+        try:
+            user = await get_user_by_id(db, invoice.user_id)
+            await self._bot.send_message(
+                user.telegram_id,
+                f"✅ <b>Пополнение успешно!</b>\n\n"
+                f"💰 Сумма: {settings.format_price(invoice.amount_kopeks)}\n"
+                f"🪙 Способ: CryptoBot ({invoice.amount} {invoice.asset})\n\n"
+                f"Баланс пополнен автоматически!",
+                parse_mode="HTML"
+            )
+        except Exception as e:
+            logger.error(f"Ошибка отправки уведомления о пополнении CryptoBot: {e}")
+
+    async def _reconcile_yookassa(self) -> bool:
+        if not self._yookassa:
+            return False
+
+        created_after = datetime.utcnow() - timedelta(hours=settings.RECONCILIATION_MAX_AGE_HOURS)
+
+        async with AsyncSessionLocal() as db:
+            pending = [
+                payment for payment in await get_pending_yookassa_payments(db, limit=1000)
+                if payment.created_at and payment.created_at >= created_after
+            ]
+        if not pending:
+            return False
+
+        pending_ids = {payment.yookassa_payment_id for payment in pending}
+        since = min(payment.created_at for payment in pending) - timedelta(minutes=10)
+        resolved = set()
+        cursor = None
+
+        # Вместо запроса на каждый платеж листаем все платежи магазина с момента самого старого
+        for _ in range(YOOKASSA_MAX_PAGES):
+            self.api_calls["yookassa"] += 1
+            page = await self._yookassa.list_payments(created_at_gte=since, cursor=cursor)
+            if page is None:
+                break
+
+            for item in page["items"]:
+                if item.get("id") in pending_ids and await self._apply_yookassa_item(item):
+                    resolved.add(item["id"])
+
+            cursor = page.get("next_cursor")
+            if not cursor or resolved == pending_ids:
+                break
+
+        return any(
+            self._is_hot(payment.created_at)
+            for payment in pending if payment.yookassa_payment_id not in resolved
+        )
+
+    async def _apply_yookassa_item(self, item: Dict[str, Any]) -> bool:
+        status = item.get("status")
+
+        if status in ("succeeded", "waiting_for_capture"):
+            # Идем тем же путем, что и вебхук: ключ события совпадает,
+            # поэтому пришедший позже (или раньше) вебхук станет дублем
+            webhook_data = {"type": "notification", "event": f"payment.{status}", "object": item}
+            event_id, payment_id = yookassa_event_key(webhook_data)
+            if await payment_inbox_service.enqueue(
+                YOOKASSA_PROVIDER, event_id, json.dumps(webhook_data, ensure_ascii=False, default=str),
+                event_type=webhook_data["event"], object_id=payment_id
+            ):
+                self.credited["yookassa"] += 1
+            return status == "succeeded"
+
+        if status == "canceled":
+            async with AsyncSessionLocal() as db:
+                await update_yookassa_payment_status(db, item["id"], "canceled")
+            return True
+
+        return False
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "running": bool(self._task and not self._task.done()),
+            "last_run": self.last_run,
+            "api_calls": dict(self.api_calls),
+            "credited": dict(self.credited),
+        }
+
+
+payment_reconciliation_service = PaymentReconciliationService()
@@ -12,7 +12,9 @@ from app.services.yookassa_service import YooKassaService
 from app.external.telegram_stars import TelegramStarsService
 from app.database.crud.yookassa import create_yookassa_payment, link_yookassa_payment_to_transaction
 from app.database.crud.transaction import create_transaction
-from app.database.crud.user import add_user_balance, get_user_by_id
+from app.database.crud.user import (
+    add_user_balance, get_user_by_id, apply_balance_change, BalanceChange
+)
 from app.database.models import TransactionType, PaymentMethod
 
 logger = logging.getLogger(__name__)
@@ -67,26 +69,22 @@ class PaymentService:
             rubles_amount = TelegramStarsService.calculate_rubles_from_stars(stars_amount)
             amount_kopeks = int(rubles_amount * 100)
             
-            transaction = await create_transaction(
-                db=db,
-                user_id=user_id,
-                type=TransactionType.DEPOSIT,
-                amount_kopeks=amount_kopeks,
-                description=f"Пополнение через Telegram Stars ({stars_amount} ⭐)",
-                payment_method=PaymentMethod.TELEGRAM_STARS,
-                external_id=telegram_payment_charge_id,
-                is_completed=True
-            )
-            
             user = await get_user_by_id(db, user_id)
             if user:
                 old_balance = user.balance_kopeks
                 
-                user.balance_kopeks += amount_kopeks
-                user.updated_at = datetime.utcnow()
-                
-                await db.commit()
-                await db.refresh(user)
+                entry = await apply_balance_change(db, BalanceChange(
+                    user_id=user_id,
+                    amount_kopeks=amount_kopeks,
+                    description=f"Пополнение через Telegram Stars ({stars_amount} ⭐)",
+                    transaction_type=TransactionType.DEPOSIT,
+                    payment_method=PaymentMethod.TELEGRAM_STARS,
+                    external_id=telegram_payment_charge_id
+                ))
+                if entry is None:
+                    logger.error(f"❌ Stars платеж {telegram_payment_charge_id} принят, но пользователь {user_id} не найден при зачислении")
+                    return False
+                transaction = entry.transaction
                 
                 logger.info(f"💰 Баланс пользователя {user.telegram_id} изменен: {old_balance} → {user.balance_kopeks} (изменение: +{amount_kopeks})")
                 
@@ -97,7 +95,7 @@ class PaymentService:
                     logger.info(f"🔞 Вызов process_referral_topup для пользователя {user_id}")
                     try:
                         from app.services.referral_service import process_referral_topup
-                        await process_referral_topup(db, user_id, amount_kopeks, self.bot)
+                        await process_referral_topup(db, user_id, amount_kopeks, self.bot, transaction.id)
                     except Exception as e:
                         logger.error(f"Ошибка обработки реферального пополнения: {e}")
                 else:
@@ -229,8 +227,6 @@ class PaymentService:
                 update_yookassa_payment_status,
                 link_yookassa_payment_to_transaction
             )
-            from app.database.crud.transaction import create_transaction
-            from app.database.models import TransactionType, PaymentMethod
             
             payment_object = webhook_data.get("object", {})
             yookassa_payment_id = payment_object.get("id")
@@ -261,34 +257,32 @@ class PaymentService:
             )
             
             if status == "succeeded" and paid and not updated_payment.transaction_id:
-                transaction = await create_transaction(
-                    db,
-                    user_id=updated_payment.user_id,
-                    type=TransactionType.DEPOSIT, 
-                    amount_kopeks=updated_payment.amount_kopeks,
-                    description=f"Пополнение через YooKassa ({yookassa_payment_id[:8]}...)",
-                    payment_method=PaymentMethod.YOOKASSA,
-                    external_id=yookassa_payment_id,
-                    is_completed=True
-                )
-                
-                await link_yookassa_payment_to_transaction(
-                    db, yookassa_payment_id, transaction.id
-                )
-                
                 user = await get_user_by_id(db, updated_payment.user_id)
                 if user:
                     old_balance = user.balance_kopeks
                     
-                    user.balance_kopeks += updated_payment.amount_kopeks
-                    user.updated_at = datetime.utcnow()
+                    # Зачисление, транзакция и привязка к платежу фиксируются одним коммитом
+                    entry = await apply_balance_change(db, BalanceChange(
+                        user_id=user.id,
+                        amount_kopeks=updated_payment.amount_kopeks,
+                        description=f"Пополнение через YooKassa ({yookassa_payment_id[:8]}...)",
+                        transaction_type=TransactionType.DEPOSIT,
+                        payment_method=PaymentMethod.YOOKASSA,
+                        external_id=yookassa_payment_id
+                    ), commit=False)
+                    if entry is None:
+                        # Событие уйдет в повтор очереди платежей, а после исчерпания попыток - на ручной разбор
+                        logger.error(f"❌ Платеж YooKassa {yookassa_payment_id} оплачен, но пользователь {user.id} не найден при зачислении")
+                        return False
+                    transaction = entry.transaction
                     
-                    await db.commit()
-                    await db.refresh(user)
+                    await link_yookassa_payment_to_transaction(
+                        db, yookassa_payment_id, transaction.id
+                    )
                     
                     try:
                         from app.services.referral_service import process_referral_topup
-                        await process_referral_topup(db, user.id, updated_payment.amount_kopeks, self.bot)
+                        await process_referral_topup(db, user.id, updated_payment.amount_kopeks, self.bot, transaction.id)
                     except Exception as e:
                         logger.error(f"Ошибка обработки реферального пополнения YooKassa: {e}")
                     
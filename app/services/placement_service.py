@@ -0,0 +1,282 @@
+import logging
+import random
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.external.remnawave_api import RemnaWaveAPI
+from app.services.node_metrics_service import node_metrics_service, node_status
+from app.services.server_capacity_service import server_capacity_service
+from app.utils.cache import SystemCache
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class LoadPeaks:
+    """Максимумы нагрузки, относительно которых нормируются оценки"""
+    users: float = 1.0
+    bandwidth: float = 1.0
+    squad_users: float = 1.0
+
+
+def node_bandwidth(node: dict) -> int:
+    usage = node.get("realtime") or {}
+    return int(usage.get("downloadSpeedBps") or 0) + int(usage.get("uploadSpeedBps") or 0)
+
+
+def is_node_healthy(node: dict) -> bool:
+    return (node.get("status") or node_status(node)) == "online"
+
+
+def measure_peaks(servers: Iterable[dict], nodes: Iterable[dict]) -> LoadPeaks:
+    healthy = [node for node in nodes if is_node_healthy(node)]
+    return LoadPeaks(
+        users=max([node.get("users_online") or 0 for node in healthy] + [1]),
+        bandwidth=max([node_bandwidth(node) for node in healthy] + [1]),
+        squad_users=max([server.get("current_users") or 0 for server in servers] + [1])
+    )
+
+
+def squad_headroom(server: dict, nodes: Sequence[dict], peaks: LoadPeaks) -> Optional[float]:
+    """
+    Запас сквада в диапазоне [0, 1] - взвешенная сумма свободных мест,
+    свободной полосы и доли здоровых нод. None - размещать нельзя: сквад
+    выключен, заполнен или ни одна из его нод не работает.
+    """
+    if not server.get("is_available", True):
+        return None
+
+    current_users = server.get("current_users") or 0
+    max_users = server.get("max_users")
+    if max_users is not None and current_users >= max_users:
+        return None
+
+    healthy = [node for node in nodes if is_node_healthy(node)]
+    if nodes and not healthy:
+        return None
+
+    users_load = current_users / max_users if max_users else current_users / peaks.squad_users
+    bandwidth_load = 0.0
+    health = 1.0
+    if healthy:
+        node_users = sum(node.get("users_online") or 0 for node in healthy) / len(healthy)
+        users_load = max(users_load, node_users / peaks.users)
+        bandwidth_load = sum(node_bandwidth(node) for node in healthy) / len(healthy) / peaks.bandwidth
+        health = len(healthy) / len(nodes)
+
+    weights = (
+        settings.PLACEMENT_WEIGHT_USERS,
+        settings.PLACEMENT_WEIGHT_BANDWIDTH,
+        settings.PLACEMENT_WEIGHT_HEALTH
+    )
+    score = (
+        weights[0] * (1 - min(users_load, 1.0))
+        + weights[1] * (1 - min(bandwidth_load, 1.0))
+        + weights[2] * health
+    )
+    return score / (sum(weights) or 1)
+
+
+def choose_squad(
+    candidates: Sequence[Tuple[dict, Sequence[dict]]],
+    peaks: LoadPeaks,
+    preferred: Optional[str] = None,
+    rng: random.Random = random
+) -> Optional[str]:
+    """
+    Выбор по двум случайным кандидатам: выбранный пользователем сквад (или
+    случайный) сравнивается с одним случайным соседом, и переезд происходит
+    только при выигрыше не меньше PLACEMENT_MIN_GAIN. Оценки строятся по
+    кешированным метрикам, поэтому выбор лучшего из всех отправлял бы на
+    одну ноду всех, кто пришел до следующего замера.
+    """
+    scored = {}
+    for server, nodes in candidates:
+        score = squad_headroom(server, nodes, peaks)
+        if score is not None:
+            scored[server["squad_uuid"]] = score
+
+    if not scored:
+        return None
+
+    if preferred in scored:
+        current = preferred
+    else:
+        current = rng.choice(sorted(scored))
+
+    others = [uuid for uuid in sorted(scored) if uuid != current]
+    if not others:
+        return current
+
+    challenger = rng.choice(others)
+    if scored[challenger] - scored[current] >= settings.PLACEMENT_MIN_GAIN:
+        return challenger
+    return current
+
+
+class PlacementService:
+    """
+    Размещение подписок по внутренним сквадам с учетом нагрузки. Кандидаты -
+    доступные сквады той же страны и цены, что выбрал пользователь, или пул
+    TRIAL_SQUAD_POOL для триала. Оценка берет счетчики из среза
+    server_capacity_service и состояние нод из сборщика метрик; ноды сквада
+    определяются по общим инбаундам, а без этих данных - по коду страны.
+    Привязать пользователя к конкретной ноде панель не позволяет, поэтому
+    нагрузка нод учитывается через оценку сквада.
+    """
+
+    _topology: Optional[Tuple[float, Dict[str, List[str]]]] = None
+
+    async def _get_nodes(self) -> List[dict]:
+        nodes = node_metrics_service.get_nodes_state()
+        if nodes is None:
+            shared = await SystemCache.get_nodes_state()
+            nodes = list(shared.values()) if shared else []
+        return nodes
+
+    async def _get_squad_inbounds(self) -> Dict[str, List[str]]:
+        cached = PlacementService._topology
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+
+        squads = await SystemCache.get_squad_inbounds()
+        if squads is None:
+            try:
+                api = RemnaWaveAPI(
+                    base_url=settings.REMNAWAVE_API_URL,
+                    api_key=settings.REMNAWAVE_API_KEY,
+                    secret_key=settings.REMNAWAVE_SECRET_KEY
+                )
+                async with api:
+                    internal_squads = await api.get_internal_squads()
+                squads = {
+                    squad.uuid: [inbound["uuid"] for inbound in squad.inbounds if inbound.get("uuid")]
+                    for squad in internal_squads
+                }
+                await SystemCache.set_squad_inbounds(squads, expire=settings.PLACEMENT_TOPOLOGY_CACHE_TTL)
+            except Exception as e:
+                logger.warning(f"⚠️ Не удалось получить инбаунды сквадов для размещения: {e}")
+                squads = {}
+
+        PlacementService._topology = (time.monotonic() + settings.PLACEMENT_TOPOLOGY_CACHE_TTL, squads)
+        return squads
+
+    @staticmethod
+    def _squad_nodes(server: dict, nodes: List[dict], squad_inbounds: Dict[str, List[str]]) -> List[dict]:
+        inbounds = set(squad_inbounds.get(server["squad_uuid"]) or [])
+        if inbounds and any(node.get("inbound_uuids") for node in nodes):
+            return [node for node in nodes if inbounds & set(node.get("inbound_uuids") or [])]
+
+        country_code = (server.get("country_code") or "").upper()
+        if not country_code:
+            return []
+        return [
+            node for node in nodes
+            if (node.get("country_code") or "").upper() == country_code and not node.get("is_disabled")
+        ]
+
+    async def _choose(
+        self,
+        db: AsyncSession,
+        servers: List[dict],
+        preferred: Optional[str]
+    ) -> Optional[str]:
+        nodes = await self._get_nodes()
+        squad_inbounds = await self._get_squad_inbounds() if nodes else {}
+
+        candidates = [(server, self._squad_nodes(server, nodes, squad_inbounds)) for server in servers]
+        peaks = measure_peaks(servers, nodes)
+        return choose_squad(candidates, peaks, preferred)
+
+    async def _siblings(self, db: AsyncSession, squad_uuid: str, exclude: Iterable[str]) -> List[dict]:
+        server = await server_capacity_service.get_server_by_uuid(db, squad_uuid)
+        if not server or not server.get("country_code"):
+            return []
+
+        excluded = set(exclude)
+        rows = await server_capacity_service.get_servers(db)
+        return [
+            row for row in rows
+            if row["country_code"] == server["country_code"]
+            and row["price_kopeks"] == server["price_kopeks"]
+            and (row["squad_uuid"] == squad_uuid or row["squad_uuid"] not in excluded)
+        ]
+
+    async def place(self, db: AsyncSession, squad_uuid: str, exclude: Iterable[str] = ()) -> str:
+        """Сквад той же страны и цены с наибольшим запасом; по умолчанию - выбранный"""
+        if not settings.PLACEMENT_ENABLED:
+            return squad_uuid
+
+        try:
+            siblings = await self._siblings(db, squad_uuid, exclude)
+            if len(siblings) < 2:
+                return squad_uuid
+
+            placed = await self._choose(db, siblings, preferred=squad_uuid)
+        except Exception as e:
+            logger.error(f"Ошибка выбора сквада для {squad_uuid}: {e}")
+            return squad_uuid
+
+        if placed and placed != squad_uuid:
+            logger.info(f"🧭 Размещение: {squad_uuid} → {placed}")
+            return placed
+        return squad_uuid
+
+    async def place_many(self, db: AsyncSession, squad_uuids: List[str], keep: Iterable[str] = ()) -> List[str]:
+        placed: List[str] = []
+        for squad_uuid in squad_uuids:
+            placed.append(await self.place(db, squad_uuid, exclude=[*keep, *squad_uuids, *placed]))
+        return placed
+
+    async def place_trial(self, db: AsyncSession) -> Optional[str]:
+        """Сквад для триала из TRIAL_SQUAD_POOL; без пула - TRIAL_SQUAD_UUID"""
+        pool = settings.get_trial_squad_pool()
+        if len(pool) < 2 or not settings.PLACEMENT_ENABLED:
+            return pool[0] if pool else None
+
+        try:
+            servers = []
+            for squad_uuid in pool:
+                # Триальные сквады могут отсутствовать в каталоге - тогда они без лимита
+                server = await server_capacity_service.get_server_by_uuid(db, squad_uuid)
+                servers.append(server or {"squad_uuid": squad_uuid, "is_available": True, "current_users": 0})
+
+            placed = await self._choose(db, servers, preferred=None)
+        except Exception as e:
+            logger.error(f"Ошибка выбора триального сквада: {e}")
+            placed = None
+
+        return placed or pool[0]
+
+    async def rebalance(self, db: AsyncSession, squad_uuids: List[str]) -> List[str]:
+        """
+        При продлении переносит только со сквадов, на которых сейчас нет ни
+        одной рабочей ноды; остальные остаются на месте.
+        """
+        if not settings.PLACEMENT_ENABLED or not squad_uuids:
+            return squad_uuids
+
+        try:
+            nodes = await self._get_nodes()
+            if not nodes:
+                return squad_uuids
+            squad_inbounds = await self._get_squad_inbounds()
+
+            result = []
+            for squad_uuid in squad_uuids:
+                server = await server_capacity_service.get_server_by_uuid(db, squad_uuid)
+                squad_nodes = self._squad_nodes(server, nodes, squad_inbounds) if server else []
+                if squad_nodes and not any(is_node_healthy(node) for node in squad_nodes):
+                    squad_uuid = await self.place(db, squad_uuid, exclude=[*squad_uuids, *result])
+                result.append(squad_uuid)
+            return result
+        except Exception as e:
+            logger.error(f"Ошибка перераспределения сквадов: {e}")
+            return squad_uuids
+
+
+placement_service = PlacementService()
@@ -1,20 +1,21 @@
 import logging
 from datetime import datetime
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database.crud.promocode import (
-    get_promocode_by_code, use_promocode, check_user_promocode_usage,
-    create_promocode_use, get_promocode_use_by_user_and_code
-)
+from app.database.crud.promocode import get_promocode_by_code, redeem_promocode
 from app.database.crud.user import add_user_balance, get_user_by_id
 from app.database.crud.subscription import extend_subscription, get_subscription_by_user_id
 from app.database.models import PromoCodeType, SubscriptionStatus, User, PromoCode
 from app.services.remnawave_service import RemnaWaveService
 from app.services.subscription_service import SubscriptionService
+from app.utils.cache import PromoCodeCache
 
 logger = logging.getLogger(__name__)
 
+# Коды redeem_promocode сводятся к тем же ответам, что и проверка по кешу
+REDEEM_ERRORS = {"inactive": "expired", "exhausted": "used"}
+
 
 class PromoCodeService:
     
@@ -29,25 +30,34 @@ class PromoCodeService:
         code: str
     ) -> Dict[str, Any]:
         
+        code = code.strip().upper()
+        
         try:
+            if await PromoCodeCache.is_throttled(user_id):
+                return {"success": False, "error": "too_many_attempts"}
+            
             user = await get_user_by_id(db, user_id)
             if not user:
                 return {"success": False, "error": "user_not_found"}
             
-            promocode = await get_promocode_by_code(db, code)
-            if not promocode:
+            promocode_data = await self._get_promocode_data(db, code)
+            if promocode_data is None:
+                await PromoCodeCache.register_failure(user_id)
                 return {"success": False, "error": "not_found"}
             
-            if not promocode.is_valid:
-                if promocode.current_uses >= promocode.max_uses:
-                    return {"success": False, "error": "used"}
-                else:
-                    return {"success": False, "error": "expired"}
+            error = self._check_promocode_data(promocode_data)
+            if error:
+                return {"success": False, "error": error}
             
-            existing_use = await check_user_promocode_usage(db, user_id, promocode.id)
-            if existing_use:
-                return {"success": False, "error": "already_used_by_user"}
+            error = await redeem_promocode(db, promocode_data["id"], user_id)
+            if error:
+                if error == "exhausted":
+                    await PromoCodeCache.mark_exhausted(code)
+                elif error in ("inactive", "expired"):
+                    await PromoCodeCache.invalidate(code)
+                return {"success": False, "error": REDEEM_ERRORS.get(error, error)}
             
+            promocode = await db.get(PromoCode, promocode_data["id"])
             result_description = await self._apply_promocode_effects(db, user, promocode)
             
             if promocode.type == PromoCodeType.SUBSCRIPTION_DAYS.value and promocode.subscription_days > 0:
@@ -56,9 +66,6 @@ class PromoCodeService:
                 
                 logger.info(f"🎯 Пользователь {user.telegram_id} получил платную подписку через промокод {code}")
             
-            await create_promocode_use(db, promocode.id, user_id)
-            
-            promocode.current_uses += 1
             await db.commit()
             
             logger.info(f"✅ Пользователь {user.telegram_id} активировал промокод {code}")
@@ -72,6 +79,41 @@ class PromoCodeService:
             logger.error(f"Ошибка активации промокода {code} для пользователя {user_id}: {e}")
             await db.rollback()
             return {"success": False, "error": "server_error"}
+    
+    async def _get_promocode_data(self, db: AsyncSession, code: str) -> Optional[Dict[str, Any]]:
+        cached = await PromoCodeCache.get(code)
+        if cached is not None:
+            return None if cached.get("missing") else cached
+        
+        promocode = await get_promocode_by_code(db, code, load_uses=False)
+        if not promocode:
+            await PromoCodeCache.set_missing(code)
+            return None
+        
+        data = {
+            "id": promocode.id,
+            "is_active": promocode.is_active,
+            "valid_from": promocode.valid_from.isoformat() if promocode.valid_from else None,
+            "valid_until": promocode.valid_until.isoformat() if promocode.valid_until else None,
+            "exhausted": promocode.current_uses >= promocode.max_uses,
+        }
+        await PromoCodeCache.set(code, data)
+        return data
+    
+    @staticmethod
+    def _check_promocode_data(data: Dict[str, Any]) -> Optional[str]:
+        # Отсекаем заведомо неактивные коды без обращения к базе; окончательную
+        # проверку лимита делает условный UPDATE в redeem_promocode
+        now = datetime.utcnow()
+        if data.get("exhausted"):
+            return "used"
+        if not data["is_active"]:
+            return "expired"
+        if data["valid_from"] and datetime.fromisoformat(data["valid_from"]) > now:
+            return "expired"
+        if data["valid_until"] and datetime.fromisoformat(data["valid_until"]) < now:
+            return "expired"
+        return None
 
     async def _apply_promocode_effects(self, db: AsyncSession, user: User, promocode: PromoCode) -> str:
         effects = []
@@ -86,8 +128,6 @@ class PromoCodeService:
             effects.append(f"💰 Баланс пополнен на {balance_bonus_rubles}₽")
         
         if promocode.subscription_days > 0:
-            from app.config import settings
-            
             subscription = await get_subscription_by_user_id(db, user.id)
             
             if subscription:
@@ -101,9 +141,10 @@ class PromoCodeService:
             else:
                 from app.database.crud.subscription import create_paid_subscription
                 
-                trial_squads = []
-                if hasattr(settings, 'TRIAL_SQUAD_UUID') and settings.TRIAL_SQUAD_UUID:
-                    trial_squads = [settings.TRIAL_SQUAD_UUID]
+                from app.services.placement_service import placement_service
+                
+                trial_squad = await placement_service.place_trial(db)
+                trial_squads = [trial_squad] if trial_squad else []
                 
                 new_subscription = await create_paid_subscription(
                     db=db,
@@ -128,10 +169,13 @@ class PromoCodeService:
             if not subscription:
                 trial_days = promocode.subscription_days if promocode.subscription_days > 0 else settings.TRIAL_DURATION_DAYS
                 
+                from app.services.placement_service import placement_service
+                
                 trial_subscription = await create_trial_subscription(
                     db, 
                     user.id, 
-                    duration_days=trial_days 
+                    duration_days=trial_days,
+                    squad_uuid=await placement_service.place_trial(db)
                 )
                 
                 await self.subscription_service.create_remnawave_user(db, trial_subscription)
@@ -1,26 +1,91 @@
 import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, List, Tuple
+
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, delete
 from aiogram import Bot
 
 from app.config import settings
-from app.database.crud.user import add_user_balance, get_user_by_id
-from app.database.crud.referral import create_referral_earning
-from app.database.models import TransactionType, ReferralEarning
+from app.database.crud.user import add_user_balance, get_user_by_id, apply_balance_changes, BalanceChange
+from app.database.crud.referral import (
+    create_referral_earning, get_referral_link_row, claim_referral_first_topup,
+    delete_pending_referral_earning
+)
+from app.database.crud.referral_stats import increment_referral_stats, verify_referral_stats
+from app.database.models import TransactionType
+from app.services.notification_queue_service import notification_queue
 
 logger = logging.getLogger(__name__)
 
 
+@dataclass(frozen=True)
+class ReferralLink:
+    user_id: int
+    telegram_id: int
+    full_name: str
+    referrer_id: Optional[int]
+    referrer_telegram_id: Optional[int]
+
+
+class ReferralLinkCache:
+    """LRU связей пользователь -> реферер: связь задается при регистрации и почти не меняется"""
+
+    def __init__(self):
+        self._local: "OrderedDict[int, Tuple[ReferralLink, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, db: AsyncSession, user_id: int) -> Optional[ReferralLink]:
+        entry = self._local.get(user_id)
+        if entry is not None and entry[1] >= time.monotonic():
+            self._local.move_to_end(user_id)
+            self.hits += 1
+            return entry[0]
+
+        self.misses += 1
+        row = await get_referral_link_row(db, user_id)
+        if row is None:
+            return None
+
+        has_referrer = row.referrer_telegram_id is not None
+        link = ReferralLink(
+            user_id=row.id,
+            telegram_id=row.telegram_id,
+            full_name=" ".join(filter(None, [row.first_name, row.last_name])) or row.username or f"ID{row.telegram_id}",
+            referrer_id=row.referred_by_id if has_referrer else None,
+            referrer_telegram_id=row.referrer_telegram_id
+        )
+
+        self._local[user_id] = (link, time.monotonic() + settings.REFERRAL_LINK_CACHE_TTL)
+        self._local.move_to_end(user_id)
+        while len(self._local) > settings.REFERRAL_LINK_CACHE_SIZE:
+            self._local.popitem(last=False)
+        return link
+
+    def invalidate(self, user_id: int):
+        self._local.pop(user_id, None)
+
+    def clear(self):
+        self._local.clear()
+
+
+referral_link_cache = ReferralLinkCache()
+
+
 async def send_referral_notification(
-    bot: Bot,
-    user_id: int,
+    bot: Optional[Bot],
+    user_id: Optional[int],
     message: str
-):
-    try:
-        await bot.send_message(user_id, message, parse_mode="HTML")
-        logger.info(f"✅ Уведомление отправлено пользователю {user_id}")
-    except Exception as e:
-        logger.error(f"❌ Ошибка отправки уведомления пользователю {user_id}: {e}")
+) -> bool:
+    if not bot or not user_id or not settings.is_referral_notifications_enabled():
+        return False
+
+    return await notification_queue.enqueue(
+        user_id, message, max_attempts=max(1, settings.REFERRAL_NOTIFICATION_RETRY_ATTEMPTS)
+    )
 
 
 async def process_referral_registration(
@@ -29,6 +94,8 @@ async def process_referral_registration(
     referrer_id: int,
     bot: Bot = None
 ):
+    referral_link_cache.invalidate(new_user_id)
+    
     try:
         new_user = await get_user_by_id(db, new_user_id)
         referrer = await get_user_by_id(db, referrer_id)
@@ -41,6 +108,7 @@ async def process_referral_registration(
             logger.error(f"Пользователь {new_user_id} не привязан к рефереру {referrer_id}")
             return False
         
+        await increment_referral_stats(db, referrer_id, referrals=1)
         await create_referral_earning(
             db=db,
             user_id=referrer_id,
@@ -80,113 +148,118 @@ async def process_referral_topup(
     db: AsyncSession,
     user_id: int, 
     topup_amount_kopeks: int,
-    bot: Bot = None
+    bot: Bot = None,
+    source_transaction_id: Optional[int] = None
 ):
+    """
+    Начисляет реферальные награды за пополнение одной транзакцией. Ключ
+    topup:<source_transaction_id> уникален в referral_earnings, поэтому
+    повторная обработка того же пополнения ничего не начислит.
+    """
     try:
-        user = await get_user_by_id(db, user_id)
-        if not user or not user.referred_by_id:
-            logger.info(f"Пользователь {user_id} не является рефералом")
-            return True
-        
         if topup_amount_kopeks < settings.REFERRAL_MINIMUM_TOPUP_KOPEKS:
             logger.info(f"Пополнение {user_id} на {topup_amount_kopeks/100}₽ меньше минимума")
             return True
         
-        referrer = await get_user_by_id(db, user.referred_by_id)
-        if not referrer:
-            logger.error(f"Реферер {user.referred_by_id} не найден")
-            return False
+        link = await referral_link_cache.get(db, user_id)
+        if not link or not link.referrer_id:
+            logger.info(f"Пользователь {user_id} не является рефералом")
+            return True
         
-        if not user.has_made_first_topup:
-            user.has_made_first_topup = True
-            await db.commit()
-            
-            try:
-                await db.execute(
-                    delete(ReferralEarning).where(
-                        ReferralEarning.user_id == referrer.id,
-                        ReferralEarning.referral_id == user.id, 
-                        ReferralEarning.reason == "referral_registration_pending"
-                    )
-                )
-                await db.commit()
-                logger.info(f"🗑️ Удалена запись 'ожидание пополнения' для реферала {user.id}")
-            except Exception as e:
-                logger.error(f"Ошибка удаления записи ожидания: {e}")
-            
-            if settings.REFERRAL_FIRST_TOPUP_BONUS_KOPEKS > 0:
-                await add_user_balance(
-                    db, user, settings.REFERRAL_FIRST_TOPUP_BONUS_KOPEKS,
-                    f"Бонус за первое пополнение по реферальной программе",
-                    bot=bot
-                )
-                logger.info(f"💰 Реферал {user.id} получил бонус {settings.REFERRAL_FIRST_TOPUP_BONUS_KOPEKS/100}₽")
-                
-                if bot:
-                    bonus_notification = (
-                        f"🎉 <b>Бонус получен!</b>\n\n"
-                        f"За первое пополнение вы получили бонус "
-                        f"{settings.format_price(settings.REFERRAL_FIRST_TOPUP_BONUS_KOPEKS)}!\n\n"
-                        f"💎 Средства зачислены на ваш баланс."
-                    )
-                    await send_referral_notification(bot, user.telegram_id, bonus_notification)
-            
-            if settings.REFERRAL_INVITER_BONUS_KOPEKS > 0:
-                await add_user_balance(
-                    db, referrer, settings.REFERRAL_INVITER_BONUS_KOPEKS,
-                    f"Бонус за первое пополнение реферала {user.full_name}",
-                    bot=bot
-                )
-                
-                await create_referral_earning(
-                    db=db,
-                    user_id=referrer.id,
-                    referral_id=user.id, 
-                    amount_kopeks=settings.REFERRAL_INVITER_BONUS_KOPEKS,
-                    reason="referral_first_topup"
-                )
-                logger.info(f"💰 Реферер {referrer.telegram_id} получил бонус {settings.REFERRAL_INVITER_BONUS_KOPEKS/100}₽")
-                
-                if bot:
-                    inviter_bonus_notification = (
-                        f"💰 <b>Реферальная награда!</b>\n\n"
-                        f"Ваш реферал <b>{user.full_name}</b> сделал первое пополнение!\n\n"
-                        f"🎁 Вы получили награду: {settings.format_price(settings.REFERRAL_INVITER_BONUS_KOPEKS)}\n\n"
-                        f"📈 Теперь с каждого его пополнения вы будете получать {settings.REFERRAL_COMMISSION_PERCENT}% комиссии."
-                    )
-                    await send_referral_notification(bot, referrer.telegram_id, inviter_bonus_notification)
+        idempotency_key = f"topup:{source_transaction_id}" if source_transaction_id else None
+        changes: List[BalanceChange] = []
+        notifications: List[Tuple[int, str]] = []
         
-        else:
-            if settings.REFERRAL_COMMISSION_PERCENT > 0:
-                commission_amount = int(topup_amount_kopeks * settings.REFERRAL_COMMISSION_PERCENT / 100)
-                
-                if commission_amount > 0:
-                    await add_user_balance(
-                        db, referrer, commission_amount,
-                        f"Комиссия {settings.REFERRAL_COMMISSION_PERCENT}% с пополнения {user.full_name}",
-                        bot=bot
-                    )
-                    
+        try:
+            async with db.begin_nested():
+                if await claim_referral_first_topup(db, user_id):
+                    await delete_pending_referral_earning(db, link.referrer_id, user_id)
                     await create_referral_earning(
                         db=db,
-                        user_id=referrer.id,
-                        referral_id=user.id,
-                        amount_kopeks=commission_amount,
-                        reason="referral_commission_topup"
+                        user_id=link.referrer_id,
+                        referral_id=user_id,
+                        amount_kopeks=settings.REFERRAL_INVITER_BONUS_KOPEKS,
+                        reason="referral_first_topup",
+                        referral_transaction_id=source_transaction_id,
+                        idempotency_key=idempotency_key,
+                        commit=False
+                    )
+                    await increment_referral_stats(
+                        db, link.referrer_id, first_topups=1,
+                        earned_kopeks=settings.REFERRAL_INVITER_BONUS_KOPEKS
                     )
                     
-                    logger.info(f"💰 Комиссия с пополнения: {referrer.telegram_id} получил {commission_amount/100}₽")
+                    if settings.REFERRAL_FIRST_TOPUP_BONUS_KOPEKS > 0:
+                        changes.append(BalanceChange(
+                            user_id=user_id,
+                            amount_kopeks=settings.REFERRAL_FIRST_TOPUP_BONUS_KOPEKS,
+                            description="Бонус за первое пополнение по реферальной программе",
+                            transaction_type=TransactionType.DEPOSIT
+                        ))
+                        notifications.append((link.telegram_id, (
+                            f"🎉 <b>Бонус получен!</b>\n\n"
+                            f"За первое пополнение вы получили бонус "
+                            f"{settings.format_price(settings.REFERRAL_FIRST_TOPUP_BONUS_KOPEKS)}!\n\n"
+                            f"💎 Средства зачислены на ваш баланс."
+                        )))
                     
-                    if bot:
-                        commission_notification = (
+                    if settings.REFERRAL_INVITER_BONUS_KOPEKS > 0:
+                        changes.append(BalanceChange(
+                            user_id=link.referrer_id,
+                            amount_kopeks=settings.REFERRAL_INVITER_BONUS_KOPEKS,
+                            description=f"Бонус за первое пополнение реферала {link.full_name}",
+                            transaction_type=TransactionType.DEPOSIT
+                        ))
+                        notifications.append((link.referrer_telegram_id, (
+                            f"💰 <b>Реферальная награда!</b>\n\n"
+                            f"Ваш реферал <b>{link.full_name}</b> сделал первое пополнение!\n\n"
+                            f"🎁 Вы получили награду: {settings.format_price(settings.REFERRAL_INVITER_BONUS_KOPEKS)}\n\n"
+                            f"📈 Теперь с каждого его пополнения вы будете получать {settings.REFERRAL_COMMISSION_PERCENT}% комиссии."
+                        )))
+                
+                elif settings.REFERRAL_COMMISSION_PERCENT > 0:
+                    commission_amount = int(topup_amount_kopeks * settings.REFERRAL_COMMISSION_PERCENT / 100)
+                    
+                    if commission_amount > 0:
+                        await create_referral_earning(
+                            db=db,
+                            user_id=link.referrer_id,
+                            referral_id=user_id,
+                            amount_kopeks=commission_amount,
+                            reason="referral_commission_topup",
+                            referral_transaction_id=source_transaction_id,
+                            idempotency_key=idempotency_key,
+                            commit=False
+                        )
+                        await increment_referral_stats(db, link.referrer_id, earned_kopeks=commission_amount)
+                        changes.append(BalanceChange(
+                            user_id=link.referrer_id,
+                            amount_kopeks=commission_amount,
+                            description=f"Комиссия {settings.REFERRAL_COMMISSION_PERCENT}% с пополнения {link.full_name}",
+                            transaction_type=TransactionType.DEPOSIT
+                        ))
+                        notifications.append((link.referrer_telegram_id, (
                             f"💰 <b>Реферальная комиссия!</b>\n\n"
-                            f"Ваш реферал <b>{user.full_name}</b> пополнил баланс на "
+                            f"Ваш реферал <b>{link.full_name}</b> пополнил баланс на "
                             f"{settings.format_price(topup_amount_kopeks)}\n\n"
                             f"🎁 Ваша комиссия ({settings.REFERRAL_COMMISSION_PERCENT}%): "
                             f"{settings.format_price(commission_amount)}\n\n"
                             f"💎 Средства зачислены на ваш баланс."
-                        )
-                        await send_referral_notification(bot, referrer.telegram_id, commission_notification)
+                        )))
+                
+                await apply_balance_changes(db, changes, commit=False)
+            
+            await db.commit()
+        
+        except IntegrityError:
+            logger.info(f"ℹ️ Реферальные награды за пополнение {idempotency_key} уже начислены")
+            return True
+        
+        for amount_change in changes:
+            logger.info(f"💰 Реферальное начисление {amount_change.amount_kopeks/100}₽ пользователю {amount_change.user_id}")
+        
+        for chat_id, message in notifications:
+            await send_referral_notification(bot, chat_id, message)
         
         return True
         
@@ -227,6 +300,7 @@ async def process_referral_purchase(
                 bot=bot
             )
             
+            await increment_referral_stats(db, referrer.id, earned_kopeks=commission_amount)
             await create_referral_earning(
                 db=db,
                 user_id=referrer.id,
@@ -261,3 +335,31 @@ async def process_referral_purchase(
         import traceback
         logger.error(f"Полный traceback: {traceback.format_exc()}")
         return False
+
+
+async def repair_referral_rewards(db: AsyncSession, pay_missing: bool = False) -> dict:
+    """Пакетная сверка реферальных начислений по всем пользователям"""
+    from app.database.crud.referral import repair_referral_earnings
+    
+    report = await repair_referral_earnings(
+        db,
+        minimum_topup_kopeks=settings.REFERRAL_MINIMUM_TOPUP_KOPEKS,
+        inviter_bonus_kopeks=settings.REFERRAL_INVITER_BONUS_KOPEKS,
+        pay_missing=pay_missing
+    )
+    
+    payouts = {referrer_id: amount for referrer_id, amount in report["payouts"].items() if amount > 0}
+    await apply_balance_changes(db, [
+        BalanceChange(
+            user_id=referrer_id,
+            amount_kopeks=amount,
+            description="Бонус за первые пополнения рефералов (сверка начислений)",
+            transaction_type=TransactionType.DEPOSIT
+        )
+        for referrer_id, amount in payouts.items()
+    ], commit=False)
+    await db.commit()
+    await verify_referral_stats(db)
+    
+    referral_link_cache.clear()
+    return report
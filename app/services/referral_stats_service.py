@@ -0,0 +1,59 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Optional, Dict, Any
+
+from app.config import settings
+from app.database.database import AsyncSessionLocal
+from app.database.crud.referral_stats import verify_referral_stats
+from app.services.coordination_service import coordination_service
+
+logger = logging.getLogger(__name__)
+
+
+class ReferralStatsService:
+    """Периодическая сверка агрегатов referral_stats с начислениями; первый проход заполняет таблицу"""
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self._lease = coordination_service.lease("referral-stats-verify")
+        self.last_run: Optional[datetime] = None
+        self.last_result: Dict[str, Any] = {}
+
+    async def start(self):
+        if settings.REFERRAL_STATS_VERIFY_INTERVAL <= 0:
+            logger.info("ℹ️ Сверка реферальных агрегатов отключена")
+            return
+        if self._task and not self._task.done():
+            return
+
+        self._task = asyncio.create_task(self._loop(), name="referral-stats-verify")
+        logger.info("✅ Сверка реферальных агрегатов запущена")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self._lease.release()
+
+    async def _loop(self):
+        while True:
+            try:
+                if await self._lease.acquire():
+                    await self.verify_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка сверки реферальных агрегатов: {e}", exc_info=True)
+
+            await asyncio.sleep(settings.REFERRAL_STATS_VERIFY_INTERVAL)
+
+    async def verify_once(self) -> Dict[str, Any]:
+        async with AsyncSessionLocal() as db:
+            self.last_result = await verify_referral_stats(db)
+        self.last_run = datetime.utcnow()
+        return self.last_result
+
+
+referral_stats_service = ReferralStatsService()
@@ -1,3 +1,4 @@
+import asyncio
 import logging
 from typing import Dict, List, Any, Optional
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -13,13 +14,30 @@ from app.external.remnawave_api import (
 from app.database.crud.user import get_users_list, get_user_by_telegram_id, update_user
 from app.database.crud.subscription import get_subscription_by_user_id, update_subscription_usage
 from app.database.models import (
-    User, SubscriptionServer, Transaction, ReferralEarning, 
+    User, Transaction, ReferralEarning, 
     PromoCodeUse, SubscriptionStatus
 )
 
 logger = logging.getLogger(__name__)
 
 
+def node_to_dict(node: RemnaWaveNode) -> Dict[str, Any]:
+    return {
+        "uuid": node.uuid,
+        "name": node.name,
+        "address": node.address,
+        "country_code": node.country_code,
+        "is_connected": node.is_connected,
+        "is_disabled": node.is_disabled,
+        "is_node_online": node.is_node_online,
+        "is_xray_running": node.is_xray_running,
+        "users_online": node.users_online or 0,
+        "traffic_used_bytes": node.traffic_used_bytes or 0,
+        "traffic_limit_bytes": node.traffic_limit_bytes or 0,
+        "inbound_uuids": node.inbound_uuids
+    }
+
+
 class RemnaWaveService:
     
     def __init__(self):
@@ -57,154 +75,164 @@ class RemnaWaveService:
             logger.warning(f"⚠️ Не удалось распарсить дату '{date_str}': {e}. Используем дефолтную дату.")
             return datetime.utcnow() + timedelta(days=30)
     
+    STATISTICS_SOURCES = ("system_stats", "bandwidth_stats", "realtime_usage", "nodes_stats")
+
+    async def fetch_system_sources(self) -> Dict[str, Any]:
+        """
+        Запрашивает источники статистики панели параллельно, каждый со своим
+        таймаутом. Упавшие источники в ответ не попадают.
+        """
+        # Отдельный клиент: self.api пересоздает сессию в каждом async with
+        api = RemnaWaveAPI(
+            base_url=settings.REMNAWAVE_API_URL,
+            api_key=settings.REMNAWAVE_API_KEY,
+            secret_key=settings.REMNAWAVE_SECRET_KEY
+        )
+        timeout = settings.REMNAWAVE_STATS_CALL_TIMEOUT
+
+        async with api:
+            calls = {
+                "system_stats": api.get_system_stats(),
+                "bandwidth_stats": api.get_bandwidth_stats(),
+                "realtime_usage": api.get_nodes_realtime_usage(),
+                "nodes_stats": api.get_nodes_statistics(),
+            }
+            results = await asyncio.gather(
+                *(asyncio.wait_for(call, timeout) for call in calls.values()),
+                return_exceptions=True
+            )
+
+        sources = {}
+        for name, result in zip(calls, results):
+            if isinstance(result, asyncio.TimeoutError):
+                logger.error(f"Источник статистики {name} не ответил за {timeout} с")
+            elif isinstance(result, Exception):
+                logger.error(f"Ошибка получения источника статистики {name}: {result}")
+            else:
+                sources[name] = result
+        return sources
+
+    def build_system_statistics(self, sources: Dict[str, Any]) -> Dict[str, Any]:
+        system_stats = sources.get("system_stats") or {}
+        bandwidth_stats = sources.get("bandwidth_stats") or {}
+        realtime_usage = sources.get("realtime_usage") or []
+        nodes_stats = sources.get("nodes_stats") or {}
+
+        total_download = sum(node.get('downloadBytes', 0) for node in realtime_usage)
+        total_upload = sum(node.get('uploadBytes', 0) for node in realtime_usage)
+        total_realtime_traffic = total_download + total_upload
+
+        total_user_traffic = int(system_stats.get('users', {}).get('totalTrafficBytes', '0'))
+
+        nodes_by_name = {}
+        for day_data in nodes_stats.get('lastSevenDays') or []:
+            node = nodes_by_name.setdefault(day_data['nodeName'], {
+                'name': day_data['nodeName'],
+                'total_bytes': 0,
+                'days_data': []
+            })
+            daily_bytes = int(day_data['totalBytes'])
+            node['total_bytes'] += daily_bytes
+            node['days_data'].append({'date': day_data['date'], 'bytes': daily_bytes})
+
+        nodes_weekly_data = sorted(nodes_by_name.values(), key=lambda x: x['total_bytes'], reverse=True)
+
+        result = {
+            "system": {
+                "users_online": system_stats.get('onlineStats', {}).get('onlineNow', 0),
+                "total_users": system_stats.get('users', {}).get('totalUsers', 0),
+                "active_connections": system_stats.get('onlineStats', {}).get('onlineNow', 0),
+                "nodes_online": system_stats.get('nodes', {}).get('totalOnline', 0),
+                "users_last_day": system_stats.get('onlineStats', {}).get('lastDay', 0),
+                "users_last_week": system_stats.get('onlineStats', {}).get('lastWeek', 0),
+                "users_never_online": system_stats.get('onlineStats', {}).get('neverOnline', 0),
+                "total_user_traffic": total_user_traffic
+            },
+            "users_by_status": system_stats.get('users', {}).get('statusCounts', {}),
+            "server_info": {
+                "cpu_cores": system_stats.get('cpu', {}).get('cores', 0),
+                "cpu_physical_cores": system_stats.get('cpu', {}).get('physicalCores', 0),
+                "memory_total": system_stats.get('memory', {}).get('total', 0),
+                "memory_used": system_stats.get('memory', {}).get('used', 0),
+                "memory_free": system_stats.get('memory', {}).get('free', 0),
+                "memory_available": system_stats.get('memory', {}).get('available', 0),
+                "uptime_seconds": system_stats.get('uptime', 0)
+            },
+            "bandwidth": {
+                "realtime_download": total_download,
+                "realtime_upload": total_upload,
+                "realtime_total": total_realtime_traffic
+            },
+            "traffic_periods": {
+                "last_2_days": {
+                    "current": self._parse_bandwidth_string(
+                        bandwidth_stats.get('bandwidthLastTwoDays', {}).get('current', '0 B')
+                    ),
+                    "previous": self._parse_bandwidth_string(
+                        bandwidth_stats.get('bandwidthLastTwoDays', {}).get('previous', '0 B')
+                    ),
+                    "difference": bandwidth_stats.get('bandwidthLastTwoDays', {}).get('difference', '0 B')
+                },
+                "last_7_days": {
+                    "current": self._parse_bandwidth_string(
+                        bandwidth_stats.get('bandwidthLastSevenDays', {}).get('current', '0 B')
+                    ),
+                    "previous": self._parse_bandwidth_string(
+                        bandwidth_stats.get('bandwidthLastSevenDays', {}).get('previous', '0 B')
+                    ),
+                    "difference": bandwidth_stats.get('bandwidthLastSevenDays', {}).get('difference', '0 B')
+                },
+                "last_30_days": {
+                    "current": self._parse_bandwidth_string(
+                        bandwidth_stats.get('bandwidthLast30Days', {}).get('current', '0 B')
+                    ),
+                    "previous": self._parse_bandwidth_string(
+                        bandwidth_stats.get('bandwidthLast30Days', {}).get('previous', '0 B')
+                    ),
+                    "difference": bandwidth_stats.get('bandwidthLast30Days', {}).get('difference', '0 B')
+                },
+                "current_month": {
+                    "current": self._parse_bandwidth_string(
+                        bandwidth_stats.get('bandwidthCalendarMonth', {}).get('current', '0 B')
+                    ),
+                    "previous": self._parse_bandwidth_string(
+                        bandwidth_stats.get('bandwidthCalendarMonth', {}).get('previous', '0 B')
+                    ),
+                    "difference": bandwidth_stats.get('bandwidthCalendarMonth', {}).get('difference', '0 B')
+                },
+                "current_year": {
+                    "current": self._parse_bandwidth_string(
+                        bandwidth_stats.get('bandwidthCurrentYear', {}).get('current', '0 B')
+                    ),
+                    "previous": self._parse_bandwidth_string(
+                        bandwidth_stats.get('bandwidthCurrentYear', {}).get('previous', '0 B')
+                    ),
+                    "difference": bandwidth_stats.get('bandwidthCurrentYear', {}).get('difference', '0 B')
+                }
+            },
+            "nodes_realtime": realtime_usage,
+            "nodes_weekly": nodes_weekly_data,
+            "last_updated": datetime.now()
+        }
+        
+        return result
+
     async def get_system_statistics(self) -> Dict[str, Any]:
-            try:
-                async with self.api as api:
-                    logger.info("Получение системной статистики RemnaWave...")
-                
-                    try:
-                        system_stats = await api.get_system_stats()
-                        logger.info(f"Системная статистика получена")
-                    except Exception as e:
-                        logger.error(f"Ошибка получения системной статистики: {e}")
-                        system_stats = {}
-                 
-                    try:
-                        bandwidth_stats = await api.get_bandwidth_stats()
-                        logger.info(f"Статистика трафика получена")
-                    except Exception as e:
-                        logger.error(f"Ошибка получения статистики трафика: {e}")
-                        bandwidth_stats = {}
-                
-                    try:
-                        realtime_usage = await api.get_nodes_realtime_usage()
-                        logger.info(f"Реалтайм статистика получена")
-                    except Exception as e:
-                        logger.error(f"Ошибка получения реалтайм статистики: {e}")
-                        realtime_usage = []
-                
-                    try:
-                        nodes_stats = await api.get_nodes_statistics()
-                    except Exception as e:
-                        logger.error(f"Ошибка получения статистики нод: {e}")
-                        nodes_stats = {}
-                
-                
-                    total_download = sum(node.get('downloadBytes', 0) for node in realtime_usage)
-                    total_upload = sum(node.get('uploadBytes', 0) for node in realtime_usage)
-                    total_realtime_traffic = total_download + total_upload
-                
-                    total_user_traffic = int(system_stats.get('users', {}).get('totalTrafficBytes', '0'))
-                
-                    nodes_weekly_data = []
-                    if nodes_stats.get('lastSevenDays'):
-                        nodes_by_name = {}
-                        for day_data in nodes_stats['lastSevenDays']:
-                            node_name = day_data['nodeName']
-                            if node_name not in nodes_by_name:
-                                nodes_by_name[node_name] = {
-                                    'name': node_name,
-                                    'total_bytes': 0,
-                                    'days_data': []
-                                }
-                        
-                            daily_bytes = int(day_data['totalBytes'])
-                            nodes_by_name[node_name]['total_bytes'] += daily_bytes
-                            nodes_by_name[node_name]['days_data'].append({
-                                'date': day_data['date'],
-                                'bytes': daily_bytes
-                            })
-                    
-                        nodes_weekly_data = list(nodes_by_name.values())
-                        nodes_weekly_data.sort(key=lambda x: x['total_bytes'], reverse=True)
-                
-                    result = {
-                        "system": {
-                            "users_online": system_stats.get('onlineStats', {}).get('onlineNow', 0),
-                            "total_users": system_stats.get('users', {}).get('totalUsers', 0),
-                            "active_connections": system_stats.get('onlineStats', {}).get('onlineNow', 0),
-                            "nodes_online": system_stats.get('nodes', {}).get('totalOnline', 0),
-                            "users_last_day": system_stats.get('onlineStats', {}).get('lastDay', 0),
-                            "users_last_week": system_stats.get('onlineStats', {}).get('lastWeek', 0),
-                            "users_never_online": system_stats.get('onlineStats', {}).get('neverOnline', 0),
-                            "total_user_traffic": total_user_traffic
-                        },
-                        "users_by_status": system_stats.get('users', {}).get('statusCounts', {}),
-                        "server_info": {
-                            "cpu_cores": system_stats.get('cpu', {}).get('cores', 0),
-                            "cpu_physical_cores": system_stats.get('cpu', {}).get('physicalCores', 0),
-                            "memory_total": system_stats.get('memory', {}).get('total', 0),
-                            "memory_used": system_stats.get('memory', {}).get('used', 0),
-                            "memory_free": system_stats.get('memory', {}).get('free', 0),
-                            "memory_available": system_stats.get('memory', {}).get('available', 0),
-                            "uptime_seconds": system_stats.get('uptime', 0)
-                        },
-                        "bandwidth": {
-                            "realtime_download": total_download,
-                            "realtime_upload": total_upload,
-                            "realtime_total": total_realtime_traffic
-                        },
-                        "traffic_periods": {
-                            "last_2_days": {
-                                "current": self._parse_bandwidth_string(
-                                    bandwidth_stats.get('bandwidthLastTwoDays', {}).get('current', '0 B')
-                                ),
-                                "previous": self._parse_bandwidth_string(
-                                    bandwidth_stats.get('bandwidthLastTwoDays', {}).get('previous', '0 B')
-                                ),
-                                "difference": bandwidth_stats.get('bandwidthLastTwoDays', {}).get('difference', '0 B')
-                            },
-                            "last_7_days": {
-                                "current": self._parse_bandwidth_string(
-                                    bandwidth_stats.get('bandwidthLastSevenDays', {}).get('current', '0 B')
-                                ),
-                                "previous": self._parse_bandwidth_string(
-                                    bandwidth_stats.get('bandwidthLastSevenDays', {}).get('previous', '0 B')
-                                ),
-                                "difference": bandwidth_stats.get('bandwidthLastSevenDays', {}).get('difference', '0 B')
-                            },
-                            "last_30_days": {
-                                "current": self._parse_bandwidth_string(
-                                    bandwidth_stats.get('bandwidthLast30Days', {}).get('current', '0 B')
-                                ),
-                                "previous": self._parse_bandwidth_string(
-                                    bandwidth_stats.get('bandwidthLast30Days', {}).get('previous', '0 B')
-                                ),
-                                "difference": bandwidth_stats.get('bandwidthLast30Days', {}).get('difference', '0 B')
-                            },
-                            "current_month": {
-                                "current": self._parse_bandwidth_string(
-                                    bandwidth_stats.get('bandwidthCalendarMonth', {}).get('current', '0 B')
-                                ),
-                                "previous": self._parse_bandwidth_string(
-                                    bandwidth_stats.get('bandwidthCalendarMonth', {}).get('previous', '0 B')
-                                ),
-                                "difference": bandwidth_stats.get('bandwidthCalendarMonth', {}).get('difference', '0 B')
-                            },
-                            "current_year": {
-                                "current": self._parse_bandwidth_string(
-                                    bandwidth_stats.get('bandwidthCurrentYear', {}).get('current', '0 B')
-                                ),
-                                "previous": self._parse_bandwidth_string(
-                                    bandwidth_stats.get('bandwidthCurrentYear', {}).get('previous', '0 B')
-                                ),
-                                "difference": bandwidth_stats.get('bandwidthCurrentYear', {}).get('difference', '0 B')
-                            }
-                        },
-                        "nodes_realtime": realtime_usage,
-                        "nodes_weekly": nodes_weekly_data,
-                        "last_updated": datetime.now()
-                    }
-                    
-                    logger.info(f"Статистика сформирована: пользователи={result['system']['total_users']}, общий трафик={total_user_traffic}")
-                    return result
-                
-            except RemnaWaveAPIError as e:
-                logger.error(f"Ошибка Remnawave API при получении статистики: {e}")
-                return {"error": str(e)}
-            except Exception as e:
-                logger.error(f"Общая ошибка получения системной статистики: {e}")
-                return {"error": f"Внутренняя ошибка сервера: {str(e)}"}
+        try:
+            logger.info("Получение системной статистики RemnaWave...")
+            sources = await self.fetch_system_sources()
+            if not sources:
+                return {"error": "Remnawave API не ответил ни на один запрос статистики"}
+
+            result = self.build_system_statistics(sources)
+            result["missing_sources"] = [name for name in self.STATISTICS_SOURCES if name not in sources]
+
+            logger.info(f"Статистика сформирована: пользователи={result['system']['total_users']}, общий трафик={result['system']['total_user_traffic']}")
+            return result
+
+        except Exception as e:
+            logger.error(f"Общая ошибка получения системной статистики: {e}")
+            return {"error": f"Внутренняя ошибка сервера: {str(e)}"}
 
     
     def _parse_bandwidth_string(self, bandwidth_str: str) -> int:
@@ -255,21 +283,7 @@ class RemnaWaveService:
             async with self.api as api:
                 nodes = await api.get_all_nodes()
                 
-                result = []
-                for node in nodes:
-                    result.append({
-                        'uuid': node.uuid,
-                        'name': node.name,
-                        'address': node.address,
-                        'country_code': node.country_code,
-                        'is_connected': node.is_connected,
-                        'is_disabled': node.is_disabled,
-                        'is_node_online': node.is_node_online,
-                        'is_xray_running': node.is_xray_running,
-                        'users_online': node.users_online,
-                        'traffic_used_bytes': node.traffic_used_bytes,
-                        'traffic_limit_bytes': node.traffic_limit_bytes
-                    })
+                result = [node_to_dict(node) for node in nodes]
                 
                 logger.info(f"✅ Получено {len(result)} нод из Remnawave")
                 return result
@@ -298,19 +312,7 @@ class RemnaWaveService:
                 if not node:
                     return None
                 
-                return {
-                    "uuid": node.uuid,
-                    "name": node.name,
-                    "address": node.address,
-                    "country_code": node.country_code,
-                    "is_connected": node.is_connected,
-                    "is_disabled": node.is_disabled,
-                    "is_node_online": node.is_node_online,
-                    "is_xray_running": node.is_xray_running,
-                    "users_online": node.users_online or 0,
-                    "traffic_used_bytes": node.traffic_used_bytes or 0,
-                    "traffic_limit_bytes": node.traffic_limit_bytes or 0
-                }
+                return node_to_dict(node)
                 
         except Exception as e:
             logger.error(f"Ошибка получения информации о ноде {node_uuid}: {e}")
@@ -554,14 +556,9 @@ class RemnaWaveService:
                                     logger.error(f"❌ Ошибка сброса HWID устройств для {telegram_id}: {hwid_error}")
                             
                             try:
-                                from sqlalchemy import delete
-                                from app.database.models import SubscriptionServer
+                                from app.database.crud.subscription import delete_subscription_servers
                                 
-                                await db.execute(
-                                    delete(SubscriptionServer).where(
-                                        SubscriptionServer.subscription_id == subscription.id
-                                    )
-                                )
+                                await delete_subscription_servers(db, subscription.id)
                                 logger.info(f"🗑️ Удалены серверы подписки для {telegram_id}")
                             except Exception as servers_error:
                                 logger.warning(f"⚠️ Не удалось удалить серверы подписки: {servers_error}")
@@ -1048,16 +1045,13 @@ class RemnaWaveService:
             try:
                 from sqlalchemy import delete
                 from app.database.models import (
-                    SubscriptionServer, Transaction, ReferralEarning, 
+                    Transaction, ReferralEarning, 
                     PromoCodeUse, SubscriptionStatus
                 )
                 
                 if user.subscription:
-                    await db.execute(
-                        delete(SubscriptionServer).where(
-                            SubscriptionServer.subscription_id == user.subscription.id
-                        )
-                    )
+                    from app.database.crud.subscription import delete_subscription_servers
+                    await delete_subscription_servers(db, user.subscription.id)
                     logger.info(f"🗑️ Удалены серверы подписки для {user.telegram_id}")
                 
                 await db.execute(
@@ -0,0 +1,66 @@
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.database.crud.server_squad import get_server_capacity_rows
+from app.utils.cache import ServerCapacityCache
+
+logger = logging.getLogger(__name__)
+
+
+class ServerCapacityService:
+    """
+    Доступность серверов для покупки. Счетчики current_users поддерживаются
+    при изменении серверов подписки, поэтому проверка заполненности - это
+    чтение среза из кеша (в процессе и в Redis, SERVER_CAPACITY_CACHE_TTL),
+    а не запрос на каждый сервер. Лимит мягкий: в пределах TTL срез может
+    отставать на несколько подключений.
+    """
+
+    _local: Optional[Tuple[float, Dict[int, dict], Dict[str, dict]]] = None
+
+    async def _load(self, db: AsyncSession) -> Tuple[Dict[int, dict], Dict[str, dict]]:
+        cached = ServerCapacityService._local
+        if cached and cached[0] > time.monotonic():
+            return cached[1], cached[2]
+
+        rows = await ServerCapacityCache.get()
+        if rows is None:
+            rows = await get_server_capacity_rows(db)
+            await ServerCapacityCache.set(rows)
+
+        by_id = {row["id"]: row for row in rows}
+        by_uuid = {row["squad_uuid"]: row for row in rows}
+        ServerCapacityService._local = (time.monotonic() + settings.SERVER_CAPACITY_CACHE_TTL, by_id, by_uuid)
+        return by_id, by_uuid
+
+    async def get_servers(self, db: AsyncSession) -> List[dict]:
+        by_id, _ = await self._load(db)
+        return list(by_id.values())
+
+    async def get_server(self, db: AsyncSession, server_id: int) -> Optional[dict]:
+        by_id, _ = await self._load(db)
+        return by_id.get(server_id)
+
+    async def get_server_by_uuid(self, db: AsyncSession, squad_uuid: str) -> Optional[dict]:
+        _, by_uuid = await self._load(db)
+        return by_uuid.get(squad_uuid)
+
+    @staticmethod
+    def accepts_users(server: Optional[dict]) -> bool:
+        if not server or not server["is_available"]:
+            return False
+        if server["max_users"] is None:
+            return True
+        return (server["current_users"] or 0) < server["max_users"]
+
+    @staticmethod
+    async def invalidate():
+        ServerCapacityService._local = None
+        await ServerCapacityCache.invalidate()
+
+
+server_capacity_service = ServerCapacityService()
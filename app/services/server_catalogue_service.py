@@ -0,0 +1,143 @@
+import asyncio
+import hashlib
+import json
+import logging
+from typing import Any, Dict, List, Optional
+
+from app.config import settings
+from app.database.database import AsyncSessionLocal
+from app.database.crud.server_squad import ServerCatalogueDiff, sync_with_remnawave
+from app.external.remnawave_api import RemnaWaveAPI
+from app.keyboards.factory import clear_keyboard_cache
+from app.services.coordination_service import coordination_service
+from app.services.placement_service import PlacementService
+from app.services.server_capacity_service import ServerCapacityService
+from app.utils.cache import cache, ServerCapacityCache
+
+logger = logging.getLogger(__name__)
+
+CATALOGUE_HASH_KEY = "servers:catalogue:hash"
+CATALOGUE_CHANNEL = "servers:catalogue:changed"
+
+
+def squads_hash(squads: List[Dict[str, Any]]) -> str:
+    normalized = sorted(
+        (squad["uuid"], squad["name"], sorted(squad.get("inbound_uuids") or []))
+        for squad in squads
+    )
+    return hashlib.sha256(json.dumps(normalized, ensure_ascii=False).encode()).hexdigest()
+
+
+class ServerCatalogueService:
+    """
+    Сверка каталога серверов со сквадами Remnawave раз в
+    SERVER_CATALOGUE_SYNC_INTERVAL секунд. Список сквадов хешируется, и пока
+    хеш совпадает с последним примененным (он хранится и в Redis, чтобы
+    процессы и перезапуски не сверяли заново), база не трогается.
+    Об изменениях каталога реплики узнают через CATALOGUE_CHANNEL и
+    сбрасывают свои локальные кеши.
+    """
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self._lease = coordination_service.lease("server-catalogue-sync")
+        self._last_hash: Optional[str] = None
+        coordination_service.subscribe(CATALOGUE_CHANNEL, self._on_catalogue_changed)
+
+    async def start(self):
+        if settings.SERVER_CATALOGUE_SYNC_INTERVAL <= 0:
+            logger.info("ℹ️ Автосинхронизация каталога серверов отключена")
+            return
+        if self._task and not self._task.done():
+            return
+
+        self._task = asyncio.create_task(self._loop(), name="server-catalogue-sync")
+        logger.info("✅ Автосинхронизация каталога серверов запущена")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self._lease.release()
+
+    async def _loop(self):
+        while True:
+            try:
+                if await self._lease.acquire():
+                    await self.sync()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка автосинхронизации каталога серверов: {e}")
+
+            await asyncio.sleep(settings.SERVER_CATALOGUE_SYNC_INTERVAL)
+
+    async def _fetch_squads(self) -> List[Dict[str, Any]]:
+        api = RemnaWaveAPI(
+            base_url=settings.REMNAWAVE_API_URL,
+            api_key=settings.REMNAWAVE_API_KEY,
+            secret_key=settings.REMNAWAVE_SECRET_KEY
+        )
+        async with api:
+            squads = await api.get_internal_squads()
+
+        return [
+            {
+                "uuid": squad.uuid,
+                "name": squad.name,
+                "inbound_uuids": [inbound["uuid"] for inbound in squad.inbounds if inbound.get("uuid")]
+            }
+            for squad in squads
+        ]
+
+    async def sync(self, force: bool = False) -> Optional[ServerCatalogueDiff]:
+        """
+        Применяет изменения списка сквадов к каталогу. None - Remnawave не
+        вернул сквадов или (без force) список не менялся с прошлой сверки.
+        """
+        squads = await self._fetch_squads()
+        if not squads:
+            logger.warning("⚠️ Remnawave вернул пустой список сквадов, каталог не изменен")
+            return None
+
+        digest = squads_hash(squads)
+        if not force:
+            if self._last_hash is None:
+                self._last_hash = await cache.get(CATALOGUE_HASH_KEY)
+            if digest == self._last_hash:
+                return None
+
+        async with AsyncSessionLocal() as db:
+            diff = await sync_with_remnawave(db, squads)
+
+        # Инбаунды сквадов входят в хеш, поэтому кеши сбрасываются и без изменений каталога
+        await self.refresh_caches()
+
+        self._last_hash = digest
+        await cache.set(CATALOGUE_HASH_KEY, digest)
+
+        if diff.changed:
+            for old_uuid, new_uuid in diff.recreated:
+                logger.warning(f"⚠️ Сквад {old_uuid} пересоздан как {new_uuid}, настройки сервера перенесены")
+        return diff
+
+    async def refresh_caches(self):
+        """Сбрасывает все производные каталога: список стран, цены и лимиты, инбаунды сквадов, кнопки серверов"""
+        self._clear_local_caches()
+        await ServerCapacityCache.invalidate_catalogue()
+        await coordination_service.publish(CATALOGUE_CHANNEL)
+
+    @staticmethod
+    def _clear_local_caches():
+        ServerCapacityService._local = None
+        clear_keyboard_cache()
+        PlacementService._topology = None
+
+    async def _on_catalogue_changed(self, payload: Dict[str, Any]):
+        # При переподключении (resync) событие могло быть пропущено - сбрасываем тоже
+        self._clear_local_caches()
+        self._last_hash = None
+
+
+server_catalogue_service = ServerCatalogueService()
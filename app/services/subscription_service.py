@@ -237,7 +237,7 @@ class SubscriptionService:
     ) -> Tuple[int, List[int]]:
     
         from app.config import PERIOD_PRICES
-        from app.database.crud.server_squad import get_server_squad_by_id
+        from app.services.server_capacity_service import server_capacity_service
     
         if settings.MAX_DEVICES_LIMIT > 0 and devices > settings.MAX_DEVICES_LIMIT:
             raise ValueError(f"Превышен максимальный лимит устройств: {settings.MAX_DEVICES_LIMIT}")
@@ -250,11 +250,11 @@ class SubscriptionService:
         total_servers_price = 0
     
         for server_id in server_squad_ids:
-            server = await get_server_squad_by_id(db, server_id)
-            if server and server.is_available and not server.is_full:
-                server_prices.append(server.price_kopeks)
-                total_servers_price += server.price_kopeks
-                logger.debug(f"Сервер {server.display_name}: {server.price_kopeks/100}₽")
+            server = await server_capacity_service.get_server(db, server_id)
+            if server_capacity_service.accepts_users(server):
+                server_prices.append(server["price_kopeks"])
+                total_servers_price += server["price_kopeks"]
+                logger.debug(f"Сервер {server['display_name']}: {server['price_kopeks']/100}₽")
             else:
                 server_prices.append(0)
                 logger.warning(f"Сервер ID {server_id} недоступен")
@@ -361,18 +361,18 @@ class SubscriptionService:
         db: AsyncSession
     ) -> Tuple[int, List[int]]:
         try:
-            from app.database.crud.server_squad import get_server_squad_by_uuid
+            from app.services.server_capacity_service import server_capacity_service
             
             total_price = 0
             prices_list = []
             
             for country_uuid in country_uuids:
-                server = await get_server_squad_by_uuid(db, country_uuid)
-                if server and server.is_available and not server.is_full:
-                    price = server.price_kopeks
+                server = await server_capacity_service.get_server_by_uuid(db, country_uuid)
+                if server_capacity_service.accepts_users(server):
+                    price = server["price_kopeks"]
                     total_price += price
                     prices_list.append(price)
-                    logger.debug(f"🏷️ Страна {server.display_name}: {price/100}₽")
+                    logger.debug(f"🏷️ Страна {server['display_name']}: {price/100}₽")
                 else:
                     default_price = 0  
                     total_price += default_price
@@ -405,7 +405,7 @@ class SubscriptionService:
     ) -> Tuple[int, List[int]]:
     
         from app.config import PERIOD_PRICES
-        from app.database.crud.server_squad import get_server_squad_by_id
+        from app.services.server_capacity_service import server_capacity_service
         
         if settings.MAX_DEVICES_LIMIT > 0 and devices > settings.MAX_DEVICES_LIMIT:
             raise ValueError(f"Превышен максимальный лимит устройств: {settings.MAX_DEVICES_LIMIT}")
@@ -421,13 +421,13 @@ class SubscriptionService:
         total_servers_price = 0
         
         for server_id in server_squad_ids:
-            server = await get_server_squad_by_id(db, server_id)
-            if server and server.is_available and not server.is_full:
-                server_price_per_month = server.price_kopeks
+            server = await server_capacity_service.get_server(db, server_id)
+            if server_capacity_service.accepts_users(server):
+                server_price_per_month = server["price_kopeks"]
                 server_price_total = server_price_per_month * months_in_period
                 server_prices.append(server_price_total)
                 total_servers_price += server_price_total
-                logger.debug(f"Сервер {server.display_name}: {server_price_per_month/100}₽/мес x {months_in_period} мес = {server_price_total/100}₽")
+                logger.debug(f"Сервер {server['display_name']}: {server_price_per_month/100}₽/мес x {months_in_period} мес = {server_price_total/100}₽")
             else:
                 server_prices.append(0)
                 logger.warning(f"Сервер ID {server_id} недоступен")
@@ -1,32 +1,105 @@
 import logging
-from typing import List
-from aiogram import Bot, Router, types, F
-from aiogram.enums import ChatMemberStatus
-from aiogram.utils.keyboard import InlineKeyboardBuilder
+import time
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+from aiogram import Bot
 from sqlalchemy.ext.asyncio import AsyncSession
 import html # Добавляем импорт для экранирования HTML
 
-from app.database.crud.tasks import get_active_tasks, check_task_completion, complete_task, get_task_by_id
-from app.database.crud.user import add_user_balance
-from app.database.models import User, Task
+from app.config import settings
+from app.database.crud.tasks import get_active_tasks, get_completed_task_ids, complete_task_with_reward
+from app.database.models import User
 from app.localization.texts import get_texts
+from app.services.channel_membership_service import channel_membership_service
+from app.utils.cache import TaskCache
 
 logger = logging.getLogger(__name__)
-router = Router()
+
+
+@dataclass
+class TaskChannelInfo:
+    name: str
+    channel_id: str
+    url: str
+
+
+@dataclass
+class TaskInfo:
+    id: int
+    title: str
+    description: str
+    reward_kopeks: int
+    channels: List[TaskChannelInfo] = field(default_factory=list)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "TaskInfo":
+        channels = [TaskChannelInfo(**channel) for channel in data.get("channels", [])]
+        return cls(**{**data, "channels": channels})
 
 
 class TasksService:
-    async def get_available_tasks_text(self, db: AsyncSession, user_id: int) -> str:
+    """
+    Задания для пользователей. Активные задания с каналами читаются одним
+    запросом и кешируются (в процессе и в Redis), выполнения пользователя -
+    одним IN-запросом, подписки проверяются параллельно через общий кеш
+    channel_membership_service.
+    """
+
+    _local: Optional[Tuple[float, List[TaskInfo]]] = None
+
+    async def get_active_tasks(self, db: AsyncSession) -> List[TaskInfo]:
+        cached = TasksService._local
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+
+        data = await TaskCache.get_active()
+        if data is None:
+            data = [
+                {
+                    "id": task.id,
+                    "title": task.title,
+                    "description": task.description,
+                    "reward_kopeks": task.reward_kopeks,
+                    "channels": [
+                        {"name": channel.name, "channel_id": channel.channel_id, "url": channel.url}
+                        for channel in task.channels
+                    ]
+                }
+                for task in await get_active_tasks(db)
+            ]
+            await TaskCache.set_active(data)
+
+        tasks = [TaskInfo.from_dict(item) for item in data]
+        TasksService._local = (time.monotonic() + settings.TASKS_CACHE_TTL, tasks)
+        return tasks
+
+    async def get_task(self, db: AsyncSession, task_id: int) -> Optional[TaskInfo]:
+        for task in await self.get_active_tasks(db):
+            if task.id == task_id:
+                return task
+        return None
+
+    @staticmethod
+    async def invalidate_cache():
+        TasksService._local = None
+        await TaskCache.invalidate()
+
+    async def get_user_tasks(self, db: AsyncSession, user: User) -> List[Tuple[TaskInfo, bool]]:
+        """Активные задания с отметкой о выполнении пользователем."""
+        tasks = await self.get_active_tasks(db)
+        completed = await get_completed_task_ids(db, user.id, [task.id for task in tasks])
+        return [(task, task.id in completed) for task in tasks]
+
+    async def is_completed(self, db: AsyncSession, user: User, task_id: int) -> bool:
+        return bool(await get_completed_task_ids(db, user.id, [task_id]))
+
+    async def get_available_tasks_text(self, db: AsyncSession, user: User) -> str:
         """Формирует текст со списком доступных заданий."""
         texts = get_texts('ru')
-        active_tasks = await get_active_tasks(db)
 
         task_list_text = texts.TASKS_MENU_TITLE + "\n\n"
 
-        for task in active_tasks:
-            is_completed = await check_task_completion(db, user_id, task.id)
-            status = "✅ Выполнено" if is_completed else "🔴 Не выполнено"
-
+        for task, is_completed in await self.get_user_tasks(db, user):
             # ✅ ИЗМЕНЕНИЕ: Генерируем "Канал 1", "Канал 2" и т.д.
             channels_list = ", ".join(
                 f"<a href='{html.escape(c.url)}'>Канал {i + 1}</a>" for i, c in enumerate(task.channels))
@@ -41,120 +114,28 @@ class TasksService:
 
         return task_list_text
 
-    async def check_subscription_and_reward(self, bot: Bot, db: AsyncSession, user: User, task: Task) -> bool:
-        """Проверяет подписку на все каналы задания и начисляет награду."""
-        # ✅ ИСПРАВЛЕНИЕ: Итерация по объектам TaskChannel
-        for channel in task.channels:
-            try:
-                member = await bot.get_chat_member(chat_id=channel.channel_id, user_id=user.telegram_id)
-                if member.status not in [ChatMemberStatus.MEMBER, ChatMemberStatus.ADMINISTRATOR,
-                                         ChatMemberStatus.CREATOR]:
-                    return False
-            except Exception as e:
-                logger.error(f"Не удалось проверить подписку на канал {channel.name}: {e}")
-                return False
-
-        await add_user_balance(db, user, task.reward_kopeks, f"Выполнение задания: {task.title}")
-        await complete_task(db, user.telegram_id, task.id)
-
-        return True
-
-
-# Добавляем хэндлеры из второго файла
-@router.callback_query(F.data == "tasks")
-async def show_tasks(call: types.CallbackQuery, db: AsyncSession):
-    """Отображает список доступных заданий."""
-    tasks_service = TasksService()
-    active_tasks = await get_active_tasks(db)
-    user_id = call.from_user.id
-
-    keyboard = InlineKeyboardBuilder()
-
-    if active_tasks:
-        for task in active_tasks:
-            is_completed = await check_task_completion(db, user_id, task.id)
-            if is_completed:
-                button_text = f"✅ {html.escape(task.title)}"
-            else:
-                button_text = f"{html.escape(task.title)} ({task.reward_kopeks / 100}₽)"
-
-            keyboard.row(types.InlineKeyboardButton(
-                text=button_text,
-                callback_data=f"show_task_{task.id}"
-            ))
-    else:
-        await call.message.edit_text("Сейчас нет доступных заданий.")
-        await call.answer()
-        return
-
-    # Кнопка назад
-    keyboard.row(types.InlineKeyboardButton(text="↩️ Назад", callback_data="menu"))
-
-    await call.message.edit_text(
-        "Выберите задание:",
-        reply_markup=keyboard.as_markup()
-    )
-    await call.answer()
-
-
-@router.callback_query(F.data.startswith("check_task_"))
-async def check_task_completion_handler(call: types.CallbackQuery, bot: Bot, db: AsyncSession):
-    """
-    Проверяет подписки и выдает вознаграждение.
-    """
-    task_id = int(call.data.split('_')[2])
-    task = await get_task_by_id(db, task_id)
-    user_id = call.from_user.id
-
-    if not task:
-        await call.answer("Задание не найдено.", show_alert=True)
-        return
-
-    if await check_task_completion(db, user_id, task_id):
-        await call.answer("Вы уже выполнили это задание!", show_alert=True)
-        return
-
-    tasks_service = TasksService()
-
-    # Получаем пользователя из базы данных (нужно добавить соответствующий метод в CRUD)
-    user = User(telegram_id=user_id)  # Замените на реальное получение пользователя
+    async def check_subscription_and_reward(self, bot: Bot, db: AsyncSession, user: User, task: TaskInfo) -> str:
+        """
+        Проверяет подписку на все каналы задания и начисляет награду.
+        Возвращает "completed", "already_completed" или "not_subscribed".
+        """
+        if await self.is_completed(db, user, task.id):
+            return "already_completed"
+
+        statuses = await channel_membership_service.check_channels(
+            bot, [channel.channel_id for channel in task.channels], user.telegram_id,
+            trust_negative=False
+        )
+        if not all(statuses.values()):
+            return "not_subscribed"
 
-    # Проверяем подписку и награждаем
-    success = await tasks_service.check_subscription_and_reward(bot, db, user, task)
+        if not await complete_task_with_reward(
+            db, user.id, task.id, task.reward_kopeks, f"Выполнение задания: {task.title}"
+        ):
+            return "already_completed"
 
-    if success:
-        success_text = (
-            f"✅ Поздравляем! Вы успешно выполнили задание и получили {task.reward_kopeks / 100}₽ на свой баланс."
-        )
-        await call.message.edit_text(success_text, parse_mode='HTML')
-    else:
-        # Формируем текст с каналами для подписки
-        channels_text = ""
-        # ✅ ИСПРАВЛЕНИЕ: Итерация по объектам TaskChannel
-        if task.channels:
-            for channel in task.channels:
-                channels_text += f'<a href="{html.escape(channel.url)}">{html.escape(channel.name)}</a>\n'
-
-        error_text = (
-            "❌ Вы подписались не на все каналы. Пожалуйста, подпишитесь на следующие каналы и попробуйте снова:\n\n"
-            f"{channels_text}"
-        )
+        logger.info(f"✅ Пользователь {user.telegram_id} выполнил задание {task.id}, награда {task.reward_kopeks / 100}₽")
+        return "completed"
 
-        # Кнопки для проверки
-        keyboard = InlineKeyboardBuilder()
-        keyboard.row(types.InlineKeyboardButton(
-            text="Проверить выполнение ✅",
-            callback_data=f"check_task_{task_id}"
-        ))
-        keyboard.row(types.InlineKeyboardButton(
-            text="↩️ Назад к списку",
-            callback_data="tasks"
-        ))
-
-        await call.message.edit_text(
-            error_text,
-            reply_markup=keyboard.as_markup(),
-            parse_mode="HTML"
-        )
 
-    await call.answer()
\ No newline at end of file
+tasks_service = TasksService()
@@ -13,8 +13,11 @@ from app.database.models import Transaction, TransactionType, PaymentMethod
 from app.database.crud.transaction import (
     create_transaction, get_transaction_by_external_id, complete_transaction
 )
-from app.database.crud.user import get_user_by_telegram_id, add_user_balance
+from app.database.crud.user import (
+    get_user_by_telegram_id, add_user_balance, apply_balance_change, BalanceChange
+)
 from app.external.tribute import TributeService as TributeAPI
+from app.services.notification_queue_service import notification_queue
 
 logger = logging.getLogger(__name__)
 
@@ -63,7 +66,7 @@ class TributeService:
             logger.error("Некорректный JSON в Tribute webhook")
             return {"status": "error", "reason": "invalid_json"}
         
-        logger.info(f"Получен Tribute webhook: {json.dumps(webhook_data, ensure_ascii=False)}")
+        logger.debug(f"Получен Tribute webhook: {json.dumps(webhook_data, ensure_ascii=False)}")
         
         processed_data = await self.tribute_api.process_webhook(webhook_data)
         if not processed_data:
@@ -119,21 +122,19 @@ class TributeService:
                     user_id=user.id,
                     payment_id=payment_id,
                     amount_kopeks=amount_kopeks,
-                    description=f"Пополнение через Tribute: {amount_kopeks/100}₽ (ID: {payment_id})"
+                    description=f"Пополнение через Tribute: {amount_kopeks/100}₽ (ID: {payment_id})",
+                    commit=False
                 )
                 
                 old_balance = user.balance_kopeks
-                user.balance_kopeks += amount_kopeks
-                user.updated_at = datetime.utcnow()
-                
-                await session.commit()
+                await apply_balance_change(session, BalanceChange(user_id=user.id, amount_kopeks=amount_kopeks))
                 
                 logger.info(f"✅ Баланс пользователя {user_telegram_id} обновлен: {old_balance} -> {user.balance_kopeks} коп (+{amount_kopeks})")
                 logger.info(f"✅ Создана транзакция ID: {transaction.id}")
                 
                 try:
                     from app.services.referral_service import process_referral_topup
-                    await process_referral_topup(session, user.id, amount_kopeks, self.bot)
+                    await process_referral_topup(session, user.id, amount_kopeks, self.bot, transaction.id)
                 except Exception as e:
                     logger.error(f"Ошибка обработки реферального пополнения Tribute: {e}")
                     
@@ -158,6 +159,7 @@ class TributeService:
                 
         except Exception as e:
             logger.error(f"⌘ Ошибка обработки успешного Tribute платежа: {e}", exc_info=True)
+            raise
     
     async def _handle_failed_payment(self, payment_data: Dict[str, Any]):
         
@@ -202,9 +204,8 @@ class TributeService:
                 )
                 
                 user = await get_user_by_telegram_id(session, user_id)
-                if user and user.balance_kopeks >= amount_kopeks:
-                    user.balance_kopeks -= amount_kopeks
-                    await session.commit()
+                if user:
+                    await apply_balance_change(session, BalanceChange(user_id=user.id, amount_kopeks=-amount_kopeks))
                 
                 await self._send_refund_notification(user_id, amount_kopeks)
                 
@@ -232,12 +233,7 @@ class TributeService:
                 [InlineKeyboardButton(text="🏠 Главное меню", callback_data="back_to_menu")]
             ])
             
-            await self.bot.send_message(
-                user_id,
-                text,
-                reply_markup=keyboard,
-                parse_mode="Markdown"
-            )
+            await notification_queue.enqueue(user_id, text, parse_mode="Markdown", reply_markup=keyboard)
             
         except Exception as e:
             logger.error(f"Ошибка отправки уведомления об успешном платеже: {e}")
@@ -260,12 +256,7 @@ class TributeService:
                 [InlineKeyboardButton(text="💬 Поддержка", callback_data="menu_support")]
             ])
             
-            await self.bot.send_message(
-                user_id,
-                text,
-                reply_markup=keyboard,
-                parse_mode="Markdown"
-            )
+            await notification_queue.enqueue(user_id, text, parse_mode="Markdown", reply_markup=keyboard)
             
         except Exception as e:
             logger.error(f"Ошибка отправки уведомления о неудачном платеже: {e}")
@@ -288,12 +279,7 @@ class TributeService:
                 [InlineKeyboardButton(text="🏠 Главное меню", callback_data="back_to_menu")]
             ])
             
-            await self.bot.send_message(
-                user_id,
-                text,
-                reply_markup=keyboard,
-                parse_mode="Markdown"
-            )
+            await notification_queue.enqueue(user_id, text, parse_mode="Markdown", reply_markup=keyboard)
             
         except Exception as e:
             logger.error(f"Ошибка отправки уведомления о возврате: {e}")
@@ -317,22 +303,15 @@ class TributeService:
                 
                 external_id = f"force_donation_{payment_id}_{int(datetime.utcnow().timestamp())}"
                 
-                transaction = await create_transaction(
-                    db=session,
+                old_balance = user.balance_kopeks
+                await apply_balance_change(session, BalanceChange(
                     user_id=user.id,
-                    type=TransactionType.DEPOSIT,
                     amount_kopeks=amount_kopeks,
                     description=description,
+                    transaction_type=TransactionType.DEPOSIT,
                     payment_method=PaymentMethod.TRIBUTE,
-                    external_id=external_id,
-                    is_completed=True
-                )
-                
-                old_balance = user.balance_kopeks
-                user.balance_kopeks += amount_kopeks
-                user.updated_at = datetime.utcnow()
-                
-                await session.commit()
+                    external_id=external_id
+                ))
                 
                 logger.info(f"💰 ПРИНУДИТЕЛЬНО обновлен баланс: {old_balance} -> {user.balance_kopeks} коп")
                 
@@ -0,0 +1,244 @@
+import asyncio
+import logging
+import time
+from collections import Counter, deque
+from typing import Any, Deque, Dict, Hashable, List, Optional, Tuple
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+from app.config import settings
+from app.services.metrics_service import Histogram
+
+logger = logging.getLogger(__name__)
+
+
+LANE_PAYMENTS = "payments"
+LANE_INTERACTIVE = "interactive"
+LANE_BULK = "bulk"
+LANES = (LANE_PAYMENTS, LANE_INTERACTIVE, LANE_BULK)
+
+# Обычные воркеры берут платежи раньше остальных апдейтов, тяжелые операции
+# админки обслуживают свои воркеры и не занимают пул пользователей
+WORKER_GROUPS = {
+    "general": (LANE_PAYMENTS, LANE_INTERACTIVE),
+    "bulk": (LANE_BULK,),
+}
+LANE_GROUP = {lane: group for group, lanes in WORKER_GROUPS.items() for lane in lanes}
+
+PAYMENT_CALLBACKS = frozenset({"subscription_confirm"})
+PAYMENT_CALLBACK_PREFIXES = ("topup_",)
+
+BULK_CALLBACKS = frozenset({
+    "admin_confirm_broadcast",
+    "admin_cleanup_inactive",
+    "admin_restart_all_nodes",
+    "admin_send_expiry_reminders",
+    "admin_payment_inbox_retry_all",
+})
+BULK_CALLBACK_PREFIXES = ("sync_", "admin_servers_sync")
+
+QueuedUpdate = Tuple[str, float, Dict[str, Any]]
+
+
+def _event_of(data: Dict[str, Any]) -> Tuple[Optional[str], Dict[str, Any]]:
+    for event_type, event in data.items():
+        if event_type != "update_id" and isinstance(event, dict):
+            return event_type, event
+    return None, {}
+
+
+def _user_id_of(event: Dict[str, Any]) -> Optional[int]:
+    user = event.get("from") or event.get("user")
+    if user:
+        return user.get("id")
+    chat = event.get("chat") or (event.get("message") or {}).get("chat")
+    if chat:
+        return chat.get("id")
+    return None
+
+
+def classify_update(data: Dict[str, Any]) -> Tuple[str, Hashable]:
+    """
+    Полоса и ключ упорядочивания апдейта по сырому JSON - без валидации
+    модели, чтобы ответ Telegram не ждал разбора. Апдейты с одним ключом
+    обрабатываются строго по очереди. Тяжелые операции админа упорядочены
+    между собой, но не блокируют его обычные нажатия.
+    """
+    event_type, event = _event_of(data)
+    user_id = _user_id_of(event)
+    key: Hashable = user_id if user_id is not None else ("update", data.get("update_id"))
+
+    if event_type == "pre_checkout_query" or (event_type == "message" and "successful_payment" in event):
+        return LANE_PAYMENTS, key
+
+    if event_type == "callback_query":
+        callback_data = event.get("data") or ""
+        if callback_data in PAYMENT_CALLBACKS or callback_data.startswith(PAYMENT_CALLBACK_PREFIXES):
+            return LANE_PAYMENTS, key
+        if (
+            (callback_data in BULK_CALLBACKS or callback_data.startswith(BULK_CALLBACK_PREFIXES))
+            and user_id is not None and settings.is_admin(user_id)
+        ):
+            return LANE_BULK, ("bulk", key)
+
+    return LANE_INTERACTIVE, key
+
+
+class UpdateQueueService:
+    """
+    Прием апдейтов Telegram в режиме вебхука: вебхук только ставит апдейт
+    в очередь и сразу отвечает, обработку ведет ограниченный пул воркеров.
+    Апдейты одного пользователя идут последовательно, разные пользователи -
+    параллельно. Очередь ограничена UPDATE_QUEUE_SIZE: при переполнении
+    вебхук отвечает 503 и Telegram повторит доставку позже. Платежные
+    апдейты принимаются всегда - на pre_checkout_query есть 10 секунд.
+    """
+
+    def __init__(self):
+        self._bot: Optional[Bot] = None
+        self._dispatcher: Optional[Dispatcher] = None
+        self._tasks: List[asyncio.Task] = []
+        self._pending: Dict[Hashable, Deque[QueuedUpdate]] = {}
+        self._active: set = set()
+        self._ready: Dict[str, Deque[Hashable]] = {lane: deque() for lane in LANES}
+        self._wakeup: Dict[str, asyncio.Event] = {group: asyncio.Event() for group in WORKER_GROUPS}
+        self._size = 0
+        self._accepting = False
+        self.wait_time: Dict[str, Histogram] = {lane: Histogram() for lane in LANES}
+        self.stats = Counter()
+
+    def set_dispatcher(self, bot: Bot, dispatcher: Dispatcher):
+        self._bot = bot
+        self._dispatcher = dispatcher
+
+    @property
+    def is_running(self) -> bool:
+        return any(not task.done() for task in self._tasks)
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def depth(self) -> Dict[str, int]:
+        depth = Counter()
+        for queue in self._pending.values():
+            for lane, _, _ in queue:
+                depth[lane] += 1
+        return {lane: depth[lane] for lane in LANES}
+
+    def submit(self, data: Dict[str, Any]) -> bool:
+        """Ставит сырой апдейт в очередь. False - очередь переполнена"""
+        if not self._accepting:
+            self.stats["rejected"] += 1
+            return False
+
+        lane, key = classify_update(data)
+        if lane != LANE_PAYMENTS and self._size >= settings.UPDATE_QUEUE_SIZE:
+            self.stats["rejected"] += 1
+            return False
+
+        queue = self._pending.get(key)
+        if queue is None:
+            queue = self._pending[key] = deque()
+        queue.append((lane, time.monotonic(), data))
+        self._size += 1
+        self.stats["accepted"] += 1
+
+        if len(queue) == 1 and key not in self._active:
+            self._schedule(key)
+        return True
+
+    async def start(self):
+        if self.is_running:
+            return
+        if self._dispatcher is None:
+            raise RuntimeError("Диспетчер не установлен")
+
+        self._accepting = True
+        workers = {"general": settings.UPDATE_WORKERS, "bulk": settings.UPDATE_BULK_WORKERS}
+        self._tasks = [
+            asyncio.create_task(self._worker_loop(group), name=f"update-worker-{group}-{index}")
+            for group, count in workers.items()
+            for index in range(max(1, count))
+        ]
+        logger.info(
+            f"✅ Очередь апдейтов запущена: {settings.UPDATE_WORKERS} воркеров, "
+            f"{settings.UPDATE_BULK_WORKERS} для тяжелых операций админки"
+        )
+
+    async def stop(self, timeout: Optional[float] = None):
+        if not self._tasks:
+            return
+
+        self._accepting = False
+        deadline = time.monotonic() + (settings.UPDATE_DRAIN_TIMEOUT if timeout is None else timeout)
+        while self._size and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        if self._size:
+            logger.warning(f"⚠️ Не обработано апдейтов при остановке: {self._size}")
+
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info("Очередь апдейтов остановлена")
+
+    def _schedule(self, key: Hashable):
+        lane = self._pending[key][0][0]
+        self._ready[lane].append(key)
+        self._wakeup[LANE_GROUP[lane]].set()
+
+    def _take(self, lanes: Tuple[str, ...]) -> Optional[Tuple[Hashable, QueuedUpdate]]:
+        for lane in lanes:
+            if self._ready[lane]:
+                key = self._ready[lane].popleft()
+                self._active.add(key)
+                return key, self._pending[key].popleft()
+        return None
+
+    def _release(self, key: Hashable):
+        self._size -= 1
+        self._active.discard(key)
+        if self._pending[key]:
+            self._schedule(key)
+        else:
+            del self._pending[key]
+
+    async def _worker_loop(self, group: str):
+        lanes = WORKER_GROUPS[group]
+        wakeup = self._wakeup[group]
+
+        while True:
+            taken = self._take(lanes)
+            if taken is None:
+                wakeup.clear()
+                await wakeup.wait()
+                continue
+
+            key, (lane, queued_at, data) = taken
+            self.wait_time[lane].observe(time.monotonic() - queued_at)
+            try:
+                update = Update.model_validate(data, context={"bot": self._bot})
+                await self._dispatcher.feed_update(self._bot, update)
+                self.stats["processed"] += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["failed"] += 1
+                logger.error(f"❌ Ошибка обработки апдейта {data.get('update_id')}: {e}", exc_info=True)
+            finally:
+                self._release(key)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.is_running,
+            "queued": self._size,
+            "active_users": len(self._active),
+            "depth": self.depth(),
+            "wait_p95": {lane: histogram.quantile(0.95) for lane, histogram in self.wait_time.items()},
+            **self.stats,
+        }
+
+
+update_queue_service = UpdateQueueService()
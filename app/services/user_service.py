@@ -10,10 +10,10 @@ from app.database.crud.user import (
     add_user_balance, subtract_user_balance, update_user, delete_user
 )
 from app.database.crud.transaction import get_user_transactions_count
-from app.database.crud.subscription import get_subscription_by_user_id
+from app.database.crud.subscription import get_subscription_by_user_id, delete_subscription_servers
 from app.database.models import (
     User, UserStatus, Subscription, Transaction, PromoCodeUse, 
-    ReferralEarning, SubscriptionServer, YooKassaPayment, BroadcastHistory
+    ReferralEarning, YooKassaPayment, BroadcastHistory
 )
 from app.config import settings
 
@@ -337,11 +337,7 @@ class UserService:
             
             if user.subscription:
                 try:
-                    await db.execute(
-                        delete(SubscriptionServer).where(
-                            SubscriptionServer.subscription_id == user.subscription.id
-                        )
-                    )
+                    await delete_subscription_servers(db, user.subscription.id)
                     await db.flush()
                     logger.info(f"🗑️ Удалены записи SubscriptionServer для подписки {user.subscription.id}")
                 except Exception as e:
@@ -367,6 +363,8 @@ class UserService:
                 )
                 if referrals_result.rowcount > 0:
                     logger.info(f"🔗 Очищены реферальные ссылки у {referrals_result.rowcount} рефералов")
+                    from app.services.referral_service import referral_link_cache
+                    referral_link_cache.clear()
                 await db.flush()
             except Exception as e:
                 logger.error(f"❌ Ошибка очистки реферальных ссылок: {e}")
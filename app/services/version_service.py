@@ -6,9 +6,13 @@ from pathlib import Path
 from packaging import version
 
 from app.config import settings
+from app.services.coordination_service import coordination_service
+from app.utils.cache import cache
 
 logger = logging.getLogger(__name__)
 
+RELEASE_KEY = "version:latest_release"
+
 
 class VersionService:
     """Сервис для работы с версиями бота"""
@@ -18,6 +22,7 @@ class VersionService:
         self.latest_version: Optional[str] = None
         self.update_available = False
         self.changelog: Optional[str] = None
+        self._lease = coordination_service.lease("version-check")
         
     def get_current_version(self) -> str:
         """Получает текущую версию из файла VERSION"""
@@ -107,14 +112,40 @@ class VersionService:
         else:
             return f"v{self.current_version} ✅"
     
+    async def _save_release_to_cache(self):
+        if not self.latest_version:
+            return
+        await cache.set(RELEASE_KEY, {
+            "latest_version": self.latest_version,
+            "changelog": self.changelog
+        }, expire=7 * 86400)
+    
+    async def _load_release_from_cache(self):
+        release = await cache.get(RELEASE_KEY)
+        if not release or not release.get("latest_version"):
+            return
+        
+        self.latest_version = release["latest_version"]
+        self.changelog = release.get("changelog")
+        try:
+            self.update_available = version.parse(self.latest_version) > version.parse(self.current_version)
+        except Exception:
+            self.update_available = False
+    
     async def start_version_monitoring(self, interval_hours: int = 24):
         """Запускает мониторинг версий"""
         logger.info(f"Запуск мониторинга версий (интервал: {interval_hours}ч)")
         
         while True:
             try:
-                await self.check_for_updates()
-                await asyncio.sleep(interval_hours * 3600)  # Конвертируем часы в секунды
+                # GitHub опрашивает одна реплика, остальные берут результат из кеша
+                if await self._lease.acquire():
+                    await self.check_for_updates()
+                    await self._save_release_to_cache()
+                    await asyncio.sleep(interval_hours * 3600)  # Конвертируем часы в секунды
+                else:
+                    await self._load_release_from_cache()
+                    await asyncio.sleep(3600)
             except Exception as e:
                 logger.error(f"Ошибка в мониторинге версий: {e}")
                 await asyncio.sleep(3600)  # Ждем час при ошибке
@@ -1,13 +1,10 @@
 import uuid
 import logging
-import asyncio
+from datetime import datetime
 from typing import Optional, Dict, Any, List
 
-from yookassa import Configuration, Payment as YooKassaPayment
-from yookassa.domain.request.payment_request_builder import PaymentRequestBuilder
-from yookassa.domain.common.confirmation_type import ConfirmationType
-
 from app.config import settings
+from app.external.yookassa_api import YooKassaAPI, YooKassaAPIError, yookassa_api
 
 logger = logging.getLogger(__name__)
 
@@ -29,16 +26,16 @@ class YooKassaService:
                 "YooKassa SHOP_ID или SECRET_KEY не настроены в settings. "
                 "Функционал платежей будет ОТКЛЮЧЕН.")
             self.configured = False
+            self.api = yookassa_api
         else:
-            try:
-                Configuration.configure(shop_id, secret_key)
-                self.configured = True
-                logger.info(
-                    f"YooKassa SDK сконфигурирован для shop_id: {shop_id[:5]}...")
-            except Exception as e:
-                logger.error(f"Ошибка конфигурации YooKassa SDK: {e}",
-                              exc_info=True)
-                self.configured = False
+            # Для магазина из настроек используем общий клиент с его пулом соединений
+            if shop_id == settings.YOOKASSA_SHOP_ID and secret_key == settings.YOOKASSA_SECRET_KEY:
+                self.api = yookassa_api
+            else:
+                self.api = YooKassaAPI(shop_id, secret_key)
+            self.configured = True
+            logger.info(
+                f"YooKassa API клиент сконфигурирован для shop_id: {shop_id[:5]}...")
 
         if configured_return_url:
             self.return_url = configured_return_url
@@ -61,7 +58,8 @@ class YooKassaService:
             description: str,
             metadata: Dict[str, Any],
             receipt_email: Optional[str] = None,
-            receipt_phone: Optional[str] = None) -> Optional[Dict[str, Any]]:
+            receipt_phone: Optional[str] = None,
+            idempotence_key: Optional[str] = None) -> Optional[Dict[str, Any]]:
         """Создает платеж в YooKassa"""
         
         if not self.configured:
@@ -83,67 +81,63 @@ class YooKassaService:
                 "internal_message": "Отсутствуют контактные данные для чека YooKassa и не настроен email по умолчанию."
             }
 
-        try:
-            builder = PaymentRequestBuilder()
-            builder.set_amount({
-                "value": str(round(amount, 2)),
-                "currency": currency.upper()
-            })
-            builder.set_capture(True)
-            builder.set_confirmation({
-                "type": ConfirmationType.REDIRECT,
+        amount_data = {
+            "value": f"{amount:.2f}",
+            "currency": currency.upper()
+        }
+
+        receipt_items_list: List[Dict[str, Any]] = [{
+            "description": description[:128],
+            "quantity": "1.00",
+            "amount": amount_data,
+            "vat_code": int(getattr(settings, 'YOOKASSA_VAT_CODE', 1)),
+            "payment_mode": getattr(settings, 'YOOKASSA_PAYMENT_MODE', 'full_payment'),
+            "payment_subject": getattr(settings, 'YOOKASSA_PAYMENT_SUBJECT', 'service')
+        }]
+
+        receipt_data_dict: Dict[str, Any] = {
+            "customer": customer_contact_for_receipt,
+            "items": receipt_items_list
+        }
+
+        payment_request = {
+            "amount": amount_data,
+            "capture": True,
+            "confirmation": {
+                "type": "redirect",
                 "return_url": self.return_url
-            })
-            builder.set_description(description)
-            builder.set_metadata(metadata)
-
-            receipt_items_list: List[Dict[str, Any]] = [{
-                "description": description[:128],
-                "quantity": "1.00",
-                "amount": {
-                    "value": str(round(amount, 2)),
-                    "currency": currency.upper()
-                },
-                "vat_code": str(getattr(settings, 'YOOKASSA_VAT_CODE', 1)),
-                "payment_mode": getattr(settings, 'YOOKASSA_PAYMENT_MODE', 'full_payment'),
-                "payment_subject": getattr(settings, 'YOOKASSA_PAYMENT_SUBJECT', 'service')
-            }]
-
-            receipt_data_dict: Dict[str, Any] = {
-                "customer": customer_contact_for_receipt,
-                "items": receipt_items_list
-            }
+            },
+            "description": description[:128],
+            "metadata": metadata,
+            "receipt": receipt_data_dict
+        }
 
-            builder.set_receipt(receipt_data_dict)
-
-            idempotence_key = str(uuid.uuid4())
-            payment_request = builder.build()
+        idempotence_key = idempotence_key or str(uuid.uuid4())
 
+        try:
             logger.info(
                 f"Создание платежа YooKassa (Idempotence-Key: {idempotence_key}). "
                 f"Сумма: {amount} {currency}. Метаданные: {metadata}. Чек: {receipt_data_dict}")
 
-            loop = asyncio.get_running_loop()
-            response = await loop.run_in_executor(
-                None, lambda: YooKassaPayment.create(payment_request, idempotence_key))
+            response = await self.api.create_payment(payment_request, idempotence_key)
 
             logger.info(
-                f"Ответ YooKassa Payment.create: ID={response.id}, Status={response.status}, Paid={response.paid}")
+                f"Ответ YooKassa Payment.create: ID={response.get('id')}, "
+                f"Status={response.get('status')}, Paid={response.get('paid')}")
 
             return {
-                "id": response.id,
-                "confirmation_url": response.confirmation.confirmation_url if response.confirmation else None,
-                "status": response.status,
-                "metadata": response.metadata,
-                "amount_value": float(response.amount.value),
-                "amount_currency": response.amount.currency,
+                "id": response["id"],
+                "confirmation_url": (response.get("confirmation") or {}).get("confirmation_url"),
+                "status": response.get("status"),
+                "metadata": response.get("metadata"),
+                "amount_value": float(response["amount"]["value"]),
+                "amount_currency": response["amount"]["currency"],
                 "idempotence_key_used": idempotence_key,
-                "paid": response.paid,
-                "refundable": response.refundable,
-                "created_at": response.created_at.isoformat() if hasattr(
-                    response.created_at, 'isoformat') else str(response.created_at),
-                "description_from_yk": response.description,
-                "test_mode": response.test if hasattr(response, 'test') else None
+                "paid": response.get("paid"),
+                "refundable": response.get("refundable"),
+                "created_at": response.get("created_at"),
+                "description_from_yk": response.get("description"),
+                "test_mode": response.get("test")
             }
         except Exception as e:
             logger.error(f"Ошибка создания платежа YooKassa: {e}", exc_info=True)
@@ -159,36 +153,92 @@ class YooKassaService:
         try:
             logger.info(f"Получение информации о платеже YooKassa ID: {payment_id_in_yookassa}")
 
-            loop = asyncio.get_running_loop()
-            payment_info_yk = await loop.run_in_executor(
-                None, lambda: YooKassaPayment.find_one(payment_id_in_yookassa))
-
-            if payment_info_yk:
-                logger.info(
-                    f"Информация о платеже YooKassa {payment_id_in_yookassa}: "
-                    f"Status={payment_info_yk.status}, Paid={payment_info_yk.paid}")
-                return {
-                    "id": payment_info_yk.id,
-                    "status": payment_info_yk.status,
-                    "paid": payment_info_yk.paid,
-                    "amount_value": float(payment_info_yk.amount.value),
-                    "amount_currency": payment_info_yk.amount.currency,
-                    "metadata": payment_info_yk.metadata,
-                    "description": payment_info_yk.description,
-                    "refundable": payment_info_yk.refundable,
-                    "created_at": payment_info_yk.created_at.isoformat() if hasattr(
-                        payment_info_yk.created_at, 'isoformat') else str(payment_info_yk.created_at),
-                    "captured_at": payment_info_yk.captured_at.isoformat()
-                    if payment_info_yk.captured_at and hasattr(
-                        payment_info_yk.captured_at, 'isoformat') else None,
-                    "payment_method_type": payment_info_yk.payment_method.type
-                    if payment_info_yk.payment_method else None,
-                    "test_mode": payment_info_yk.test if hasattr(payment_info_yk, 'test') else None
-                }
-            else:
+            payment_info_yk = await self.api.get_payment(payment_id_in_yookassa)
+
+            logger.info(
+                f"Информация о платеже YooKassa {payment_id_in_yookassa}: "
+                f"Status={payment_info_yk.get('status')}, Paid={payment_info_yk.get('paid')}")
+            return self._payment_info(payment_info_yk)
+        except YooKassaAPIError as e:
+            if e.status_code == 404:
                 logger.warning(f"Платеж не найден в YooKassa ID: {payment_id_in_yookassa}")
-                return None
+            else:
+                logger.error(f"Ошибка получения информации о платеже YooKassa {payment_id_in_yookassa}: {e}")
+            return None
         except Exception as e:
             logger.error(f"Ошибка получения информации о платеже YooKassa {payment_id_in_yookassa}: {e}",
                          exc_info=True)
             return None
+
+    @staticmethod
+    def _payment_info(payment: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "id": payment["id"],
+            "status": payment.get("status"),
+            "paid": payment.get("paid"),
+            "amount_value": float(payment["amount"]["value"]),
+            "amount_currency": payment["amount"]["currency"],
+            "metadata": payment.get("metadata"),
+            "description": payment.get("description"),
+            "refundable": payment.get("refundable"),
+            "created_at": payment.get("created_at"),
+            "captured_at": payment.get("captured_at"),
+            "payment_method_type": (payment.get("payment_method") or {}).get("type"),
+            "test_mode": payment.get("test")
+        }
+
+    async def list_payments(
+            self,
+            created_at_gte: Optional[datetime] = None,
+            status: Optional[str] = None,
+            limit: int = 100,
+            cursor: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Одна страница списка платежей: {"items": [...], "next_cursor": ...}"""
+
+        if not self.configured:
+            logger.error("YooKassa не сконфигурирован. Невозможно получить список платежей.")
+            return None
+
+        params: Dict[str, Any] = {"limit": limit}
+        if created_at_gte:
+            params["created_at.gte"] = created_at_gte.strftime("%Y-%m-%dT%H:%M:%S.000Z")
+        if status:
+            params["status"] = status
+        if cursor:
+            params["cursor"] = cursor
+
+        try:
+            response = await self.api.list_payments(params)
+
+            return {
+                "items": response.get("items", []),
+                "next_cursor": response.get("next_cursor")
+            }
+        except Exception as e:
+            logger.error(f"Ошибка получения списка платежей YooKassa: {e}", exc_info=True)
+            return None
+
+    async def capture_payment(
+            self,
+            payment_id_in_yookassa: str,
+            amount: Optional[float] = None,
+            currency: str = "RUB",
+            idempotence_key: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Подтверждает платеж в статусе waiting_for_capture (частично, если передана сумма)"""
+
+        if not self.configured:
+            logger.error("YooKassa не сконфигурирован. Невозможно подтвердить платеж.")
+            return None
+
+        amount_data = {"value": f"{amount:.2f}", "currency": currency.upper()} if amount is not None else None
+
+        try:
+            response = await self.api.capture_payment(
+                payment_id_in_yookassa, amount_data,
+                idempotence_key or f"capture_{payment_id_in_yookassa}"
+            )
+            logger.info(f"Платеж YooKassa {payment_id_in_yookassa} подтвержден: Status={response.get('status')}")
+            return self._payment_info(response)
+        except Exception as e:
+            logger.error(f"Ошибка подтверждения платежа YooKassa {payment_id_in_yookassa}: {e}", exc_info=True)
+            return None
@@ -14,6 +14,7 @@ class CacheService:
     def __init__(self):
         self.redis_client: Optional[redis.Redis] = None
         self._connected = False
+        self._scripts = {}
     
     async def connect(self):
         try:
@@ -25,6 +26,10 @@ class CacheService:
             logger.warning(f"⚠️ Не удалось подключиться к Redis: {e}")
             self._connected = False
     
+    @property
+    def is_connected(self) -> bool:
+        return self._connected
+    
     async def disconnect(self):
         if self.redis_client:
             await self.redis_client.close()
@@ -75,6 +80,17 @@ class CacheService:
             logger.error(f"Ошибка удаления из кеша {key}: {e}")
             return False
     
+    async def delete_many(self, *keys: str) -> int:
+        # Одна команда DEL - ключи исчезают одновременно
+        if not self._connected or not keys:
+            return 0
+        
+        try:
+            return await self.redis_client.delete(*keys)
+        except Exception as e:
+            logger.error(f"Ошибка удаления из кеша {keys}: {e}")
+            return 0
+    
     async def exists(self, key: str) -> bool:
         if not self._connected:
             return False
@@ -128,6 +144,20 @@ class CacheService:
             logger.error(f"Ошибка инкремента {key}: {e}")
             return None
     
+    async def run_script(self, script: str, keys: list, args: list) -> Optional[Any]:
+        if not self._connected:
+            return None
+        
+        try:
+            registered = self._scripts.get(script)
+            if registered is None:
+                registered = self.redis_client.register_script(script)
+                self._scripts[script] = registered
+            return await registered(keys=keys, args=args)
+        except Exception as e:
+            logger.error(f"Ошибка выполнения Lua-скрипта для {keys}: {e}")
+            return None
+    
     async def set_hash(self, name: str, mapping: dict, expire: int = None) -> bool:
         if not self._connected:
             return False
@@ -212,6 +242,90 @@ class UserCache:
         return await cache.set(key, data, expire)
 
 
+class PromoCodeCache:
+    """
+    Метаданные промокодов для активации без похода в базу. Несуществующие
+    коды кешируются отдельной отметкой, а неудачные попытки считаются на
+    пользователя, чтобы перебор кодов не доходил до базы.
+    """
+    
+    @staticmethod
+    async def get(code: str) -> Optional[dict]:
+        return await cache.get(cache_key("promocode", code))
+    
+    @staticmethod
+    async def set(code: str, data: dict) -> bool:
+        return await cache.set(cache_key("promocode", code), data, settings.PROMOCODE_CACHE_TTL)
+    
+    @staticmethod
+    async def set_missing(code: str) -> bool:
+        return await cache.set(
+            cache_key("promocode", code), {"missing": True}, settings.PROMOCODE_NEGATIVE_CACHE_TTL
+        )
+    
+    @staticmethod
+    async def mark_exhausted(code: str) -> bool:
+        data = await PromoCodeCache.get(code)
+        if not data or data.get("missing"):
+            return False
+        data["exhausted"] = True
+        return await PromoCodeCache.set(code, data)
+    
+    @staticmethod
+    async def invalidate(code: str) -> bool:
+        return await cache.delete(cache_key("promocode", code.upper()))
+    
+    @staticmethod
+    async def register_failure(user_id: int) -> Optional[int]:
+        key = cache_key("promocode_failures", user_id)
+        failures = await cache.increment(key)
+        if failures == 1:
+            await cache.expire(key, settings.PROMOCODE_FAILED_ATTEMPTS_WINDOW)
+        return failures
+    
+    @staticmethod
+    async def is_throttled(user_id: int) -> bool:
+        failures = await cache.get(cache_key("promocode_failures", user_id))
+        return bool(failures) and failures >= settings.PROMOCODE_MAX_FAILED_ATTEMPTS
+
+
+class TaskCache:
+    """Активные задания с каналами; сбрасывается при изменении заданий админом"""
+    
+    @staticmethod
+    async def get_active() -> Optional[list]:
+        return await cache.get("tasks:active")
+    
+    @staticmethod
+    async def set_active(tasks: list) -> bool:
+        return await cache.set("tasks:active", tasks, settings.TASKS_CACHE_TTL)
+    
+    @staticmethod
+    async def invalidate() -> bool:
+        return await cache.delete("tasks:active")
+
+
+class ServerCapacityCache:
+    """Срез серверов (доступность, лимиты, счетчики, цены) для проверок при покупке"""
+    
+    @staticmethod
+    async def get() -> Optional[list]:
+        return await cache.get("servers:capacity")
+    
+    @staticmethod
+    async def set(servers: list) -> bool:
+        return await cache.set("servers:capacity", servers, settings.SERVER_CAPACITY_CACHE_TTL)
+    
+    @staticmethod
+    async def invalidate() -> bool:
+        return await cache.delete("servers:capacity")
+    
+    @staticmethod
+    async def invalidate_catalogue() -> int:
+        """Все производные каталога серверов: список стран, срез серверов и инбаунды сквадов"""
+        return await cache.delete_many("available_countries", "servers:capacity", "remnawave:squads:inbounds")
+
+
 class SystemCache:
     
     @staticmethod
@@ -230,6 +344,22 @@ class SystemCache:
     async def set_nodes_status(nodes: list, expire: int = 60) -> bool:
         return await cache.set("remnawave:nodes", nodes, expire)
     
+    @staticmethod
+    async def get_nodes_state() -> Optional[dict]:
+        return await cache.get("remnawave:nodes:state")
+    
+    @staticmethod
+    async def set_nodes_state(states: dict, expire: int = 300) -> bool:
+        return await cache.set("remnawave:nodes:state", states, expire)
+    
+    @staticmethod
+    async def get_squad_inbounds() -> Optional[dict]:
+        return await cache.get("remnawave:squads:inbounds")
+    
+    @staticmethod
+    async def set_squad_inbounds(squads: dict, expire: int = 600) -> bool:
+        return await cache.set("remnawave:squads:inbounds", squads, expire)
+    
     @staticmethod
     async def get_daily_stats(date: str) -> Optional[dict]:
         key = cache_key("stats", "daily", date)
@@ -241,24 +371,28 @@ class SystemCache:
         return await cache.set(key, stats, 86400)  # 24 часа
 
 
+FIXED_WINDOW_SCRIPT = """
+local current = redis.call('INCR', KEYS[1])
+if current == 1 then
+    redis.call('EXPIRE', KEYS[1], ARGV[1])
+end
+return current
+"""
+
+
 class RateLimitCache:
     
     @staticmethod
     async def is_rate_limited(user_id: int, action: str, limit: int, window: int) -> bool:
         key = cache_key("rate_limit", user_id, action)
-        current = await cache.get(key)
+        current = await cache.run_script(FIXED_WINDOW_SCRIPT, [key], [window])
         
         if current is None:
-            await cache.set(key, 1, window)
             return False
         
-        if current >= limit:
-            return True
-        
-        await cache.increment(key)
-        return False
+        return int(current) > limit
     
     @staticmethod
     async def reset_rate_limit(user_id: int, action: str) -> bool:
         key = cache_key("rate_limit", user_id, action)
-        return await cache.delete(key)
\ No newline at end of file
+        return await cache.delete(key)
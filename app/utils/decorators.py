@@ -6,6 +6,7 @@ from aiogram.fsm.context import FSMContext
 
 from app.config import settings
 from app.localization.texts import get_texts
+from app.utils.rate_limiter import rate_limiter, RateLimit
 
 logger = logging.getLogger(__name__)
 
@@ -103,6 +104,8 @@ def typing_action(func: Callable) -> Callable:
 
 def rate_limit(rate: float = 1.0, key: str = None):
     def decorator(func: Callable) -> Callable:
+        action = key or func.__name__
+        default_limit = RateLimit(limit=1, period=rate)
         
         @functools.wraps(func)
         async def wrapper(
@@ -110,8 +113,24 @@ def rate_limit(rate: float = 1.0, key: str = None):
             *args,
             **kwargs
         ) -> Any:
+            user = None
+            if isinstance(event, (types.Message, types.CallbackQuery)):
+                user = event.from_user
+            
+            if user:
+                limit = rate_limiter.get_limit(action) or default_limit
+                allowed, retry_after = await rate_limiter.hit(action, user.id, limit)
+                
+                if not allowed:
+                    text = f"⏳ Слишком часто! Повторите через {max(1, round(retry_after))} сек."
+                    if isinstance(event, types.Message):
+                        await event.answer(text)
+                    elif isinstance(event, types.CallbackQuery):
+                        await event.answer(text, show_alert=True)
+                    return
+            
             return await func(event, *args, **kwargs)
         
         return wrapper
     
-    return decorator
\ No newline at end of file
+    return decorator
@@ -0,0 +1,63 @@
+import asyncio
+import importlib
+import logging
+import time
+from typing import Optional, Sequence
+
+from aiogram import Dispatcher, Router
+
+logger = logging.getLogger(__name__)
+
+
+class DeferredHandlers:
+    """
+    Отложенная регистрация группы обработчиков без изменения их порядка.
+
+    При создании запоминает, сколько обработчиков и вложенных роутеров уже
+    зарегистрировано в диспетчере. load() импортирует модули группы в
+    отдельном потоке (цикл событий продолжает обслуживать апдейты),
+    регистрирует их во временный роутер и вставляет обработчики на
+    запомненные позиции - фильтры проверяются в том же порядке, что и при
+    обычной регистрации в этом месте.
+    """
+
+    def __init__(self, dp: Dispatcher, modules: Sequence[str], name: str):
+        self.dp = dp
+        self.modules = list(modules)
+        self.name = name
+        self._marks = {event: len(observer.handlers) for event, observer in dp.observers.items()}
+        self._router_mark = len(dp.sub_routers)
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._task is not None and self._task.done() and not self._task.cancelled() and self._task.exception() is None
+
+    async def load(self):
+        if self._task is None or (self._task.done() and not self.is_loaded):
+            self._task = asyncio.create_task(self._load(), name=f"deferred-handlers-{self.name}")
+        await asyncio.shield(self._task)
+
+    async def _load(self):
+        started = time.perf_counter()
+
+        modules = [await asyncio.to_thread(importlib.import_module, name) for name in self.modules]
+
+        staging = Router(name=f"deferred:{self.name}")
+        for module in modules:
+            module.register_handlers(staging)
+
+        for event, observer in staging.observers.items():
+            if not observer.handlers:
+                continue
+            mark = self._marks.get(event, len(self.dp.observers[event].handlers))
+            self.dp.observers[event].handlers[mark:mark] = observer.handlers
+            observer.handlers.clear()
+
+        if staging.sub_routers:
+            self.dp.include_router(staging)
+            self.dp.sub_routers.insert(self._router_mark, self.dp.sub_routers.pop())
+
+        logger.info(
+            f"✅ Обработчики группы {self.name} загружены за {(time.perf_counter() - started) * 1000:.0f} мс"
+        )
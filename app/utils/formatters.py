@@ -1,5 +1,5 @@
 from datetime import datetime, timedelta
-from typing import Union, Optional
+from typing import List, Union, Optional
 
 
 def format_datetime(dt: Union[datetime, str], format_str: str = "%d.%m.%Y %H:%M") -> str:
@@ -113,6 +113,27 @@ def format_bytes(bytes_value: int) -> str:
         return f"{size:.1f} {units[unit_index]}"
 
 
+def format_sparkline(values: List[Optional[float]]) -> str:
+    """Строка из блоков ▁..█ по значениям; None - пропуск замеров"""
+    blocks = "▁▂▃▄▅▆▇█"
+    present = [value for value in values if value is not None]
+    if not present:
+        return ""
+    
+    low, high = min(present), max(present)
+    spread = high - low
+    
+    line = ""
+    for value in values:
+        if value is None:
+            line += " "
+        elif spread == 0:
+            line += blocks[0] if high == 0 else blocks[3]
+        else:
+            line += blocks[int((value - low) / spread * (len(blocks) - 1))]
+    return line
+
+
 def format_percentage(value: float, decimals: int = 1) -> str:
     return f"{value:.{decimals}f}%"
 
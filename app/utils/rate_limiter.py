@@ -0,0 +1,157 @@
+import logging
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from app.config import settings
+from app.utils.cache import cache, cache_key
+
+logger = logging.getLogger(__name__)
+
+
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1])
+local ts = tonumber(state[2])
+if tokens == nil or ts == nil then
+    tokens = burst
+    ts = now
+end
+
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+
+local allowed = 0
+local retry_after = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+else
+    retry_after = (cost - tokens) / rate
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return {allowed, tostring(retry_after)}
+"""
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    limit: int
+    period: float
+
+    @property
+    def rate(self) -> float:
+        return self.limit / self.period
+
+
+class RateLimiter:
+    """Token bucket с поколениями бакетов в памяти и опциональным Redis-бэкендом"""
+
+    def __init__(self):
+        self._current: Dict[str, Tuple[float, float]] = {}
+        self._previous: Dict[str, Tuple[float, float]] = {}
+        self._rotated_at = time.monotonic()
+        self.limits: Dict[str, RateLimit] = {
+            action: RateLimit(config["limit"], config["period"])
+            for action, config in settings.get_rate_limits().items()
+        }
+        self._sweep_interval = max([60.0] + [limit.period for limit in self.limits.values()])
+        self.allowed = Counter()
+        self.throttled = Counter()
+
+    def _rotate(self, now: float):
+        # Бакеты, не тронутые за целое поколение, гарантированно успели
+        # наполниться, поэтому их можно просто отбросить
+        if now - self._rotated_at >= self._sweep_interval:
+            self._previous = self._current
+            self._current = {}
+            self._rotated_at = now
+
+    def _hit_local(self, key: str, limit: RateLimit) -> Tuple[bool, float]:
+        now = time.monotonic()
+        self._rotate(now)
+
+        state = self._current.get(key)
+        if state is None:
+            state = self._previous.pop(key, None)
+
+        if state is None:
+            tokens = float(limit.limit)
+        else:
+            tokens, updated_at = state
+            tokens = min(float(limit.limit), tokens + (now - updated_at) * limit.rate)
+
+        if tokens >= 1:
+            self._current[key] = (tokens - 1, now)
+            return True, 0.0
+
+        self._current[key] = (tokens, now)
+        return False, (1 - tokens) / limit.rate
+
+    async def _hit_redis(self, key: str, limit: RateLimit) -> Optional[Tuple[bool, float]]:
+        result = await cache.run_script(
+            TOKEN_BUCKET_SCRIPT,
+            [cache_key("rate_limit", "bucket", key)],
+            [limit.rate, limit.limit, 1]
+        )
+        if result is None:
+            return None
+
+        allowed, retry_after = result
+        if isinstance(retry_after, bytes):
+            retry_after = retry_after.decode()
+        return bool(int(allowed)), float(retry_after)
+
+    def get_limit(self, action: str) -> Optional[RateLimit]:
+        return self.limits.get(action)
+
+    async def hit(
+        self,
+        action: str,
+        user_id: int,
+        limit: Optional[RateLimit] = None
+    ) -> Tuple[bool, float]:
+        limit = limit or self.get_limit(action)
+        if limit is None:
+            return True, 0.0
+
+        if limit.period > self._sweep_interval:
+            self._sweep_interval = limit.period
+
+        key = f"{action}:{user_id}"
+        result = None
+
+        if settings.RATE_LIMIT_BACKEND == "redis" and cache.is_connected:
+            result = await self._hit_redis(key, limit)
+
+        if result is None:
+            result = self._hit_local(key, limit)
+
+        if result[0]:
+            self.allowed[action] += 1
+        else:
+            self.throttled[action] += 1
+        return result
+
+    def get_stats(self) -> Dict[str, Dict[str, int]]:
+        return {
+            action: {
+                "allowed": self.allowed[action],
+                "throttled": self.throttled[action]
+            }
+            for action in set(self.allowed) | set(self.throttled)
+        }
+
+    def tracked_buckets(self) -> int:
+        return len(self._current) + len(self._previous)
+
+
+rate_limiter = RateLimiter()
@@ -8,6 +8,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
 from app.database.models import User, ReferralEarning, Transaction, TransactionType
+from app.database.crud.referral_stats import get_referral_stats
 
 logger = logging.getLogger(__name__)
 
@@ -52,23 +53,10 @@ async def mark_user_as_had_paid_subscription(db: AsyncSession, user_id: int) ->
 
 async def get_user_referral_summary(db: AsyncSession, user_id: int) -> Dict:
     try:
-        invited_count_result = await db.execute(
-            select(func.count(User.id)).where(User.referred_by_id == user_id)
-        )
-        invited_count = invited_count_result.scalar() or 0
-        
-        referrals_result = await db.execute(
-            select(User).where(User.referred_by_id == user_id)
-        )
-        referrals = referrals_result.scalars().all()
-        
-        paid_referrals_count = sum(1 for ref in referrals if ref.has_made_first_topup)
-        
-        total_earnings_result = await db.execute(
-            select(func.coalesce(func.sum(ReferralEarning.amount_kopeks), 0))
-            .where(ReferralEarning.user_id == user_id)
-        )
-        total_earned_kopeks = total_earnings_result.scalar() or 0
+        stats = await get_referral_stats(db, user_id)
+        invited_count = stats.referrals_count if stats else 0
+        paid_referrals_count = stats.first_topup_count if stats else 0
+        total_earned_kopeks = stats.total_earned_kopeks if stats else 0
         
         month_ago = datetime.utcnow() - timedelta(days=30)
         month_earnings_result = await db.execute(
@@ -119,9 +107,17 @@ async def get_user_referral_summary(db: AsyncSession, user_id: int) -> Dict:
             }
         
         active_referrals_count = 0
-        for referral in referrals:
-            if referral.last_activity and referral.last_activity >= month_ago:
-                active_referrals_count += 1
+        if invited_count:
+            active_referrals_result = await db.execute(
+                select(func.count(User.id))
+                .where(
+                    and_(
+                        User.referred_by_id == user_id,
+                        User.last_activity >= month_ago
+                    )
+                )
+            )
+            active_referrals_count = active_referrals_result.scalar() or 0
         
         return {
             'invited_count': invited_count,
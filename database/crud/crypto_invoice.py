@@ -0,0 +1,99 @@
+import logging
+from typing import Optional, List
+from datetime import datetime
+from sqlalchemy import select, update, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database.models import CryptoInvoice
+
+logger = logging.getLogger(__name__)
+
+
+async def create_crypto_invoice(
+    db: AsyncSession,
+    invoice_id: int,
+    user_id: int,
+    amount_kopeks: int,
+    asset: str,
+    amount: str,
+    pay_url: Optional[str] = None
+) -> CryptoInvoice:
+
+    invoice = CryptoInvoice(
+        invoice_id=invoice_id,
+        user_id=user_id,
+        amount_kopeks=amount_kopeks,
+        asset=asset,
+        amount=amount,
+        pay_url=pay_url
+    )
+
+    db.add(invoice)
+    await db.commit()
+    await db.refresh(invoice)
+
+    logger.info(f"Создан счет CryptoBot {invoice_id} на {amount_kopeks/100}₽ для пользователя {user_id}")
+    return invoice
+
+
+async def get_crypto_invoice(db: AsyncSession, invoice_id: int) -> Optional[CryptoInvoice]:
+
+    result = await db.execute(
+        select(CryptoInvoice).where(CryptoInvoice.invoice_id == invoice_id)
+    )
+    return result.scalar_one_or_none()
+
+
+async def get_active_crypto_invoices(
+    db: AsyncSession,
+    created_after: datetime,
+    limit: int = 1000
+) -> List[CryptoInvoice]:
+
+    result = await db.execute(
+        select(CryptoInvoice)
+        .where(
+            and_(
+                CryptoInvoice.status == "active",
+                CryptoInvoice.created_at >= created_after
+            )
+        )
+        .order_by(CryptoInvoice.created_at.desc())
+        .limit(limit)
+    )
+    return result.scalars().all()
+
+
+async def claim_crypto_invoice_payment(db: AsyncSession, invoice_id: int) -> bool:
+    """Переводит счет в paid одним условным UPDATE; True только у первого вызвавшего"""
+
+    result = await db.execute(
+        update(CryptoInvoice)
+        .where(
+            and_(
+                CryptoInvoice.invoice_id == invoice_id,
+                CryptoInvoice.status != "paid"
+            )
+        )
+        .values(status="paid", paid_at=datetime.utcnow())
+    )
+    return result.rowcount == 1
+
+
+async def update_crypto_invoice_status(db: AsyncSession, invoice_ids: List[int], status: str) -> int:
+
+    if not invoice_ids:
+        return 0
+
+    result = await db.execute(
+        update(CryptoInvoice)
+        .where(
+            and_(
+                CryptoInvoice.invoice_id.in_(invoice_ids),
+                CryptoInvoice.status == "active"
+            )
+        )
+        .values(status=status)
+    )
+    await db.commit()
+    return result.rowcount
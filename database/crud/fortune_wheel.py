@@ -1,13 +1,42 @@
-from sqlalchemy import select, func, Integer
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import select, update, or_, func, Integer
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database.models import FortuneWheelSpin
+from app.database.models import FortuneWheelSpin, User
+
+async def claim_wheel_spin(db: AsyncSession, telegram_id: int, cooldown: timedelta) -> Optional[int]:
+    """
+    Занимает спин одним условным UPDATE users.wheel_last_used: из двух
+    одновременных нажатий строку обновит только первое. Возвращает users.id
+    или None, если кулдаун не истек. Коммит остается вызывающему.
+    """
+    now = datetime.utcnow()
+    stmt = (
+        update(User)
+        .where(
+            User.telegram_id == telegram_id,
+            or_(User.wheel_last_used.is_(None), User.wheel_last_used <= now - cooldown)
+        )
+        .values(wheel_last_used=now)
+        .execution_options(synchronize_session=False)
+    )
+
+    if db.get_bind().dialect.update_returning:
+        return (await db.execute(stmt.returning(User.id))).scalar_one_or_none()
+
+    result = await db.execute(stmt)
+    if result.rowcount == 0:
+        return None
+    return await db.scalar(select(User.id).where(User.telegram_id == telegram_id))
 
 async def create_fortune_wheel_spin(
     db: AsyncSession,
     user_id: int,
     amount_kopeks: int,
-    is_win: bool
+    is_win: bool,
+    commit: bool = True
 ) -> FortuneWheelSpin:
     spin = FortuneWheelSpin(
         user_id=user_id,
@@ -15,6 +44,9 @@ async def create_fortune_wheel_spin(
         is_win=is_win
     )
     db.add(spin)
+    if not commit:
+        await db.flush()
+        return spin
     await db.commit()
     await db.refresh(spin)
     return spin
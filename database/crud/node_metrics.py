@@ -0,0 +1,153 @@
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Any, Optional
+
+from sqlalchemy import select, delete, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database.models import NodeMetric
+
+logger = logging.getLogger(__name__)
+
+RAW_RESOLUTION = 0
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def floor_bucket(moment: datetime, seconds: int) -> datetime:
+    return _EPOCH + timedelta(seconds=int((moment - _EPOCH).total_seconds()) // seconds * seconds)
+
+
+async def add_node_samples(db: AsyncSession, samples: List[Dict[str, Any]], sampled_at: datetime):
+    """Записывает сырые замеры всех нод одной пачкой"""
+
+    db.add_all([
+        NodeMetric(
+            node_uuid=sample["uuid"],
+            resolution=RAW_RESOLUTION,
+            bucket_at=sampled_at,
+            samples=1,
+            online_samples=1 if sample["healthy"] else 0,
+            users_online_avg=sample["users_online"],
+            users_online_max=sample["users_online"],
+            download_bps=sample["download_bps"],
+            upload_bps=sample["upload_bps"],
+            traffic_used_bytes=sample["traffic_used_bytes"]
+        )
+        for sample in samples
+    ])
+    await db.commit()
+
+
+async def rollup_node_metrics(db: AsyncSession, source: int, target: int, until: datetime) -> int:
+    """
+    Сворачивает завершенные корзины ширины target из строк source.
+    Начинает с конца последней уже свернутой корзины, поэтому повторный
+    запуск ничего не дублирует. Возвращает число созданных строк.
+    """
+
+    until = floor_bucket(until, target)
+    last_bucket = await db.scalar(select(func.max(NodeMetric.bucket_at)).where(NodeMetric.resolution == target))
+    if last_bucket is not None:
+        start = last_bucket + timedelta(seconds=target)
+    else:
+        first_source = await db.scalar(select(func.min(NodeMetric.bucket_at)).where(NodeMetric.resolution == source))
+        if first_source is None:
+            return 0
+        start = floor_bucket(first_source, target)
+
+    if start >= until:
+        return 0
+
+    rows = (await db.execute(
+        select(NodeMetric)
+        .where(
+            NodeMetric.resolution == source,
+            NodeMetric.bucket_at >= start,
+            NodeMetric.bucket_at < until
+        )
+        .order_by(NodeMetric.bucket_at)
+    )).scalars().all()
+
+    buckets: Dict[tuple, Dict[str, Any]] = {}
+    for row in rows:
+        key = (row.node_uuid, floor_bucket(row.bucket_at, target))
+        bucket = buckets.setdefault(key, {
+            "samples": 0, "online_samples": 0, "users_sum": 0.0, "users_max": 0,
+            "download_sum": 0, "upload_sum": 0, "traffic_used_bytes": None
+        })
+        bucket["samples"] += row.samples
+        bucket["online_samples"] += row.online_samples
+        bucket["users_sum"] += row.users_online_avg * row.samples
+        bucket["users_max"] = max(bucket["users_max"], row.users_online_max)
+        bucket["download_sum"] += row.download_bps * row.samples
+        bucket["upload_sum"] += row.upload_bps * row.samples
+        if row.traffic_used_bytes is not None:
+            bucket["traffic_used_bytes"] = row.traffic_used_bytes
+
+    db.add_all([
+        NodeMetric(
+            node_uuid=node_uuid,
+            resolution=target,
+            bucket_at=bucket_at,
+            samples=bucket["samples"],
+            online_samples=bucket["online_samples"],
+            users_online_avg=bucket["users_sum"] / bucket["samples"],
+            users_online_max=bucket["users_max"],
+            download_bps=bucket["download_sum"] // bucket["samples"],
+            upload_bps=bucket["upload_sum"] // bucket["samples"],
+            traffic_used_bytes=bucket["traffic_used_bytes"]
+        )
+        for (node_uuid, bucket_at), bucket in buckets.items()
+    ])
+    await db.commit()
+    return len(buckets)
+
+
+async def delete_node_metrics_before(db: AsyncSession, resolution: int, before: datetime) -> int:
+
+    result = await db.execute(
+        delete(NodeMetric)
+        .where(NodeMetric.resolution == resolution, NodeMetric.bucket_at < before)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    return result.rowcount or 0
+
+
+async def get_node_metrics(
+    db: AsyncSession,
+    node_uuid: str,
+    since: datetime,
+    resolution: int
+) -> List[NodeMetric]:
+    """
+    Ряд ноды с указанного момента в корзинах resolution, дополненный
+    сырыми замерами, которые еще не попали в свертку.
+    """
+
+    rows = list((await db.execute(
+        select(NodeMetric)
+        .where(
+            NodeMetric.node_uuid == node_uuid,
+            NodeMetric.resolution == resolution,
+            NodeMetric.bucket_at >= since
+        )
+        .order_by(NodeMetric.bucket_at)
+    )).scalars().all())
+
+    tail_since: Optional[datetime] = since
+    if rows:
+        tail_since = max(since, rows[-1].bucket_at + timedelta(seconds=resolution))
+
+    rows.extend((await db.execute(
+        select(NodeMetric)
+        .where(
+            NodeMetric.node_uuid == node_uuid,
+            NodeMetric.resolution == RAW_RESOLUTION,
+            NodeMetric.bucket_at >= tail_since
+        )
+        .order_by(NodeMetric.bucket_at)
+    )).scalars().all())
+
+    return rows
@@ -0,0 +1,206 @@
+import logging
+from typing import Optional, List, Dict
+from datetime import datetime, timedelta
+from sqlalchemy import select, update, func, and_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database.models import PaymentEvent, PaymentEventStatus
+
+logger = logging.getLogger(__name__)
+
+
+async def store_payment_event(
+    db: AsyncSession,
+    provider: str,
+    event_id: str,
+    payload: str,
+    event_type: Optional[str] = None,
+    object_id: Optional[str] = None
+) -> bool:
+
+    event = PaymentEvent(
+        provider=provider,
+        event_id=event_id,
+        event_type=event_type,
+        object_id=object_id,
+        payload=payload,
+        status=PaymentEventStatus.PENDING.value,
+        next_attempt_at=datetime.utcnow()
+    )
+
+    db.add(event)
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        logger.debug(f"Повторное событие {provider}:{event_id} уже в очереди")
+        return False
+
+    return True
+
+
+async def claim_next_payment_event(db: AsyncSession) -> Optional[PaymentEvent]:
+
+    now = datetime.utcnow()
+
+    for _ in range(3):
+        result = await db.execute(
+            select(PaymentEvent.id)
+            .where(
+                and_(
+                    PaymentEvent.status == PaymentEventStatus.PENDING.value,
+                    PaymentEvent.next_attempt_at <= now
+                )
+            )
+            .order_by(PaymentEvent.next_attempt_at, PaymentEvent.id)
+            .limit(1)
+        )
+        event_id = result.scalar_one_or_none()
+        if event_id is None:
+            return None
+
+        # Условный UPDATE: событие достанется только одному воркеру,
+        # даже если несколько процессов выбрали один и тот же id
+        claimed = await db.execute(
+            update(PaymentEvent)
+            .where(
+                and_(
+                    PaymentEvent.id == event_id,
+                    PaymentEvent.status == PaymentEventStatus.PENDING.value
+                )
+            )
+            .values(
+                status=PaymentEventStatus.PROCESSING.value,
+                attempts=PaymentEvent.attempts + 1,
+                locked_at=now
+            )
+        )
+        await db.commit()
+
+        if claimed.rowcount == 1:
+            return await db.get(PaymentEvent, event_id, populate_existing=True)
+
+    return None
+
+
+async def mark_payment_event_processed(db: AsyncSession, event_id: int) -> None:
+
+    await db.execute(
+        update(PaymentEvent)
+        .where(PaymentEvent.id == event_id)
+        .values(
+            status=PaymentEventStatus.PROCESSED.value,
+            processed_at=datetime.utcnow(),
+            locked_at=None,
+            last_error=None
+        )
+    )
+    await db.commit()
+
+
+async def mark_payment_event_failed(
+    db: AsyncSession,
+    event_id: int,
+    error: str,
+    retry_at: Optional[datetime]
+) -> None:
+
+    values = {
+        "last_error": error[:2000],
+        "locked_at": None
+    }
+
+    if retry_at is None:
+        values["status"] = PaymentEventStatus.DEAD.value
+    else:
+        values["status"] = PaymentEventStatus.PENDING.value
+        values["next_attempt_at"] = retry_at
+
+    await db.execute(
+        update(PaymentEvent)
+        .where(PaymentEvent.id == event_id)
+        .values(**values)
+    )
+    await db.commit()
+
+
+async def release_stale_payment_events(db: AsyncSession, older_than: timedelta) -> int:
+
+    result = await db.execute(
+        update(PaymentEvent)
+        .where(
+            and_(
+                PaymentEvent.status == PaymentEventStatus.PROCESSING.value,
+                PaymentEvent.locked_at < datetime.utcnow() - older_than
+            )
+        )
+        .values(
+            status=PaymentEventStatus.PENDING.value,
+            locked_at=None,
+            next_attempt_at=datetime.utcnow()
+        )
+    )
+    await db.commit()
+
+    if result.rowcount:
+        logger.warning(f"Возвращено в очередь зависших платежных событий: {result.rowcount}")
+    return result.rowcount
+
+
+async def requeue_payment_event(db: AsyncSession, event_id: int) -> bool:
+
+    result = await db.execute(
+        update(PaymentEvent)
+        .where(
+            and_(
+                PaymentEvent.id == event_id,
+                PaymentEvent.status == PaymentEventStatus.DEAD.value
+            )
+        )
+        .values(
+            status=PaymentEventStatus.PENDING.value,
+            attempts=0,
+            next_attempt_at=datetime.utcnow()
+        )
+    )
+    await db.commit()
+    return result.rowcount == 1
+
+
+async def requeue_dead_payment_events(db: AsyncSession) -> int:
+
+    result = await db.execute(
+        update(PaymentEvent)
+        .where(PaymentEvent.status == PaymentEventStatus.DEAD.value)
+        .values(
+            status=PaymentEventStatus.PENDING.value,
+            attempts=0,
+            next_attempt_at=datetime.utcnow()
+        )
+    )
+    await db.commit()
+    return result.rowcount
+
+
+async def get_payment_event_stats(db: AsyncSession) -> Dict[str, int]:
+
+    result = await db.execute(
+        select(PaymentEvent.status, func.count(PaymentEvent.id))
+        .group_by(PaymentEvent.status)
+    )
+
+    stats = {status.value: 0 for status in PaymentEventStatus}
+    stats.update({status: count for status, count in result.all()})
+    return stats
+
+
+async def get_dead_payment_events(db: AsyncSession, limit: int = 10) -> List[PaymentEvent]:
+
+    result = await db.execute(
+        select(PaymentEvent)
+        .where(PaymentEvent.status == PaymentEventStatus.DEAD.value)
+        .order_by(PaymentEvent.updated_at.desc())
+        .limit(limit)
+    )
+    return result.scalars().all()
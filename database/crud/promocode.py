@@ -1,7 +1,8 @@
 import logging
 from datetime import datetime
 from typing import Optional, List
-from sqlalchemy import select, and_, func
+from sqlalchemy import select, update, and_, or_, func
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
@@ -10,12 +11,12 @@ from app.database.models import PromoCode, PromoCodeUse, PromoCodeType, User
 logger = logging.getLogger(__name__)
 
 
-async def get_promocode_by_code(db: AsyncSession, code: str) -> Optional[PromoCode]:
-    result = await db.execute(
-        select(PromoCode)
-        .options(selectinload(PromoCode.uses))
-        .where(PromoCode.code == code.upper())
-    )
+async def get_promocode_by_code(db: AsyncSession, code: str, load_uses: bool = True) -> Optional[PromoCode]:
+    query = select(PromoCode).where(PromoCode.code == code.upper())
+    if load_uses:
+        query = query.options(selectinload(PromoCode.uses))
+    
+    result = await db.execute(query)
     return result.scalar_one_or_none()
 
 
@@ -78,6 +79,69 @@ async def use_promocode(
         return False
 
 
+class _PromoCodeUnavailable(Exception):
+    pass
+
+
+async def redeem_promocode(db: AsyncSession, promocode_id: int, user_id: int) -> Optional[str]:
+    """
+    Занимает одно использование промокода. Повторная активация тем же
+    пользователем упирается в уникальный индекс (promocode_id, user_id),
+    а счетчик растет условным UPDATE, поэтому одновременные активации не
+    превышают max_uses. Возвращает None или код ошибки: already_used_by_user,
+    inactive, expired, exhausted или used, если код снова доступен к моменту
+    перечитывания строки. Коммит остается вызывающему.
+    """
+    now = datetime.utcnow()
+    stmt = (
+        update(PromoCode)
+        .where(
+            PromoCode.id == promocode_id,
+            PromoCode.is_active.is_(True),
+            PromoCode.current_uses < PromoCode.max_uses,
+            or_(PromoCode.valid_until.is_(None), PromoCode.valid_until >= now)
+        )
+        .values(current_uses=PromoCode.current_uses + 1)
+        .execution_options(synchronize_session=False)
+    )
+    
+    try:
+        async with db.begin_nested():
+            db.add(PromoCodeUse(promocode_id=promocode_id, user_id=user_id, used_at=now))
+            await db.flush()
+            
+            if db.get_bind().dialect.update_returning:
+                claimed = (await db.execute(stmt.returning(PromoCode.current_uses))).scalar_one_or_none() is not None
+            else:
+                claimed = (await db.execute(stmt)).rowcount == 1
+            
+            if not claimed:
+                raise _PromoCodeUnavailable()
+    
+    except IntegrityError:
+        return "already_used_by_user"
+    except _PromoCodeUnavailable:
+        return await _unavailable_reason(db, promocode_id, now)
+    
+    return None
+
+
+async def _unavailable_reason(db: AsyncSession, promocode_id: int, now: datetime) -> str:
+    """Причина, по которой условный UPDATE в redeem_promocode не занял использование"""
+    row = (await db.execute(
+        select(PromoCode.is_active, PromoCode.valid_until, PromoCode.current_uses, PromoCode.max_uses)
+        .where(PromoCode.id == promocode_id)
+    )).one_or_none()
+    
+    if row is None or not row.is_active:
+        return "inactive"
+    if row.valid_until is not None and row.valid_until < now:
+        return "expired"
+    if row.current_uses >= row.max_uses:
+        return "exhausted"
+    return "used"
+
+
 async def check_user_promocode_usage(
     db: AsyncSession,
     user_id: int,
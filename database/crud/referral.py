@@ -1,11 +1,13 @@
 import logging
 from datetime import datetime, timedelta
-from typing import List, Optional
-from sqlalchemy import select, and_, func
+from typing import List, Optional, Dict, Any
+from sqlalchemy import select, update, delete, insert, and_, func, literal, exists, cast, String
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
+from sqlalchemy.orm import selectinload, aliased
+from sqlalchemy.orm.attributes import set_committed_value
 
-from app.database.models import ReferralEarning, User
+from app.database.models import ReferralEarning, User, Transaction, TransactionType
+from app.database.crud.referral_stats import get_referral_stats, get_referral_stats_totals, get_top_referrers
 
 logger = logging.getLogger(__name__)
 
@@ -16,7 +18,9 @@ async def create_referral_earning(
     referral_id: int,
     amount_kopeks: int,
     reason: str,
-    referral_transaction_id: Optional[int] = None
+    referral_transaction_id: Optional[int] = None,
+    idempotency_key: Optional[str] = None,
+    commit: bool = True
 ) -> ReferralEarning:
     
     earning = ReferralEarning(
@@ -24,17 +28,247 @@ async def create_referral_earning(
         referral_id=referral_id,
         amount_kopeks=amount_kopeks,
         reason=reason,
-        referral_transaction_id=referral_transaction_id
+        referral_transaction_id=referral_transaction_id,
+        idempotency_key=idempotency_key
     )
     
     db.add(earning)
-    await db.commit()
-    await db.refresh(earning)
+    if commit:
+        await db.commit()
+        await db.refresh(earning)
+    else:
+        await db.flush()
     
     logger.info(f"💰 Создан реферальный заработок: {amount_kopeks/100}₽ для пользователя {user_id}")
     return earning
 
 
+async def get_referral_link_row(db: AsyncSession, user_id: int) -> Optional[Any]:
+    """Пользователь и его реферер одним запросом; None - пользователь не найден"""
+    
+    referrer = aliased(User)
+    result = await db.execute(
+        select(
+            User.id,
+            User.telegram_id,
+            User.username,
+            User.first_name,
+            User.last_name,
+            User.referred_by_id,
+            referrer.telegram_id.label("referrer_telegram_id")
+        )
+        .outerjoin(referrer, referrer.id == User.referred_by_id)
+        .where(User.id == user_id)
+    )
+    return result.first()
+
+
+async def claim_referral_first_topup(db: AsyncSession, user_id: int) -> bool:
+    """Отмечает первое пополнение условным UPDATE; True только у первого вызвавшего"""
+    
+    result = await db.execute(
+        update(User)
+        .where(
+            and_(
+                User.id == user_id,
+                User.has_made_first_topup.is_(False)
+            )
+        )
+        .values(has_made_first_topup=True)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        return False
+    
+    user = db.identity_map.get(db.identity_key(User, user_id))
+    if user is not None:
+        set_committed_value(user, "has_made_first_topup", True)
+    return True
+
+
+async def delete_pending_referral_earning(db: AsyncSession, referrer_id: int, referral_id: int):
+    
+    await db.execute(
+        delete(ReferralEarning).where(
+            and_(
+                ReferralEarning.user_id == referrer_id,
+                ReferralEarning.referral_id == referral_id,
+                ReferralEarning.reason == "referral_registration_pending"
+            )
+        )
+    )
+
+
+def _topup_earning_key(transaction_id):
+    return literal("topup:") + cast(transaction_id, String)
+
+
+def _qualifying_topups(minimum_topup_kopeks: int):
+    # Реальные пополнения отличаются от бонусов и ручных начислений наличием способа оплаты
+    return (
+        select(
+            Transaction.user_id.label("referral_id"),
+            func.min(Transaction.id).label("transaction_id")
+        )
+        .where(
+            and_(
+                Transaction.type == TransactionType.DEPOSIT.value,
+                Transaction.payment_method.isnot(None),
+                Transaction.is_completed.is_(True),
+                Transaction.amount_kopeks >= minimum_topup_kopeks
+            )
+        )
+        .group_by(Transaction.user_id)
+        .subquery()
+    )
+
+
+def _missing_first_topup_rewards(minimum_topup_kopeks: int):
+    topups = _qualifying_topups(minimum_topup_kopeks)
+    return (
+        select(
+            User.referred_by_id.label("referrer_id"),
+            User.id.label("referral_id"),
+            topups.c.transaction_id
+        )
+        .join(topups, topups.c.referral_id == User.id)
+        .where(
+            and_(
+                User.referred_by_id.isnot(None),
+                ~exists().where(
+                    and_(
+                        ReferralEarning.referral_id == User.id,
+                        ReferralEarning.reason == "referral_first_topup"
+                    )
+                ),
+                ~exists().where(
+                    ReferralEarning.idempotency_key == _topup_earning_key(topups.c.transaction_id)
+                )
+            )
+        )
+    )
+
+
+def _stale_pending_condition():
+    return and_(
+        ReferralEarning.reason == "referral_registration_pending",
+        exists().where(
+            and_(
+                User.id == ReferralEarning.referral_id,
+                User.has_made_first_topup.is_(True)
+            )
+        )
+    )
+
+
+def _missing_flag_condition(minimum_topup_kopeks: int):
+    topups = _qualifying_topups(minimum_topup_kopeks)
+    return and_(
+        User.referred_by_id.isnot(None),
+        User.has_made_first_topup.is_(False),
+        User.id.in_(select(topups.c.referral_id))
+    )
+
+
+async def get_referral_repair_report(db: AsyncSession, minimum_topup_kopeks: int) -> Dict[str, int]:
+    """Сколько записей исправит repair_referral_earnings, ничего не меняя"""
+    
+    missing = _missing_first_topup_rewards(minimum_topup_kopeks).subquery()
+    duplicates = (
+        select(ReferralEarning.referral_transaction_id)
+        .where(ReferralEarning.referral_transaction_id.isnot(None))
+        .group_by(ReferralEarning.referral_transaction_id, ReferralEarning.reason)
+        .having(func.count() > 1)
+        .subquery()
+    )
+    
+    return {
+        "missing_first_topup_flags": (await db.execute(
+            select(func.count()).select_from(User).where(_missing_flag_condition(minimum_topup_kopeks))
+        )).scalar(),
+        "stale_pending_earnings": (await db.execute(
+            select(func.count()).select_from(ReferralEarning).where(_stale_pending_condition())
+        )).scalar(),
+        "missing_first_topup_rewards": (await db.execute(
+            select(func.count()).select_from(missing)
+        )).scalar(),
+        "duplicate_earnings": (await db.execute(
+            select(func.count()).select_from(duplicates)
+        )).scalar(),
+    }
+
+
+async def repair_referral_earnings(
+    db: AsyncSession,
+    minimum_topup_kopeks: int,
+    inviter_bonus_kopeks: int,
+    pay_missing: bool = False
+) -> Dict[str, Any]:
+    """
+    Исправляет реферальные начисления набором UPDATE/DELETE/INSERT ... SELECT
+    по всем пользователям сразу. Без pay_missing только удаляет устаревшие
+    записи ожидания. С pay_missing дописывает недостающие бонусы за первое
+    пополнение и отмечает has_made_first_topup; суммы к зачислению по
+    реферерам возвращаются в payouts, зачисление и коммит - за вызывающим.
+    """
+    
+    pending = await db.execute(
+        delete(ReferralEarning)
+        .where(_stale_pending_condition())
+        .execution_options(synchronize_session=False)
+    )
+    report = {
+        "stale_pending_earnings": pending.rowcount,
+        "first_topup_flags": 0,
+        "first_topup_rewards": 0,
+        "payouts": {},
+    }
+    
+    if not pay_missing:
+        logger.info(f"🔧 Сверка рефералов: удалено ожиданий {pending.rowcount}")
+        return report
+    
+    missing = _missing_first_topup_rewards(minimum_topup_kopeks).subquery()
+    report["payouts"] = {
+        referrer_id: count * inviter_bonus_kopeks
+        for referrer_id, count in (await db.execute(
+            select(missing.c.referrer_id, func.count()).group_by(missing.c.referrer_id)
+        )).all()
+    }
+    
+    rewards = await db.execute(
+        insert(ReferralEarning).from_select(
+            ["user_id", "referral_id", "amount_kopeks", "reason",
+             "referral_transaction_id", "idempotency_key", "created_at"],
+            select(
+                missing.c.referrer_id,
+                missing.c.referral_id,
+                literal(inviter_bonus_kopeks),
+                literal("referral_first_topup"),
+                missing.c.transaction_id,
+                _topup_earning_key(missing.c.transaction_id),
+                func.now()
+            )
+        )
+    )
+    
+    flags = await db.execute(
+        update(User)
+        .where(_missing_flag_condition(minimum_topup_kopeks))
+        .values(has_made_first_topup=True)
+        .execution_options(synchronize_session=False)
+    )
+    
+    report["first_topup_rewards"] = rewards.rowcount
+    report["first_topup_flags"] = flags.rowcount
+    
+    logger.info(
+        f"🔧 Сверка рефералов: удалено ожиданий {pending.rowcount}, "
+        f"добавлено бонусов {rewards.rowcount}, отмечено первых пополнений {flags.rowcount}"
+    )
+    return report
+
+
 async def get_referral_earnings_by_user(
     db: AsyncSession,
     user_id: int,
@@ -91,121 +325,12 @@ async def get_referral_earnings_sum(
 
 
 async def get_referral_statistics(db: AsyncSession) -> dict:
+    totals = await get_referral_stats_totals(db)
+    users_with_referrals = totals["users_with_referrals"]
+    active_referrers = totals["active_referrers"]
+    total_paid = totals["total_earned_kopeks"]
     
-    users_with_referrals_result = await db.execute(
-        select(func.count(func.distinct(User.id)))
-        .where(User.referred_by_id.isnot(None))
-    )
-    users_with_referrals = users_with_referrals_result.scalar()
-    
-    active_referrers_result = await db.execute(
-        select(func.count(func.distinct(User.referred_by_id)))
-        .where(User.referred_by_id.isnot(None))
-    )
-    active_referrers = active_referrers_result.scalar()
-    
-    referral_paid_result = await db.execute(
-        select(func.coalesce(func.sum(ReferralEarning.amount_kopeks), 0))
-    )
-    referral_paid = referral_paid_result.scalar()
-    
-    from app.database.models import Transaction, TransactionType
-    transaction_paid_result = await db.execute(
-        select(func.coalesce(func.sum(Transaction.amount_kopeks), 0))
-        .where(Transaction.type == TransactionType.REFERRAL_REWARD.value)
-    )
-    transaction_paid = transaction_paid_result.scalar()
-    
-    total_paid = referral_paid + transaction_paid
-    
-    referrals_stats_result = await db.execute(
-        select(
-            User.referred_by_id.label('referrer_id'),
-            func.count(User.id).label('referrals_count')
-        )
-        .where(User.referred_by_id.isnot(None))
-        .group_by(User.referred_by_id)
-    )
-    referrals_stats = {row.referrer_id: row.referrals_count for row in referrals_stats_result.all()}
-    
-    referral_earnings_result = await db.execute(
-        select(
-            ReferralEarning.user_id.label('referrer_id'),
-            func.sum(ReferralEarning.amount_kopeks).label('referral_earnings')
-        )
-        .group_by(ReferralEarning.user_id)
-    )
-    referral_earnings = {row.referrer_id: row.referral_earnings for row in referral_earnings_result.all()}
-    
-    transaction_earnings_result = await db.execute(
-        select(
-            Transaction.user_id.label('referrer_id'),
-            func.sum(Transaction.amount_kopeks).label('transaction_earnings')
-        )
-        .where(Transaction.type == TransactionType.REFERRAL_REWARD.value)
-        .group_by(Transaction.user_id)
-    )
-    transaction_earnings = {row.referrer_id: row.transaction_earnings for row in transaction_earnings_result.all()}
-    
-    top_referrers_data = {}
-    
-    for referrer_id, count in referrals_stats.items():
-        if referrer_id not in top_referrers_data:
-            top_referrers_data[referrer_id] = {
-                'referrals_count': 0,
-                'total_earned': 0
-            }
-        top_referrers_data[referrer_id]['referrals_count'] = count
-    
-    for referrer_id, earnings in referral_earnings.items():
-        if referrer_id not in top_referrers_data:
-            top_referrers_data[referrer_id] = {
-                'referrals_count': 0,
-                'total_earned': 0
-            }
-        top_referrers_data[referrer_id]['total_earned'] += earnings or 0
-    
-    for referrer_id, earnings in transaction_earnings.items():
-        if referrer_id not in top_referrers_data:
-            top_referrers_data[referrer_id] = {
-                'referrals_count': 0,
-                'total_earned': 0
-            }
-        top_referrers_data[referrer_id]['total_earned'] += earnings or 0
-    
-    sorted_referrers = sorted(
-        top_referrers_data.items(),
-        key=lambda x: (x[1]['total_earned'], x[1]['referrals_count']),
-        reverse=True
-    )
-    
-    top_referrers = []
-    for referrer_id, stats in sorted_referrers[:5]:
-        user_result = await db.execute(
-            select(User.id, User.username, User.first_name, User.last_name, User.telegram_id)
-            .where(User.id == referrer_id)
-        )
-        user = user_result.first()
-        
-        if user:
-            display_name = ""
-            if user.first_name:
-                display_name = user.first_name
-                if user.last_name:
-                    display_name += f" {user.last_name}"
-            elif user.username:
-                display_name = f"@{user.username}"
-            else:
-                display_name = f"ID{user.telegram_id}"
-            
-            top_referrers.append({
-                "user_id": user.telegram_id, 
-                "display_name": display_name,
-                "username": user.username,
-                "telegram_id": user.telegram_id,
-                "total_earned_kopeks": stats['total_earned'],
-                "referrals_count": stats['referrals_count']
-            })
+    top_referrers = await get_top_referrers(db, limit=5)
     
     today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
     
@@ -270,13 +395,9 @@ async def get_referral_statistics(db: AsyncSession) -> dict:
 
 
 async def get_user_referral_stats(db: AsyncSession, user_id: int) -> dict:
-    
-    invited_count_result = await db.execute(
-        select(func.count(User.id)).where(User.referred_by_id == user_id)
-    )
-    invited_count = invited_count_result.scalar()
-    
-    total_earned = await get_referral_earnings_sum(db, user_id)
+    stats = await get_referral_stats(db, user_id)
+    invited_count = stats.referrals_count if stats else 0
+    total_earned = stats.total_earned_kopeks if stats else 0
     
     month_ago = datetime.utcnow() - timedelta(days=30)
     month_earned = await get_referral_earnings_sum(db, user_id, start_date=month_ago)
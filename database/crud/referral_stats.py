@@ -0,0 +1,279 @@
+import logging
+from datetime import datetime
+from typing import Optional, List, Dict, Any
+
+from sqlalchemy import select, update, delete, func, case, and_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database.models import ReferralStats, ReferralEarning, User, Transaction, TransactionType
+
+logger = logging.getLogger(__name__)
+
+
+def _dialect_insert(db: AsyncSession):
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+        return insert
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+        return insert
+    return None
+
+
+async def increment_referral_stats(
+    db: AsyncSession,
+    referrer_id: int,
+    referrals: int = 0,
+    first_topups: int = 0,
+    earned_kopeks: int = 0
+):
+    """Прибавляет счетчики реферера одним upsert; коммит остается вызывающему"""
+
+    now = datetime.utcnow()
+    deltas = {
+        "referrals_count": ReferralStats.referrals_count + referrals,
+        "first_topup_count": ReferralStats.first_topup_count + first_topups,
+        "total_earned_kopeks": ReferralStats.total_earned_kopeks + earned_kopeks,
+        "last_activity_at": now,
+        "updated_at": now,
+    }
+
+    insert = _dialect_insert(db)
+    if insert is not None:
+        await db.execute(
+            insert(ReferralStats)
+            .values(
+                referrer_id=referrer_id,
+                referrals_count=referrals,
+                first_topup_count=first_topups,
+                total_earned_kopeks=earned_kopeks,
+                last_activity_at=now,
+                updated_at=now
+            )
+            .on_conflict_do_update(index_elements=[ReferralStats.referrer_id], set_=deltas)
+        )
+        return
+
+    result = await db.execute(
+        update(ReferralStats)
+        .where(ReferralStats.referrer_id == referrer_id)
+        .values(**deltas)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 0:
+        db.add(ReferralStats(
+            referrer_id=referrer_id,
+            referrals_count=referrals,
+            first_topup_count=first_topups,
+            total_earned_kopeks=earned_kopeks,
+            last_activity_at=now,
+            updated_at=now
+        ))
+        await db.flush()
+
+
+async def get_referral_stats(db: AsyncSession, referrer_id: int) -> Optional[ReferralStats]:
+
+    return await db.get(ReferralStats, referrer_id)
+
+
+async def get_referral_stats_totals(db: AsyncSession) -> Dict[str, int]:
+
+    row = (await db.execute(
+        select(
+            func.coalesce(func.sum(ReferralStats.referrals_count), 0),
+            func.coalesce(func.sum(case((ReferralStats.referrals_count > 0, 1), else_=0)), 0),
+            func.coalesce(func.sum(ReferralStats.total_earned_kopeks), 0)
+        )
+    )).one()
+
+    return {
+        "users_with_referrals": row[0],
+        "active_referrers": row[1],
+        "total_earned_kopeks": row[2],
+    }
+
+
+async def get_top_referrers(db: AsyncSession, limit: int = 5) -> List[Dict[str, Any]]:
+
+    result = await db.execute(
+        select(
+            ReferralStats.referrals_count,
+            ReferralStats.first_topup_count,
+            ReferralStats.total_earned_kopeks,
+            User.telegram_id,
+            User.username,
+            User.first_name,
+            User.last_name
+        )
+        .join(User, User.id == ReferralStats.referrer_id)
+        .where(ReferralStats.referrals_count > 0)
+        .order_by(ReferralStats.total_earned_kopeks.desc(), ReferralStats.referrals_count.desc())
+        .limit(limit)
+    )
+
+    top_referrers = []
+    for row in result.all():
+        if row.first_name:
+            display_name = " ".join(filter(None, [row.first_name, row.last_name]))
+        elif row.username:
+            display_name = f"@{row.username}"
+        else:
+            display_name = f"ID{row.telegram_id}"
+
+        top_referrers.append({
+            "user_id": row.telegram_id,
+            "display_name": display_name,
+            "username": row.username,
+            "telegram_id": row.telegram_id,
+            "total_earned_kopeks": row.total_earned_kopeks,
+            "referrals_count": row.referrals_count,
+            "first_topup_count": row.first_topup_count
+        })
+    return top_referrers
+
+
+async def verify_referral_stats(db: AsyncSession) -> Dict[str, int]:
+    """
+    Пересчитывает агрегаты по исходным таблицам и исправляет расхождения.
+    Текущие счетчики читаются до пересчета, а исправление применяется
+    условным UPDATE только к строке, не изменившейся с момента чтения:
+    начисление, прошедшее во время пересчета, не затирается, а строка
+    будет сверена при следующем запуске.
+    """
+
+    current = {
+        row.referrer_id: row
+        for row in (await db.execute(select(
+            ReferralStats.referrer_id,
+            ReferralStats.referrals_count,
+            ReferralStats.first_topup_count,
+            ReferralStats.total_earned_kopeks
+        ))).all()
+    }
+
+    expected: Dict[int, Dict[str, Any]] = {}
+
+    def entry(referrer_id: int) -> Dict[str, Any]:
+        return expected.setdefault(referrer_id, {
+            "referrals_count": 0, "first_topup_count": 0,
+            "total_earned_kopeks": 0, "last_activity_at": None
+        })
+
+    def touch(item: Dict[str, Any], moment: Optional[datetime]):
+        if moment and (item["last_activity_at"] is None or moment > item["last_activity_at"]):
+            item["last_activity_at"] = moment
+
+    def unchanged_since_read(row):
+        return and_(
+            ReferralStats.referrer_id == row.referrer_id,
+            ReferralStats.referrals_count == row.referrals_count,
+            ReferralStats.first_topup_count == row.first_topup_count,
+            ReferralStats.total_earned_kopeks == row.total_earned_kopeks
+        )
+
+    referrals = await db.execute(
+        select(
+            User.referred_by_id,
+            func.count(User.id),
+            func.coalesce(func.sum(case((User.has_made_first_topup.is_(True), 1), else_=0)), 0),
+            func.max(User.created_at)
+        )
+        .where(User.referred_by_id.isnot(None))
+        .group_by(User.referred_by_id)
+    )
+    for referrer_id, count, first_topups, last_created in referrals.all():
+        item = entry(referrer_id)
+        item["referrals_count"] = count
+        item["first_topup_count"] = first_topups
+        touch(item, last_created)
+
+    earnings = await db.execute(
+        select(ReferralEarning.user_id, func.sum(ReferralEarning.amount_kopeks), func.max(ReferralEarning.created_at))
+        .group_by(ReferralEarning.user_id)
+    )
+    # Прежние начисления транзакциями referral_reward учитываются так же, как в статистике раньше
+    legacy_rewards = await db.execute(
+        select(Transaction.user_id, func.sum(Transaction.amount_kopeks), func.max(Transaction.created_at))
+        .where(Transaction.type == TransactionType.REFERRAL_REWARD.value)
+        .group_by(Transaction.user_id)
+    )
+    for referrer_id, total, last_created in earnings.all() + legacy_rewards.all():
+        item = entry(referrer_id)
+        item["total_earned_kopeks"] += total or 0
+        touch(item, last_created)
+
+    corrected = 0
+    skipped = 0
+    for referrer_id, item in expected.items():
+        row = current.get(referrer_id)
+        now = datetime.utcnow()
+
+        if row is None:
+            if await _insert_referral_stats(db, referrer_id, item, now):
+                corrected += 1
+            else:
+                skipped += 1
+            continue
+
+        if (
+            row.referrals_count == item["referrals_count"]
+            and row.first_topup_count == item["first_topup_count"]
+            and row.total_earned_kopeks == item["total_earned_kopeks"]
+        ):
+            continue
+
+        result = await db.execute(
+            update(ReferralStats)
+            .where(unchanged_since_read(row))
+            .values(updated_at=now, **item)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount:
+            corrected += 1
+        else:
+            skipped += 1
+
+    removed = 0
+    for referrer_id, row in current.items():
+        if referrer_id in expected:
+            continue
+        result = await db.execute(
+            delete(ReferralStats)
+            .where(unchanged_since_read(row))
+            .execution_options(synchronize_session=False)
+        )
+        removed += result.rowcount
+
+    await db.commit()
+
+    if corrected or removed:
+        logger.warning(
+            f"⚠️ Реферальные агрегаты исправлены: {corrected} рефереров, удалено устаревших {removed}"
+        )
+    if skipped:
+        logger.info(f"ℹ️ Реферальные агрегаты изменились во время сверки, отложено до следующей: {skipped}")
+
+    return {"referrers": len(expected), "corrected": corrected, "removed": removed}
+
+
+async def _insert_referral_stats(db: AsyncSession, referrer_id: int, item: Dict[str, Any], now: datetime) -> bool:
+    """Создает строку агрегатов; False - ее успело создать параллельное начисление"""
+
+    insert = _dialect_insert(db)
+    if insert is not None:
+        result = await db.execute(
+            insert(ReferralStats)
+            .values(referrer_id=referrer_id, updated_at=now, **item)
+            .on_conflict_do_nothing(index_elements=[ReferralStats.referrer_id])
+        )
+        return bool(result.rowcount)
+
+    try:
+        async with db.begin_nested():
+            db.add(ReferralStats(referrer_id=referrer_id, updated_at=now, **item))
+        return True
+    except IntegrityError:
+        return False
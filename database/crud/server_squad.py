@@ -1,10 +1,12 @@
 import logging
-from typing import List, Optional, Tuple
-from sqlalchemy import select, and_, func, update, delete
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import select, and_, func, update, delete, case, insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
-from app.database.models import ServerSquad, SubscriptionServer
+from app.database.models import ServerSquad, SubscriptionServer, Subscription, SubscriptionStatus
 
 logger = logging.getLogger(__name__)
 
@@ -149,52 +151,122 @@ async def delete_server_squad(db: AsyncSession, server_id: int) -> bool:
     return True
 
 
+@dataclass
+class ServerCatalogueDiff:
+    created: List[str] = field(default_factory=list)
+    renamed: List[Tuple[str, str, str]] = field(default_factory=list)
+    recreated: List[Tuple[str, str]] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    
+    @property
+    def changed(self) -> bool:
+        return bool(self.created or self.renamed or self.recreated or self.removed)
+
+
+_INHERITED_FIELDS = (
+    'display_name', 'country_code', 'price_kopeks', 'description',
+    'max_users', 'is_available', 'sort_order'
+)
+
+
 async def sync_with_remnawave(
     db: AsyncSession,
     remnawave_squads: List[dict]
-) -> Tuple[int, int, int]:
-    
-    created = 0
-    updated = 0
-    disabled = 0
+) -> ServerCatalogueDiff:
+    """
+    Сверяет каталог с полным списком сквадов Remnawave и применяет разницу
+    одной транзакцией: пачкой вставок, пачкой переименований и одним UPDATE
+    на отключение.
+    Переименованный сквад сохраняет uuid и обновляется на месте. Сквад,
+    удаленный и созданный заново с тем же именем, приходит с новым uuid:
+    новая запись наследует настройки старой (цена, название, лимиты,
+    доступность), а старая отключается. Остальные новые сквады создаются
+    недоступными, пропавшие - отключаются.
+    """
+    diff = ServerCatalogueDiff()
     
-    existing_servers = {}
     result = await db.execute(select(ServerSquad))
-    for server in result.scalars().all():
-        existing_servers[server.squad_uuid] = server
+    existing = {server.squad_uuid: server for server in result.scalars().all()}
+    incoming = {
+        squad['uuid']: squad.get('name') or f"Squad {squad['uuid'][:8]}"
+        for squad in remnawave_squads
+    }
     
-    remnawave_uuids = {squad['uuid'] for squad in remnawave_squads}
+    gone = {uuid: server for uuid, server in existing.items() if uuid not in incoming}
+    gone_by_name: Dict[str, ServerSquad] = {}
+    for server in gone.values():
+        if server.original_name:
+            gone_by_name.setdefault(server.original_name, server)
     
-    for squad in remnawave_squads:
-        squad_uuid = squad['uuid']
-        original_name = squad.get('name', f'Squad {squad_uuid[:8]}')
+    new_rows = []
+    renames = []
+    inherited_from = set()
+    
+    for squad_uuid, original_name in incoming.items():
+        server = existing.get(squad_uuid)
         
-        if squad_uuid in existing_servers:
-            server = existing_servers[squad_uuid]
+        if server is not None:
             if server.original_name != original_name:
-                server.original_name = original_name
-                updated += 1
-        else:
-            await create_server_squad(
-                db=db,
-                squad_uuid=squad_uuid,
-                display_name=_generate_display_name(original_name),
-                original_name=original_name,
-                country_code=_extract_country_code(original_name),
-                price_kopeks=1000, 
-                is_available=False 
-            )
-            created += 1
-    
-    for uuid, server in existing_servers.items():
-        if uuid not in remnawave_uuids and server.is_available:
-            server.is_available = False
-            disabled += 1
+                values = {'id': server.id, 'original_name': original_name}
+                # Название, сгенерированное при создании, следует за именем сквада; заданное вручную - нет
+                if server.display_name == _generate_display_name(server.original_name or ''):
+                    values['display_name'] = _generate_display_name(original_name)
+                renames.append(values)
+                diff.renamed.append((squad_uuid, server.original_name, original_name))
+            continue
+        
+        predecessor = gone_by_name.pop(original_name, None)
+        if predecessor is not None:
+            row = {name: getattr(predecessor, name) for name in _INHERITED_FIELDS}
+            row.update(squad_uuid=squad_uuid, original_name=original_name, current_users=0)
+            new_rows.append(row)
+            inherited_from.add(predecessor.squad_uuid)
+            diff.recreated.append((predecessor.squad_uuid, squad_uuid))
+            continue
+        
+        new_rows.append({
+            'squad_uuid': squad_uuid,
+            'display_name': _generate_display_name(original_name),
+            'original_name': original_name,
+            'country_code': _extract_country_code(original_name),
+            'price_kopeks': 1000,
+            'is_available': False,
+            'current_users': 0
+        })
+        diff.created.append(squad_uuid)
+    
+    disable_ids = [server.id for server in gone.values() if server.is_available]
+    diff.removed = [
+        uuid for uuid, server in gone.items()
+        if server.is_available and uuid not in inherited_from
+    ]
+    
+    if not (new_rows or renames or disable_ids):
+        return diff
     
-    await db.commit()
+    try:
+        if disable_ids:
+            await db.execute(
+                update(ServerSquad)
+                .where(ServerSquad.id.in_(disable_ids))
+                .values(is_available=False)
+                .execution_options(synchronize_session=False)
+            )
+        if renames:
+            await db.execute(update(ServerSquad), renames)
+        if new_rows:
+            await db.execute(insert(ServerSquad), new_rows)
+        
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
     
-    logger.info(f"🔄 Синхронизация завершена: +{created} ~{updated} -{disabled}")
-    return created, updated, disabled
+    logger.info(
+        f"🔄 Синхронизация каталога: +{len(diff.created)} ~{len(diff.renamed)} "
+        f"⇄{len(diff.recreated)} -{len(diff.removed)}"
+    )
+    return diff
 
 
 def _generate_display_name(original_name: str) -> str:
@@ -263,19 +335,38 @@ async def get_server_statistics(db: AsyncSession) -> dict:
         'total_revenue_rubles': total_revenue_kopeks / 100
     }
 
+async def adjust_server_user_counts(
+    db: AsyncSession,
+    server_squad_ids: List[int],
+    delta: int
+) -> None:
+    """
+    Сдвигает счетчики current_users на delta за каждое вхождение сервера в
+    server_squad_ids, не опускаясь ниже нуля. Обычно это один UPDATE по IN;
+    коммит остается за вызывающим, чтобы счетчик менялся в одной транзакции
+    со связями подписки.
+    """
+    by_step: Dict[int, List[int]] = {}
+    for server_id, times in Counter(server_squad_ids).items():
+        by_step.setdefault(delta * times, []).append(server_id)
+
+    for step, server_ids in by_step.items():
+        new_value = ServerSquad.current_users + step
+        await db.execute(
+            update(ServerSquad)
+            .where(ServerSquad.id.in_(server_ids))
+            .values(current_users=case((new_value > 0, new_value), else_=0))
+            .execution_options(synchronize_session=False)
+        )
+
+
 async def add_user_to_servers(
     db: AsyncSession,
     server_squad_ids: List[int]
 ) -> bool:
     
     try:
-        for server_id in server_squad_ids:
-            await db.execute(
-                update(ServerSquad)
-                .where(ServerSquad.id == server_id)
-                .values(current_users=ServerSquad.current_users + 1)
-            )
-        
+        await adjust_server_user_counts(db, server_squad_ids, 1)
         await db.commit()
         logger.info(f"✅ Увеличен счетчик пользователей для серверов: {server_squad_ids}")
         return True
@@ -292,13 +383,7 @@ async def remove_user_from_servers(
 ) -> bool:
     
     try:
-        for server_id in server_squad_ids:
-            await db.execute(
-                update(ServerSquad)
-                .where(ServerSquad.id == server_id)
-                .values(current_users=func.greatest(ServerSquad.current_users - 1, 0))
-            )
-        
+        await adjust_server_user_counts(db, server_squad_ids, -1)
         await db.commit()
         logger.info(f"✅ Уменьшен счетчик пользователей для серверов: {server_squad_ids}")
         return True
@@ -309,6 +394,24 @@ async def remove_user_from_servers(
         return False
 
 
+async def get_server_capacity_rows(db: AsyncSession) -> List[dict]:
+    """Легкий срез серверов для проверок доступности и цен без загрузки моделей"""
+    
+    result = await db.execute(
+        select(
+            ServerSquad.id,
+            ServerSquad.squad_uuid,
+            ServerSquad.display_name,
+            ServerSquad.country_code,
+            ServerSquad.price_kopeks,
+            ServerSquad.is_available,
+            ServerSquad.max_users,
+            ServerSquad.current_users
+        )
+    )
+    return [dict(row._mapping) for row in result]
+
+
 async def get_server_ids_by_uuids(
     db: AsyncSession,
     squad_uuids: List[str]
@@ -322,28 +425,33 @@ async def get_server_ids_by_uuids(
 
 
 async def sync_server_user_counts(db: AsyncSession) -> int:
+    """
+    Пересчитывает current_users всех серверов одним UPDATE по коррелированному
+    подзапросу (число разных активных подписок на сервере): серверы без
+    активных подписок получают 0. Обновляются только
+    расходящиеся счетчики; возвращается их количество.
+    """
     
     try:
-        result = await db.execute(
-            select(
-                ServerSquad.id,
-                ServerSquad.squad_uuid,
-                func.count(SubscriptionServer.id).label('actual_users')
-            )
-            .outerjoin(SubscriptionServer, ServerSquad.id == SubscriptionServer.server_squad_id)
+        actual_users = func.coalesce(
+            select(func.count(func.distinct(SubscriptionServer.subscription_id)))
             .join(Subscription, SubscriptionServer.subscription_id == Subscription.id)
-            .where(Subscription.status == 'active')
-            .group_by(ServerSquad.id, ServerSquad.squad_uuid)
+            .where(
+                SubscriptionServer.server_squad_id == ServerSquad.id,
+                Subscription.status == SubscriptionStatus.ACTIVE.value
+            )
+            .correlate(ServerSquad)
+            .scalar_subquery(),
+            0
         )
         
-        updated_count = 0
-        for server_id, squad_uuid, actual_users in result.fetchall():
-            await db.execute(
-                update(ServerSquad)
-                .where(ServerSquad.id == server_id)
-                .values(current_users=actual_users)
-            )
-            updated_count += 1
+        result = await db.execute(
+            update(ServerSquad)
+            .where(func.coalesce(ServerSquad.current_users, -1) != actual_users)
+            .values(current_users=actual_users)
+            .execution_options(synchronize_session=False)
+        )
+        updated_count = result.rowcount or 0
         
         await db.commit()
         logger.info(f"✅ Синхронизированы счетчики для {updated_count} серверов")
@@ -352,4 +460,4 @@ async def sync_server_user_counts(db: AsyncSession) -> int:
     except Exception as e:
         logger.error(f"Ошибка синхронизации счетчиков пользователей: {e}")
         await db.rollback()
-        return 0
\ No newline at end of file
+        return 0
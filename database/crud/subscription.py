@@ -1,7 +1,7 @@
 import logging
 from datetime import datetime, timedelta
 from typing import Optional, List, Tuple
-from sqlalchemy import select, and_, func
+from sqlalchemy import select, and_, func, delete
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
@@ -9,6 +9,7 @@ from app.database.models import (
     Subscription, SubscriptionStatus, User, 
     SubscriptionServer
 )
+from app.database.crud.server_squad import adjust_server_user_counts
 from app.utils.pricing_utils import calculate_months_from_days, get_remaining_months
 from app.config import settings
 
@@ -234,12 +235,13 @@ async def deactivate_subscription(
 
 async def get_expiring_subscriptions(
     db: AsyncSession,
-    days_before: int = 3
+    days_before: int = 3,
+    reachable_only: bool = False
 ) -> List[Subscription]:
     
     threshold_date = datetime.utcnow() + timedelta(days=days_before)
     
-    result = await db.execute(
+    query = (
         select(Subscription)
         .options(selectinload(Subscription.user))
         .where(
@@ -250,6 +252,11 @@ async def get_expiring_subscriptions(
             )
         )
     )
+    
+    if reachable_only:
+        query = query.join(User, User.id == Subscription.user_id).where(User.is_reachable.is_(True))
+    
+    result = await db.execute(query)
     return result.scalars().all()
 
 
@@ -454,6 +461,14 @@ async def add_subscription_servers(
             total_price_for_period = server_price_per_month * months_remaining
             paid_prices.append(total_price_for_period)
     
+    # Продление добавляет записи с оплатой повторно; счетчик сервера растет
+    # только для серверов, которых у подписки еще не было
+    linked_result = await db.execute(
+        select(SubscriptionServer.server_squad_id)
+        .where(SubscriptionServer.subscription_id == subscription.id)
+    )
+    new_server_ids = set(server_squad_ids) - set(linked_result.scalars().all())
+    
     for i, server_id in enumerate(server_squad_ids):
         subscription_server = SubscriptionServer(
             subscription_id=subscription.id,
@@ -462,6 +477,7 @@ async def add_subscription_servers(
         )
         db.add(subscription_server)
     
+    await adjust_server_user_counts(db, list(new_server_ids), 1)
     await db.commit()
     await db.refresh(subscription)
     
@@ -583,8 +599,14 @@ async def remove_subscription_servers(
     server_squad_ids: List[int]
 ) -> bool:
     try:
-        from app.database.models import SubscriptionServer
-        from sqlalchemy import delete
+        result = await db.execute(
+            select(SubscriptionServer.server_squad_id)
+            .where(
+                SubscriptionServer.subscription_id == subscription_id,
+                SubscriptionServer.server_squad_id.in_(server_squad_ids)
+            )
+        )
+        linked_ids = list(set(result.scalars().all()))
         
         await db.execute(
             delete(SubscriptionServer)
@@ -593,6 +615,7 @@ async def remove_subscription_servers(
                 SubscriptionServer.server_squad_id.in_(server_squad_ids)
             )
         )
+        await adjust_server_user_counts(db, linked_ids, -1)
         
         await db.commit()
         logger.info(f"🗑️ Удалены серверы {server_squad_ids} из подписки {subscription_id}")
@@ -604,6 +627,26 @@ async def remove_subscription_servers(
         return False
 
 
+async def delete_subscription_servers(db: AsyncSession, subscription_id: int) -> int:
+    """
+    Удаляет все серверы подписки и уменьшает их счетчики пользователей.
+    Без коммита - вызывается внутри удаления пользователя или подписки.
+    """
+    result = await db.execute(
+        select(SubscriptionServer.server_squad_id)
+        .where(SubscriptionServer.subscription_id == subscription_id)
+    )
+    linked_ids = list(set(result.scalars().all()))
+    
+    if linked_ids:
+        await db.execute(
+            delete(SubscriptionServer).where(SubscriptionServer.subscription_id == subscription_id)
+        )
+        await adjust_server_user_counts(db, linked_ids, -1)
+    
+    return len(linked_ids)
+
+
 async def get_subscription_renewal_cost(
     db: AsyncSession,
     subscription_id: int,
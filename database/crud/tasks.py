@@ -1,7 +1,10 @@
+from datetime import datetime
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, delete
-from typing import List, Optional
-from app.database.models import Task, TaskChannel, TaskCompletion
+from sqlalchemy.exc import IntegrityError
+from typing import List, Optional, Set
+from app.database.models import Task, TaskChannel, TaskCompletion, TransactionType
+from app.database.crud.user import BalanceChange, apply_balance_change
 from sqlalchemy.orm import selectinload
 
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -74,13 +77,67 @@ async def get_task_by_id(db: AsyncSession, task_id: int) -> Optional[Task]:
 
 
 async def get_active_tasks(db: AsyncSession) -> List[Task]:
-    """Возвращает список всех активных заданий."""
+    """Возвращает список всех активных заданий вместе с каналами."""
     result = await db.execute(
-        select(Task).where(Task.is_active == True)
+        select(Task)
+        .where(Task.is_active == True)
+        .options(selectinload(Task.channels))
+        .order_by(Task.id)
     )
     return result.scalars().all()
 
 
+async def get_completed_task_ids(db: AsyncSession, user_id: int, task_ids: List[int]) -> Set[int]:
+    """Какие из заданий уже выполнены пользователем (users.id) - одним запросом."""
+    if not task_ids:
+        return set()
+
+    result = await db.execute(
+        select(TaskCompletion.task_id).where(
+            TaskCompletion.user_id == user_id,
+            TaskCompletion.task_id.in_(task_ids)
+        )
+    )
+    return set(result.scalars().all())
+
+
+async def complete_task_with_reward(
+    db: AsyncSession,
+    user_id: int,
+    task_id: int,
+    reward_kopeks: int,
+    description: str
+) -> bool:
+    """
+    Записывает выполнение и начисляет награду одной транзакцией. Повторное
+    выполнение упирается в уникальный индекс (user_id, task_id), поэтому
+    награда не выдается дважды. False - задание уже выполнено.
+    """
+    try:
+        async with db.begin_nested():
+            db.add(TaskCompletion(user_id=user_id, task_id=task_id, completed_at=datetime.utcnow()))
+            await db.flush()
+    except IntegrityError:
+        return False
+
+    try:
+        if reward_kopeks > 0:
+            entry = await apply_balance_change(db, BalanceChange(
+                user_id=user_id,
+                amount_kopeks=reward_kopeks,
+                description=description,
+                transaction_type=TransactionType.DEPOSIT
+            ), commit=False)
+            if entry is None:
+                raise ValueError(f"Пользователь {user_id} не найден")
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
+
+    return True
+
+
 async def get_user_completed_tasks(db: AsyncSession, user_id: int) -> List[TaskCompletion]:
     """Возвращает список заданий, выполненных пользователем."""
     result = await db.execute(
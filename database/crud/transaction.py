@@ -18,7 +18,8 @@ async def create_transaction(
     description: str,
     payment_method: Optional[PaymentMethod] = None,
     external_id: Optional[str] = None,
-    is_completed: bool = True
+    is_completed: bool = True,
+    commit: bool = True
 ) -> Transaction:
     
     transaction = Transaction(
@@ -33,8 +34,11 @@ async def create_transaction(
     )
     
     db.add(transaction)
-    await db.commit()
-    await db.refresh(transaction)
+    if commit:
+        await db.commit()
+        await db.refresh(transaction)
+    else:
+        await db.flush()
     
     logger.info(f"💳 Создана транзакция: {type.value} на {amount_kopeks/100}₽ для пользователя {user_id}")
     return transaction
@@ -341,7 +345,8 @@ async def create_unique_tribute_transaction(
     user_id: int,
     payment_id: str,
     amount_kopeks: int,
-    description: str
+    description: str,
+    commit: bool = True
 ) -> Transaction:
     
     external_id = f"donation_{payment_id}"
@@ -362,5 +367,6 @@ async def create_unique_tribute_transaction(
         description=description,
         payment_method=PaymentMethod.TRIBUTE,
         external_id=external_id,
-        is_completed=True
+        is_completed=True,
+        commit=commit
     )
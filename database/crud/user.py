@@ -2,10 +2,12 @@ import logging
 import secrets
 import string
 from datetime import datetime, timedelta
+from dataclasses import dataclass
 from typing import Optional, List
-from sqlalchemy import select, and_, or_, func
+from sqlalchemy import select, and_, or_, func, case
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
+from sqlalchemy.orm.attributes import set_committed_value
 import logging
 from datetime import datetime, timedelta
 from sqlalchemy import select, update
@@ -15,7 +17,9 @@ from typing import Dict, Any
 from app.config import settings  # Измените config на settings
 
 
-from app.database.models import User, UserStatus, Subscription, Transaction
+from app.database.models import (
+    User, UserStatus, Subscription, Transaction, TransactionType, PaymentMethod
+)
 from app.config import settings
 
 logger = logging.getLogger(__name__)
@@ -187,7 +191,7 @@ async def get_remaining_cooldown(session: AsyncSession, user_id: int) -> int:
 
     cooldown_hours = settings.WHEEL_OF_FORTUNE_COOLDOWN_HOURS  # Используйте settings
     next_available = last_used + timedelta(hours=cooldown_hours)
-    now = datetime.now()
+    now = datetime.utcnow()
 
     if now >= next_available:
         return 0
@@ -209,10 +213,161 @@ async def set_wheel_cooldown(session: AsyncSession, user_id: int) -> None:
     await session.execute(
         update(User)
         .where(User.telegram_id == user_id)
-        .values(wheel_last_used=datetime.now())
+        .values(wheel_last_used=datetime.utcnow())
     )
 
 
+@dataclass
+class BalanceChange:
+    user_id: int
+    amount_kopeks: int
+    description: str = ""
+    transaction_type: Optional[TransactionType] = None
+    payment_method: Optional[PaymentMethod] = None
+    external_id: Optional[str] = None
+    transaction_amount_kopeks: Optional[int] = None
+
+    @property
+    def recorded_amount(self) -> int:
+        if self.transaction_amount_kopeks is not None:
+            return self.transaction_amount_kopeks
+        return abs(self.amount_kopeks)
+
+
+@dataclass
+class LedgerEntry:
+    user_id: int
+    balance_kopeks: int
+    transaction: Optional[Transaction] = None
+
+
+def _supports_update_returning(db: AsyncSession) -> bool:
+    return db.get_bind().dialect.update_returning
+
+
+def _sync_loaded_balance(db: AsyncSession, user_id: int, balance_kopeks: int):
+    # UPDATE выполняется мимо ORM, поэтому подставляем новое значение
+    # в уже загруженный объект, не помечая его измененным
+    user = db.identity_map.get(db.identity_key(User, user_id))
+    if user is not None:
+        set_committed_value(user, "balance_kopeks", balance_kopeks)
+
+
+async def _record_transactions(db: AsyncSession, changes: List[BalanceChange]) -> List[Transaction]:
+    from app.database.crud.transaction import create_transaction
+
+    transactions = []
+    for change in changes:
+        if change.transaction_type is None:
+            continue
+        transactions.append(await create_transaction(
+            db=db,
+            user_id=change.user_id,
+            type=change.transaction_type,
+            amount_kopeks=change.recorded_amount,
+            description=change.description,
+            payment_method=change.payment_method,
+            external_id=change.external_id,
+            commit=False
+        ))
+    return transactions
+
+
+async def _update_balance(db: AsyncSession, user_id: int, amount_kopeks: int) -> Optional[int]:
+    stmt = (
+        update(User)
+        .where(User.id == user_id)
+        .values(
+            balance_kopeks=User.balance_kopeks + amount_kopeks,
+            updated_at=datetime.utcnow()
+        )
+        .execution_options(synchronize_session=False)
+    )
+    if amount_kopeks < 0:
+        stmt = stmt.where(User.balance_kopeks >= -amount_kopeks)
+
+    if _supports_update_returning(db):
+        result = await db.execute(stmt.returning(User.balance_kopeks))
+        return result.scalar_one_or_none()
+
+    result = await db.execute(stmt)
+    if result.rowcount != 1:
+        return None
+    return (await db.execute(
+        select(User.balance_kopeks).where(User.id == user_id)
+    )).scalar_one()
+
+
+async def apply_balance_change(
+    db: AsyncSession,
+    change: BalanceChange,
+    commit: bool = True
+) -> Optional[LedgerEntry]:
+    """Атомарно меняет баланс одним UPDATE; None - пользователь не найден или не хватает средств"""
+    new_balance = await _update_balance(db, change.user_id, change.amount_kopeks)
+    if new_balance is None:
+        return None
+
+    transactions = await _record_transactions(db, [change])
+    _sync_loaded_balance(db, change.user_id, new_balance)
+
+    if commit:
+        await db.commit()
+
+    return LedgerEntry(change.user_id, new_balance, transactions[0] if transactions else None)
+
+
+async def apply_balance_changes(
+    db: AsyncSession,
+    changes: List[BalanceChange],
+    commit: bool = True
+) -> Dict[int, int]:
+    """Пакетное начисление/списание одним UPDATE с CASE; возвращает новые балансы примененных пользователей"""
+    if not changes:
+        return {}
+
+    deltas: Dict[int, int] = {}
+    for change in changes:
+        deltas[change.user_id] = deltas.get(change.user_id, 0) + change.amount_kopeks
+
+    if _supports_update_returning(db):
+        delta_expr = case(deltas, value=User.id, else_=0)
+        result = await db.execute(
+            update(User)
+            .where(
+                User.id.in_(list(deltas)),
+                or_(delta_expr >= 0, User.balance_kopeks + delta_expr >= 0)
+            )
+            .values(
+                balance_kopeks=User.balance_kopeks + delta_expr,
+                updated_at=datetime.utcnow()
+            )
+            .returning(User.id, User.balance_kopeks)
+            .execution_options(synchronize_session=False)
+        )
+        balances = {user_id: balance for user_id, balance in result.all()}
+    else:
+        balances = {}
+        for user_id, delta in deltas.items():
+            new_balance = await _update_balance(db, user_id, delta)
+            if new_balance is not None:
+                balances[user_id] = new_balance
+
+    await _record_transactions(db, [change for change in changes if change.user_id in balances])
+    for user_id, balance in balances.items():
+        _sync_loaded_balance(db, user_id, balance)
+
+    if commit:
+        await db.commit()
+
+    skipped = len(deltas) - len(balances)
+    logger.info(
+        f"💰 Пакетное изменение балансов: применено {len(balances)} пользователям"
+        + (f", пропущено {skipped}" if skipped else "")
+    )
+    return balances
+
+
 async def add_user_balance(
     db: AsyncSession,
     user: User,
@@ -223,26 +378,19 @@ async def add_user_balance(
 ) -> bool:
     try:
         old_balance = user.balance_kopeks
-        user.balance_kopeks += amount_kopeks
-        user.updated_at = datetime.utcnow()
-        
-        if create_transaction:
-            from app.database.crud.transaction import create_transaction as create_trans
-            from app.database.models import TransactionType
-            
-            await create_trans(
-                db=db,
-                user_id=user.id,
-                type=TransactionType.DEPOSIT,
-                amount_kopeks=amount_kopeks,
-                description=description
-            )
-        
-        await db.commit()
-        await db.refresh(user)
+        entry = await apply_balance_change(db, BalanceChange(
+            user_id=user.id,
+            amount_kopeks=amount_kopeks,
+            description=description,
+            transaction_type=TransactionType.DEPOSIT if create_transaction else None,
+            transaction_amount_kopeks=amount_kopeks
+        ))
         
+        if entry is None:
+            logger.warning(f"Не удалось изменить баланс пользователя {user.telegram_id} на {amount_kopeks}")
+            return False
         
-        logger.info(f"💰 Баланс пользователя {user.telegram_id} изменен: {old_balance} → {user.balance_kopeks} (изменение: +{amount_kopeks})")
+        logger.info(f"💰 Баланс пользователя {user.telegram_id} изменен: {old_balance} → {entry.balance_kopeks} (изменение: {amount_kopeks:+})")
         return True
         
     except Exception as e:
@@ -274,31 +422,27 @@ async def subtract_user_balance(
     db: AsyncSession, 
     user: User, 
     amount_kopeks: int, 
-    description: str
+    description: str,
+    transaction_type: Optional[TransactionType] = None
 ) -> bool:
-    logger.error(f"💸 ОТЛАДКА subtract_user_balance:")
-    logger.error(f"   👤 User ID: {user.id} (TG: {user.telegram_id})")
-    logger.error(f"   💰 Баланс до списания: {user.balance_kopeks} копеек")
-    logger.error(f"   💸 Сумма к списанию: {amount_kopeks} копеек")
-    logger.error(f"   📝 Описание: {description}")
-    
-    if user.balance_kopeks < amount_kopeks:
-        logger.error(f"   ❌ НЕДОСТАТОЧНО СРЕДСТВ!")
-        return False
-    
     try:
         old_balance = user.balance_kopeks
-        user.balance_kopeks -= amount_kopeks
-        user.updated_at = datetime.utcnow()
+        entry = await apply_balance_change(db, BalanceChange(
+            user_id=user.id,
+            amount_kopeks=-amount_kopeks,
+            description=description,
+            transaction_type=transaction_type
+        ))
         
-        await db.commit()
-        await db.refresh(user)
+        if entry is None:
+            logger.warning(f"💸 Недостаточно средств у пользователя {user.telegram_id}: требуется {amount_kopeks} коп")
+            return False
         
-        logger.error(f"   ✅ Средства списаны: {old_balance} → {user.balance_kopeks}")
+        logger.info(f"💸 Списано с баланса пользователя {user.telegram_id}: {old_balance} → {entry.balance_kopeks} ({description})")
         return True
         
     except Exception as e:
-        logger.error(f"   ❌ ОШИБКА СПИСАНИЯ: {e}")
+        logger.error(f"Ошибка списания средств пользователя {user.telegram_id}: {e}")
         await db.rollback()
         return False
 
@@ -308,7 +452,8 @@ async def get_users_list(
     offset: int = 0,
     limit: int = 50,
     search: Optional[str] = None,
-    status: Optional[UserStatus] = None
+    status: Optional[UserStatus] = None,
+    reachable_only: bool = False
 ) -> List[User]:
     
     query = select(User).options(selectinload(User.subscription))
@@ -316,6 +461,9 @@ async def get_users_list(
     if status:
         query = query.where(User.status == status.value)
     
+    if reachable_only:
+        query = query.where(User.is_reachable.is_(True))
+    
     if search:
         search_term = f"%{search}%"
         conditions = [
@@ -389,6 +537,96 @@ async def get_inactive_users(db: AsyncSession, months: int = 3) -> List[User]:
     return result.scalars().all()
 
 
+async def record_delivery_failure(db: AsyncSession, telegram_id: int, threshold: int) -> Optional[bool]:
+    """
+    Учитывает отказ Telegram доставить сообщение (бот заблокирован).
+    Возвращает доступность пользователя после обновления или None, если его нет в базе.
+    """
+    now = datetime.utcnow()
+    result = await db.execute(
+        update(User)
+        .where(User.telegram_id == telegram_id)
+        .values(
+            delivery_failures=User.delivery_failures + 1,
+            delivery_first_failed_at=func.coalesce(User.delivery_first_failed_at, now),
+            delivery_last_failed_at=now,
+            is_reachable=case((User.delivery_failures + 1 >= threshold, False), else_=User.is_reachable)
+        )
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    
+    if result.rowcount == 0:
+        return None
+    return (await db.execute(
+        select(User.is_reachable).where(User.telegram_id == telegram_id)
+    )).scalar_one()
+
+
+async def mark_user_unreachable(db: AsyncSession, telegram_id: int, threshold: int) -> bool:
+    now = datetime.utcnow()
+    result = await db.execute(
+        update(User)
+        .where(User.telegram_id == telegram_id, User.is_reachable.is_(True))
+        .values(
+            is_reachable=False,
+            delivery_failures=case((User.delivery_failures < threshold, threshold), else_=User.delivery_failures),
+            delivery_first_failed_at=func.coalesce(User.delivery_first_failed_at, now),
+            delivery_last_failed_at=now
+        )
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    return result.rowcount > 0
+
+
+async def reset_delivery_health(db: AsyncSession, telegram_id: int) -> bool:
+    """Снимает отметки о недоставке; возвращает True, если пользователь был помечен"""
+    result = await db.execute(
+        update(User)
+        .where(
+            User.telegram_id == telegram_id,
+            or_(User.is_reachable.is_(False), User.delivery_failures > 0)
+        )
+        .values(
+            is_reachable=True,
+            delivery_failures=0,
+            delivery_first_failed_at=None,
+            delivery_last_failed_at=None,
+            delivery_probed_at=datetime.utcnow()
+        )
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    return result.rowcount > 0
+
+
+async def get_users_for_delivery_probe(db: AsyncSession, probed_before: datetime, limit: int) -> List[int]:
+    result = await db.execute(
+        select(User.telegram_id)
+        .where(
+            User.is_reachable.is_(False),
+            User.status == UserStatus.ACTIVE.value,
+            or_(User.delivery_probed_at.is_(None), User.delivery_probed_at < probed_before)
+        )
+        .order_by(User.delivery_probed_at.asc().nullsfirst())
+        .limit(limit)
+    )
+    return list(result.scalars().all())
+
+
+async def touch_delivery_probe(db: AsyncSession, telegram_ids: List[int]):
+    if not telegram_ids:
+        return
+    await db.execute(
+        update(User)
+        .where(User.telegram_id.in_(telegram_ids))
+        .values(delivery_probed_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+
+
 async def delete_user(db: AsyncSession, user: User) -> bool:
     user.status = UserStatus.DELETED.value
     user.updated_at = datetime.utcnow()
@@ -4,7 +4,7 @@ from enum import Enum
 
 from sqlalchemy import (
     Column, Integer, String, DateTime, Boolean, Text, 
-    ForeignKey, Float, JSON, BigInteger
+    ForeignKey, Float, JSON, BigInteger, UniqueConstraint, Index
 )
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship, Mapped, mapped_column
@@ -67,6 +67,7 @@ class PaymentMethod(Enum):
     TELEGRAM_STARS = "telegram_stars"
     TRIBUTE = "tribute"
     YOOKASSA = "yookassa" 
+    CRYPTOBOT = "cryptobot"
     MANUAL = "manual"
 
 
@@ -74,6 +75,9 @@ class PaymentMethod(Enum):
 class TaskCompletion(Base):
     """Модель для хранения выполненных заданий пользователем."""
     __tablename__ = "task_completions"
+    __table_args__ = (
+        UniqueConstraint("user_id", "task_id", name="uq_task_completions_user_task"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
@@ -143,6 +147,64 @@ class YooKassaPayment(Base):
         return f"<YooKassaPayment(id={self.id}, yookassa_id={self.yookassa_payment_id}, amount={self.amount_rubles}₽, status={self.status})>"
 
 
+class CryptoInvoice(Base):
+    __tablename__ = "crypto_invoices"
+
+    id = Column(Integer, primary_key=True, index=True)
+    invoice_id = Column(BigInteger, unique=True, nullable=False, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    amount_kopeks = Column(Integer, nullable=False)
+    asset = Column(String(16), nullable=False)
+    amount = Column(String(50), nullable=False)
+    status = Column(String(20), default="active", nullable=False, index=True)
+    pay_url = Column(Text, nullable=True)
+    transaction_id = Column(Integer, ForeignKey("transactions.id"), nullable=True)
+    paid_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=func.now())
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
+    user = relationship("User", backref="crypto_invoices")
+
+    @property
+    def is_paid(self) -> bool:
+        return self.status == "paid"
+
+    def __repr__(self):
+        return f"<CryptoInvoice(id={self.id}, invoice_id={self.invoice_id}, amount={self.amount_kopeks / 100}₽, status={self.status})>"
+
+
+class PaymentEventStatus(Enum):
+    PENDING = "pending"
+    PROCESSING = "processing"
+    PROCESSED = "processed"
+    DEAD = "dead"
+
+
+class PaymentEvent(Base):
+    __tablename__ = "payment_events"
+    __table_args__ = (
+        UniqueConstraint("provider", "event_id", name="uq_payment_events_provider_event"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    provider = Column(String(32), nullable=False)
+    event_id = Column(String(255), nullable=False)
+    event_type = Column(String(100), nullable=True)
+    object_id = Column(String(255), nullable=True)
+    payload = Column(Text, nullable=False)
+    status = Column(String(20), default=PaymentEventStatus.PENDING.value, nullable=False, index=True)
+    attempts = Column(Integer, default=0, nullable=False)
+    last_error = Column(Text, nullable=True)
+    next_attempt_at = Column(DateTime, default=func.now(), nullable=False, index=True)
+    locked_at = Column(DateTime, nullable=True)
+    processed_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=func.now())
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<PaymentEvent(id={self.id}, provider={self.provider}, event_id={self.event_id}, status={self.status})>"
+
+
 class User(Base):
     __tablename__ = "users"
     
@@ -174,6 +236,12 @@ class User(Base):
     ss_password = Column(String(255), nullable=True)
     task_completions: Mapped[list["TaskCompletion"]] = relationship(back_populates="user")
     has_made_first_topup: Mapped[bool] = mapped_column(Boolean, default=False, nullable=False)
+    is_reachable = Column(Boolean, default=True, nullable=False)
+    delivery_failures = Column(Integer, default=0, nullable=False)
+    delivery_first_failed_at = Column(DateTime, nullable=True)
+    delivery_last_failed_at = Column(DateTime, nullable=True)
+    delivery_probed_at = Column(DateTime, nullable=True)
+    wheel_last_used = Column(DateTime, nullable=True)
     tasks_completed = relationship(
         "TaskCompletion",
         back_populates="user"
@@ -456,6 +524,9 @@ class PromoCode(Base):
 
 class PromoCodeUse(Base):
     __tablename__ = "promocode_uses"
+    __table_args__ = (
+        UniqueConstraint("promocode_id", "user_id", name="uq_promocode_uses_promocode_user"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     promocode_id = Column(Integer, ForeignKey("promocodes.id"), nullable=False)
@@ -478,6 +549,9 @@ class ReferralEarning(Base):
     reason = Column(String(100), nullable=False) 
     
     referral_transaction_id = Column(Integer, ForeignKey("transactions.id"), nullable=True)
+    # Ключ источника начисления (например, topup:<id транзакции>): повторная обработка
+    # того же пополнения упирается в уникальность и не начисляет награду второй раз
+    idempotency_key = Column(String(100), nullable=True, unique=True)
     
     created_at = Column(DateTime, default=func.now())
     
@@ -490,6 +564,51 @@ class ReferralEarning(Base):
         return self.amount_kopeks / 100
 
 
+class ReferralStats(Base):
+    """Агрегаты реферера, обновляются вместе с начислениями и сверяются фоновой задачей"""
+    __tablename__ = "referral_stats"
+    
+    referrer_id = Column(Integer, primary_key=True)
+    
+    referrals_count = Column(Integer, nullable=False, default=0)
+    first_topup_count = Column(Integer, nullable=False, default=0)
+    total_earned_kopeks = Column(Integer, nullable=False, default=0)
+    
+    last_activity_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+    
+    __table_args__ = (
+        Index("ix_referral_stats_top", "total_earned_kopeks", "referrals_count"),
+    )
+
+
+class NodeMetric(Base):
+    """
+    Временной ряд состояния нод Remnawave. resolution - ширина корзины в
+    секундах: 0 для сырых замеров, 300 и 3600 для свертки. Средние хранятся
+    вместе с числом замеров, чтобы их можно было сворачивать дальше.
+    """
+    __tablename__ = "node_metrics"
+    
+    id = Column(Integer, primary_key=True)
+    node_uuid = Column(String(64), nullable=False)
+    resolution = Column(Integer, nullable=False, default=0)
+    bucket_at = Column(DateTime, nullable=False)
+    
+    samples = Column(Integer, nullable=False, default=1)
+    online_samples = Column(Integer, nullable=False, default=0)
+    users_online_avg = Column(Float, nullable=False, default=0)
+    users_online_max = Column(Integer, nullable=False, default=0)
+    download_bps = Column(BigInteger, nullable=False, default=0)
+    upload_bps = Column(BigInteger, nullable=False, default=0)
+    traffic_used_bytes = Column(BigInteger, nullable=True)
+    
+    __table_args__ = (
+        UniqueConstraint("node_uuid", "resolution", "bucket_at", name="uq_node_metrics_bucket"),
+        Index("ix_node_metrics_resolution_bucket", "resolution", "bucket_at"),
+    )
+
+
 class Squad(Base):
     __tablename__ = "squads"
     
@@ -291,6 +291,185 @@ async def add_referral_system_columns():
         logger.error(f"Ошибка миграции реферальной системы: {e}")
         return False
 
+async def add_referral_earning_idempotency_column():
+    
+    column_exists = await check_column_exists('referral_earnings', 'idempotency_key')
+    if column_exists:
+        logger.info("Колонка idempotency_key уже существует")
+        return True
+    
+    try:
+        async with engine.begin() as conn:
+            await conn.execute(text("ALTER TABLE referral_earnings ADD COLUMN idempotency_key VARCHAR(100)"))
+            await conn.execute(text("""
+                CREATE UNIQUE INDEX uq_referral_earnings_idempotency_key
+                ON referral_earnings (idempotency_key)
+            """))
+        
+        logger.info("✅ Колонка idempotency_key добавлена в referral_earnings")
+        return True
+        
+    except Exception as e:
+        logger.error(f"Ошибка добавления колонки idempotency_key: {e}")
+        return False
+
+async def add_user_delivery_health_columns():
+    
+    columns_to_add = {
+        'is_reachable': 'BOOLEAN NOT NULL DEFAULT TRUE',
+        'delivery_failures': 'INTEGER NOT NULL DEFAULT 0',
+        'delivery_first_failed_at': 'TIMESTAMP NULL',
+        'delivery_last_failed_at': 'TIMESTAMP NULL',
+        'delivery_probed_at': 'TIMESTAMP NULL'
+    }
+    
+    try:
+        db_type = await get_database_type()
+        columns_added = 0
+        
+        async with engine.begin() as conn:
+            for column_name, column_def in columns_to_add.items():
+                if await check_column_exists('users', column_name):
+                    continue
+                
+                if db_type == 'sqlite':
+                    column_def = column_def.replace('TIMESTAMP', 'DATETIME').replace('TRUE', '1')
+                elif db_type == 'mysql':
+                    column_def = column_def.replace('TIMESTAMP', 'DATETIME')
+                
+                await conn.execute(text(f"ALTER TABLE users ADD COLUMN {column_name} {column_def}"))
+                columns_added += 1
+            
+            if columns_added:
+                await conn.execute(text(
+                    "CREATE INDEX IF NOT EXISTS ix_users_delivery_probe ON users (is_reachable, delivery_probed_at)"
+                ))
+        
+        if columns_added:
+            logger.info(f"✅ Колонки доставляемости добавлены в users: {columns_added}")
+        else:
+            logger.info("Колонки доставляемости уже существуют")
+        return True
+        
+    except Exception as e:
+        logger.error(f"Ошибка добавления колонок доставляемости: {e}")
+        return False
+
+async def add_user_wheel_cooldown_column():
+    
+    try:
+        if await check_column_exists('users', 'wheel_last_used'):
+            logger.info("Колонка wheel_last_used уже существует")
+        else:
+            db_type = await get_database_type()
+            column_type = 'TIMESTAMP' if db_type == 'postgresql' else 'DATETIME'
+            
+            async with engine.begin() as conn:
+                await conn.execute(text(f"ALTER TABLE users ADD COLUMN wheel_last_used {column_type} NULL"))
+            
+            logger.info("✅ Колонка wheel_last_used добавлена в users")
+        
+        if not await check_table_exists('fortune_wheel_spins'):
+            return True
+        
+        async with engine.begin() as conn:
+            # Раньше вращения записывались с telegram_id вместо users.id - переводим их на users.id
+            remapped = await conn.execute(text("""
+                UPDATE fortune_wheel_spins
+                SET user_id = (SELECT users.id FROM users WHERE users.telegram_id = fortune_wheel_spins.user_id)
+                WHERE user_id NOT IN (SELECT id FROM users)
+                  AND user_id IN (SELECT telegram_id FROM users)
+            """))
+            if remapped.rowcount:
+                logger.info(f"✅ Вращения колеса переведены на users.id: {remapped.rowcount}")
+            
+            # Кулдаун тех, кто крутил до появления колонки, берем из истории вращений
+            backfilled = await conn.execute(text("""
+                UPDATE users
+                SET wheel_last_used = (
+                    SELECT MAX(fortune_wheel_spins.created_at) FROM fortune_wheel_spins
+                    WHERE fortune_wheel_spins.user_id = users.id
+                )
+                WHERE wheel_last_used IS NULL
+                  AND id IN (SELECT user_id FROM fortune_wheel_spins)
+            """))
+            if backfilled.rowcount:
+                logger.info(f"✅ Кулдаун колеса восстановлен из истории вращений: {backfilled.rowcount}")
+        
+        return True
+        
+    except Exception as e:
+        logger.error(f"Ошибка добавления колонки wheel_last_used: {e}")
+        return False
+
+async def add_promocode_uses_unique_index():
+    
+    try:
+        async with engine.begin() as conn:
+            # Прежние гонки активаций могли оставить повторы; оставляем самое раннее использование
+            removed = await conn.execute(text("""
+                DELETE FROM promocode_uses
+                WHERE id NOT IN (
+                    SELECT min_id FROM (
+                        SELECT MIN(id) AS min_id FROM promocode_uses GROUP BY promocode_id, user_id
+                    ) AS first_uses
+                )
+            """))
+            if removed.rowcount:
+                logger.warning(f"⚠️ Удалено повторных использований промокодов: {removed.rowcount}")
+            
+            await conn.execute(text("""
+                CREATE UNIQUE INDEX IF NOT EXISTS uq_promocode_uses_promocode_user
+                ON promocode_uses (promocode_id, user_id)
+            """))
+        
+        logger.info("✅ Уникальный индекс использований промокодов готов")
+        return True
+        
+    except Exception as e:
+        logger.error(f"Ошибка создания уникального индекса использований промокодов: {e}")
+        return False
+
+async def add_task_completions_unique_index():
+    
+    if not await check_table_exists('task_completions'):
+        return True
+    
+    try:
+        async with engine.begin() as conn:
+            # Раньше выполнения записывались с telegram_id вместо users.id - переводим их на users.id
+            remapped = await conn.execute(text("""
+                UPDATE task_completions
+                SET user_id = (SELECT users.id FROM users WHERE users.telegram_id = task_completions.user_id)
+                WHERE user_id NOT IN (SELECT id FROM users)
+                  AND user_id IN (SELECT telegram_id FROM users)
+            """))
+            if remapped.rowcount:
+                logger.info(f"✅ Выполнения заданий переведены на users.id: {remapped.rowcount}")
+            
+            removed = await conn.execute(text("""
+                DELETE FROM task_completions
+                WHERE id NOT IN (
+                    SELECT min_id FROM (
+                        SELECT MIN(id) AS min_id FROM task_completions GROUP BY user_id, task_id
+                    ) AS first_completions
+                )
+            """))
+            if removed.rowcount:
+                logger.warning(f"⚠️ Удалено повторных выполнений заданий: {removed.rowcount}")
+            
+            await conn.execute(text("""
+                CREATE UNIQUE INDEX IF NOT EXISTS uq_task_completions_user_task
+                ON task_completions (user_id, task_id)
+            """))
+        
+        logger.info("✅ Уникальный индекс выполнений заданий готов")
+        return True
+        
+    except Exception as e:
+        logger.error(f"Ошибка создания уникального индекса выполнений заданий: {e}")
+        return False
+
 async def create_subscription_conversions_table():
     
     table_exists = await check_table_exists('subscription_conversions')
@@ -367,6 +546,41 @@ async def create_subscription_conversions_table():
         logger.error(f"Ошибка создания таблицы subscription_conversions: {e}")
         return False
 
+async def create_model_table(model) -> bool:
+    
+    table_name = model.__tablename__
+    table_exists = await check_table_exists(table_name)
+    if table_exists:
+        logger.info(f"Таблица {table_name} уже существует")
+        return True
+    
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(model.__table__.create, checkfirst=True)
+        
+        logger.info(f"✅ Таблица {table_name} успешно создана")
+        return True
+        
+    except Exception as e:
+        logger.error(f"Ошибка создания таблицы {table_name}: {e}")
+        return False
+
+async def create_payment_events_table():
+    from app.database.models import PaymentEvent
+    return await create_model_table(PaymentEvent)
+
+async def create_crypto_invoices_table():
+    from app.database.models import CryptoInvoice
+    return await create_model_table(CryptoInvoice)
+
+async def create_referral_stats_table():
+    from app.database.models import ReferralStats
+    return await create_model_table(ReferralStats)
+
+async def create_node_metrics_table():
+    from app.database.models import NodeMetric
+    return await create_model_table(NodeMetric)
+
 async def fix_subscription_duplicates_universal():
     
     async with engine.begin() as conn:
@@ -459,6 +673,21 @@ async def run_universal_migration():
         if not referral_migration_success:
             logger.warning("⚠️ Проблемы с миграцией реферальной системы")
         
+        if not await add_referral_earning_idempotency_column():
+            logger.warning("⚠️ Проблемы с ключами идемпотентности реферальных начислений")
+        
+        if not await add_user_delivery_health_columns():
+            logger.warning("⚠️ Проблемы с колонками доставляемости пользователей")
+        
+        if not await add_user_wheel_cooldown_column():
+            logger.warning("⚠️ Проблемы с колонкой кулдауна колеса фортуны")
+        
+        if not await add_promocode_uses_unique_index():
+            logger.warning("⚠️ Проблемы с уникальностью использований промокодов")
+        
+        if not await add_task_completions_unique_index():
+            logger.warning("⚠️ Проблемы с уникальностью выполнений заданий")
+        
         logger.info("=== СОЗДАНИЕ ТАБЛИЦЫ YOOKASSA ===")
         yookassa_created = await create_yookassa_payments_table()
         if yookassa_created:
@@ -473,6 +702,33 @@ async def run_universal_migration():
         else:
             logger.warning("⚠️ Проблемы с таблицей subscription_conversions")
         
+        logger.info("=== СОЗДАНИЕ ТАБЛИЦЫ ПЛАТЕЖНЫХ СОБЫТИЙ ===")
+        payment_events_created = await create_payment_events_table()
+        if payment_events_created:
+            logger.info("✅ Таблица payment_events готова")
+        else:
+            logger.warning("⚠️ Проблемы с таблицей payment_events")
+        
+        logger.info("=== СОЗДАНИЕ ТАБЛИЦЫ СЧЕТОВ CRYPTOBOT ===")
+        crypto_invoices_created = await create_crypto_invoices_table()
+        if crypto_invoices_created:
+            logger.info("✅ Таблица crypto_invoices готова")
+        else:
+            logger.warning("⚠️ Проблемы с таблицей crypto_invoices")
+        
+        logger.info("=== СОЗДАНИЕ ТАБЛИЦЫ РЕФЕРАЛЬНЫХ АГРЕГАТОВ ===")
+        referral_stats_created = await create_referral_stats_table()
+        if referral_stats_created:
+            logger.info("✅ Таблица referral_stats готова")
+        else:
+            logger.warning("⚠️ Проблемы с таблицей referral_stats")
+        
+        logger.info("=== СОЗДАНИЕ ТАБЛИЦЫ МЕТРИК НОД ===")
+        if await create_node_metrics_table():
+            logger.info("✅ Таблица node_metrics готова")
+        else:
+            logger.warning("⚠️ Проблемы с таблицей node_metrics")
+        
         async with engine.begin() as conn:
             total_subs = await conn.execute(text("SELECT COUNT(*) FROM subscriptions"))
             unique_users = await conn.execute(text("SELECT COUNT(DISTINCT user_id) FROM subscriptions"))
@@ -522,18 +778,39 @@ async def check_migration_status():
     try:
         status = {
             "has_made_first_topup_column": False,
+            "referral_earning_idempotency_column": False,
+            "user_delivery_health_columns": False,
+            "user_wheel_cooldown_column": False,
             "yookassa_table": False,
             "remnawave_v2_columns": False,
             "subscription_duplicates": False,
-            "subscription_conversions_table": False
+            "subscription_conversions_table": False,
+            "payment_events_table": False,
+            "crypto_invoices_table": False,
+            "referral_stats_table": False,
+            "node_metrics_table": False
         }
         
         status["has_made_first_topup_column"] = await check_column_exists('users', 'has_made_first_topup')
         
+        status["referral_earning_idempotency_column"] = await check_column_exists('referral_earnings', 'idempotency_key')
+        
+        status["user_delivery_health_columns"] = await check_column_exists('users', 'is_reachable')
+        
+        status["user_wheel_cooldown_column"] = await check_column_exists('users', 'wheel_last_used')
+        
         status["yookassa_table"] = await check_table_exists('yookassa_payments')
         
         status["subscription_conversions_table"] = await check_table_exists('subscription_conversions')
         
+        status["payment_events_table"] = await check_table_exists('payment_events')
+        
+        status["crypto_invoices_table"] = await check_table_exists('crypto_invoices')
+        
+        status["referral_stats_table"] = await check_table_exists('referral_stats')
+        
+        status["node_metrics_table"] = await check_table_exists('node_metrics')
+        
         remnawave_columns = ['lifetime_used_traffic_bytes', 'last_remnawave_sync', 'trojan_password', 'vless_uuid', 'ss_password']
         remnawave_status = []
         for col in remnawave_columns:
@@ -555,8 +832,15 @@ async def check_migration_status():
         
         check_names = {
             "has_made_first_topup_column": "Колонка реферальной системы",
+            "referral_earning_idempotency_column": "Ключи идемпотентности реферальных начислений",
+            "user_delivery_health_columns": "Колонки доставляемости пользователей",
+            "user_wheel_cooldown_column": "Колонка кулдауна колеса фортуны",
             "yookassa_table": "Таблица YooKassa payments",
             "subscription_conversions_table": "Таблица конверсий подписок",
+            "payment_events_table": "Таблица платежных событий",
+            "crypto_invoices_table": "Таблица счетов CryptoBot",
+            "referral_stats_table": "Таблица реферальных агрегатов",
+            "node_metrics_table": "Таблица метрик нод",
             "remnawave_v2_columns": "Колонки RemnaWave v2.1.5",
             "subscription_duplicates": "Отсутствие дубликатов подписок"
         }
@@ -1,15 +1,18 @@
 import asyncio
 import json
 import ssl
+import time
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Union, Any
 from urllib.parse import urlparse
 import aiohttp
 import logging
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from enum import Enum
 from urllib.parse import urlparse, urljoin
 
+from app.services.metrics_service import metrics_service
+
 logger = logging.getLogger(__name__)
 
 
@@ -81,6 +84,7 @@ class RemnaWaveNode:
     users_online: Optional[int]
     traffic_used_bytes: Optional[int]
     traffic_limit_bytes: Optional[int]
+    inbound_uuids: List[str] = field(default_factory=list)
 
 
 class RemnaWaveAPIError(Exception):
@@ -195,6 +199,8 @@ class RemnaWaveAPI:
             raise RemnaWaveAPIError("Session not initialized. Use async context manager.")
             
         url = f"{self.base_url}{endpoint}"
+        start_time = time.perf_counter()
+        failed = True
         
         try:
             kwargs = {
@@ -222,12 +228,16 @@ class RemnaWaveAPI:
                         response.status, 
                         response_data
                     )
-                    
+                
+                failed = False
                 return response_data
                 
         except aiohttp.ClientError as e:
             logger.error(f"Request failed: {e}")
             raise RemnaWaveAPIError(f"Request failed: {str(e)}")
+        
+        finally:
+            metrics_service.observe_panel(method, endpoint, time.perf_counter() - start_time, failed)
     
     
     async def create_user(
@@ -570,7 +580,12 @@ class RemnaWaveAPI:
             is_xray_running=node_data['isXrayRunning'],
             users_online=node_data.get('usersOnline'),
             traffic_used_bytes=node_data.get('trafficUsedBytes'),
-            traffic_limit_bytes=node_data.get('trafficLimitBytes')
+            traffic_limit_bytes=node_data.get('trafficLimitBytes'),
+            inbound_uuids=[
+                inbound['uuid']
+                for inbound in (node_data.get('configProfile') or {}).get('activeInbounds') or []
+                if inbound.get('uuid')
+            ]
         )
 
 
@@ -70,7 +70,7 @@ class TributeService:
             if isinstance(payload_or_data, str):
                 try:
                     webhook_data = json.loads(payload_or_data)
-                    logger.info(f"📊 Распарсенные данные: {webhook_data}")
+                    logger.debug(f"📊 Распарсенные данные: {webhook_data}")
                 except json.JSONDecodeError as e:
                     logger.error(f"❌ Ошибка парсинга JSON: {e}")
                     return None
@@ -131,7 +131,7 @@ class TributeService:
                 "payment_system": "tribute"
             }
             
-            logger.info(f"✅ Tribute webhook обработан успешно: {result}")
+            logger.debug(f"✅ Tribute webhook обработан успешно: {result}")
             return result
             
         except Exception as e:
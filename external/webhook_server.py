@@ -1,3 +1,4 @@
+import hmac
 import logging
 import json
 from typing import Optional
@@ -7,6 +8,11 @@ from aiogram import Bot
 
 from app.config import settings
 from app.services.tribute_service import TributeService
+from app.services.metrics_service import metrics_service
+from app.services.update_queue_service import update_queue_service
+from app.services.payment_inbox_service import (
+    payment_inbox_service, tribute_event_key, TRIBUTE_PROVIDER
+)
 
 logger = logging.getLogger(__name__)
 
@@ -26,12 +32,22 @@ class WebhookServer:
         
         self.app.router.add_post(settings.TRIBUTE_WEBHOOK_PATH, self._tribute_webhook_handler)
         self.app.router.add_get('/health', self._health_check)
+
+        if settings.TELEGRAM_WEBHOOK_ENABLED:
+            self.app.router.add_post(settings.TELEGRAM_WEBHOOK_PATH, self._telegram_webhook_handler)
+        
+        if settings.METRICS_ENABLED:
+            self.app.router.add_get('/metrics', self._metrics_handler)
         
         self.app.router.add_options(settings.TRIBUTE_WEBHOOK_PATH, self._options_handler)
         
-        logger.info(f"Webhook сервер настроен:")
+        logger.info("Webhook сервер настроен:")
         logger.info(f"  - Tribute webhook: POST {settings.TRIBUTE_WEBHOOK_PATH}")
-        logger.info(f"  - Health check: GET /health")
+        logger.info("  - Health check: GET /health")
+        if settings.TELEGRAM_WEBHOOK_ENABLED:
+            logger.info(f"  - Telegram updates: POST {settings.TELEGRAM_WEBHOOK_PATH}")
+        if settings.METRICS_ENABLED:
+            logger.info("  - Metrics: GET /metrics")
         
         return self.app
     
@@ -86,8 +102,8 @@ class WebhookServer:
     async def _tribute_webhook_handler(self, request: web.Request) -> web.Response:
         
         try:
-            logger.info(f"📥 Получен Tribute webhook: {request.method} {request.path}")
-            logger.info(f"📋 Headers: {dict(request.headers)}")
+            logger.debug(f"📥 Получен Tribute webhook: {request.method} {request.path}")
+            logger.debug(f"📋 Headers: {dict(request.headers)}")
             
             raw_body = await request.read()
             
@@ -99,11 +115,10 @@ class WebhookServer:
                 )
             
             payload = raw_body.decode('utf-8')
-            logger.info(f"📄 Payload: {payload}")
+            logger.debug(f"📄 Payload: {payload}")
             
             try:
                 webhook_data = json.loads(payload)
-                logger.info(f"📊 Распарсенные данные: {webhook_data}")
             except json.JSONDecodeError as e:
                 logger.error(f"❌ Ошибка парсинга JSON: {e}")
                 return web.json_response(
@@ -112,7 +127,6 @@ class WebhookServer:
                 )
             
             signature = request.headers.get('trbt-signature')
-            logger.info(f"🔐 Signature: {signature}")
 
             if not signature:
                 logger.error("❌ Отсутствует заголовок подписи Tribute webhook")
@@ -131,17 +145,17 @@ class WebhookServer:
                         status=401
                     )
 
-            result = await self.tribute_service.process_webhook(payload)
+            event_id, object_id = tribute_event_key(webhook_data, payload)
+            stored = await payment_inbox_service.enqueue(
+                TRIBUTE_PROVIDER, event_id, payload,
+                event_type=webhook_data.get("name") or webhook_data.get("status"),
+                object_id=object_id
+            )
             
-            if result:
-                logger.info(f"✅ Tribute webhook обработан успешно: {result}")
-                return web.json_response({"status": "ok", "result": result}, status=200)
-            else:
-                logger.error("❌ Ошибка обработки Tribute webhook")
-                return web.json_response(
-                    {"status": "error", "reason": "processing_failed"},
-                    status=400
-                )
+            return web.json_response(
+                {"status": "ok", "result": "queued" if stored else "duplicate"},
+                status=200
+            )
             
         except Exception as e:
             logger.error(f"❌ Критическая ошибка обработки Tribute webhook: {e}", exc_info=True)
@@ -150,12 +164,48 @@ class WebhookServer:
                 status=500
             )
     
+    async def _telegram_webhook_handler(self, request: web.Request) -> web.Response:
+
+        token = request.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+        if not hmac.compare_digest(token, settings.get_telegram_webhook_secret()):
+            logger.warning("⚠️ Апдейт Telegram с неверным секретом отклонен")
+            return web.Response(status=401)
+
+        try:
+            update_data = await request.json()
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            return web.json_response({"status": "error", "reason": "invalid_json"}, status=400)
+
+        if not isinstance(update_data, dict):
+            return web.json_response({"status": "error", "reason": "invalid_update"}, status=400)
+
+        if not update_queue_service.submit(update_data):
+            return web.json_response({"status": "error", "reason": "overloaded"}, status=503)
+
+        return web.json_response({"status": "ok"})
+
+    async def _metrics_handler(self, request: web.Request) -> web.Response:
+        
+        if settings.METRICS_TOKEN:
+            auth_header = request.headers.get('Authorization', '')
+            if auth_header != f"Bearer {settings.METRICS_TOKEN}":
+                return web.Response(status=401)
+        
+        return web.Response(
+            text=metrics_service.render_prometheus(),
+            content_type='text/plain',
+            charset='utf-8',
+            headers={'Cache-Control': 'no-cache'}
+        )
+    
     async def _health_check(self, request: web.Request) -> web.Response:
         
         return web.json_response({
             "status": "ok",
             "service": "tribute-webhooks",
             "tribute_enabled": settings.TRIBUTE_ENABLED,
+            "payment_inbox_running": payment_inbox_service.is_running,
+            "update_queue": update_queue_service.get_stats() if settings.TELEGRAM_WEBHOOK_ENABLED else None,
             "port": settings.TRIBUTE_WEBHOOK_PORT,
             "path": settings.TRIBUTE_WEBHOOK_PATH
         })
@@ -0,0 +1,157 @@
+import asyncio
+import json
+import logging
+import random
+import time
+import uuid
+from typing import Dict, Optional, Any
+
+import aiohttp
+
+from app.config import settings
+from app.services.metrics_service import metrics_service
+
+logger = logging.getLogger(__name__)
+
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class YooKassaAPIError(Exception):
+    def __init__(self, message: str, status_code: int = None, response_data: dict = None):
+        self.message = message
+        self.status_code = status_code
+        self.response_data = response_data
+        super().__init__(self.message)
+
+
+class YooKassaAPI:
+    """Асинхронный клиент YooKassa API v3 на общем пуле соединений aiohttp"""
+
+    def __init__(
+        self,
+        shop_id: Optional[str] = None,
+        secret_key: Optional[str] = None,
+        base_url: Optional[str] = None
+    ):
+        self.shop_id = shop_id or settings.YOOKASSA_SHOP_ID
+        self.secret_key = secret_key or settings.YOOKASSA_SECRET_KEY
+        self.base_url = (base_url or settings.YOOKASSA_API_URL).rstrip('/')
+        self.session: Optional[aiohttp.ClientSession] = None
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.shop_id and self.secret_key)
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                auth=aiohttp.BasicAuth(str(self.shop_id), str(self.secret_key)),
+                timeout=aiohttp.ClientTimeout(total=settings.YOOKASSA_REQUEST_TIMEOUT),
+                connector=aiohttp.TCPConnector(limit=settings.YOOKASSA_POOL_SIZE, keepalive_timeout=60),
+                headers={'Accept': 'application/json'}
+            )
+        return self.session
+
+    async def close(self):
+        if self.session and not self.session.closed:
+            await self.session.close()
+        self.session = None
+
+    @staticmethod
+    def _backoff(attempt: int, retry_after: Optional[float] = None) -> float:
+        if retry_after is not None:
+            return retry_after
+        return min(0.5 * 2 ** attempt, 8.0) * random.uniform(0.8, 1.2)
+
+    async def _make_request(
+        self,
+        method: str,
+        endpoint: str,
+        data: Optional[Dict] = None,
+        params: Optional[Dict] = None,
+        idempotence_key: Optional[str] = None
+    ) -> Dict:
+        if not self.configured:
+            raise YooKassaAPIError("YooKassa SHOP_ID/SECRET_KEY не настроены")
+
+        headers = {}
+        if method == 'POST':
+            # Один ключ на все повторы: YooKassa вернет результат первой попытки,
+            # а не создаст второй платеж
+            headers['Idempotence-Key'] = idempotence_key or str(uuid.uuid4())
+
+        url = f"{self.base_url}{endpoint}"
+        last_error: Optional[YooKassaAPIError] = None
+
+        for attempt in range(settings.YOOKASSA_MAX_RETRIES + 1):
+            start_time = time.perf_counter()
+            failed = True
+            retry_after = None
+
+            try:
+                async with self._get_session().request(
+                    method, url, json=data, params=params, headers=headers
+                ) as response:
+                    response_text = await response.text()
+
+                    try:
+                        response_data = json.loads(response_text) if response_text else {}
+                    except json.JSONDecodeError:
+                        response_data = {'raw_response': response_text}
+
+                    if response.status == 202:
+                        # Запрос с этим ключом еще обрабатывается, YooKassa подсказывает паузу
+                        retry_after = response_data.get('retry_after', 1000) / 1000
+                        last_error = YooKassaAPIError("Запрос еще обрабатывается", 202, response_data)
+                    elif response.status in RETRY_STATUSES:
+                        last_error = YooKassaAPIError(
+                            response_data.get('description', f'HTTP {response.status}'),
+                            response.status, response_data
+                        )
+                    elif response.status >= 400:
+                        error_message = response_data.get('description', f'HTTP {response.status}')
+                        logger.error(f"YooKassa API Error {response.status}: {error_message}")
+                        raise YooKassaAPIError(error_message, response.status, response_data)
+                    else:
+                        failed = False
+                        return response_data
+
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                last_error = YooKassaAPIError(f"Request failed: {e!r}")
+
+            finally:
+                metrics_service.observe_external("yookassa", method, endpoint, time.perf_counter() - start_time, failed)
+
+            if attempt < settings.YOOKASSA_MAX_RETRIES:
+                delay = self._backoff(attempt, retry_after)
+                logger.warning(
+                    f"⚠️ YooKassa {method} {endpoint}: {last_error.message}, "
+                    f"повтор {attempt + 1}/{settings.YOOKASSA_MAX_RETRIES} через {delay:.1f}с"
+                )
+                await asyncio.sleep(delay)
+
+        raise last_error
+
+    async def create_payment(self, payload: Dict[str, Any], idempotence_key: Optional[str] = None) -> Dict:
+        return await self._make_request('POST', '/payments', data=payload, idempotence_key=idempotence_key)
+
+    async def get_payment(self, payment_id: str) -> Dict:
+        return await self._make_request('GET', f'/payments/{payment_id}')
+
+    async def list_payments(self, params: Optional[Dict[str, Any]] = None) -> Dict:
+        return await self._make_request('GET', '/payments', params=params)
+
+    async def capture_payment(
+        self,
+        payment_id: str,
+        amount: Optional[Dict[str, str]] = None,
+        idempotence_key: Optional[str] = None
+    ) -> Dict:
+        data = {'amount': amount} if amount else {}
+        return await self._make_request(
+            'POST', f'/payments/{payment_id}/capture', data=data, idempotence_key=idempotence_key
+        )
+
+
+yookassa_api = YooKassaAPI()
@@ -10,7 +10,9 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.config import settings
 from app.services.payment_service import PaymentService
-from app.database.database import get_db
+from app.services.payment_inbox_service import (
+    payment_inbox_service, yookassa_event_key, YOOKASSA_PROVIDER
+)
 
 logger = logging.getLogger(__name__)
 
@@ -35,7 +37,7 @@ class YooKassaWebhookHandler:
                 logger.error(f"Неподдерживаемая версия подписи: {version}")
                 return False
             
-            logger.info(f"Проверка подписи v1 для платежа {payment_id}, timestamp: {timestamp}")
+            logger.debug(f"Проверка подписи v1 для платежа {payment_id}, timestamp: {timestamp}")
             
             
             expected_signature_1 = hmac.new(
@@ -73,7 +75,7 @@ class YooKassaWebhookHandler:
             )
             
             if is_valid:
-                logger.info("✅ Подпись YooKassa webhook проверена успешно")
+                logger.debug("✅ Подпись YooKassa webhook проверена успешно")
             else:
                 logger.warning("⚠️ Подпись YooKassa webhook не совпадает ни с одним вариантом")
             
@@ -89,8 +91,8 @@ class YooKassaWebhookHandler:
     async def handle_webhook(self, request: web.Request) -> web.Response:
         
         try:
-            logger.info(f"📥 Получен YooKassa webhook: {request.method} {request.path}")
-            logger.info(f"📋 Headers: {dict(request.headers)}")
+            logger.debug(f"📥 Получен YooKassa webhook: {request.method} {request.path}")
+            logger.debug(f"📋 Headers: {dict(request.headers)}")
             
             body = await request.text()
             
@@ -98,26 +100,21 @@ class YooKassaWebhookHandler:
                 logger.warning("⚠️ Получен пустой webhook от YooKassa")
                 return web.Response(status=400, text="Empty body")
             
-            logger.info(f"📄 Body: {body}")
+            logger.debug(f"📄 Body: {body}")
             
             signature = request.headers.get('Signature') or request.headers.get('X-YooKassa-Signature')
             
-            if settings.YOOKASSA_WEBHOOK_SECRET and signature:
-                logger.info(f"🔐 Получена подпись: {signature}")
+            if settings.YOOKASSA_WEBHOOK_SECRET:
+                if not signature:
+                    logger.error("❌ Отсутствует подпись YooKassa webhook")
+                    return web.Response(status=401, text="Missing signature")
                 
                 if not YooKassaWebhookHandler.verify_webhook_signature(body, signature, settings.YOOKASSA_WEBHOOK_SECRET):
-                    logger.warning("❌ Подпись не совпала, но продолжаем обработку (режим отладки)")
-                else:
-                    logger.info("✅ Подпись webhook проверена успешно")
-                    
-            elif settings.YOOKASSA_WEBHOOK_SECRET and not signature:
-                logger.warning("⚠️ Webhook без подписи, но секрет настроен")
+                    logger.error("❌ Неверная подпись YooKassa webhook")
+                    return web.Response(status=401, text="Invalid signature")
                 
-            elif signature and not settings.YOOKASSA_WEBHOOK_SECRET:
-                logger.info("ℹ️ Подпись получена, но проверка отключена (YOOKASSA_WEBHOOK_SECRET не настроен)")
-                
-            else:
-                logger.info("ℹ️ Проверка подписи отключена")
+            elif signature:
+                logger.debug("ℹ️ Подпись получена, но проверка отключена (YOOKASSA_WEBHOOK_SECRET не настроен)")
             
             try:
                 webhook_data = json.loads(body)
@@ -125,9 +122,6 @@ class YooKassaWebhookHandler:
                 logger.error(f"❌ Ошибка парсинга JSON webhook YooKassa: {e}")
                 return web.Response(status=400, text="Invalid JSON")
             
-            logger.info(f"📊 Обработка webhook YooKassa: {webhook_data.get('event', 'unknown_event')}")
-            logger.debug(f"🔍 Полные данные webhook: {webhook_data}")
-            
             event_type = webhook_data.get("event")
             if not event_type:
                 logger.warning("⚠️ Webhook YooKassa без типа события")
@@ -137,19 +131,18 @@ class YooKassaWebhookHandler:
                 logger.info(f"ℹ️ Игнорируем событие YooKassa: {event_type}")
                 return web.Response(status=200, text="OK")
             
-            async for db in get_db():
-                try:
-                    success = await self.payment_service.process_yookassa_webhook(db, webhook_data)
-                    
-                    if success:
-                        logger.info(f"✅ Успешно обработан webhook YooKassa: {event_type}")
-                        return web.Response(status=200, text="OK")
-                    else:
-                        logger.error(f"❌ Ошибка обработки webhook YooKassa: {event_type}")
-                        return web.Response(status=500, text="Processing error")
-                        
-                finally:
-                    await db.close()
+            event_id, payment_id = yookassa_event_key(webhook_data)
+            if not payment_id:
+                logger.error("❌ Webhook YooKassa без ID платежа")
+                return web.Response(status=400, text="No payment id")
+            
+            # Обработка идет в воркерах очереди: отвечаем сразу после записи
+            # события, чтобы медленные БД/Telegram не вызывали ретраи YooKassa
+            await payment_inbox_service.enqueue(
+                YOOKASSA_PROVIDER, event_id, body,
+                event_type=event_type, object_id=payment_id
+            )
+            return web.Response(status=200, text="OK")
         
         except Exception as e:
             logger.error(f"❌ Критическая ошибка обработки webhook YooKassa: {e}", exc_info=True)
@@ -1,6 +1,18 @@
-from . import (
-    main, users, subscriptions, promocodes, messages,
-    monitoring, referrals, rules, remnawave,
-    statistics, user_messages, version, servers,
-    maintenance, admin_create_task
-)
\ No newline at end of file
+import importlib
+
+# Порядок важен: фильтры обработчиков проверяются в порядке регистрации
+MODULES = (
+    "main", "users", "subscriptions", "servers", "promocodes", "messages",
+    "monitoring", "performance", "payment_inbox", "referrals", "rules",
+    "remnawave", "statistics", "maintenance", "user_messages", "version"
+)
+
+
+def module_names():
+    return [f"{__name__}.{name}" for name in MODULES]
+
+
+def register_handlers(dp):
+    """Регистрация обработчиков админки (без admin_create_task - он регистрируется отдельно)"""
+    for name in module_names():
+        importlib.import_module(name).register_handlers(dp)
@@ -9,6 +9,7 @@ from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.types import InlineKeyboardButton
 from app.database.crud.tasks import get_active_tasks, get_task_by_id, create_task, delete_task, delete_task_by_id
 from app.database.session import AsyncSessionLocal
+from app.services.tasks_service import TasksService
 from app.keyboards.admin import get_admin_main_keyboard
 from app.localization.texts import get_texts
 from html import escape
@@ -160,6 +161,7 @@ async def process_task_reward(message: types.Message, state: FSMContext, db: Asy
             channels=channels_data,
             reward_kopeks=task_data['reward_kopeks']
         )
+        await TasksService.invalidate_cache()
 
         await message.answer(
             f"✅ <b>Задание создано!</b>\n\n"
@@ -184,6 +186,7 @@ async def delete_task_callback(callback: types.CallbackQuery, db: AsyncSession):
         success = await delete_task_by_id(db, task_id)  # Вызываем новую функцию
 
         if success:
+            await TasksService.invalidate_cache()
             await callback.message.edit_text("Задание успешно удалено.")
         else:
             await callback.message.edit_text("Ошибка при удалении задания. Возможно, оно уже удалено.")
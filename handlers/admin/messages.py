@@ -3,6 +3,7 @@ import asyncio
 from datetime import datetime, timedelta
 from typing import Optional
 from aiogram import Dispatcher, types, F
+from aiogram.exceptions import TelegramForbiddenError
 from aiogram.fsm.context import FSMContext
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func, and_, or_
@@ -18,6 +19,7 @@ from app.keyboards.admin import (
 from app.localization.texts import get_texts
 from app.database.crud.user import get_users_list
 from app.database.crud.subscription import get_expiring_subscriptions
+from app.services.delivery_health_service import delivery_health_service
 from app.utils.decorators import admin_required, error_handler
 
 logger = logging.getLogger(__name__)
@@ -337,6 +339,8 @@ async def confirm_broadcast(
     sent_count = 0
     failed_count = 0
     
+    blocked_count = 0
+    
     for user in users:
         try:
             await callback.bot.send_message(
@@ -346,13 +350,24 @@ async def confirm_broadcast(
             )
             sent_count += 1
             
+            if user.delivery_failures:
+                await delivery_health_service.record_success(user.telegram_id)
+            
             if sent_count % 20 == 0:
                 await asyncio.sleep(1)
+        
+        except TelegramForbiddenError:
+            failed_count += 1
+            blocked_count += 1
+            await delivery_health_service.record_failure(user.telegram_id)
                 
         except Exception as e:
             failed_count += 1
             logger.error(f"Ошибка отправки рассылки пользователю {user.telegram_id}: {e}")
     
+    if blocked_count:
+        logger.info(f"🚫 Рассылка: {blocked_count} пользователей заблокировали бота")
+    
     broadcast_history.sent_count = sent_count
     broadcast_history.failed_count = failed_count
     broadcast_history.status = "completed" if failed_count == 0 else "partial"
@@ -365,6 +380,7 @@ async def confirm_broadcast(
 📊 <b>Результат:</b>
 - Отправлено: {sent_count}
 - Не доставлено: {failed_count}
+- Заблокировали бота: {blocked_count}
 - Всего пользователей: {len(users)}
 - Успешность: {round(sent_count / len(users) * 100, 1) if users else 0}%
 
@@ -390,18 +406,18 @@ async def get_target_users_count(db: AsyncSession, target: str) -> int:
 
 async def get_target_users(db: AsyncSession, target: str) -> list:
    if target == "all":
-       return await get_users_list(db, offset=0, limit=10000, status=UserStatus.ACTIVE)
+       return await get_users_list(db, offset=0, limit=10000, status=UserStatus.ACTIVE, reachable_only=True)
    elif target == "active":
-       users = await get_users_list(db, offset=0, limit=10000, status=UserStatus.ACTIVE)
+       users = await get_users_list(db, offset=0, limit=10000, status=UserStatus.ACTIVE, reachable_only=True)
        return [user for user in users if user.subscription and user.subscription.is_active and not user.subscription.is_trial]
    elif target == "trial":
-       users = await get_users_list(db, offset=0, limit=10000, status=UserStatus.ACTIVE)
+       users = await get_users_list(db, offset=0, limit=10000, status=UserStatus.ACTIVE, reachable_only=True)
        return [user for user in users if user.subscription and user.subscription.is_trial]
    elif target == "no":
-       users = await get_users_list(db, offset=0, limit=10000, status=UserStatus.ACTIVE)
+       users = await get_users_list(db, offset=0, limit=10000, status=UserStatus.ACTIVE, reachable_only=True)
        return [user for user in users if not user.subscription or not user.subscription.is_active]
    elif target == "expiring":
-       expiring_subs = await get_expiring_subscriptions(db, 3)
+       expiring_subs = await get_expiring_subscriptions(db, 3, reachable_only=True)
        return [sub.user for sub in expiring_subs if sub.user]
    else:
        return []
@@ -457,7 +473,7 @@ async def get_custom_users(db: AsyncSession, criteria: str) -> list:
     else:
         return []
     
-    result = await db.execute(stmt)
+    result = await db.execute(stmt.where(User.is_reachable.is_(True)))
     return result.scalars().all()
 
 
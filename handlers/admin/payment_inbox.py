@@ -0,0 +1,130 @@
+import html
+import logging
+from aiogram import Router, F
+from aiogram.types import CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
+
+from app.database.database import AsyncSessionLocal
+from app.database.crud.payment_event import (
+    get_payment_event_stats, get_dead_payment_events,
+    requeue_payment_event, requeue_dead_payment_events
+)
+from app.services.payment_inbox_service import payment_inbox_service
+from app.services.payment_reconciliation_service import payment_reconciliation_service
+from app.utils.decorators import admin_required
+
+logger = logging.getLogger(__name__)
+router = Router()
+
+
+def get_payment_inbox_keyboard(dead_events) -> InlineKeyboardMarkup:
+    rows = [
+        [InlineKeyboardButton(
+            text=f"🔁 #{event.id} {event.provider}",
+            callback_data=f"admin_payment_inbox_retry_{event.id}"
+        )]
+        for event in dead_events
+    ]
+
+    if dead_events:
+        rows.append([
+            InlineKeyboardButton(text="🔁 Повторить все", callback_data="admin_payment_inbox_retry_all")
+        ])
+
+    rows.append([InlineKeyboardButton(text="🔄 Обновить", callback_data="admin_payment_inbox")])
+    rows.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="admin_monitoring")])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
+async def _render_payment_inbox(callback: CallbackQuery):
+    async with AsyncSessionLocal() as db:
+        stats = await get_payment_event_stats(db)
+        dead_events = await get_dead_payment_events(db, limit=8)
+
+    runtime_lines = [
+        f"• {provider}: принято {counters['received']}, дублей {counters['duplicates']}, "
+        f"обработано {counters['processed']}, повторов {counters['retried']}"
+        for provider, counters in sorted(payment_inbox_service.get_stats().items())
+    ]
+    dead_lines = [
+        f"• #{event.id} <code>{html.escape(event.provider)}:{html.escape(event.event_type or '—')}</code> "
+        f"({event.attempts} попыток): {html.escape((event.last_error or '')[:120])}"
+        for event in dead_events
+    ]
+    reconciliation = payment_reconciliation_service.get_stats()
+    last_run = reconciliation["last_run"].strftime('%H:%M:%S') if reconciliation["last_run"] else "—"
+    api_calls = ", ".join(f"{name} {count}" for name, count in reconciliation["api_calls"].items()) or "—"
+    credited = ", ".join(f"{name} {count}" for name, count in reconciliation["credited"].items()) or "—"
+
+    text = f"""
+📥 <b>Очередь платежных событий</b>
+
+⚙️ <b>Воркеры:</b> {'🟢 работают' if payment_inbox_service.is_running else '🔴 остановлены'}
+
+📊 <b>События в БД:</b>
+• В очереди: {stats['pending']}
+• В обработке: {stats['processing']}
+• Обработано: {stats['processed']}
+• Dead-letter: {stats['dead']}
+
+🕐 <b>С момента запуска:</b>
+{chr(10).join(runtime_lines) or '—'}
+
+🔎 <b>Сверка с провайдерами:</b> {'🟢' if reconciliation['running'] else '🔴'} (последняя {last_run})
+• Запросов к API: {api_calls}
+• Найдено сверкой: {credited}
+
+☠️ <b>Dead-letter:</b>
+{chr(10).join(dead_lines) or '—'}
+"""
+
+    await callback.message.edit_text(
+        text[:4000],
+        parse_mode="HTML",
+        reply_markup=get_payment_inbox_keyboard(dead_events)
+    )
+
+
+@router.callback_query(F.data == "admin_payment_inbox")
+@admin_required
+async def show_payment_inbox(callback: CallbackQuery):
+    try:
+        await _render_payment_inbox(callback)
+        await callback.answer()
+    except Exception as e:
+        logger.error(f"Ошибка отображения очереди платежных событий: {e}")
+        await callback.answer("❌ Ошибка получения данных", show_alert=True)
+
+
+@router.callback_query(F.data == "admin_payment_inbox_retry_all")
+@admin_required
+async def retry_all_dead_events(callback: CallbackQuery):
+    async with AsyncSessionLocal() as db:
+        count = await requeue_dead_payment_events(db)
+
+    payment_inbox_service.wake()
+    logger.info(f"Админ {callback.from_user.id} вернул в очередь {count} платежных событий")
+    await _render_payment_inbox(callback)
+    await callback.answer(f"✅ Возвращено в очередь: {count}")
+
+
+@router.callback_query(F.data.startswith("admin_payment_inbox_retry_"))
+@admin_required
+async def retry_dead_event(callback: CallbackQuery):
+    event_id = int(callback.data.split("_")[-1])
+
+    async with AsyncSessionLocal() as db:
+        requeued = await requeue_payment_event(db, event_id)
+
+    await _render_payment_inbox(callback)
+
+    if requeued:
+        payment_inbox_service.wake()
+        logger.info(f"Админ {callback.from_user.id} вернул в очередь платежное событие #{event_id}")
+        await callback.answer(f"✅ Событие #{event_id} возвращено в очередь")
+    else:
+        await callback.answer("Событие уже не в dead-letter", show_alert=True)
+
+
+def register_handlers(dp):
+    """Регистрация обработчиков очереди платежных событий"""
+    dp.include_router(router)
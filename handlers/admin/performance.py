@@ -0,0 +1,159 @@
+import html
+import logging
+from datetime import datetime
+from typing import Optional
+from aiogram import Router, F
+from aiogram.types import CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
+
+from app.config import settings
+from app.services.metrics_service import metrics_service
+from app.utils.decorators import admin_required
+from app.utils.rate_limiter import rate_limiter
+
+logger = logging.getLogger(__name__)
+router = Router()
+
+# Строк на экране не больше 8 + 5 + 5 + 5, так что с такими именами текст
+# гарантированно укладывается в лимит сообщения Telegram
+NAME_MAX_LENGTH = 80
+
+
+def _ms(seconds: float) -> str:
+    return f"{seconds * 1000:.0f}мс"
+
+
+def get_performance_keyboard() -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [
+            InlineKeyboardButton(text="🔄 Обновить", callback_data="admin_perf"),
+            InlineKeyboardButton(text="🐢 Профили", callback_data="admin_perf_profiles")
+        ],
+        [
+            InlineKeyboardButton(text="🗑️ Сбросить", callback_data="admin_perf_reset")
+        ],
+        [
+            InlineKeyboardButton(text="⬅️ Назад", callback_data="admin_monitoring")
+        ]
+    ])
+
+
+def _name(value: str) -> str:
+    # Обрезаем до экранирования, иначе срез может разорвать тег или сущность
+    if len(value) > NAME_MAX_LENGTH:
+        value = value[:NAME_MAX_LENGTH - 1] + "…"
+    return html.escape(value)
+
+
+def _render_performance() -> str:
+    uptime = datetime.utcnow() - metrics_service.started_at
+
+    handler_lines = [
+        f"• <code>{_name(row['handler'])}</code>: {row['count']} шт, "
+        f"avg {_ms(row['avg'])}, p95 {_ms(row['p95'])}, "
+        f"БД {row['db_queries_avg']:.1f} запр/{_ms(row['db_time_avg'])}"
+        + (f", ❌ {row['errors']}" if row['errors'] else "")
+        for row in metrics_service.get_top_handlers(8)
+    ]
+    panel_lines = [
+        f"• <code>{_name(row['endpoint'])}</code>: {row['count']} шт, "
+        f"avg {_ms(row['avg'])}, p95 {_ms(row['p95'])}"
+        + (f", ❌ {row['errors']}" if row['errors'] else "")
+        for row in metrics_service.get_panel_summary(5)
+    ]
+    external_lines = [
+        f"• <code>{_name(row['endpoint'])}</code>: {row['count']} шт, "
+        f"avg {_ms(row['avg'])}, p95 {_ms(row['p95'])}"
+        + (f", ❌ {row['errors']}" if row['errors'] else "")
+        for row in metrics_service.get_external_summary(5)
+    ]
+    telegram_lines = [
+        f"• {_name(row['method'])}: {row['count']} шт, avg {_ms(row['avg'])}, p95 {_ms(row['p95'])}"
+        for row in metrics_service.get_telegram_summary(5)
+    ]
+    throttled = sum(counters["throttled"] for counters in rate_limiter.get_stats().values())
+
+    return f"""
+⚡ <b>Производительность</b>
+
+🕐 <b>Сбор с:</b> {metrics_service.started_at.strftime('%d.%m %H:%M')} ({int(uptime.total_seconds() // 60)} мин)
+🗄️ <b>Запросов к БД:</b> {metrics_service.db_queries_total} ({metrics_service.db_time_total:.1f}s)
+🚫 <b>Отсечено троттлингом:</b> {throttled}
+
+🔥 <b>Обработчики (по суммарному времени):</b>
+{chr(10).join(handler_lines) or '—'}
+
+🌐 <b>Панель Remnawave:</b>
+{chr(10).join(panel_lines) or '—'}
+
+💳 <b>Платежные провайдеры:</b>
+{chr(10).join(external_lines) or '—'}
+
+✈️ <b>Telegram API:</b>
+{chr(10).join(telegram_lines) or '—'}
+"""
+
+
+async def _edit_performance(callback: CallbackQuery, notice: Optional[str] = None):
+    """Перерисовывает экран метрик и отвечает на колбэк ровно один раз"""
+    try:
+        await callback.message.edit_text(
+            _render_performance(),
+            parse_mode="HTML",
+            reply_markup=get_performance_keyboard()
+        )
+    except Exception as e:
+        if "message is not modified" not in str(e):
+            logger.error(f"Ошибка отображения метрик производительности: {e}")
+            await callback.answer("❌ Ошибка получения данных", show_alert=True)
+            return
+
+    await callback.answer(notice)
+
+
+@router.callback_query(F.data == "admin_perf")
+@admin_required
+async def show_performance(callback: CallbackQuery):
+    await _edit_performance(callback)
+
+
+@router.callback_query(F.data == "admin_perf_profiles")
+@admin_required
+async def show_slowest_profiles(callback: CallbackQuery):
+    profiles = metrics_service.get_slowest_profiles()
+
+    if not profiles:
+        status = (
+            f"включено ({settings.PROFILING_SAMPLE_RATE:.1%} событий)"
+            if settings.PROFILING_SAMPLE_RATE > 0 else "выключено (PROFILING_SAMPLE_RATE=0)"
+        )
+        await callback.answer(f"Профилей пока нет. Профилирование {status}", show_alert=True)
+        return
+
+    slowest = profiles[0]
+    summary = "\n".join(
+        f"• {_ms(sample.duration)} — <code>{html.escape(sample.handler)}</code> "
+        f"({sample.captured_at.strftime('%H:%M:%S')})"
+        for sample in profiles
+    )
+    report = html.escape(slowest.report[:2500])
+
+    await callback.message.edit_text(
+        f"🐢 <b>Самые медленные события</b>\n\n{summary}\n\n<pre>{report}</pre>",
+        parse_mode="HTML",
+        reply_markup=InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text="⬅️ Назад", callback_data="admin_perf")]
+        ])
+    )
+    await callback.answer()
+
+
+@router.callback_query(F.data == "admin_perf_reset")
+@admin_required
+async def reset_performance(callback: CallbackQuery):
+    metrics_service.reset()
+    await _edit_performance(callback, "✅ Метрики сброшены")
+
+
+def register_handlers(dp):
+    """Регистрация обработчиков метрик производительности"""
+    dp.include_router(router)
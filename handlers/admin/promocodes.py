@@ -18,6 +18,7 @@ from app.database.crud.promocode import (
     delete_promocode
 )
 from app.utils.decorators import admin_required, error_handler
+from app.utils.cache import PromoCodeCache
 from app.utils.formatters import format_datetime
 
 logger = logging.getLogger(__name__)
@@ -667,6 +668,7 @@ async def handle_edit_uses(
             return
         
         await update_promocode(db, promo, max_uses=max_uses)
+        await PromoCodeCache.invalidate(promo.code)
         
         uses_text = "безлимитное" if max_uses == 999999 else str(max_uses)
         await message.answer(
@@ -729,6 +731,7 @@ async def process_promocode_expiry(
             valid_until=valid_until,
             created_by=db_user.id
         )
+        await PromoCodeCache.invalidate(promocode.code)
         
         type_names = {
             "balance": "Пополнение баланса", 
@@ -794,6 +797,7 @@ async def handle_edit_expiry(
             valid_until = datetime.utcnow() + timedelta(days=expiry_days)
         
         await update_promocode(db, promo, valid_until=valid_until)
+        await PromoCodeCache.invalidate(promo.code)
         
         if valid_until:
             expiry_text = f"до {format_datetime(valid_until)}"
@@ -830,6 +834,7 @@ async def toggle_promocode_status(
     
     new_status = not promo.is_active
     await update_promocode(db, promo, is_active=new_status)
+    await PromoCodeCache.invalidate(promo.code)
     
     status_text = "активирован" if new_status else "деактивирован"
     await callback.answer(f"✅ Промокод {status_text}", show_alert=True)
@@ -905,6 +910,7 @@ async def delete_promocode_confirmed(
     
     code = promo.code
     success = await delete_promocode(db, promo)
+    await PromoCodeCache.invalidate(code)
     
     if success:
         await callback.answer(f"✅ Промокод {code} удален", show_alert=True)
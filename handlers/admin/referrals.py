@@ -7,6 +7,7 @@ from app.config import settings
 from app.database.models import User
 from app.localization.texts import get_texts
 from app.database.crud.referral import get_referral_statistics, get_user_referral_stats
+from app.database.crud.referral_stats import get_top_referrers
 from app.database.crud.user import get_user_by_id
 from app.utils.decorators import admin_required, error_handler
 
@@ -131,8 +132,7 @@ async def show_top_referrers(
     db: AsyncSession
 ):
     try:
-        stats = await get_referral_statistics(db)
-        top_referrers = stats.get('top_referrers', [])
+        top_referrers = await get_top_referrers(db, limit=20)
         
         text = "🏆 <b>Топ рефереров</b>\n\n"
         
@@ -13,8 +13,10 @@ from app.keyboards.admin import (
 )
 from app.localization.texts import get_texts
 from app.services.remnawave_service import RemnaWaveService
+from app.services.panel_metrics_service import panel_metrics_service
+from app.services.node_metrics_service import node_metrics_service
 from app.utils.decorators import admin_required, error_handler
-from app.utils.formatters import format_bytes, format_datetime
+from app.utils.formatters import format_bytes, format_datetime, format_sparkline
 
 logger = logging.getLogger(__name__)
 
@@ -58,8 +60,7 @@ async def show_system_stats(
 ):
    from datetime import datetime, timedelta
    
-   remnawave_service = RemnaWaveService()
-   stats = await remnawave_service.get_system_statistics()
+   stats = await panel_metrics_service.get_system_statistics()
    
    if "error" in stats:
        await callback.message.edit_text(
@@ -169,6 +170,9 @@ async def show_system_stats(
 🕒 <b>Обновлено:</b> {format_datetime(stats.get('last_updated', datetime.now()))}
 """
    
+   if stats.get('stale_sources'):
+       text += "⚠️ Часть данных из прошлого снимка: панель не ответила вовремя\n"
+   
    keyboard = [
        [types.InlineKeyboardButton(text="🔄 Обновить", callback_data="admin_rw_system")],
        [types.InlineKeyboardButton(text="📈 Ноды", callback_data="admin_rw_nodes"),
@@ -322,8 +326,9 @@ async def show_nodes_management(
    db_user: User,
    db: AsyncSession
 ):
-   remnawave_service = RemnaWaveService()
-   nodes = await remnawave_service.get_all_nodes()
+   nodes = node_metrics_service.get_nodes_state()
+   if nodes is None:
+       nodes = await RemnaWaveService().get_all_nodes()
    
    if not nodes:
        await callback.message.edit_text(
@@ -374,8 +379,9 @@ async def show_node_details(
 ):
    node_uuid = callback.data.split('_')[-1]
    
-   remnawave_service = RemnaWaveService()
-   node = await remnawave_service.get_node_details(node_uuid)
+   node = node_metrics_service.get_node_state(node_uuid)
+   if node is None:
+       node = await RemnaWaveService().get_node_details(node_uuid)
    
    if not node:
        await callback.answer("❌ Нода не найдена", show_alert=True)
@@ -421,6 +427,7 @@ async def manage_node(
    
    remnawave_service = RemnaWaveService()
    success = await remnawave_service.manage_node(node_uuid, action)
+   node_metrics_service.invalidate()
    
    if success:
        action_text = {"enable": "включена", "disable": "отключена", "restart": "перезагружена"}
@@ -449,34 +456,21 @@ async def show_node_statistics(
 ):
     node_uuid = callback.data.split('_')[-1]
     
-    remnawave_service = RemnaWaveService()
-    
-    node = await remnawave_service.get_node_details(node_uuid)
+    node = node_metrics_service.get_node_state(node_uuid)
+    if node is None:
+        node = await RemnaWaveService().get_node_details(node_uuid)
     
     if not node:
         await callback.answer("❌ Нода не найдена", show_alert=True)
         return
     
+    status_emoji = "🟢" if node["is_node_online"] else "🔴"
+    xray_emoji = "✅" if node["is_xray_running"] else "❌"
+    
     try:
-        from datetime import datetime, timedelta
-        
-        end_date = datetime.now()
-        start_date = end_date - timedelta(days=7)
-        
-        node_usage = await remnawave_service.get_node_user_usage_by_range(
-            node_uuid, start_date, end_date
-        )
-        
-        realtime_stats = await remnawave_service.get_nodes_realtime_usage()
-        
-        node_realtime = None
-        for stats in realtime_stats:
-            if stats.get('nodeUuid') == node_uuid:
-                node_realtime = stats
-                break
-        
-        status_emoji = "🟢" if node["is_node_online"] else "🔴"
-        xray_emoji = "✅" if node["is_xray_running"] else "❌"
+        # Реалтайм берется из последнего замера сборщика, история - из локального ряда node_metrics
+        node_realtime = node.get('realtime')
+        history = await node_metrics_service.get_node_history(node_uuid)
         
         text = f"""
 📊 <b>Статистика ноды: {node['name']}</b>
@@ -501,17 +495,18 @@ async def show_node_statistics(
 - Скорость загрузки: {format_bytes(node_realtime.get('uploadSpeedBps', 0))}/с
 """
 
-        if node_usage:
-            text += f"\n<b>Статистика за 7 дней:</b>\n"
-            total_usage = 0
-            for usage in node_usage[-5:]: 
-                daily_usage = usage.get('total', 0)
-                total_usage += daily_usage
-                text += f"- {usage.get('date', 'N/A')}: {format_bytes(daily_usage)}\n"
-            
-            text += f"\n<b>Общий трафик за 7 дней:</b> {format_bytes(total_usage)}"
+        if history['samples']:
+            peak_bps = max((value for value in history['bandwidth_bps'] if value is not None), default=0)
+            text += f"""
+<b>За 24 часа:</b>
+👥 <code>{format_sparkline(history['users_online'])}</code> макс. {history['users_online_max']}
+⚡ <code>{format_sparkline(history['bandwidth_bps'])}</code> пик {format_bytes(int(peak_bps))}/с
+- Доступность за сутки: {history['availability_day']:.1f}%
+"""
+            if history['availability_week'] is not None:
+                text += f"- Доступность за неделю: {history['availability_week']:.1f}%\n"
         else:
-            text += "\n<b>Статистика за 7 дней:</b> Данные недоступны"
+            text += "\n<b>История:</b> замеров пока нет, сборщик метрик накапливает данные"
         
         keyboard = types.InlineKeyboardMarkup(inline_keyboard=[
             [types.InlineKeyboardButton(text="🔄 Обновить", callback_data=f"node_stats_{node_uuid}")],
@@ -1293,6 +1288,7 @@ async def restart_all_nodes(
 ):
    remnawave_service = RemnaWaveService()
    success = await remnawave_service.restart_all_nodes()
+   node_metrics_service.invalidate()
    
    if success:
        await callback.message.edit_text(
@@ -7,12 +7,12 @@ from app.states import AdminStates
 from app.database.models import User
 from app.database.crud.server_squad import (
     get_all_server_squads, get_server_squad_by_id, update_server_squad,
-    delete_server_squad, sync_with_remnawave, get_server_statistics,
+    delete_server_squad, get_server_statistics,
     create_server_squad, get_available_server_squads
 )
-from app.services.remnawave_service import RemnaWaveService
+from app.services.server_capacity_service import server_capacity_service
+from app.services.server_catalogue_service import server_catalogue_service
 from app.utils.decorators import admin_required, error_handler
-from app.utils.cache import cache
 
 logger = logging.getLogger(__name__)
 
@@ -152,10 +152,9 @@ async def sync_servers_with_remnawave(
     )
     
     try:
-        remnawave_service = RemnaWaveService()
-        squads = await remnawave_service.get_all_squads()
+        diff = await server_catalogue_service.sync(force=True)
         
-        if not squads:
+        if diff is None:
             await callback.message.edit_text(
                 "❌ Не удалось получить данные о сквадах из Remnawave.\n\nПроверьте настройки API.",
                 reply_markup=types.InlineKeyboardMarkup(inline_keyboard=[
@@ -164,18 +163,14 @@ async def sync_servers_with_remnawave(
             )
             return
         
-        created, updated, disabled = await sync_with_remnawave(db, squads)
-        
-        await cache.delete("available_countries")
-        
         text = f"""
 ✅ <b>Синхронизация завершена</b>
 
 📊 <b>Результаты:</b>
-• Создано новых серверов: {created}
-• Обновлено существующих: {updated}
-• Отключено неактивных: {disabled}
-• Всего обработано: {len(squads)}
+• Создано новых серверов: {len(diff.created)}
+• Переименовано: {len(diff.renamed)}
+• Пересоздано с переносом настроек: {len(diff.recreated)}
+• Отключено неактивных: {len(diff.removed)}
 
 ℹ️ Новые серверы созданы как недоступные.
 Настройте их в списке серверов.
@@ -296,7 +291,7 @@ async def toggle_server_availability(
     new_status = not server.is_available
     await update_server_squad(db, server_id, is_available=new_status)
     
-    await cache.delete("available_countries")
+    await server_catalogue_service.refresh_caches()
     
     status_text = "включен" if new_status else "отключен"
     await callback.answer(f"✅ Сервер {status_text}!")
@@ -422,7 +417,7 @@ async def process_server_price_edit(
         if server:
             await state.clear()
             
-            await cache.delete("available_countries")
+            await server_catalogue_service.refresh_caches()
             
             price_text = f"{price_rubles:.2f} ₽" if price_kopeks > 0 else "Бесплатно"
             await message.answer(
@@ -497,7 +492,7 @@ async def process_server_name_edit(
     if server:
         await state.clear()
         
-        await cache.delete("available_countries")
+        await server_catalogue_service.refresh_caches()
         
         await message.answer(
             f"✅ Название сервера изменено на: <b>{new_name}</b>",
@@ -570,7 +565,7 @@ async def delete_server_execute(
     success = await delete_server_squad(db, server_id)
     
     if success:
-        await cache.delete("available_countries")
+        await server_catalogue_service.refresh_caches()
         
         await callback.message.edit_text(
             f"✅ Сервер <b>{server.display_name}</b> успешно удален!",
@@ -701,7 +696,7 @@ async def process_server_country_edit(
     if server:
         await state.clear()
         
-        await cache.delete("available_countries")
+        await server_catalogue_service.refresh_caches()
         
         country_text = new_country or "Удален"
         await message.answer(
@@ -776,6 +771,7 @@ async def process_server_limit_edit(
         server = await update_server_squad(db, server_id, max_users=max_users)
         
         if server:
+            await server_capacity_service.invalidate()
             await state.clear()
             
             limit_text = f"{limit} пользователей" if limit > 0 else "Без лимита"
@@ -879,6 +875,7 @@ async def sync_server_user_counts_handler(
         from app.database.crud.server_squad import sync_server_user_counts
         
         updated_count = await sync_server_user_counts(db)
+        await server_capacity_service.invalidate()
         
         text = f"""
 ✅ <b>Синхронизация завершена</b>
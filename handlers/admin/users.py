@@ -891,8 +891,8 @@ async def show_user_statistics(
                 status = "🟢" if detail['is_active'] else "🔴"
                 text += f"• {status} {referral_name}: {earned}\n"
             
-            if len(referral_stats['referrals_detail']) > 5:
-                text += f"• ... и еще {len(referral_stats['referrals_detail']) - 5} рефералов\n"
+            if referral_stats['invited_count'] > 5:
+                text += f"• ... и еще {referral_stats['invited_count'] - 5} рефералов\n"
     else:
         text += f"<b>Реферальная программа:</b>\n"
         text += f"• Рефералов нет\n"
@@ -907,54 +907,62 @@ async def show_user_statistics(
     await callback.answer()
 
 
-async def get_detailed_referral_stats(db: AsyncSession, user_id: int) -> dict:
-    from app.database.crud.referral import get_user_referral_stats, get_referral_earnings_by_user
-    from sqlalchemy import select, func
-    from sqlalchemy.orm import selectinload
+async def get_detailed_referral_stats(db: AsyncSession, user_id: int, details_limit: int = 5) -> dict:
+    from app.database.crud.referral import get_user_referral_stats
+    from app.database.models import ReferralEarning, Subscription, SubscriptionStatus
+    from sqlalchemy import select, func, and_, case
     
     base_stats = await get_user_referral_stats(db, user_id)
     
-    referrals_query = select(User).options(
-        selectinload(User.subscription)
-    ).where(User.referred_by_id == user_id)
-    
-    referrals_result = await db.execute(referrals_query)
-    referrals = referrals_result.scalars().all()
-    
-    earnings_by_referral = {}
-    all_earnings = await get_referral_earnings_by_user(db, user_id)
-    
-    for earning in all_earnings:
-        referral_id = earning.referral_id
-        if referral_id not in earnings_by_referral:
-            earnings_by_referral[referral_id] = 0
-        earnings_by_referral[referral_id] += earning.amount_kopeks
-    
     referrals_detail = []
-    current_time = datetime.utcnow()
-    
-    for referral in referrals:
-        earned = earnings_by_referral.get(referral.id, 0)
-        
-        is_active = False
-        if referral.subscription:
-            from app.database.models import SubscriptionStatus
-            is_active = (
-                referral.subscription.status == SubscriptionStatus.ACTIVE.value and 
-                referral.subscription.end_date > current_time
+    if base_stats['invited_count'] > 0:
+        current_time = datetime.utcnow()
+        earned = (
+            select(
+                ReferralEarning.referral_id,
+                func.sum(ReferralEarning.amount_kopeks).label('total_earned')
             )
+            .where(ReferralEarning.user_id == user_id)
+            .group_by(ReferralEarning.referral_id)
+            .subquery()
+        )
+        total_earned = func.coalesce(earned.c.total_earned, 0)
+        
+        result = await db.execute(
+            select(
+                User.id,
+                User.telegram_id,
+                User.first_name,
+                User.last_name,
+                User.username,
+                User.created_at,
+                total_earned.label('total_earned'),
+                Subscription.id.label('subscription_id'),
+                case(
+                    (and_(
+                        Subscription.status == SubscriptionStatus.ACTIVE.value,
+                        Subscription.end_date > current_time
+                    ), True),
+                    else_=False
+                ).label('is_active')
+            )
+            .outerjoin(earned, earned.c.referral_id == User.id)
+            .outerjoin(Subscription, Subscription.user_id == User.id)
+            .where(User.referred_by_id == user_id)
+            .order_by(total_earned.desc())
+            .limit(details_limit)
+        )
         
-        referrals_detail.append({
-            'referral_id': referral.id,
-            'referral_name': referral.full_name,
-            'referral_telegram_id': referral.telegram_id,
-            'total_earned_kopeks': earned,
-            'is_active': is_active,
-            'registration_date': referral.created_at,
-            'has_subscription': bool(referral.subscription)
-        })
-    
-    referrals_detail.sort(key=lambda x: x['total_earned_kopeks'], reverse=True)
+        for row in result.all():
+            referrals_detail.append({
+                'referral_id': row.id,
+                'referral_name': " ".join(filter(None, [row.first_name, row.last_name])) or row.username or f"ID{row.telegram_id}",
+                'referral_telegram_id': row.telegram_id,
+                'total_earned_kopeks': row.total_earned,
+                'is_active': bool(row.is_active),
+                'registration_date': row.created_at,
+                'has_subscription': row.subscription_id is not None
+            })
     
     return {
         'invited_count': base_stats['invited_count'],
@@ -2157,7 +2165,10 @@ async def _grant_trial_subscription(db: AsyncSession, user_id: int, admin_id: in
             logger.error(f"У пользователя {user_id} уже есть подписка")
             return False
         
-        subscription = await create_trial_subscription(db, user_id)
+        from app.services.placement_service import placement_service
+        subscription = await create_trial_subscription(
+            db, user_id, squad_uuid=await placement_service.place_trial(db)
+        )
         
         subscription_service = SubscriptionService()
         await subscription_service.create_remnawave_user(db, subscription)
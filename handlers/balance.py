@@ -5,7 +5,6 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.config import settings
 from app.states import BalanceStates
-from app.database.crud.user import add_user_balance
 from app.database.crud.transaction import (
     get_user_transactions, get_user_transactions_count,
     create_transaction
@@ -21,11 +20,12 @@ from app.utils.pagination import paginate_list
 from app.utils.decorators import error_handler
 
 from app.services.crypto_payment_service import CryptoPaymentService, TON_TO_RUB_EXCHANGE_RATE
+from app.services.payment_reconciliation_service import payment_reconciliation_service
+from app.database.crud.crypto_invoice import create_crypto_invoice, get_crypto_invoice
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram import Router, F, types
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
-from app.database.crud.user import get_user_by_telegram_id
 
 logger = logging.getLogger(__name__)
 router = Router()
@@ -53,7 +53,7 @@ async def start_crypto_payment(callback: types.CallbackQuery, state: FSMContext,
     await callback.answer()
 
 @router.message(TopupStates.waiting_for_amount, F.text.regexp(r"^\d+(\.\d{1,2})?$"))
-async def process_amount(message: types.Message, state: FSMContext, db_user: User):
+async def process_amount(message: types.Message, state: FSMContext, db_user: User, db: AsyncSession):
     """Обработчик, который получает сумму и создает счет."""
     try:
         amount_rub = float(message.text)
@@ -80,9 +80,17 @@ async def process_amount(message: types.Message, state: FSMContext, db_user: Use
                     ]
                 ])
             )
-            # ✅ Теперь мы сохраняем сумму в копейках для последующего зачисления
-            await state.update_data(amount_kopeks=int(amount_rub * 100))
-            # ❌ Важно! Не очищаем состояние здесь
+            await create_crypto_invoice(
+                db,
+                invoice_id=int(invoice['invoice_id']),
+                user_id=db_user.id,
+                amount_kopeks=int(amount_rub * 100),
+                asset=invoice.get('asset', 'TON'),
+                amount=str(invoice.get('amount', amount_ton)),
+                pay_url=invoice.get('pay_url')
+            )
+            payment_reconciliation_service.wake()
+            await state.clear()
         else:
             await message.answer("❌ Не удалось создать счет. Попробуйте позже.")
 
@@ -91,49 +99,47 @@ async def process_amount(message: types.Message, state: FSMContext, db_user: Use
 
 
 @router.callback_query(F.data.startswith("check_crypto_"))
-async def check_crypto_payment_handler(callback: types.CallbackQuery, state: FSMContext, db: AsyncSession):
+async def check_crypto_payment_handler(callback: types.CallbackQuery, db: AsyncSession):
     try:
-        logger.info(f"Тип callback: {type(callback)}")
-        logger.info(f"Callback data: {callback.data}")
-        logger.info(f"User ID: {callback.from_user.id}")
-
         invoice_id = int(callback.data.split("_")[-1])
-        service = CryptoPaymentService()
-        status = await service.check_invoice_status(invoice_id)
 
-        logger.info(f"Статус счета {invoice_id}: {status}")
-
-        if status == "paid":
-            db_user = await get_user_by_telegram_id(db, callback.from_user.id)
-            data = await state.get_data()
-            amount_kopeks = data.get('amount_kopeks')
+        invoice = await get_crypto_invoice(db, invoice_id)
+        if not invoice:
+            await callback.answer(
+                "❌ Не удалось найти информацию о платеже. Пожалуйста, обратитесь в поддержку.",
+                show_alert=True
+            )
+            return
 
-            if db_user and amount_kopeks is not None:
-                # ✅ ПЕРЕДАЕМ ОБЪЕКТ USER, А НЕ ID
-                success = await add_user_balance(db, db_user, amount_kopeks)
+        if invoice.is_paid:
+            await callback.answer("✅ Платеж уже зачислен на баланс", show_alert=True)
+            return
 
-                if success:
-                    await db.commit()
-                    await state.clear()
+        status = await CryptoPaymentService().check_invoice_status(invoice_id)
+        logger.debug(f"Статус счета {invoice_id}: {status}")
 
-                    await callback.message.edit_text(
-                        "🎉 Платеж успешно зачислен на ваш баланс!",
-                        reply_markup=get_balance_keyboard()
-                    )
-                    await callback.answer("Платеж зачислен!")
+        if status == "paid":
+            # Зачисление идемпотентно: если сверка успела раньше, повторно не начислим
+            entry = await payment_reconciliation_service.credit_crypto_invoice(invoice_id)
+            if entry is None:
+                await db.refresh(invoice)
+                if invoice.is_paid:
+                    await callback.answer("✅ Платеж уже зачислен на баланс", show_alert=True)
                 else:
                     await callback.answer(
-                        "❌ Ошибка при зачислении средств. Обратитесь в поддержку.",
+                        "❌ Не удалось зачислить платеж. Пожалуйста, обратитесь в поддержку.",
                         show_alert=True
                     )
-            else:
-                await callback.answer(
-                    "❌ Не удалось найти информацию о платеже. Пожалуйста, обратитесь в поддержку.",
-                    show_alert=True
-                )
+                return
+
+            await callback.message.edit_text(
+                "🎉 Платеж успешно зачислен на ваш баланс!",
+                reply_markup=get_balance_keyboard()
+            )
+            await callback.answer("Платеж зачислен!")
         elif status == "active":
             await callback.answer(
-                "⏳ Платеж еще не поступил. Попробуйте снова через 1-2 минуты.",
+                "⏳ Платеж еще не поступил. Средства зачислятся автоматически сразу после оплаты.",
                 show_alert=True
             )
         else:
@@ -585,6 +591,7 @@ async def process_yookassa_payment_amount(
         
         await state.clear()
         
+        payment_reconciliation_service.wake()
         logger.info(f"Создан платеж YooKassa для пользователя {db_user.telegram_id}: "
                    f"{amount_kopeks/100}₽, ID: {payment_result['yookassa_payment_id']}")
         
@@ -1,11 +1,13 @@
 import logging
 from aiogram import Dispatcher, types, F
+from aiogram.enums import ChatMemberStatus, ChatType
 from aiogram.fsm.context import FSMContext
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.database.models import User
 from app.localization.texts import get_texts
 from app.keyboards.inline import get_back_keyboard
+from app.services.delivery_health_service import delivery_health_service
 
 logger = logging.getLogger(__name__)
 
@@ -71,8 +73,21 @@ async def show_rules(
     await callback.answer()
 
 
+async def handle_bot_chat_member(event: types.ChatMemberUpdated):
+    # В личном чате статус kicked означает, что пользователь заблокировал бота
+    await delivery_health_service.set_reachable(
+        event.from_user.id,
+        event.new_chat_member.status != ChatMemberStatus.KICKED
+    )
+
+
 def register_handlers(dp: Dispatcher):
     
+    dp.my_chat_member.register(
+        handle_bot_chat_member,
+        F.chat.type == ChatType.PRIVATE
+    )
+    
     dp.callback_query.register(
         show_rules,
         F.data == "menu_rules"
@@ -1,6 +1,7 @@
 import logging
 from aiogram import Router, F, types
-from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+from app.keyboards.inline import get_download_app_keyboard, get_download_instructions_keyboard
 
 logger = logging.getLogger(__name__)
 router = Router()
@@ -8,14 +9,7 @@ router = Router()
 @router.callback_query(F.data == "download_app")
 async def download_app_handler(call: types.CallbackQuery):
     """Обрабатывает нажатие на кнопку 'Скачать приложение'."""
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="📱 Iphone", callback_data="instructions_iphone")],
-        [InlineKeyboardButton(text="📱 Android", callback_data="instructions_android")],
-        [InlineKeyboardButton(text="📱 Huawei и HONOR", callback_data="instructions_huawei")],
-        [InlineKeyboardButton(text="💻 MacOS", callback_data="instructions_macos")],
-        [InlineKeyboardButton(text="🖥️ Windows", callback_data="instructions_windows")],
-        [InlineKeyboardButton(text="↩️ Назад", callback_data="back_to_profile")],
-    ])
+    keyboard = get_download_app_keyboard()
     await call.message.edit_text(
         "На какое устройство желаете установить приложение?\n"
         "К одному ключу можно подключить до 3 устройств.",
@@ -35,9 +29,7 @@ async def instructions_iphone_handler(call: types.CallbackQuery):
         "3. <b>Откройте</b> приложение и вставьте ссылку\n"  
         "4. <b>Подключитесь</b> к серверу"
     )
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="↩️ Назад", callback_data="download_app")]
-    ])
+    keyboard = get_download_instructions_keyboard()
     await call.message.edit_text(text, reply_markup=keyboard)
     await call.answer()
 
@@ -52,9 +44,7 @@ async def instructions_android_handler(call: types.CallbackQuery):
         "3. <b>Откройте</b> приложение и вставьте ссылку\n"
         "4. <b>Подключитесь</b> к серверу"
     )
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="↩️ Назад", callback_data="download_app")]
-    ])
+    keyboard = get_download_instructions_keyboard()
     await call.message.edit_text(text, reply_markup=keyboard)
     await call.answer()
 
@@ -65,9 +55,7 @@ async def instructions_huawei_handler(call: types.CallbackQuery):
         "Инструкция для Huawei, Honor и других Android устройств без Google Play с APK файлом по ссылке ниже:\n"
         "<a href='https://t.me/v2raytunhuawei'>Открыть инструкцию</a>\n"
     )
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="↩️ Назад", callback_data="download_app")]
-    ])
+    keyboard = get_download_instructions_keyboard()
     await call.message.edit_text(text, reply_markup=keyboard)
     await call.answer()
 
@@ -81,9 +69,7 @@ async def instructions_macos_handler(call: types.CallbackQuery):
         "3. <b>Откройте</b> приложение и вставьте ссылку\n"
         "4. <b>Подключитесь</b> к серверу"
     )
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="↩️ Назад", callback_data="download_app")]
-    ])
+    keyboard = get_download_instructions_keyboard()
     await call.message.edit_text(text, reply_markup=keyboard)
     await call.answer()
 
@@ -97,9 +83,7 @@ async def instructions_windows_handler(call: types.CallbackQuery):
         "3. <b>Откройте</b> приложение и вставьте ссылку\n"
         "4. <b>Подключитесь</b> к серверу"
     )
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="↩️ Назад", callback_data="download_app")]
-    ])
+    keyboard = get_download_instructions_keyboard()
     await call.message.edit_text(text, reply_markup=keyboard)
     await call.answer()
 
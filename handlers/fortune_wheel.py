@@ -3,9 +3,10 @@ from aiogram.filters import Command
 from sqlalchemy.ext.asyncio import AsyncSession
 import logging
 
-from app.database.database import get_db
-from app.services.fortune_wheel_service import FortuneWheelService
+from app.database.models import User
+from app.services.fortune_wheel_service import fortune_wheel_service, SPIN_ANIMATION_TEXT
 from app.handlers.keyboards import get_fortune_wheel_keyboard
+from app.utils.decorators import rate_limit
 from sqlalchemy import select, func, Integer
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -20,23 +21,23 @@ router = Router() # ✅ ДОБАВЬТЕ ЭТУ СТРОКУ
 async def show_fortune_wheel(callback: types.CallbackQuery):
     logger.info(f"Обработчик колеса фортуны вызван пользователем {callback.from_user.id}")
     await callback.message.edit_text(
-        "🎡 Колесо фортуны\n\nКаждый день вы можете крутить колесо и выигрывать до 50 рублей!",
+        "🎡 Колесо фортуны\n\n"
+        f"Каждый день вы можете крутить колесо и выигрывать до {fortune_wheel_service.max_prize_rubles} рублей!",
         reply_markup=get_fortune_wheel_keyboard()
     )
 
 
 @router.callback_query(F.data == "spin_wheel")
+@rate_limit(key="fortune_wheel")
 async def spin_fortune_wheel(callback: types.CallbackQuery, db: AsyncSession):
     try:
-        service = FortuneWheelService()
-        result = await service.spin_wheel(db, callback.from_user, callback.message)
+        result = await fortune_wheel_service.spin_wheel(db, callback.from_user)
 
         if result["success"]:
             await callback.answer()  # Отправляем пустой ответ на callback
-            await callback.message.answer(
-                result["message"]
-            )
-            # Успешно, больше ничего не делаем с предыдущим сообщением
+            # Выигрыш уже начислен; анимация - отложенная замена текста, обработчик не ждет
+            animation_message = await callback.message.answer(SPIN_ANIMATION_TEXT)
+            fortune_wheel_service.schedule_reveal(animation_message, result["message"])
 
         else:
             # Пользователь уже крутил колесо
@@ -49,11 +50,9 @@ async def spin_fortune_wheel(callback: types.CallbackQuery, db: AsyncSession):
 
 
 @router.callback_query(F.data == "wheel_stats")
-async def show_wheel_stats(callback: types.CallbackQuery):
+async def show_wheel_stats(callback: types.CallbackQuery, db: AsyncSession, db_user: User):
     try:
-        async for db in get_db():
-            service = FortuneWheelService()
-            stats = await service.get_stats(db, callback.from_user.id)
+        stats = await fortune_wheel_service.get_stats(db, db_user.id)
 
         total_winnings_kopeks = stats.get('total_winnings', 0)
         total_winnings_rubles = total_winnings_kopeks / 100
@@ -34,16 +34,6 @@ from app.handlers import (
     fortune_wheel
 )
 
-from app.handlers.admin import (
-    main as admin_main, users as admin_users, subscriptions as admin_subscriptions,
-    promocodes as admin_promocodes, messages as admin_messages,
-    monitoring as admin_monitoring, referrals as admin_referrals,
-    rules as admin_rules, remnawave as admin_remnawave,
-    statistics as admin_statistics, user_messages as admin_user_messages,
-    version as admin_version, servers as admin_servers,
-    maintenance as admin_maintenance
-)
-
 logger = logging.getLogger(__name__)
 router = Router()
 
@@ -187,6 +177,7 @@ async def process_promocode(
             "expired": texts.PROMOCODE_EXPIRED,
             "used": texts.PROMOCODE_USED,
             "already_used_by_user": texts.PROMOCODE_USED,
+            "too_many_attempts": texts.PROMOCODE_TOO_MANY_ATTEMPTS,
             "server_error": texts.ERROR,
         }
         error_text = error_messages.get(result["error"], texts.PROMOCODE_INVALID)
@@ -64,6 +64,7 @@ async def process_promocode(
             "expired": texts.PROMOCODE_EXPIRED,
             "used": texts.PROMOCODE_USED,
             "already_used_by_user": texts.PROMOCODE_USED,
+            "too_many_attempts": texts.PROMOCODE_TOO_MANY_ATTEMPTS,
             "server_error": texts.ERROR
         }
         
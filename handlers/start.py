@@ -15,10 +15,10 @@ from app.keyboards.inline import (
     get_rules_keyboard, get_main_menu_keyboard
 )
 from app.localization.texts import get_texts
-from app.services.referral_service import process_referral_registration
+from app.services.referral_service import process_referral_registration, referral_link_cache
 from app.utils.user_utils import generate_unique_referral_code
 from app.database.crud.user_message import get_random_active_message
-from aiogram.enums import ChatMemberStatus
+from app.services.channel_membership_service import channel_membership_service, is_member_status
 
 logger = logging.getLogger(__name__)
 
@@ -161,16 +161,13 @@ async def cmd_start(message: types.Message, state: FSMContext, db: AsyncSession,
             from app.services.user_service import UserService
             from app.database.models import (
                 Subscription, Transaction, PromoCodeUse,
-                ReferralEarning, SubscriptionServer
+                ReferralEarning
             )
             from sqlalchemy import delete
 
             if user.subscription:
-                await db.execute(
-                    delete(SubscriptionServer).where(
-                        SubscriptionServer.subscription_id == user.subscription.id
-                    )
-                )
+                from app.database.crud.subscription import delete_subscription_servers
+                await delete_subscription_servers(db, user.subscription.id)
                 logger.info(f"🗑️ Удалены записи SubscriptionServer")
 
             if user.subscription:
@@ -197,6 +194,7 @@ async def cmd_start(message: types.Message, state: FSMContext, db: AsyncSession,
             user.remnawave_uuid = None
             user.has_had_paid_subscription = False
             user.referred_by_id = None
+            referral_link_cache.invalidate(user.id)
 
             user.username = message.from_user.username
             user.first_name = message.from_user.first_name
@@ -821,16 +819,32 @@ async def required_sub_channel_check(
     db: AsyncSession,
     db_user=None
 ):
-    chat_member = await bot.get_chat_member(
-        chat_id=settings.CHANNEL_SUB_ID,
-        user_id=query.from_user.id
+    is_member = await channel_membership_service.is_member(
+        bot,
+        settings.CHANNEL_SUB_ID,
+        query.from_user.id,
+        force=True
     )
-    if chat_member.status not in [ChatMemberStatus.MEMBER]:
+    if not is_member:
         return await query.answer("❌ Вы не подписались на канал!", show_alert=True)
     await query.answer("✅ Спасибо за подписку", show_alert=True)
     await query.message.delete()
     await cmd_start(query.message, state, db, db_user)
 
+
+async def handle_channel_member_update(event: types.ChatMemberUpdated):
+    await channel_membership_service.set_status(
+        event.chat.id,
+        event.new_chat_member.user.id,
+        is_member_status(event.new_chat_member)
+    )
+    if event.chat.username:
+        await channel_membership_service.set_status(
+            f"@{event.chat.username}",
+            event.new_chat_member.user.id,
+            is_member_status(event.new_chat_member)
+        )
+
 def register_handlers(dp: Dispatcher):
     logger.info("🔧 === НАЧАЛО регистрации обработчиков start.py ===")
 
@@ -875,4 +889,7 @@ def register_handlers(dp: Dispatcher):
     )
     logger.info("✅ Зарегистрирован required_sub_channel_check")
 
+    dp.chat_member.register(handle_channel_member_update)
+    logger.info("✅ Зарегистрирован handle_channel_member_update")
+
     logger.info("🔧 === КОНЕЦ регистрации обработчиков start.py ===")
@@ -4,8 +4,6 @@ from aiogram import Dispatcher, types, F
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.fsm.context import FSMContext
 from sqlalchemy.ext.asyncio import AsyncSession
-import json
-import os
 from typing import Dict, List, Any, Tuple, Optional
 
 from app.config import settings, PERIOD_PRICES, get_traffic_prices
@@ -32,14 +30,15 @@ from app.keyboards.inline import (
     get_extend_subscription_keyboard, get_add_traffic_keyboard,
     get_add_devices_keyboard, get_reset_traffic_confirm_keyboard,
     get_manage_countries_keyboard,
-    get_device_selection_keyboard, get_connection_guide_keyboard,
-    get_app_selection_keyboard, get_specific_app_keyboard,
+    get_device_selection_keyboard,
     get_subscription_settings_keyboard, get_extend_subscription_keyboard_with_prices
 )
 from app.localization.texts import get_texts
 from app.services.remnawave_service import RemnaWaveService
 from app.services.admin_notification_service import AdminNotificationService
 from app.services.subscription_service import SubscriptionService
+from app.services.app_config_service import app_config_service
+from app.utils.decorators import rate_limit
 from app.utils.pricing_utils import (
     calculate_months_from_days,
     get_remaining_months,
@@ -51,6 +50,7 @@ logger = logging.getLogger(__name__)
 
 TRAFFIC_PRICES = get_traffic_prices()
 
+@rate_limit(key="panel")
 async def show_subscription_info(
     callback: types.CallbackQuery,
     db_user: User,
@@ -345,6 +345,7 @@ async def show_trial_offer(
     await callback.answer()
 
 
+@rate_limit(key="purchase")
 async def activate_trial(
     callback: types.CallbackQuery,
     db_user: User,
@@ -363,7 +364,10 @@ async def activate_trial(
         return
     
     try:
-        subscription = await create_trial_subscription(db, db_user.id)
+        from app.services.placement_service import placement_service
+        subscription = await create_trial_subscription(
+            db, db_user.id, squad_uuid=await placement_service.place_trial(db)
+        )
         
         await db.refresh(db_user)
         
@@ -531,16 +535,16 @@ async def handle_add_countries(
 
 async def get_countries_price_by_uuids_fallback(country_uuids: List[str], db: AsyncSession) -> Tuple[int, List[int]]:
     try:
-        from app.database.crud.server_squad import get_server_squad_by_uuid
+        from app.services.server_capacity_service import server_capacity_service
         
         total_price = 0
         prices_list = []
         
         for country_uuid in country_uuids:
             try:
-                server = await get_server_squad_by_uuid(db, country_uuid)
-                if server and server.is_available and not server.is_full:
-                    price = server.price_kopeks
+                server = await server_capacity_service.get_server_by_uuid(db, country_uuid)
+                if server_capacity_service.accepts_users(server):
+                    price = server["price_kopeks"]
                     total_price += price
                     prices_list.append(price)
                 else:
@@ -672,32 +676,40 @@ async def apply_countries_changes(
         if added and total_cost > 0:
             success = await subtract_user_balance(
                 db, db_user, total_cost, 
-                f"Добавление стран: {', '.join(added_names)} на {charged_months} мес"
+                f"Добавление стран к подписке: {', '.join(added_names)} на {charged_months} мес",
+                transaction_type=TransactionType.SUBSCRIPTION_PAYMENT
             )
             if not success:
                 await callback.answer("⚠ Ошибка списания средств", show_alert=True)
                 return
-            
-            await create_transaction(
-                db=db,
-                user_id=db_user.id,
-                type=TransactionType.SUBSCRIPTION_PAYMENT,
-                amount_kopeks=total_cost,
-                description=f"Добавление стран к подписке: {', '.join(added_names)} на {charged_months} мес"
-            )
         
         if added:
-            from app.database.crud.server_squad import get_server_ids_by_uuids, add_user_to_servers
+            from app.database.crud.server_squad import get_server_ids_by_uuids
             from app.database.crud.subscription import add_subscription_servers
+            from app.services.placement_service import placement_service
+            
+            placed = await placement_service.place_many(
+                db, added, keep=[c for c in selected_countries if c not in added]
+            )
+            selected_countries = [placed[added.index(c)] if c in added else c for c in selected_countries]
+            added = placed
             
             added_server_ids = await get_server_ids_by_uuids(db, added)
             
             if added_server_ids:
                 await add_subscription_servers(db, subscription, added_server_ids, added_server_prices)
-                await add_user_to_servers(db, added_server_ids)
                 
                 logger.info(f"📊 Добавлены серверы с ценами за {charged_months} мес: {list(zip(added_server_ids, added_server_prices))}")
         
+        if removed:
+            from app.database.crud.server_squad import get_server_ids_by_uuids
+            from app.database.crud.subscription import remove_subscription_servers
+            
+            removed_server_ids = await get_server_ids_by_uuids(db, removed)
+            
+            if removed_server_ids:
+                await remove_subscription_servers(db, subscription.id, removed_server_ids)
+        
         subscription.connected_squads = selected_countries
         subscription.updated_at = datetime.utcnow()
         await db.commit()
@@ -916,6 +928,7 @@ async def handle_reset_traffic(
 
 
 
+@rate_limit(key="purchase")
 async def confirm_add_traffic(
     callback: types.CallbackQuery,
     db_user: User,
@@ -1003,6 +1016,7 @@ def update_traffic_prices():
     logger.info("🔄 TRAFFIC_PRICES обновлены из конфигурации")
 
 
+@rate_limit(key="purchase")
 async def confirm_add_devices(
     callback: types.CallbackQuery,
     db_user: User,
@@ -1080,6 +1094,7 @@ async def confirm_add_devices(
     await callback.answer()
 
 
+@rate_limit(key="purchase")
 async def confirm_extend_subscription(
     callback: types.CallbackQuery,
     db_user: User,
@@ -1170,6 +1185,12 @@ async def confirm_extend_subscription(
         
         from app.database.crud.server_squad import get_server_ids_by_uuids
         from app.database.crud.subscription import add_subscription_servers
+        from app.services.placement_service import placement_service
+        
+        connected_squads = await placement_service.rebalance(db, subscription.connected_squads)
+        if connected_squads != subscription.connected_squads:
+            subscription.connected_squads = connected_squads
+            await db.commit()
         
         server_ids = await get_server_ids_by_uuids(db, subscription.connected_squads)
         if server_ids:
@@ -1252,6 +1273,7 @@ def get_extend_subscription_keyboard_with_prices(language: str, prices: dict) ->
     ])
 
 
+@rate_limit(key="panel")
 async def confirm_reset_traffic(
     callback: types.CallbackQuery,
     db_user: User,
@@ -1732,6 +1754,7 @@ async def devices_continue(
     await callback.answer()
 
 
+@rate_limit(key="purchase")
 async def confirm_purchase(
     callback: types.CallbackQuery,
     state: FSMContext,
@@ -1813,6 +1836,9 @@ async def confirm_purchase(
             await callback.answer()
             return
         
+        from app.services.placement_service import placement_service
+        data['countries'] = await placement_service.place_many(db, data['countries'])
+        
         existing_subscription = db_user.subscription
         was_trial_conversion = False
         
@@ -1869,14 +1895,13 @@ async def confirm_purchase(
         from app.utils.user_utils import mark_user_as_had_paid_subscription
         await mark_user_as_had_paid_subscription(db, db_user)
         
-        from app.database.crud.server_squad import get_server_ids_by_uuids, add_user_to_servers
+        from app.database.crud.server_squad import get_server_ids_by_uuids
         from app.database.crud.subscription import add_subscription_servers
         
         server_ids = await get_server_ids_by_uuids(db, data['countries'])
         
         if server_ids:
             await add_subscription_servers(db, subscription, server_ids, server_prices)
-            await add_user_to_servers(db, server_ids)
             
             logger.info(f"Сохранены цены серверов за весь период: {server_prices}")
         
@@ -2265,6 +2290,22 @@ async def handle_subscription_cancel(
     
     await callback.answer("❌ Покупка отменена")
 
+async def _apply_server_capacity(countries):
+    # Список стран кешируется надолго, а заполненность серверов берется из свежего среза
+    from app.database.database import AsyncSessionLocal
+    from app.services.server_capacity_service import server_capacity_service
+    
+    try:
+        async with AsyncSessionLocal() as db:
+            for country in countries:
+                server = await server_capacity_service.get_server_by_uuid(db, country["uuid"])
+                if server:
+                    country["is_available"] = server_capacity_service.accepts_users(server)
+    except Exception as e:
+        logger.error(f"Ошибка проверки заполненности серверов: {e}")
+    
+    return countries
+
 async def _get_available_countries():
     from app.utils.cache import cache
     from app.database.database import AsyncSessionLocal
@@ -2272,7 +2313,7 @@ async def _get_available_countries():
     
     cached_countries = await cache.get("available_countries")
     if cached_countries:
-        return cached_countries
+        return await _apply_server_capacity(cached_countries)
     
     try:
         async with AsyncSessionLocal() as db:
@@ -2285,7 +2326,7 @@ async def _get_available_countries():
                 "name": server.display_name, 
                 "price_kopeks": server.price_kopeks,
                 "country_code": server.country_code,
-                "is_available": server.is_available and not server.is_full
+                "is_available": server.is_available
             })
         
         if not countries:
@@ -2317,7 +2358,7 @@ async def _get_available_countries():
                 })
         
         await cache.set("available_countries", countries, 300)
-        return countries
+        return await _apply_server_capacity(countries)
         
     except Exception as e:
         logger.error(f"Ошибка получения списка стран: {e}")
@@ -2453,6 +2494,7 @@ async def _should_show_countries_management() -> bool:
         return True
 
 
+@rate_limit(key="purchase")
 async def confirm_add_countries_to_subscription(
     callback: types.CallbackQuery,
     db_user: User,
@@ -2501,20 +2543,13 @@ async def confirm_add_countries_to_subscription(
         if new_countries and total_price > 0:
             success = await subtract_user_balance(
                 db, db_user, total_price,
-                f"Добавление стран к подписке: {', '.join(new_countries_names)}"
+                f"Добавление стран к подписке: {', '.join(new_countries_names)}",
+                transaction_type=TransactionType.SUBSCRIPTION_PAYMENT
             )
             
             if not success:
                 await callback.answer("❌ Ошибка списания средств", show_alert=True)
                 return
-            
-            await create_transaction(
-                db=db,
-                user_id=db_user.id,
-                type=TransactionType.SUBSCRIPTION_PAYMENT,
-                amount_kopeks=total_price,
-                description=f"Добавление стран к подписке: {', '.join(new_countries_names)}"
-            )
         
         subscription.connected_squads = selected_countries
         subscription.updated_at = datetime.utcnow()
@@ -2556,6 +2591,7 @@ async def confirm_add_countries_to_subscription(
     await state.clear()
     await callback.answer()
 
+@rate_limit(key="panel")
 async def confirm_reset_devices(
     callback: types.CallbackQuery,
     db_user: User,
@@ -2746,30 +2782,28 @@ async def handle_device_guide(
         await callback.answer("❌ Ссылка подписки недоступна", show_alert=True)
         return
     
-    apps = get_apps_for_device(device_type, db_user.language)
+    featured_app = app_config_service.get_featured_app(device_type, db_user.language)
     
-    if not apps:
+    if not featured_app:
         await callback.answer("❌ Приложения для этого устройства не найдены", show_alert=True)
         return
     
-    featured_app = next((app for app in apps if app.get('isFeatured', False)), apps[0])
-    
     guide_text = f"""
 📱 <b>Настройка для {get_device_name(device_type, db_user.language)}</b>
 
 🔗 <b>Ссылка подписки:</b>
 <code>{subscription.subscription_url}</code>
 
-📋 <b>Рекомендуемое приложение:</b> {featured_app['name']}
+📋 <b>Рекомендуемое приложение:</b> {featured_app.name}
 
 <b>Шаг 1 - Установка:</b>
-{featured_app['installationStep']['description'][db_user.language]}
+{featured_app.installation}
 
 <b>Шаг 2 - Добавление подписки:</b>
-{featured_app['addSubscriptionStep']['description'][db_user.language]}
+{featured_app.add_subscription}
 
 <b>Шаг 3 - Подключение:</b>
-{featured_app['connectAndUseStep']['description'][db_user.language]}
+{featured_app.connect_and_use}
 
 💡 <b>Как подключить:</b>
 1. Установите приложение по ссылке выше
@@ -2780,10 +2814,9 @@ async def handle_device_guide(
     
     await callback.message.edit_text(
         guide_text,
-        reply_markup=get_connection_guide_keyboard(
+        reply_markup=app_config_service.get_connection_guide_keyboard(
             subscription.subscription_url,
-            featured_app,
-            db_user.language
+            featured_app
         ),
         parse_mode="HTML"
     )
@@ -2799,9 +2832,9 @@ async def handle_app_selection(
     texts = get_texts(db_user.language)
     subscription = db_user.subscription
     
-    apps = get_apps_for_device(device_type, db_user.language)
+    keyboard = app_config_service.get_app_selection_keyboard(device_type, db_user.language)
     
-    if not apps:
+    if not keyboard:
         await callback.answer("❌ Приложения для этого устройства не найдены", show_alert=True)
         return
     
@@ -2813,7 +2846,7 @@ async def handle_app_selection(
     
     await callback.message.edit_text(
         app_text,
-        reply_markup=get_app_selection_keyboard(device_type, apps, db_user.language),
+        reply_markup=keyboard,
         parse_mode="HTML"
     )
     await callback.answer()
@@ -2828,44 +2861,41 @@ async def handle_specific_app_guide(
     texts = get_texts(db_user.language)
     subscription = db_user.subscription
     
-    apps = get_apps_for_device(device_type, db_user.language)
-    app = next((a for a in apps if a['id'] == app_id), None)
+    app = app_config_service.get_app(device_type, app_id, db_user.language)
     
     if not app:
         await callback.answer("❌ Приложение не найдено", show_alert=True)
         return
     
     guide_text = f"""
-📱 <b>{app['name']} - {get_device_name(device_type, db_user.language)}</b>
+📱 <b>{app.name} - {get_device_name(device_type, db_user.language)}</b>
 
 🔗 <b>Ссылка подписки:</b>
 <code>{subscription.subscription_url}</code>
 
 <b>Шаг 1 - Установка:</b>
-{app['installationStep']['description'][db_user.language]}
+{app.installation}
 
 <b>Шаг 2 - Добавление подписки:</b>
-{app['addSubscriptionStep']['description'][db_user.language]}
+{app.add_subscription}
 
 <b>Шаг 3 - Подключение:</b>
-{app['connectAndUseStep']['description'][db_user.language]}
+{app.connect_and_use}
 """
     
-    if 'additionalAfterAddSubscriptionStep' in app:
-        additional = app['additionalAfterAddSubscriptionStep']
+    if app.additional_title is not None:
         guide_text += f"""
 
-<b>{additional['title'][db_user.language]}:</b>
-{additional['description'][db_user.language]}
+<b>{app.additional_title}:</b>
+{app.additional_description}
 """
     
     await callback.message.edit_text(
         guide_text,
-        reply_markup=get_specific_app_keyboard(
+        reply_markup=app_config_service.get_specific_app_keyboard(
             subscription.subscription_url,
             app,
-            device_type,
-            db_user.language
+            device_type
         ),
         parse_mode="HTML"
     )
@@ -2922,33 +2952,6 @@ async def handle_open_subscription_link(
     await callback.answer()
 
 
-def load_app_config() -> Dict[str, Any]:
-    try:
-        from app.config import settings
-        config_path = settings.get_app_config_path()
-        
-        with open(config_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except Exception as e:
-        logger.error(f"Ошибка загрузки конфига приложений: {e}")
-        return {}
-
-
-def get_apps_for_device(device_type: str, language: str = "ru") -> List[Dict[str, Any]]:
-    config = load_app_config()
-    
-    device_mapping = {
-        'ios': 'ios',
-        'android': 'android', 
-        'windows': 'pc',
-        'mac': 'pc',
-        'tv': 'tv'
-    }
-    
-    config_key = device_mapping.get(device_type, device_type)
-    return config.get(config_key, [])
-
-
 def get_device_name(device_type: str, language: str = "ru") -> str:
     if language == "en":
         names = {
@@ -1,10 +1,11 @@
 from typing import List, Optional
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
-
+from app.keyboards.factory import cached_keyboard
 from app.localization.texts import get_texts
 
 
+@cached_keyboard()
 def get_admin_main_keyboard(language: str = "ru") -> InlineKeyboardMarkup:
     texts = get_texts(language)
     
@@ -46,6 +47,7 @@ def get_admin_task_creation_keyboard(texts) -> InlineKeyboardMarkup:
         ]
     ])
 
+@cached_keyboard()
 def get_admin_users_keyboard(language: str = "ru") -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=[
         [
@@ -62,6 +64,7 @@ def get_admin_users_keyboard(language: str = "ru") -> InlineKeyboardMarkup:
     ])
 
 
+@cached_keyboard()
 def get_admin_subscriptions_keyboard(language: str = "ru") -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=[
         [
@@ -81,6 +84,7 @@ def get_admin_subscriptions_keyboard(language: str = "ru") -> InlineKeyboardMark
     ])
 
 
+@cached_keyboard()
 def get_admin_promocodes_keyboard(language: str = "ru") -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=[
         [
@@ -112,6 +116,7 @@ def get_promocode_management_keyboard(promo_id: int, language: str = "ru") -> In
     ])
 
 
+@cached_keyboard()
 def get_admin_messages_keyboard(language: str = "ru") -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=[
         [
@@ -128,6 +133,7 @@ def get_admin_messages_keyboard(language: str = "ru") -> InlineKeyboardMarkup:
     ])
 
 
+@cached_keyboard()
 def get_admin_monitoring_keyboard(language: str = "ru") -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=[
         [
@@ -147,6 +153,7 @@ def get_admin_monitoring_keyboard(language: str = "ru") -> InlineKeyboardMarkup:
     ])
 
 
+@cached_keyboard()
 def get_admin_remnawave_keyboard(language: str = "ru") -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=[
         [
@@ -166,6 +173,7 @@ def get_admin_remnawave_keyboard(language: str = "ru") -> InlineKeyboardMarkup:
     ])
 
 
+@cached_keyboard()
 def get_admin_statistics_keyboard(language: str = "ru") -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=[
         [
@@ -237,6 +245,7 @@ def get_confirmation_keyboard(
     ])
 
 
+@cached_keyboard()
 def get_promocode_type_keyboard(language: str = "ru") -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=[
         [
@@ -293,6 +302,7 @@ def get_promocode_list_keyboard(promocodes: list, page: int, total_pages: int, l
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 
+@cached_keyboard()
 def get_broadcast_target_keyboard(language: str = "ru") -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=[
         [
@@ -312,6 +322,7 @@ def get_broadcast_target_keyboard(language: str = "ru") -> InlineKeyboardMarkup:
     ])
 
 
+@cached_keyboard()
 def get_custom_criteria_keyboard(language: str = "ru") -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=[
         [
@@ -368,6 +379,7 @@ def get_broadcast_history_keyboard(page: int, total_pages: int, language: str =
     
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
+@cached_keyboard()
 def get_sync_options_keyboard(language: str = "ru") -> InlineKeyboardMarkup:
     keyboard = [
         [InlineKeyboardButton(text="🔄 Полная синхронизация", callback_data="sync_all_users")],
@@ -417,6 +429,7 @@ def get_sync_result_keyboard(sync_type: str, has_errors: bool = False, language:
 
 
 
+@cached_keyboard()
 def get_period_selection_keyboard(language: str = "ru") -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=[
         [
@@ -481,6 +494,7 @@ def get_squad_edit_keyboard(squad_uuid: str, language: str = "ru") -> InlineKeyb
         ]
     ])
 
+@cached_keyboard()
 def get_monitoring_keyboard() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=[
         [
@@ -495,11 +509,16 @@ def get_monitoring_keyboard() -> InlineKeyboardMarkup:
             InlineKeyboardButton(text="🧪 Тест уведомлений", callback_data="admin_mon_test_notifications"),
             InlineKeyboardButton(text="📊 Статистика", callback_data="admin_mon_statistics")
         ],
+        [
+            InlineKeyboardButton(text="⚡ Производительность", callback_data="admin_perf"),
+            InlineKeyboardButton(text="📥 Платежные события", callback_data="admin_payment_inbox")
+        ],
         [
             InlineKeyboardButton(text="⬅️ Назад в админку", callback_data="admin_panel")
         ]
     ])
 
+@cached_keyboard()
 def get_monitoring_logs_keyboard() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=[
         [
@@ -511,6 +530,7 @@ def get_monitoring_logs_keyboard() -> InlineKeyboardMarkup:
         ]
     ])
 
+@cached_keyboard()
 def get_admin_servers_keyboard(language: str = "ru") -> InlineKeyboardMarkup:
     
     return InlineKeyboardMarkup(inline_keyboard=[
@@ -661,6 +681,7 @@ def get_maintenance_keyboard(
     
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
+@cached_keyboard()
 def get_sync_simplified_keyboard(language: str = "ru") -> InlineKeyboardMarkup:
     keyboard = [
         [InlineKeyboardButton(text="🔄 Полная синхронизация", callback_data="sync_all_users")],
@@ -0,0 +1,35 @@
+"""
+Кеш готовых инлайн-клавиатур.
+
+Разметка меню зависит только от языка, флагов варианта и настроек, которые
+читаются при старте, поэтому собирается один раз на набор аргументов.
+Динамические строки (баланс, отметки выбранных серверов, пагинация)
+строятся на каждый вызов и приклеиваются к готовым.
+
+Закешированная разметка общая для всех вызовов - изменять ее нельзя.
+При передаче в новый InlineKeyboardMarkup строки копируются, поэтому
+собирать из них свои клавиатуры можно.
+"""
+import functools
+from typing import Callable, Dict, List, TypeVar
+
+F = TypeVar("F", bound=Callable)
+
+_registry: List[Callable] = []
+
+
+def cached_keyboard(maxsize: int = 128) -> Callable[[F], F]:
+    def decorator(func: F) -> F:
+        memo = functools.lru_cache(maxsize=maxsize)(func)
+        _registry.append(memo)
+        return memo
+    return decorator
+
+
+def clear_keyboard_cache():
+    for memo in _registry:
+        memo.cache_clear()
+
+
+def keyboard_cache_info() -> Dict[str, tuple]:
+    return {f"{memo.__module__}.{memo.__qualname__}": memo.cache_info() for memo in _registry}
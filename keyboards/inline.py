@@ -6,8 +6,8 @@ from app.config import settings, PERIOD_PRICES, TRAFFIC_PRICES
 import logging
 from aiogram import Router, types
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-from app.handlers.keyboards import get_fortune_wheel_keyboard
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from app.keyboards.factory import cached_keyboard
 from app.localization.texts import get_texts
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
@@ -32,6 +32,7 @@ support_router = Router()
 
 
 
+@cached_keyboard()
 def get_rules_keyboard(language: str = "ru") -> InlineKeyboardMarkup:
     texts = get_texts(language)
     return InlineKeyboardMarkup(inline_keyboard=[
@@ -78,6 +79,7 @@ def get_tasks_keyboard(tasks: list, texts: object) -> InlineKeyboardMarkup:
 
     return builder.as_markup()
 
+@cached_keyboard()
 def get_profile_keyboard(texts) -> InlineKeyboardMarkup:
     """Возвращает клавиатуру для меню профиля."""
     return InlineKeyboardMarkup(inline_keyboard=[
@@ -97,6 +99,7 @@ def get_profile_keyboard(texts) -> InlineKeyboardMarkup:
     ])
 
 
+@cached_keyboard()
 def get_documents_keyboard(texts) -> InlineKeyboardMarkup:
     """Возвращает клавиатуру для раздела документов."""
     keyboard = InlineKeyboardBuilder()
@@ -146,40 +149,46 @@ def get_main_menu_keyboard(
     else:
         balance_button_text = f"💰 Баланс: {texts.format_price(balance_kopeks)}"
     
-    keyboard = [
-        ([
-            InlineKeyboardButton(text=balance_button_text, callback_data="menu_balance")
-        ])
-    ]
+    rows = _get_main_menu_rows(
+        language,
+        is_admin,
+        show_subscription=has_active_subscription and subscription_is_active,
+        show_trial=not has_had_paid_subscription and not has_active_subscription,
+        show_buy=not has_active_subscription or not subscription_is_active
+    )
+    
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text=balance_button_text, callback_data="menu_balance")],
+        *rows
+    ])
+
+
+@cached_keyboard()
+def _get_main_menu_rows(
+    language: str,
+    is_admin: bool,
+    show_subscription: bool,
+    show_trial: bool,
+    show_buy: bool
+) -> tuple:
+    texts = get_texts(language)
+    keyboard = []
     
-    if has_active_subscription and subscription_is_active:
+    if show_subscription:
         keyboard.append([
             InlineKeyboardButton(text=texts.MENU_SUBSCRIPTION, callback_data="menu_subscription")
         ])
     
-    show_trial = not has_had_paid_subscription and not has_active_subscription
-    
-    show_buy = not has_active_subscription or not subscription_is_active
-    
-    subscription_buttons = []
-
     if show_trial:
         keyboard.append([
             InlineKeyboardButton(text=texts.MENU_TRIAL, callback_data="menu_trial")
         ])
-
-
+    
     if show_buy:
         keyboard.append([
             InlineKeyboardButton(text=texts.MENU_BUY_SUBSCRIPTION, callback_data="menu_buy")
         ])
     
-    if subscription_buttons:
-        if len(subscription_buttons) == 2:
-            keyboard.append(subscription_buttons)
-        else:
-            keyboard.append([subscription_buttons[0]])
-    
     keyboard.extend([
         [
             InlineKeyboardButton(text=texts.MENU_TASKS, callback_data="tasks_menu"),
@@ -188,13 +197,9 @@ def get_main_menu_keyboard(
         [
             InlineKeyboardButton(text=texts.MENU_SUPPORT, callback_data="menu_support"),
             InlineKeyboardButton(text=texts.MENU_WHEEL, callback_data="fortune_wheel")
-        ]
-    ])
-    keyboard.extend([
+        ],
         [
-            InlineKeyboardButton(
-                text=texts.PROFILE_BUTTON,
-                callback_data="show_profile")
+            InlineKeyboardButton(text=texts.PROFILE_BUTTON, callback_data="show_profile")
         ]
     ])
     
@@ -202,18 +207,14 @@ def get_main_menu_keyboard(
         print(f"DEBUG KEYBOARD: is_admin={is_admin}, добавляем админ кнопку: {is_admin}")
     
     if is_admin:
-        if settings.DEBUG:
-            print("DEBUG KEYBOARD: Админ кнопка ДОБАВЛЕНА!")
         keyboard.append([
             InlineKeyboardButton(text=texts.MENU_ADMIN, callback_data="admin_panel")
         ])
-    else:
-        if settings.DEBUG:
-            print("DEBUG KEYBOARD: Админ кнопка НЕ добавлена")
     
-    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+    return tuple(keyboard)
 
 
+@cached_keyboard()
 def get_back_keyboard(language: str = "ru") -> InlineKeyboardMarkup:
     texts = get_texts(language)
     return InlineKeyboardMarkup(inline_keyboard=[
@@ -227,40 +228,43 @@ def get_subscription_keyboard(
     is_trial: bool = False,
     subscription=None
 ) -> InlineKeyboardMarkup:
-    from app.config import settings 
+    keyboard = []
     
+    if has_subscription and subscription and subscription.subscription_url:
+        if settings.CONNECT_BUTTON_MODE == "miniapp_subscription":
+            keyboard.append([
+                InlineKeyboardButton(
+                    text="🔗 Подключиться 🌐",
+                    web_app=types.WebAppInfo(url=subscription.subscription_url)
+                )
+            ])
+        else:
+            keyboard.append(_get_connect_row())
+    
+    keyboard.extend(_get_subscription_rows(language, has_subscription, is_trial))
+    
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+
+@cached_keyboard()
+def _get_connect_row() -> list:
+    if settings.CONNECT_BUTTON_MODE == "miniapp_custom" and settings.MINIAPP_CUSTOM_URL:
+        return [
+            InlineKeyboardButton(
+                text="🔗 Подключиться 🌐",
+                web_app=types.WebAppInfo(url=settings.MINIAPP_CUSTOM_URL)
+            )
+        ]
+    
+    return [InlineKeyboardButton(text="🔗 Подключиться 🌐", callback_data="subscription_connect")]
+
+
+@cached_keyboard()
+def _get_subscription_rows(language: str, has_subscription: bool, is_trial: bool) -> tuple:
     texts = get_texts(language)
     keyboard = []
     
     if has_subscription:
-        if subscription and subscription.subscription_url:
-            connect_mode = settings.CONNECT_BUTTON_MODE
-
-            if connect_mode == "miniapp_subscription":
-                keyboard.append([
-                    InlineKeyboardButton(
-                        text="🔗 Подключиться 🌐",
-                        web_app=types.WebAppInfo(url=subscription.subscription_url)
-                    )
-                ])
-            elif connect_mode == "miniapp_custom":
-                if settings.MINIAPP_CUSTOM_URL:
-                    keyboard.append([
-                        InlineKeyboardButton(
-                            text="🔗 Подключиться 🌐",
-                            web_app=types.WebAppInfo(url=settings.MINIAPP_CUSTOM_URL)
-                        )
-                    ])
-                else:
-                    keyboard.append([
-                        InlineKeyboardButton(text="🔗 Подключиться 🌐", callback_data="subscription_connect")
-                    ])
-            else:
-                keyboard.append([
-                    InlineKeyboardButton(text="🔗 Подключиться 🌐", callback_data="subscription_connect")
-                ])
-
-
         keyboard.append([
             InlineKeyboardButton(text="⏰ Продлить", callback_data="subscription_extend")
         ])
@@ -283,9 +287,10 @@ def get_subscription_keyboard(
         InlineKeyboardButton(text=texts.BACK, callback_data="back_to_menu")
     ])
 
-    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+    return tuple(keyboard)
 
 
+@cached_keyboard()
 def get_subscription_settings_keyboard(language: str = "ru", show_countries_management: bool = True) -> InlineKeyboardMarkup:
     from app.config import settings
     
@@ -321,6 +326,7 @@ def get_subscription_settings_keyboard(language: str = "ru", show_countries_mana
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 
+@cached_keyboard()
 def get_trial_keyboard(language: str = "ru") -> InlineKeyboardMarkup:
     texts = get_texts(language)
     return InlineKeyboardMarkup(inline_keyboard=[
@@ -331,6 +337,7 @@ def get_trial_keyboard(language: str = "ru") -> InlineKeyboardMarkup:
     ])
 
 
+@cached_keyboard()
 def get_subscription_period_keyboard(language: str = "ru") -> InlineKeyboardMarkup:
     texts = get_texts(language)
     keyboard = []
@@ -362,6 +369,7 @@ def get_subscription_period_keyboard(language: str = "ru") -> InlineKeyboardMark
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 
+@cached_keyboard()
 def get_traffic_packages_keyboard(language: str = "ru") -> InlineKeyboardMarkup:
     import logging
     logger = logging.getLogger(__name__)
@@ -422,26 +430,11 @@ def get_traffic_packages_keyboard(language: str = "ru") -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 def get_countries_keyboard(countries: List[dict], selected: List[str], language: str = "ru") -> InlineKeyboardMarkup:
-    texts = get_texts(language)
-    keyboard = []
-    
-    for country in countries:
-        if not country.get('is_available', True):
-            continue 
-            
-        emoji = "✅" if country['uuid'] in selected else "⚪"
-        
-        if country['price_kopeks'] > 0:
-            price_text = f" (+{texts.format_price(country['price_kopeks'])})"
-        else:
-            price_text = " (Бесплатно)"
-        
-        keyboard.append([
-            InlineKeyboardButton(
-                text=f"{emoji} {country['name']}{price_text}",
-                callback_data=f"country_{country['uuid']}"
-            )
-        ])
+    keyboard = [
+        [_get_country_button(country['uuid'], country['name'], country['price_kopeks'], country['uuid'] in selected, language)]
+        for country in countries
+        if country.get('is_available', True)
+    ]
     
     if not keyboard:
         keyboard.append([
@@ -451,16 +444,37 @@ def get_countries_keyboard(countries: List[dict], selected: List[str], language:
             )
         ])
     
-    keyboard.extend([
-        [InlineKeyboardButton(text="✅ Продолжить", callback_data="countries_continue")],
-        [InlineKeyboardButton(text=texts.BACK, callback_data="subscription_config_back")]
-    ])
+    keyboard.extend(_get_config_footer_rows("countries_continue", language))
     
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 
-def get_devices_keyboard(current: int, language: str = "ru") -> InlineKeyboardMarkup:
+@cached_keyboard(maxsize=1024)
+def _get_country_button(uuid: str, name: str, price_kopeks: int, is_selected: bool, language: str) -> InlineKeyboardButton:
+    texts = get_texts(language)
+    emoji = "✅" if is_selected else "⚪"
+    
+    if price_kopeks > 0:
+        price_text = f" (+{texts.format_price(price_kopeks)})"
+    else:
+        price_text = " (Бесплатно)"
+    
+    return InlineKeyboardButton(
+        text=f"{emoji} {name}{price_text}",
+        callback_data=f"country_{uuid}"
+    )
+
+
+@cached_keyboard()
+def _get_config_footer_rows(continue_callback: str, language: str) -> tuple:
     texts = get_texts(language)
+    return (
+        [InlineKeyboardButton(text="✅ Продолжить", callback_data=continue_callback)],
+        [InlineKeyboardButton(text=texts.BACK, callback_data="subscription_config_back")]
+    )
+
+
+def get_devices_keyboard(current: int, language: str = "ru") -> InlineKeyboardMarkup:
     keyboard = []
     
     start_devices = settings.DEFAULT_DEVICE_LIMIT
@@ -470,18 +484,7 @@ def get_devices_keyboard(current: int, language: str = "ru") -> InlineKeyboardMa
     buttons = []
     
     for devices in range(start_devices, end_devices): 
-        price = max(0, devices - settings.DEFAULT_DEVICE_LIMIT) * settings.PRICE_PER_DEVICE
-        price_text = f" (+{texts.format_price(price)})" if price > 0 else " (вкл.)"
-        emoji = "✅" if devices == current else "⚪"
-        
-        button_text = f"{emoji} {devices}{price_text}"
-        
-        buttons.append(
-            InlineKeyboardButton(
-                text=button_text,
-                callback_data=f"devices_{devices}"
-            )
-        )
+        buttons.append(_get_device_button(devices, devices == current, language))
     
     for i in range(0, len(buttons), 2):
         if i + 1 < len(buttons):
@@ -489,13 +492,23 @@ def get_devices_keyboard(current: int, language: str = "ru") -> InlineKeyboardMa
         else:
             keyboard.append([buttons[i]])
     
-    keyboard.extend([
-        [InlineKeyboardButton(text="✅ Продолжить", callback_data="devices_continue")],
-        [InlineKeyboardButton(text=texts.BACK, callback_data="subscription_config_back")]
-    ])
+    keyboard.extend(_get_config_footer_rows("devices_continue", language))
     
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
+
+@cached_keyboard(maxsize=256)
+def _get_device_button(devices: int, is_selected: bool, language: str) -> InlineKeyboardButton:
+    texts = get_texts(language)
+    price = max(0, devices - settings.DEFAULT_DEVICE_LIMIT) * settings.PRICE_PER_DEVICE
+    price_text = f" (+{texts.format_price(price)})" if price > 0 else " (вкл.)"
+    emoji = "✅" if is_selected else "⚪"
+    
+    return InlineKeyboardButton(
+        text=f"{emoji} {devices}{price_text}",
+        callback_data=f"devices_{devices}"
+    )
+
 def _get_device_declension(count: int) -> str:
     if count % 10 == 1 and count % 100 != 11:
         return "устройство"
@@ -504,6 +517,7 @@ def _get_device_declension(count: int) -> str:
     else:
         return "устройств"
 
+@cached_keyboard()
 def get_subscription_confirm_keyboard(language: str = "ru") -> InlineKeyboardMarkup:
     texts = get_texts(language)
     return InlineKeyboardMarkup(inline_keyboard=[
@@ -514,6 +528,7 @@ def get_subscription_confirm_keyboard(language: str = "ru") -> InlineKeyboardMar
     ])
 
 
+@cached_keyboard()
 def get_balance_keyboard(language: str = "ru") -> InlineKeyboardMarkup:
     texts = get_texts(language)
     
@@ -531,6 +546,11 @@ def get_balance_keyboard(language: str = "ru") -> InlineKeyboardMarkup:
 
 
 def get_payment_methods_keyboard(amount_kopeks: int, language: str = "ru") -> InlineKeyboardMarkup:
+    return _get_payment_methods_keyboard(language)
+
+
+@cached_keyboard()
+def _get_payment_methods_keyboard(language: str) -> InlineKeyboardMarkup:
     texts = get_texts(language)
     keyboard = []
 
@@ -655,6 +675,7 @@ def get_subscription_expiring_keyboard(subscription_id: int, language: str = "ru
         ]
     ])
 
+@cached_keyboard()
 def get_referral_keyboard(language: str = "ru") -> InlineKeyboardMarkup:
     texts = get_texts(language)
     
@@ -688,6 +709,7 @@ def get_referral_keyboard(language: str = "ru") -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 
+@cached_keyboard()
 def get_support_keyboard(language: str = "ru") -> InlineKeyboardMarkup:
     texts = get_texts(language)
     return InlineKeyboardMarkup(inline_keyboard=[
@@ -744,6 +766,7 @@ def get_confirmation_keyboard(
     ])
 
 
+@cached_keyboard()
 def get_autopay_keyboard(language: str = "ru") -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=[
         [
@@ -759,6 +782,7 @@ def get_autopay_keyboard(language: str = "ru") -> InlineKeyboardMarkup:
     ])
 
 
+@cached_keyboard()
 def get_autopay_days_keyboard(language: str = "ru") -> InlineKeyboardMarkup:
     keyboard = []
     
@@ -787,6 +811,7 @@ def _get_days_suffix(days: int) -> str:
 
 
 
+@cached_keyboard()
 def get_extend_subscription_keyboard(language: str = "ru") -> InlineKeyboardMarkup:
     texts = get_texts(language)
     keyboard = []
@@ -999,6 +1024,26 @@ def get_manage_countries_keyboard(
     
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
+@cached_keyboard()
+def get_download_app_keyboard() -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="📱 Iphone", callback_data="instructions_iphone")],
+        [InlineKeyboardButton(text="📱 Android", callback_data="instructions_android")],
+        [InlineKeyboardButton(text="📱 Huawei и HONOR", callback_data="instructions_huawei")],
+        [InlineKeyboardButton(text="💻 MacOS", callback_data="instructions_macos")],
+        [InlineKeyboardButton(text="🖥️ Windows", callback_data="instructions_windows")],
+        [InlineKeyboardButton(text="↩️ Назад", callback_data="back_to_profile")],
+    ])
+
+
+@cached_keyboard()
+def get_download_instructions_keyboard() -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="↩️ Назад", callback_data="download_app")]
+    ])
+
+
+@cached_keyboard()
 def get_device_selection_keyboard(language: str = "ru") -> InlineKeyboardMarkup:
     from app.config import settings
     
@@ -1028,125 +1073,6 @@ def get_device_selection_keyboard(language: str = "ru") -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 
-def get_connection_guide_keyboard(
-    subscription_url: str, 
-    app: dict, 
-    language: str = "ru"
-) -> InlineKeyboardMarkup:
-    from app.handlers.subscription import create_deep_link
-    
-    keyboard = []
-    
-    if 'installationStep' in app and 'buttons' in app['installationStep']:
-        app_buttons = []
-        for button in app['installationStep']['buttons']:
-            button_text = button['buttonText'].get(language, button['buttonText']['en'])
-            app_buttons.append(
-                InlineKeyboardButton(text=f"📥 {button_text}", url=button['buttonLink'])
-            )
-            if len(app_buttons) == 2:
-                keyboard.append(app_buttons)
-                app_buttons = []
-        
-        if app_buttons:
-            keyboard.append(app_buttons)
-    
-    keyboard.append([
-        InlineKeyboardButton(text="📋 Скопировать ссылку подписки", url=subscription_url)
-    ])
-    
-    keyboard.extend([
-        [
-            InlineKeyboardButton(text="📱 Выбрать другое устройство", callback_data="subscription_connect")
-        ],
-        [
-            InlineKeyboardButton(text="↩️ К подписке", callback_data="menu_subscription")
-        ]
-    ])
-    
-    return InlineKeyboardMarkup(inline_keyboard=keyboard)
-
-
-def get_app_selection_keyboard(
-    device_type: str, 
-    apps: list, 
-    language: str = "ru"
-) -> InlineKeyboardMarkup:
-    keyboard = []
-    
-    for app in apps:
-        app_name = app['name']
-        if app.get('isFeatured', False):
-            app_name = f"⭐ {app_name}"
-        
-        keyboard.append([
-            InlineKeyboardButton(
-                text=app_name, 
-                callback_data=f"app_{device_type}_{app['id']}"
-            )
-        ])
-    
-    keyboard.extend([
-        [
-            InlineKeyboardButton(text="📱 Выбрать другое устройство", callback_data="subscription_connect")
-        ],
-        [
-            InlineKeyboardButton(text="⬅️ К подписке", callback_data="menu_subscription")
-        ]
-    ])
-    
-    return InlineKeyboardMarkup(inline_keyboard=keyboard)
-
-
-def get_specific_app_keyboard(
-    subscription_url: str,
-    app: dict,
-    device_type: str,
-    language: str = "ru"
-) -> InlineKeyboardMarkup:
-    from app.handlers.subscription import create_deep_link
-    
-    keyboard = []
-    
-    if 'installationStep' in app and 'buttons' in app['installationStep']:
-        app_buttons = []
-        for button in app['installationStep']['buttons']:
-            button_text = button['buttonText'].get(language, button['buttonText']['en'])
-            app_buttons.append(
-                InlineKeyboardButton(text=f"📥 {button_text}", url=button['buttonLink'])
-            )
-            if len(app_buttons) == 2:
-                keyboard.append(app_buttons)
-                app_buttons = []
-        
-        if app_buttons:
-            keyboard.append(app_buttons)
-    
-    keyboard.append([
-        InlineKeyboardButton(text="📋 Скопировать ссылку подписки", url=subscription_url)
-    ])
-    
-    if 'additionalAfterAddSubscriptionStep' in app and 'buttons' in app['additionalAfterAddSubscriptionStep']:
-        for button in app['additionalAfterAddSubscriptionStep']['buttons']:
-            button_text = button['buttonText'].get(language, button['buttonText']['en'])
-            keyboard.append([
-                InlineKeyboardButton(text=button_text, url=button['buttonLink'])
-            ])
-    
-    keyboard.extend([
-        [
-            InlineKeyboardButton(text="📋 Другие приложения", callback_data=f"app_list_{device_type}")
-        ],
-        [
-            InlineKeyboardButton(text="📱 Выбрать другое устройство", callback_data="subscription_connect")
-        ],
-        [
-            InlineKeyboardButton(text="⬅️ К подписке", callback_data="menu_subscription")
-        ]
-    ])
-    
-    return InlineKeyboardMarkup(inline_keyboard=keyboard)
-
 def get_extend_subscription_keyboard_with_prices(language: str, prices: dict) -> InlineKeyboardMarkup:
     texts = get_texts(language)
     keyboard = []
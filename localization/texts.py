@@ -1,7 +1,10 @@
-import asyncio
-from typing import Dict, Any
+import logging
+from string import Formatter
+from typing import Dict, Any, Optional
 from app.config import settings
 
+logger = logging.getLogger(__name__)
+
 _cached_rules = {}
 
 def _get_default_rules(language: str = "ru") -> str:
@@ -293,6 +296,7 @@ class RussianTexts(Texts):
     PROMOCODE_INVALID = "❌ Неверный промокод"
     PROMOCODE_EXPIRED = "❌ Промокод истек"
     PROMOCODE_USED = "❌ Промокод уже использован"
+    PROMOCODE_TOO_MANY_ATTEMPTS = "⏳ Слишком много неверных промокодов. Попробуйте позже."
     
     REFERRAL_INFO = """
 🤝 <b>Реферальная программа</b>
@@ -532,8 +536,78 @@ LANGUAGES = {
 }
 
 
+class CompiledTemplate(str):
+    """Шаблон текста с заранее разобранным набором плейсхолдеров"""
+
+    def __new__(cls, value: str, fields: frozenset):
+        template = super().__new__(cls, value)
+        template.fields = fields
+        return template
+
+    def render(self, **kwargs) -> str:
+        missing = self.fields.difference(kwargs)
+        if missing:
+            raise KeyError(f"Не переданы плейсхолдеры шаблона: {', '.join(sorted(missing))}")
+        return self.format_map(kwargs)
+
+
+def _compile_template(key: str, value: str):
+    try:
+        fields = frozenset(
+            field_name.split('.')[0].split('[')[0]
+            for _, field_name, _, _ in _formatter.parse(value)
+            if field_name
+        )
+    except ValueError as e:
+        logger.warning(f"Некорректный шаблон {key}: {e}")
+        return value
+
+    return CompiledTemplate(value, fields) if fields else value
+
+
+def _build_texts(language: str, texts_class: type, fallback: Optional[Texts] = None) -> Texts:
+    texts = texts_class()
+    keys = {
+        key
+        for cls in texts_class.__mro__
+        for key, value in vars(cls).items()
+        if key.isupper() and isinstance(value, str)
+    }
+    if fallback is not None:
+        keys.update(fallback.__dict__.keys() - {"language"})
+
+    for key in keys:
+        if hasattr(texts_class, key):
+            value = getattr(texts_class, key)
+        else:
+            value = getattr(fallback, key)
+
+        compiled = _compile_template(key, value)
+        fallback_value = getattr(fallback, key, None) if fallback is not None else None
+        if (
+            fallback_value is not None and
+            getattr(compiled, "fields", frozenset()) != getattr(fallback_value, "fields", frozenset())
+        ):
+            logger.warning(f"Плейсхолдеры {key} для языка {language} отличаются от языка по умолчанию")
+
+        texts.__dict__[key] = compiled
+
+    return texts
+
+
+_formatter = Formatter()
+
+_default_texts = _build_texts("ru", RussianTexts)
+
+TEXTS_REGISTRY: Dict[str, Texts] = {
+    language: _default_texts if texts_class is RussianTexts else _build_texts(language, texts_class, _default_texts)
+    for language, texts_class in LANGUAGES.items()
+}
+
+
 def get_texts(language: str = "ru") -> Texts:
-    return LANGUAGES.get(language, RussianTexts)()
+    return TEXTS_REGISTRY.get(language, _default_texts)
+
 
 async def get_rules_from_db(language: str = "ru") -> str:
     try:
@@ -548,39 +622,34 @@ async def get_rules_from_db(language: str = "ru") -> str:
             break
             
     except Exception as e:
-        print(f"Ошибка получения правил из БД: {e}")
+        logger.error(f"Ошибка получения правил из БД: {e}")
     
     default_rules = _get_default_rules(language)
     _cached_rules[language] = default_rules
     return default_rules
 
+
+async def load_rules_cache():
+    for language in settings.get_available_languages():
+        await get_rules_from_db(language)
+    logger.info(f"✅ Правила загружены в кеш для языков: {', '.join(_cached_rules)}")
+
+
 def get_rules_sync(language: str = "ru") -> str:
-    try:
-        if language in _cached_rules:
-            return _cached_rules[language]
-        
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        rules = loop.run_until_complete(get_rules_from_db(language))
-        loop.close()
-        return rules
-        
-    except Exception as e:
-        print(f"Ошибка получения правил: {e}")
-        return _get_default_rules(language)
+    if language in _cached_rules:
+        return _cached_rules[language]
+    return _get_default_rules(language)
+
 
 async def refresh_rules_cache(language: str = "ru"):
     try:
-        if language in _cached_rules:
-            del _cached_rules[language]
-        
         await get_rules_from_db(language)
-        print(f"✅ Кеш правил для языка {language} обновлен")
+        logger.info(f"✅ Кеш правил для языка {language} обновлен")
         
     except Exception as e:
-        print(f"Ошибка обновления кеша правил: {e}")
+        logger.error(f"Ошибка обновления кеша правил: {e}")
+
 
 def clear_rules_cache():
-    global _cached_rules
     _cached_rules.clear()
-    print("✅ Кеш правил очищен")
+    logger.info("✅ Кеш правил очищен")
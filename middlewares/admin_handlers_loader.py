@@ -0,0 +1,36 @@
+import logging
+from typing import Callable, Dict, Any, Awaitable
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, User as TgUser
+
+from app.config import settings
+from app.utils.deferred_handlers import DeferredHandlers
+
+logger = logging.getLogger(__name__)
+
+
+class AdminHandlersLoaderMiddleware(BaseMiddleware):
+    """
+    Подгружает отложенные обработчики админки по первому апдейту от
+    администратора. Апдейты остальных пользователей не ждут загрузки.
+    """
+
+    def __init__(self, admin_handlers: DeferredHandlers):
+        self.admin_handlers = admin_handlers
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+
+        if not self.admin_handlers.is_loaded:
+            user: TgUser = data.get("event_from_user")
+            if user and settings.is_admin(user.id):
+                try:
+                    await self.admin_handlers.load()
+                except Exception as e:
+                    logger.error(f"Ошибка загрузки обработчиков админки: {e}")
+
+        return await handler(event, data)
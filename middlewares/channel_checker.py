@@ -1,13 +1,13 @@
 import logging
 from typing import Callable, Dict, Any, Awaitable
 from aiogram import BaseMiddleware, Bot
-from aiogram.exceptions import TelegramForbiddenError, TelegramBadRequest
 from aiogram.types import TelegramObject, Update, Message, CallbackQuery
 
 from aiogram.fsm.context import FSMContext
 
 from app.config import settings
 from app.keyboards.inline import get_channel_sub_keyboard
+from app.services.channel_membership_service import channel_membership_service
 
 from app.utils.check_reg_process import is_registration_process
 
@@ -15,9 +15,6 @@ logger = logging.getLogger(__name__)
 
 
 class ChannelCheckerMiddleware(BaseMiddleware):
-    def __init__(self):
-        self.BAD_MEMBER_STATUS = ("left", "kicked")
-
     async def __call__(
         self,
         handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
@@ -36,6 +33,13 @@ class ChannelCheckerMiddleware(BaseMiddleware):
         if telegram_id is None:
             return await handler(event, data)
 
+        channel_id = settings.CHANNEL_SUB_ID
+        if not channel_id:
+            return await handler(event, data)
+
+        if channel_membership_service.get_cached(channel_id, telegram_id):
+            return await handler(event, data)
+
         state: FSMContext = data.get('state')
         current_state = None
 
@@ -50,17 +54,8 @@ class ChannelCheckerMiddleware(BaseMiddleware):
 
         bot: Bot = data["bot"]
 
-        channel_id = settings.CHANNEL_SUB_ID
-        if not channel_id:
-            return await handler(event, data)
-
         channel_link = settings.CHANNEL_LINK
-        try:
-            member = await bot.get_chat_member(chat_id=channel_id, user_id=telegram_id)
-            if member.status in self.BAD_MEMBER_STATUS:
-                return await self._deny_message(event, bot, channel_link)
-        except (TelegramForbiddenError, TelegramBadRequest):
-            # бот не админ или нет доступа к каналу
+        if not await channel_membership_service.is_member(bot, channel_id, telegram_id):
             return await self._deny_message(event, bot, channel_link)
 
         # если все каналы пройдены
@@ -1,12 +1,28 @@
+import inspect
 import logging
 import time
 from typing import Callable, Dict, Any, Awaitable
 from aiogram import BaseMiddleware
 from aiogram.types import Message, CallbackQuery, TelegramObject
 
+from app.config import settings
+from app.services.metrics_service import metrics_service
+
 logger = logging.getLogger(__name__)
 
 
+def _handler_name(data: Dict[str, Any], event: TelegramObject) -> str:
+    handler = data.get("handler")
+    if handler is not None:
+        callback = inspect.unwrap(handler.callback)
+        module = getattr(callback, "__module__", "") or ""
+        return f"{module.rsplit('.', 1)[-1]}:{getattr(callback, '__qualname__', repr(callback))}"
+
+    if isinstance(event, CallbackQuery) and event.data:
+        return f"callback:{event.data.split('_', 1)[0]}"
+    return type(event).__name__.lower()
+
+
 class LoggingMiddleware(BaseMiddleware):
     
     async def __call__(
@@ -16,27 +32,39 @@ class LoggingMiddleware(BaseMiddleware):
         data: Dict[str, Any]
     ) -> Any:
         
-        start_time = time.time()
+        start_time = time.perf_counter()
+        stats = metrics_service.start_update()
+        handler_name = _handler_name(data, event)
+        profiler = metrics_service.start_profile() if metrics_service.should_profile() else None
+        failed = False
         
         try:
-            if isinstance(event, Message):
-                user_info = f"@{event.from_user.username}" if event.from_user.username else f"ID:{event.from_user.id}"
-                text = event.text or event.caption or "[медиа]"
-                logger.info(f"📩 Сообщение от {user_info}: {text}")
-                
-            elif isinstance(event, CallbackQuery):
-                user_info = f"@{event.from_user.username}" if event.from_user.username else f"ID:{event.from_user.id}"
-                logger.info(f"🔘 Callback от {user_info}: {event.data}")
+            if logger.isEnabledFor(logging.DEBUG):
+                if isinstance(event, Message):
+                    user_info = f"@{event.from_user.username}" if event.from_user.username else f"ID:{event.from_user.id}"
+                    text = event.text or event.caption or "[медиа]"
+                    logger.debug(f"📩 Сообщение от {user_info}: {text}")
+                    
+                elif isinstance(event, CallbackQuery):
+                    user_info = f"@{event.from_user.username}" if event.from_user.username else f"ID:{event.from_user.id}"
+                    logger.debug(f"🔘 Callback от {user_info}: {event.data}")
             
-            result = await handler(event, data)
-            
-            execution_time = time.time() - start_time
-            if execution_time > 1.0:  
-                logger.warning(f"⏱️ Медленная операция: {execution_time:.2f}s")
-            
-            return result
+            return await handler(event, data)
             
         except Exception as e:
-            execution_time = time.time() - start_time
-            logger.error(f"❌ Ошибка при обработке события за {execution_time:.2f}s: {e}")
-            raise
\ No newline at end of file
+            failed = True
+            execution_time = time.perf_counter() - start_time
+            logger.error(f"❌ Ошибка в {handler_name} за {execution_time:.2f}s: {e}")
+            raise
+        
+        finally:
+            execution_time = time.perf_counter() - start_time
+            if profiler is not None:
+                metrics_service.finish_profile(profiler, handler_name, execution_time)
+            metrics_service.observe_handler(handler_name, execution_time, stats, failed)
+            
+            if execution_time > settings.SLOW_UPDATE_THRESHOLD:
+                logger.warning(
+                    f"⏱️ Медленная операция {handler_name}: {execution_time:.2f}s, "
+                    f"запросов к БД: {stats.db_queries} ({stats.db_time:.2f}s)"
+                )
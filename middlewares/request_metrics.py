@@ -0,0 +1,33 @@
+import time
+from typing import Any
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import TelegramMethod, Response
+
+from app.services.metrics_service import metrics_service
+
+
+class RequestMetricsMiddleware(BaseRequestMiddleware):
+    
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType,
+        bot: Bot,
+        method: TelegramMethod,
+    ) -> Response[Any]:
+        
+        start_time = time.perf_counter()
+        failed = False
+        
+        try:
+            return await make_request(bot, method)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            metrics_service.observe_telegram(
+                type(method).__name__,
+                time.perf_counter() - start_time,
+                failed
+            )
@@ -1,18 +1,20 @@
-import asyncio
 import logging
-import time
 from typing import Callable, Dict, Any, Awaitable
 from aiogram import BaseMiddleware
 from aiogram.types import Message, CallbackQuery, TelegramObject
 
+from app.config import settings
+from app.utils.rate_limiter import rate_limiter, RateLimit
+
 logger = logging.getLogger(__name__)
 
 
 class ThrottlingMiddleware(BaseMiddleware):
     
-    def __init__(self, rate_limit: float = 0.5):
-        self.rate_limit = rate_limit
-        self.user_buckets: Dict[int, float] = {}
+    def __init__(self, rate_limit: float = None, burst: int = None):
+        rate_limit = rate_limit or settings.THROTTLING_RATE_LIMIT
+        burst = burst or settings.THROTTLING_BURST
+        self.limit = RateLimit(limit=burst, period=rate_limit * burst)
     
     async def __call__(
         self,
@@ -28,11 +30,10 @@ class ThrottlingMiddleware(BaseMiddleware):
         if not user_id:
             return await handler(event, data)
         
-        now = time.time()
-        last_call = self.user_buckets.get(user_id, 0)
+        allowed, _ = await rate_limiter.hit("update", user_id, self.limit)
         
-        if now - last_call < self.rate_limit:
-            logger.warning(f"🚫 Throttling для пользователя {user_id}")
+        if not allowed:
+            logger.debug(f"🚫 Throttling для пользователя {user_id}")
             
             if isinstance(event, Message):
                 await event.answer("⏳ Пожалуйста, не отправляйте сообщения так часто!")
@@ -41,13 +42,4 @@ class ThrottlingMiddleware(BaseMiddleware):
             
             return
         
-        self.user_buckets[user_id] = now
-        
-        cleanup_threshold = now - 60
-        self.user_buckets = {
-            uid: timestamp 
-            for uid, timestamp in self.user_buckets.items() 
-            if timestamp > cleanup_threshold
-        }
-        
-        return await handler(event, data)
\ No newline at end of file
+        return await handler(event, data)
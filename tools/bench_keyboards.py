@@ -0,0 +1,94 @@
+"""
+Бенчмарк сборки инлайн-клавиатур на самых частых колбэках.
+
+Каждый сценарий рендерится дважды: с очисткой кеша клавиатур перед каждым
+вызовом (сборка с нуля, как до кеша; время самой очистки вычитается) и с
+прогретым кешем. Выводится время на рендер и пик памяти, выделенной за
+один рендер (tracemalloc).
+
+Запуск: python -m app.tools.bench_keyboards [--number 20000]
+"""
+import argparse
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+from app.keyboards.admin import get_admin_main_keyboard
+from app.keyboards.factory import clear_keyboard_cache
+from app.keyboards.inline import (
+    get_balance_keyboard, get_countries_keyboard, get_download_app_keyboard,
+    get_main_menu_keyboard, get_profile_keyboard, get_subscription_keyboard,
+    get_support_keyboard
+)
+from app.localization.texts import get_texts
+
+ALLOC_SAMPLES = 500
+
+SUBSCRIPTION = SimpleNamespace(subscription_url="https://sub.example.com/abcdef")
+COUNTRIES = [
+    {"uuid": f"squad-{index}", "name": f"🌍 Server {index}", "price_kopeks": 1000 * (index % 3), "is_available": True}
+    for index in range(10)
+]
+SELECTED = ["squad-1", "squad-4", "squad-7"]
+
+SCENARIOS = {
+    "back_to_menu": lambda: get_main_menu_keyboard(
+        "ru", is_admin=False, has_had_paid_subscription=True, has_active_subscription=True,
+        subscription_is_active=True, balance_kopeks=12345
+    ),
+    "menu_balance": lambda: get_balance_keyboard("ru"),
+    "menu_subscription": lambda: get_subscription_keyboard("ru", True, False, SUBSCRIPTION),
+    "show_profile": lambda: get_profile_keyboard(get_texts("ru")),
+    "menu_support": lambda: get_support_keyboard("ru"),
+    "download_app": lambda: get_download_app_keyboard(),
+    "country_toggle": lambda: get_countries_keyboard(COUNTRIES, SELECTED, "ru"),
+    "admin_panel": lambda: get_admin_main_keyboard("ru"),
+}
+
+
+def measure(render, number: int, cold: bool) -> tuple:
+    render()
+
+    started = time.perf_counter()
+    for _ in range(number):
+        if cold:
+            clear_keyboard_cache()
+        render()
+    elapsed = time.perf_counter() - started
+
+    if cold:
+        # Сама очистка кеша в время рендера не входит
+        started = time.perf_counter()
+        for _ in range(number):
+            clear_keyboard_cache()
+        elapsed -= time.perf_counter() - started
+    per_render_us = elapsed / number * 1_000_000
+
+    tracemalloc.start()
+    peak_total = 0
+    for _ in range(ALLOC_SAMPLES):
+        if cold:
+            clear_keyboard_cache()
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        render()
+        peak_total += max(0, tracemalloc.get_traced_memory()[1] - current)
+    tracemalloc.stop()
+
+    return per_render_us, peak_total / ALLOC_SAMPLES
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number", type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f"{'колбэк':<18} {'с нуля, мкс':>12} {'кеш, мкс':>9} {'с нуля, байт':>13} {'кеш, байт':>10}")
+    for name, render in SCENARIOS.items():
+        cold_us, cold_bytes = measure(render, args.number, cold=True)
+        warm_us, warm_bytes = measure(render, args.number, cold=False)
+        print(f"{name:<18} {cold_us:>12.2f} {warm_us:>9.2f} {cold_bytes:>13.0f} {warm_bytes:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Бенчмарк получения текстов локализации.
+
+Сравнивает прежний способ (новый экземпляр RussianTexts на каждый вызов)
+с реестром синглтонов из get_texts.
+
+Запуск: python -m app.tools.bench_localization
+"""
+import timeit
+
+from app.localization.texts import get_texts, RussianTexts, TEXTS_REGISTRY
+
+KEYS = ("MAIN_MENU", "MENU_BALANCE", "MENU_SUBSCRIPTION", "BACK", "SUBSCRIPTION_INFO")
+NUMBER = 200_000
+
+
+def legacy_lookup():
+    for key in KEYS:
+        getattr(RussianTexts(), key)
+
+
+def registry_lookup():
+    for key in KEYS:
+        getattr(get_texts("ru"), key)
+
+
+def dict_lookup():
+    texts = TEXTS_REGISTRY["ru"].__dict__
+    for key in KEYS:
+        texts[key]
+
+
+def render_main_menu():
+    get_texts("ru").MAIN_MENU.render(user_name="user", subscription_status="active")
+
+
+def main():
+    results = {
+        "new instance per call": timeit.timeit(legacy_lookup, number=NUMBER),
+        "get_texts registry": timeit.timeit(registry_lookup, number=NUMBER),
+        "raw dict lookup": timeit.timeit(dict_lookup, number=NUMBER),
+    }
+
+    for name, seconds in results.items():
+        per_key_ns = seconds / (NUMBER * len(KEYS)) * 1e9
+        print(f"{name:<24} {per_key_ns:8.1f} ns/key")
+
+    seconds = timeit.timeit(render_main_menu, number=NUMBER)
+    print(f"{'MAIN_MENU.render':<24} {seconds / NUMBER * 1e9:8.1f} ns/call")
+
+
+if __name__ == "__main__":
+    main()
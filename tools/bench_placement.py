@@ -0,0 +1,172 @@
+"""
+Симуляция размещения подписок по сквадам.
+
+Синтетический мир: несколько стран, в каждой по несколько сквадов одной
+цены, у каждого сквада свои ноды с разной "тяжестью" пользователей по
+полосе. Пользователи приходят потоком и выбирают страну, а сквад внутри
+нее - по одному из распределений:
+
+  uniform  - равномерно;
+  skewed   - 80% берут первый сквад в списке (как кнопку сверху);
+  degraded - как skewed, но на середине потока обе ноды одного сквада
+             падают, а у одной ноды появляется фоновая нагрузка по полосе.
+
+Метрики (счетчики и состояние нод) обновляются раз в --refresh приходов,
+как кеш среза и сборщик метрик в боте. Сравниваются три стратегии: как
+выбрал пользователь, жадный выбор лучшего сквада по устаревшим метрикам и
+placement_service.choose_squad. Выводится отношение пика к среднему и
+коэффициент вариации числа пользователей на рабочих нодах, а также сколько
+пользователей попало на сквад без рабочих нод.
+
+Запуск: python -m app.tools.bench_placement [--users 20000] [--refresh 1000] [--seed 1]
+"""
+import argparse
+import random
+import statistics
+import time
+from collections import Counter
+from typing import Dict, List
+
+from app.services.placement_service import choose_squad, measure_peaks, squad_headroom
+
+COUNTRIES = 4
+SQUADS_PER_COUNTRY = 3
+NODES_PER_SQUAD = 2
+BPS_PER_USER = 50_000
+HOT_BACKGROUND_BPS = 400_000_000
+
+
+class World:
+
+    def __init__(self, rng: random.Random):
+        self.squads: Dict[str, List[str]] = {}
+        self.countries: Dict[str, List[str]] = {}
+        self.node_factor: Dict[str, float] = {}
+        self.node_background: Dict[str, int] = {}
+        self.offline: set = set()
+        self.users: Counter = Counter()
+
+        for country in range(COUNTRIES):
+            country_code = f"C{country}"
+            for index in range(SQUADS_PER_COUNTRY):
+                squad_uuid = f"{country_code}-s{index}"
+                self.countries.setdefault(country_code, []).append(squad_uuid)
+                self.squads[squad_uuid] = []
+                for node_index in range(NODES_PER_SQUAD):
+                    node_uuid = f"{squad_uuid}-n{node_index}"
+                    self.squads[squad_uuid].append(node_uuid)
+                    self.node_factor[node_uuid] = rng.uniform(0.7, 1.5)
+                    self.node_background[node_uuid] = 0
+
+    def healthy_nodes(self, squad_uuid: str) -> List[str]:
+        return [node for node in self.squads[squad_uuid] if node not in self.offline]
+
+    def node_users(self) -> Dict[str, float]:
+        users = {node: 0.0 for node in self.node_factor}
+        for squad_uuid, count in self.users.items():
+            healthy = self.healthy_nodes(squad_uuid)
+            for node in healthy:
+                users[node] += count / len(healthy)
+        return users
+
+    def snapshot(self):
+        node_users = self.node_users()
+        nodes = {
+            node: {
+                "uuid": node,
+                "status": "offline" if node in self.offline else "online",
+                "users_online": int(users),
+                "realtime": {
+                    "downloadSpeedBps": int(users * BPS_PER_USER * self.node_factor[node]) + self.node_background[node],
+                    "uploadSpeedBps": 0
+                }
+            }
+            for node, users in node_users.items()
+        }
+        servers = {
+            squad_uuid: {
+                "squad_uuid": squad_uuid,
+                "is_available": True,
+                "max_users": None,
+                "current_users": self.users[squad_uuid]
+            }
+            for squad_uuid in self.squads
+        }
+        return servers, nodes
+
+
+def pick_preferred(rng: random.Random, squads: List[str], distribution: str) -> str:
+    if distribution == "uniform" or rng.random() >= 0.8:
+        return rng.choice(squads)
+    return squads[0]
+
+
+def run(strategy: str, distribution: str, users: int, refresh: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    world = World(random.Random(seed))
+    servers, nodes = world.snapshot()
+    peaks = measure_peaks(servers.values(), nodes.values())
+    failed_squad = "C0-s0"
+    on_dead = 0
+    decision_time = 0.0
+
+    for arrival in range(users):
+        if distribution == "degraded" and arrival == users // 2:
+            world.offline.update(world.squads[failed_squad])
+            world.node_background["C1-s1-n0"] = HOT_BACKGROUND_BPS
+
+        if arrival % refresh == 0:
+            servers, nodes = world.snapshot()
+            peaks = measure_peaks(servers.values(), nodes.values())
+
+        country = rng.choice(sorted(world.countries))
+        squads = world.countries[country]
+        preferred = pick_preferred(rng, squads, distribution)
+        candidates = [(servers[uuid], [nodes[node] for node in world.squads[uuid]]) for uuid in squads]
+
+        started = time.perf_counter()
+        if strategy == "as_chosen":
+            placed = preferred
+        elif strategy == "greedy":
+            scored = [(squad_headroom(server, squad_nodes, peaks), server["squad_uuid"]) for server, squad_nodes in candidates]
+            scored = [item for item in scored if item[0] is not None]
+            placed = max(scored)[1] if scored else preferred
+        else:
+            placed = choose_squad(candidates, peaks, preferred, rng) or preferred
+        decision_time += time.perf_counter() - started
+
+        if not world.healthy_nodes(placed):
+            on_dead += 1
+        world.users[placed] += 1
+
+    node_users = world.node_users()
+    loads = [users_count for node, users_count in node_users.items() if node not in world.offline]
+    mean = statistics.mean(loads)
+    return {
+        "peak_to_mean": max(loads) / mean,
+        "cv": statistics.pstdev(loads) / mean,
+        "on_dead": on_dead,
+        "decision_us": decision_time / users * 1_000_000
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--refresh", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{args.users} подписок, метрики обновляются раз в {args.refresh} приходов\n")
+    print(f"{'распределение':<10} {'стратегия':<10} {'пик/среднее':>12} {'CV':>7} {'на мертвый':>11} {'мкс/выбор':>10}")
+    for distribution in ("uniform", "skewed", "degraded"):
+        for strategy in ("as_chosen", "greedy", "engine"):
+            result = run(strategy, distribution, args.users, args.refresh, args.seed)
+            print(
+                f"{distribution:<10} {strategy:<10} {result['peak_to_mean']:>12.2f} {result['cv']:>7.2f}"
+                f" {result['on_dead']:>11} {result['decision_us']:>10.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Отчет о времени импорта модулей при старте бота.
+
+Запускает python -X importtime в отдельном процессе несколько раз, берет
+минимум по каждому модулю (меньше шума от кеша ФС и соседей) и выводит:
+общее время, сумму собственного времени по пакетам (до --depth уровней
+имени) и самые медленные модули по собственному времени. Собственное время
+модуля - без вложенных импортов, поэтому суммы по пакетам не
+пересекаются.
+
+Запуск: python -m app.tools.importtime_report [--module app.bot ...] [--runs 5] [--top 25] [--depth 2]
+"""
+import argparse
+import os
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+
+def run_once(modules: List[str]) -> Dict[str, Tuple[int, int]]:
+    code = "; ".join(f"import {module}" for module in modules)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True, text=True, env=os.environ.copy()
+    )
+    if result.returncode != 0:
+        raise SystemExit(result.stderr[-2000:])
+
+    timings: Dict[str, Tuple[int, int]] = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, self_us, cumulative_us, name = (part.strip() for part in line.replace("import time:", "|").split("|"))
+        timings[name] = (int(self_us), int(cumulative_us))
+    return timings
+
+
+def package_of(name: str, depth: int) -> str:
+    return ".".join(name.split(".")[:depth])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--module", nargs="+", default=["app.bot"])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=25)
+    parser.add_argument("--depth", type=int, default=2)
+    args = parser.parse_args()
+
+    best: Dict[str, Tuple[int, int]] = {}
+    for _ in range(args.runs):
+        for name, (self_us, cumulative_us) in run_once(args.module).items():
+            if name not in best:
+                best[name] = (self_us, cumulative_us)
+            else:
+                best[name] = (min(best[name][0], self_us), min(best[name][1], cumulative_us))
+
+    total_us = sum(self_us for self_us, _ in best.values())
+    print(f"Импорт {', '.join(args.module)}: {total_us / 1000:.0f} мс, модулей: {len(best)} (минимум из {args.runs} запусков)\n")
+
+    packages: Dict[str, int] = defaultdict(int)
+    for name, (self_us, _) in best.items():
+        packages[package_of(name, args.depth)] += self_us
+
+    print(f"{'пакет':<44} {'мс':>8} {'доля':>6}")
+    for package, self_us in sorted(packages.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"{package:<44} {self_us / 1000:>8.1f} {self_us / total_us:>6.1%}")
+
+    print(f"\n{'модуль':<56} {'свое, мс':>9} {'всего, мс':>10}")
+    for name, (self_us, cumulative_us) in sorted(best.items(), key=lambda item: -item[1][0])[:args.top]:
+        print(f"{name:<56} {self_us / 1000:>9.1f} {cumulative_us / 1000:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
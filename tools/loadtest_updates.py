@@ -0,0 +1,345 @@
+"""
+Нагрузочная проверка приема апдейтов через вебхук.
+
+Fake Bot API - локальная заглушка Telegram: отвечает успехом на любой метод
+(sendMessage и edit* возвращают сообщение, остальные - true), может
+добавлять задержку и считает вызовы по методам. GET /stats - счетчики.
+
+Запуск заглушки: python -m app.tools.loadtest_updates fake-api [--port 8090] [--latency 0.03]
+Бот направляется на нее через TELEGRAM_API_URL=http://127.0.0.1:8090
+
+Прогон потока апдейтов на вебхук бота (TELEGRAM_WEBHOOK_ENABLED=true):
+python -m app.tools.loadtest_updates replay --url http://127.0.0.1:8081/telegram-webhook
+    [--file updates.jsonl] [--users 200] [--updates 20] [--concurrency 50] [--admin-id ID]
+    [--secret S] [--fake-api http://127.0.0.1:8090]
+Без --file поток синтетический: /start, переходы по меню, pre_checkout_query
+и, с --admin-id, синхронизации серверов от админа. Печатает время ответа
+вебхука, коды ответов и, с --fake-api, сколько вызовов Bot API сделал бот
+и за какое время закончил обработку.
+
+Проверка пула без БД: python -m app.tools.loadtest_updates pool [--users 500] [--updates 20] [--handler-latency 0.01]
+Пул и диспетчер aiogram в одном процессе, обработчик только отвечает через
+fake Bot API. Проверяет порядок апдейтов каждого пользователя и печатает
+пропускную способность и ожидание в очереди по полосам.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+
+import aiohttp
+from aiohttp import web
+
+BOT_TOKEN = "123456:loadtest"
+MESSAGE_METHODS = ("sendMessage", "sendPhoto", "sendDocument", "editMessageText", "editMessageCaption",
+                   "editMessageReplyMarkup", "copyMessage", "forwardMessage")
+MENU_CALLBACKS = ("menu_balance", "menu_subscription", "back_to_menu", "menu_support", "menu_referrals")
+
+
+class FakeBotAPI:
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = Counter()
+        self.first_call: Optional[float] = None
+        self.last_call: Optional[float] = None
+        self._message_id = 0
+
+    def build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_route("*", "/bot{token}/{method}", self.handle)
+        app.router.add_get("/stats", self.stats)
+        return app
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = dict(await request.post())
+        if not params and request.can_read_body:
+            params = await request.json()
+
+        now = time.monotonic()
+        self.calls[method] += 1
+        self.first_call = self.first_call or now
+        self.last_call = now
+
+        if self.latency:
+            await asyncio.sleep(self.latency * random.uniform(0.5, 1.5))
+
+        return web.json_response({"ok": True, "result": self.result(method, params)})
+
+    def result(self, method: str, params: Dict):
+        if method == "getMe":
+            return {"id": int(BOT_TOKEN.split(":")[0]), "is_bot": True, "first_name": "Load", "username": "loadtest_bot"}
+        if method == "getChatMember":
+            return {"status": "member", "user": {"id": int(params.get("user_id", 1)), "is_bot": False, "first_name": "U"}}
+        if method in MESSAGE_METHODS:
+            self._message_id += 1
+            return {
+                "message_id": self._message_id,
+                "date": int(time.time()),
+                "chat": {"id": int(params.get("chat_id", 0)), "type": "private"},
+                "text": params.get("text") or "",
+            }
+        return True
+
+    async def stats(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            "calls": sum(self.calls.values()),
+            "methods": dict(self.calls),
+            "active_seconds": (self.last_call - self.first_call) if self.first_call else 0.0,
+        })
+
+
+def user_payload(user_id: int) -> Dict:
+    return {"id": user_id, "is_bot": False, "first_name": f"User{user_id}", "username": f"user{user_id}", "language_code": "ru"}
+
+
+def make_message(update_id: int, user_id: int, text: str) -> Dict:
+    return {"update_id": update_id, "message": {
+        "message_id": update_id, "date": int(time.time()), "text": text,
+        "chat": {"id": user_id, "type": "private"}, "from": user_payload(user_id),
+    }}
+
+
+def make_callback(update_id: int, user_id: int, data: str) -> Dict:
+    return {"update_id": update_id, "callback_query": {
+        "id": str(update_id), "chat_instance": str(user_id), "data": data, "from": user_payload(user_id),
+        "message": {"message_id": 1, "date": int(time.time()), "text": "menu",
+                    "chat": {"id": user_id, "type": "private"}},
+    }}
+
+
+def make_pre_checkout(update_id: int, user_id: int) -> Dict:
+    return {"update_id": update_id, "pre_checkout_query": {
+        "id": str(update_id), "from": user_payload(user_id), "currency": "XTR",
+        "total_amount": 100, "invoice_payload": f"balance_{user_id}_100",
+    }}
+
+
+def synthetic_stream(users: int, updates: int, admin_id: Optional[int], seed: int = 1) -> List[Dict]:
+    """Апдейты пользователей перемешаны, но у каждого идут по возрастанию update_id"""
+    rnd = random.Random(seed)
+    per_user: Dict[int, List[str]] = {}
+    for index in range(users):
+        user_id = 10_000_000 + index
+        kinds = ["start"] + [rnd.choice(MENU_CALLBACKS) for _ in range(updates - 1)]
+        if updates > 2 and rnd.random() < 0.1:
+            kinds[rnd.randrange(1, updates)] = "pre_checkout"
+        per_user[user_id] = kinds
+    if admin_id:
+        per_user[admin_id] = ["admin_panel", "admin_servers_sync", "admin_panel", "admin_servers_sync_counts", "admin_panel"]
+
+    cursors = {user_id: 0 for user_id in per_user}
+    stream = []
+    update_id = 1
+    while cursors:
+        user_id = rnd.choice(list(cursors))
+        kind = per_user[user_id][cursors[user_id]]
+        if kind == "start":
+            stream.append(make_message(update_id, user_id, "/start"))
+        elif kind == "pre_checkout":
+            stream.append(make_pre_checkout(update_id, user_id))
+        else:
+            stream.append(make_callback(update_id, user_id, kind))
+        update_id += 1
+        cursors[user_id] += 1
+        if cursors[user_id] == len(per_user[user_id]):
+            del cursors[user_id]
+    return stream
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def fetch_stats(session: aiohttp.ClientSession, fake_api: str) -> Dict:
+    async with session.get(f"{fake_api.rstrip('/')}/stats") as response:
+        return await response.json()
+
+
+async def replay(args):
+    if args.file:
+        with open(args.file, encoding="utf-8") as f:
+            stream = [json.loads(line) for line in f if line.strip()]
+    else:
+        stream = synthetic_stream(args.users, args.updates, args.admin_id)
+
+    headers = {"X-Telegram-Bot-Api-Secret-Token": args.secret} if args.secret else {}
+    latencies: List[float] = []
+    statuses = Counter()
+    queue: asyncio.Queue = asyncio.Queue()
+    for update in stream:
+        queue.put_nowait(update)
+
+    async with aiohttp.ClientSession(headers=headers) as session:
+        before = await fetch_stats(session, args.fake_api) if args.fake_api else None
+
+        async def sender():
+            while not queue.empty():
+                update = queue.get_nowait()
+                started = time.perf_counter()
+                try:
+                    async with session.post(args.url, json=update) as response:
+                        await response.read()
+                        statuses[response.status] += 1
+                except aiohttp.ClientError as e:
+                    statuses[type(e).__name__] += 1
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(sender() for _ in range(args.concurrency)))
+        sent_in = time.perf_counter() - started
+
+        print(f"Отправлено апдейтов: {len(stream)} за {sent_in:.2f} с ({len(stream) / sent_in:.0f}/с)")
+        print(f"Ответ вебхука, мс: p50={percentile(latencies, 0.5) * 1000:.1f} "
+              f"p95={percentile(latencies, 0.95) * 1000:.1f} p99={percentile(latencies, 0.99) * 1000:.1f}")
+        print(f"Коды ответов: {dict(statuses)}")
+
+        if before is not None:
+            # Ждем, пока бот перестанет обращаться к Bot API
+            calls, idle_since = before["calls"], time.monotonic()
+            while time.monotonic() - idle_since < args.idle:
+                await asyncio.sleep(0.5)
+                current = await fetch_stats(session, args.fake_api)
+                if current["calls"] != calls:
+                    calls, idle_since = current["calls"], time.monotonic()
+            done_in = time.perf_counter() - started - args.idle
+            print(f"Вызовов Bot API: {calls - before['calls']}, обработка закончена через {done_in:.2f} с")
+
+
+async def pool(args):
+    from aiogram import Bot, Dispatcher, F
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+    from aiogram.types import CallbackQuery, Message, PreCheckoutQuery
+
+    from app.config import settings
+    from app.services.update_queue_service import LANES, classify_update, update_queue_service
+
+    fake = FakeBotAPI(latency=args.api_latency)
+    runner = web.AppRunner(fake.build_app())
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+
+    bot = Bot(BOT_TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(f"http://127.0.0.1:{port}")))
+    dp = Dispatcher()
+    stream = synthetic_stream(args.users, args.updates, args.admin_id)
+    if args.admin_id:
+        settings.ADMIN_IDS = str(args.admin_id)
+
+    # Порядок проверяется по ключу очереди: тяжелые операции админа идут
+    # отдельно от его обычных нажатий
+    keys = {update["update_id"]: classify_update(update)[1] for update in stream}
+    expected = defaultdict(list)
+    for update in stream:
+        expected[keys[update["update_id"]]].append(update["update_id"])
+    seen = defaultdict(list)
+    in_flight: Counter = Counter()
+    overlaps = 0
+
+    async def track(update_id: int):
+        nonlocal overlaps
+        key = keys[update_id]
+        in_flight[key] += 1
+        if in_flight[key] > 1:
+            overlaps += 1
+        seen[key].append(update_id)
+        await asyncio.sleep(args.handler_latency * random.uniform(0.5, 1.5))
+        in_flight[key] -= 1
+
+    @dp.message(F.text)
+    async def on_message(message: Message):
+        await track(message.message_id)
+        await message.answer("ok")
+
+    @dp.callback_query()
+    async def on_callback(callback: CallbackQuery):
+        await track(int(callback.id))
+        await callback.answer()
+
+    @dp.pre_checkout_query()
+    async def on_pre_checkout(query: PreCheckoutQuery):
+        await track(int(query.id))
+        await query.answer(ok=True)
+
+    update_queue_service.set_dispatcher(bot, dp)
+    await update_queue_service.start()
+    started = time.perf_counter()
+    rejected = sum(not update_queue_service.submit(update) for update in stream)
+    while update_queue_service.size:
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - started
+    await update_queue_service.stop()
+
+    out_of_order = sum(seen[key] != update_ids for key, update_ids in expected.items())
+
+    print(f"Апдейтов: {len(stream)}, отклонено: {rejected}, за {elapsed:.2f} с ({len(stream) / elapsed:.0f}/с)")
+    print(f"Воркеров: {settings.UPDATE_WORKERS} + {settings.UPDATE_BULK_WORKERS}, вызовов Bot API: {sum(fake.calls.values())}")
+    print(f"Очередей с нарушенным порядком: {out_of_order}, параллельных апдейтов в одной очереди: {overlaps}")
+    for lane in LANES:
+        histogram = update_queue_service.wait_time[lane]
+        if histogram.count:
+            print(f"  {lane:<12} апдейтов={histogram.count:<6} ожидание avg={histogram.avg * 1000:.1f} мс "
+                  f"p95<={histogram.quantile(0.95) * 1000:.0f} мс max={histogram.max * 1000:.1f} мс")
+
+    await bot.session.close()
+    await runner.cleanup()
+
+
+async def serve_fake_api(args):
+    fake = FakeBotAPI(latency=args.latency)
+    runner = web.AppRunner(fake.build_app())
+    await runner.setup()
+    await web.TCPSite(runner, args.host, args.port).start()
+    print(f"Fake Bot API: http://{args.host}:{args.port} (задержка {args.latency} с)")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    fake_parser = subparsers.add_parser("fake-api")
+    fake_parser.add_argument("--host", default="127.0.0.1")
+    fake_parser.add_argument("--port", type=int, default=8090)
+    fake_parser.add_argument("--latency", type=float, default=0.0)
+
+    replay_parser = subparsers.add_parser("replay")
+    replay_parser.add_argument("--url", required=True)
+    replay_parser.add_argument("--file")
+    replay_parser.add_argument("--users", type=int, default=200)
+    replay_parser.add_argument("--updates", type=int, default=20)
+    replay_parser.add_argument("--concurrency", type=int, default=50)
+    replay_parser.add_argument("--admin-id", type=int)
+    replay_parser.add_argument("--secret")
+    replay_parser.add_argument("--fake-api")
+    replay_parser.add_argument("--idle", type=float, default=3.0)
+
+    pool_parser = subparsers.add_parser("pool")
+    pool_parser.add_argument("--users", type=int, default=500)
+    pool_parser.add_argument("--updates", type=int, default=20)
+    pool_parser.add_argument("--handler-latency", type=float, default=0.01)
+    pool_parser.add_argument("--api-latency", type=float, default=0.0)
+    pool_parser.add_argument("--admin-id", type=int, default=1)
+
+    args = parser.parse_args()
+    commands = {"fake-api": serve_fake_api, "replay": replay, "pool": pool}
+    try:
+        asyncio.run(commands[args.command](args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
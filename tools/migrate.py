@@ -0,0 +1,45 @@
+"""
+Миграции базы данных отдельной командой перед запуском бота.
+
+Создает недостающие таблицы и выполняет универсальную миграцию. Команда
+запускается один раз перед стартом новой версии (шаг деплоя или init-
+контейнер), а не при каждом перезапуске каждой реплики. С --check только
+проверяет статус миграций и ничего не меняет. Код возврата 1 - миграция
+не прошла или требует внимания, запускать бота на этой базе нельзя.
+
+Запуск: python -m app.tools.migrate [--check]
+"""
+import argparse
+import asyncio
+import logging
+import sys
+import time
+
+from app.database.database import create_tables, engine
+from app.database.universal_migration import check_migration_status, run_universal_migration
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description="Миграции базы данных")
+    parser.add_argument("--check", action="store_true", help="только проверить статус миграций")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    started = time.perf_counter()
+
+    try:
+        if args.check:
+            status = await check_migration_status()
+            ok = bool(status) and all(status.values())
+        else:
+            await create_tables()
+            ok = await run_universal_migration()
+    finally:
+        await engine.dispose()
+
+    print(f"{'✅ Готово' if ok else '❌ Ошибка'} за {time.perf_counter() - started:.1f} с")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
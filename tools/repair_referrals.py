@@ -0,0 +1,53 @@
+"""
+Пакетная сверка реферальных начислений по всем пользователям.
+
+Без флагов выводит отчет и удаляет записи "ожидание пополнения" у рефералов,
+которые уже пополнили баланс. С --pay-missing дополнительно начисляет
+реферерам бонусы за первые пополнения, которые не были выданы (например,
+из-за ошибки между коммитами в прежней реализации), и отмечает
+has_made_first_topup. Все изменения выполняются набором запросов по всей
+таблице и фиксируются одним коммитом.
+
+Запуск: python -m app.tools.repair_referrals [--report-only] [--pay-missing]
+"""
+import argparse
+import asyncio
+
+from app.config import settings
+from app.database.database import AsyncSessionLocal
+from app.database.crud.referral import get_referral_repair_report
+from app.services.referral_service import repair_referral_rewards
+
+REPORT_TITLES = {
+    "missing_first_topup_flags": "Рефералы с пополнением без отметки первого пополнения",
+    "stale_pending_earnings": "Устаревшие записи ожидания пополнения",
+    "missing_first_topup_rewards": "Невыданные бонусы за первое пополнение",
+    "duplicate_earnings": "Повторные начисления по одной транзакции",
+}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Сверка реферальных начислений")
+    parser.add_argument("--report-only", action="store_true", help="только показать отчет")
+    parser.add_argument("--pay-missing", action="store_true", help="начислить невыданные бонусы")
+    args = parser.parse_args()
+
+    async with AsyncSessionLocal() as db:
+        report = await get_referral_repair_report(db, settings.REFERRAL_MINIMUM_TOPUP_KOPEKS)
+        for key, title in REPORT_TITLES.items():
+            print(f"{title}: {report[key]}")
+
+        if args.report_only:
+            return
+
+        result = await repair_referral_rewards(db, pay_missing=args.pay_missing)
+        print(f"Удалено записей ожидания: {result['stale_pending_earnings']}")
+        if args.pay_missing:
+            total = sum(result["payouts"].values())
+            print(f"Добавлено бонусов: {result['first_topup_rewards']} "
+                  f"на {settings.format_price(total)} ({len(result['payouts'])} рефереров)")
+            print(f"Отмечено первых пополнений: {result['first_topup_flags']}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,153 @@
+"""
+Нагрузочная проверка атомарных операций с балансом.
+
+Запускает много конкурентных пополнений/списаний по небольшому числу
+пользователей и сравнивает итоговые балансы с ожидаемыми: сначала прежним
+способом (чтение ORM-объекта, изменение, commit), затем через
+apply_balance_change / apply_balance_changes.
+
+Запуск: python -m app.tools.stress_balance_ledger [DATABASE_URL]
+По умолчанию используется временная SQLite-база. Для PostgreSQL
+передайте отдельную тестовую базу - таблицы будут созданы в ней.
+"""
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+from sqlalchemy import select, delete
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+
+from app.database.models import Base, User, Transaction, TransactionType
+from app.database.crud.user import apply_balance_change, apply_balance_changes, BalanceChange
+
+USERS = 5
+OPERATIONS = 400
+CONCURRENCY = 50
+START_BALANCE = 10_000
+
+
+async def legacy_change(session_factory, user_id: int, amount: int) -> bool:
+    async with session_factory() as db:
+        user = await db.get(User, user_id)
+        if user.balance_kopeks + amount < 0:
+            return False
+        await asyncio.sleep(0)
+        user.balance_kopeks += amount
+        await db.commit()
+        return True
+
+
+async def ledger_change(session_factory, user_id: int, amount: int) -> bool:
+    async with session_factory() as db:
+        entry = await apply_balance_change(db, BalanceChange(
+            user_id=user_id,
+            amount_kopeks=amount,
+            description="stress",
+            transaction_type=TransactionType.DEPOSIT if amount > 0 else TransactionType.WITHDRAWAL
+        ))
+        return entry is not None
+
+
+async def ledger_batch(session_factory, amounts) -> bool:
+    async with session_factory() as db:
+        changes = [
+            BalanceChange(user_id=user_id, amount_kopeks=amount, description="stress batch",
+                          transaction_type=TransactionType.REFERRAL_REWARD)
+            for user_id, amount in amounts
+        ]
+        applied = await apply_balance_changes(db, changes)
+        return len(applied) == len({user_id for user_id, _ in amounts})
+
+
+async def reset_users(session_factory) -> list:
+    async with session_factory() as db:
+        await db.execute(delete(Transaction).where(Transaction.description.like("stress%")))
+        await db.execute(delete(User).where(User.username.like("stress_%")))
+        users = [
+            User(telegram_id=900_000_000 + index, username=f"stress_{index}",
+                 first_name="stress", balance_kopeks=START_BALANCE)
+            for index in range(USERS)
+        ]
+        db.add_all(users)
+        await db.commit()
+        return [user.id for user in users]
+
+
+async def run(session_factory, name: str, operation) -> None:
+    user_ids = await reset_users(session_factory)
+    rng = random.Random(42)
+    plan = [(rng.choice(user_ids), rng.choice((300, 200, -150, -400))) for _ in range(OPERATIONS)]
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+    expected = {user_id: START_BALANCE for user_id in user_ids}
+    errors = 0
+
+    async def execute(user_id, amount):
+        nonlocal errors
+        async with semaphore:
+            try:
+                if await operation(session_factory, user_id, amount):
+                    expected[user_id] += amount
+            except Exception:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(execute(user_id, amount) for user_id, amount in plan))
+    elapsed = time.perf_counter() - started
+
+    async with session_factory() as db:
+        rows = (await db.execute(
+            select(User.id, User.balance_kopeks).where(User.id.in_(user_ids))
+        )).all()
+
+    lost = sum(abs(balance - expected[user_id]) for user_id, balance in rows)
+    negative = sum(1 for _, balance in rows if balance < 0)
+    print(
+        f"{name:<10} {elapsed:6.2f}s  ошибок: {errors:<4} "
+        f"расхождение: {lost:<8} отрицательных балансов: {negative}"
+    )
+
+
+async def run_batch(session_factory) -> None:
+    user_ids = await reset_users(session_factory)
+    payouts = [[(user_id, 100) for user_id in user_ids] for _ in range(OPERATIONS // USERS)]
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(ledger_batch(session_factory, amounts) for amounts in payouts))
+    elapsed = time.perf_counter() - started
+
+    async with session_factory() as db:
+        rows = (await db.execute(
+            select(User.balance_kopeks).where(User.id.in_(user_ids))
+        )).scalars().all()
+
+    expected = START_BALANCE + 100 * sum(results)
+    lost = sum(abs(balance - expected) for balance in rows)
+    print(f"{'batch':<10} {elapsed:6.2f}s  пакетов: {len(payouts):<4} расхождение: {lost}")
+
+
+async def main():
+    if len(sys.argv) > 1:
+        url = sys.argv[1]
+    else:
+        url = f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(), 'ledger.db')}"
+
+    connect_args = {"timeout": 60} if url.startswith("sqlite") else {}
+    engine = create_async_engine(url, connect_args=connect_args)
+    session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    print(f"{USERS} пользователей, {OPERATIONS} операций, параллельно {CONCURRENCY}")
+    await run(session_factory, "legacy", legacy_change)
+    await run(session_factory, "ledger", ledger_change)
+    await run_batch(session_factory)
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
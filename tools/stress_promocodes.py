@@ -0,0 +1,167 @@
+"""
+Нагрузочная проверка активации промокодов.
+
+Один промокод с ограниченным числом использований одновременно активируют
+тысячи попыток, часть из них - повторные от тех же пользователей. Сначала
+прежним способом (проверка is_valid и использования, затем += 1 и commit),
+затем через PromoCodeService.activate_promocode. Для каждого варианта
+выводится время, число успешных активаций, значение current_uses и число
+записей promocode_uses: корректно, когда все три равны лимиту и ни один
+пользователь не активировал код дважды.
+
+Последний этап перебирает несуществующие коды: при подключенном Redis
+повторы отсекаются отрицательным кешем, а после PROMOCODE_MAX_FAILED_ATTEMPTS
+ошибок пользователь получает too_many_attempts без обращения к базе.
+
+Запуск: python -m app.tools.stress_promocodes [DATABASE_URL] [--attempts 5000] [--max-uses 1000]
+По умолчанию используется временная SQLite-база. Для PostgreSQL
+передайте отдельную тестовую базу - таблицы будут созданы в ней.
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+from collections import Counter
+
+from sqlalchemy import select, delete, func
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+
+from app.database.models import Base, User, PromoCode, PromoCodeUse, PromoCodeType, Transaction
+from app.database.crud.promocode import get_promocode_by_code, check_user_promocode_usage
+from app.services.promocode_service import PromoCodeService
+from app.utils.cache import cache, PromoCodeCache
+
+CONCURRENCY = 100
+BONUS_KOPEKS = 100
+
+
+async def legacy_activate(session_factory, user_id: int, code: str) -> str:
+    async with session_factory() as db:
+        promocode = await get_promocode_by_code(db, code, load_uses=False)
+        if not promocode.is_valid:
+            return "used"
+        if await check_user_promocode_usage(db, user_id, promocode.id):
+            return "already_used_by_user"
+        await asyncio.sleep(0)
+        db.add(PromoCodeUse(promocode_id=promocode.id, user_id=user_id))
+        promocode.current_uses += 1
+        await db.commit()
+        return "success"
+
+
+async def service_activate(session_factory, user_id: int, code: str) -> str:
+    async with session_factory() as db:
+        result = await PromoCodeService().activate_promocode(db, user_id, code)
+        return "success" if result["success"] else result["error"]
+
+
+async def prepare(session_factory, users: int, max_uses: int, code: str) -> list:
+    async with session_factory() as db:
+        await db.execute(delete(PromoCodeUse).where(
+            PromoCodeUse.promocode_id.in_(select(PromoCode.id).where(PromoCode.code.like("STRESS%")))
+        ))
+        await db.execute(delete(PromoCode).where(PromoCode.code.like("STRESS%")))
+        await db.execute(delete(Transaction).where(Transaction.description.like("%STRESS%")))
+        await db.execute(delete(User).where(User.username.like("promo_stress_%")))
+        db.add(PromoCode(code=code, type=PromoCodeType.BALANCE.value, balance_bonus_kopeks=BONUS_KOPEKS,
+                         max_uses=max_uses, current_uses=0, is_active=True))
+        accounts = [
+            User(telegram_id=910_000_000 + index, username=f"promo_stress_{index}", first_name="stress")
+            for index in range(users)
+        ]
+        db.add_all(accounts)
+        await db.commit()
+        await PromoCodeCache.invalidate(code)
+        return [account.id for account in accounts]
+
+
+async def run(session_factory, name: str, operation, attempts: int, max_uses: int) -> None:
+    code = f"STRESS{random.randint(1000, 9999)}"
+    # Каждый пятый запрос - повтор от уже участвующего пользователя
+    user_ids = await prepare(session_factory, attempts - attempts // 5, max_uses, code)
+    plan = user_ids + random.choices(user_ids, k=attempts - len(user_ids))
+    random.shuffle(plan)
+
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+    outcomes = Counter()
+
+    async def execute(user_id):
+        async with semaphore:
+            try:
+                outcomes[await operation(session_factory, user_id, code)] += 1
+            except Exception as e:
+                outcomes[type(e).__name__] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(execute(user_id) for user_id in plan))
+    elapsed = time.perf_counter() - started
+
+    async with session_factory() as db:
+        promocode = await get_promocode_by_code(db, code, load_uses=False)
+        uses = await db.scalar(select(func.count(PromoCodeUse.id)).where(PromoCodeUse.promocode_id == promocode.id))
+        repeated = await db.scalar(
+            select(func.count()).select_from(
+                select(PromoCodeUse.user_id)
+                .where(PromoCodeUse.promocode_id == promocode.id)
+                .group_by(PromoCodeUse.user_id)
+                .having(func.count(PromoCodeUse.id) > 1)
+                .subquery()
+            )
+        )
+
+    correct = outcomes["success"] == promocode.current_uses == uses == max_uses and not repeated
+    print(
+        f"{name:<8} {elapsed:6.2f}s {attempts / elapsed:7.0f} акт/с  успешно: {outcomes['success']:<5} "
+        f"current_uses: {promocode.current_uses:<5} записей: {uses:<5} повторов: {repeated:<4} "
+        f"{'OK' if correct else 'РАСХОЖДЕНИЕ'}"
+    )
+    print(f"         исходы: {dict(outcomes)}")
+
+
+async def run_bruteforce(session_factory, guesses: int) -> None:
+    async with session_factory() as db:
+        user_ids = list((await db.execute(
+            select(User.id).where(User.username.like("promo_stress_%")).limit(20)
+        )).scalars())
+
+    outcomes = Counter()
+    started = time.perf_counter()
+    for index in range(guesses):
+        outcome = await service_activate(session_factory, user_ids[index % len(user_ids)], f"GUESS{index % 50}")
+        outcomes[outcome] += 1
+    elapsed = time.perf_counter() - started
+
+    backend = "Redis" if cache.is_connected else "без Redis, кеш отключен"
+    print(f"{'перебор':<8} {elapsed:6.2f}s {guesses / elapsed:7.0f} попыток/с ({backend}) исходы: {dict(outcomes)}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Нагрузочная проверка активации промокодов")
+    parser.add_argument("url", nargs="?", default=None)
+    parser.add_argument("--attempts", type=int, default=5000)
+    parser.add_argument("--max-uses", type=int, default=1000)
+    parser.add_argument("--guesses", type=int, default=1000)
+    args = parser.parse_args()
+
+    url = args.url or f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(), 'promocodes.db')}"
+    connect_args = {"timeout": 60} if url.startswith("sqlite") else {}
+    engine = create_async_engine(url, connect_args=connect_args)
+    session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    await cache.connect()
+
+    print(f"{args.attempts} активаций, лимит {args.max_uses}, параллельно {CONCURRENCY}")
+    await run(session_factory, "legacy", legacy_activate, args.attempts, args.max_uses)
+    await run(session_factory, "engine", service_activate, args.attempts, args.max_uses)
+    await run_bruteforce(session_factory, args.guesses)
+
+    await cache.disconnect()
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,257 @@
+"""
+Локальный mock YooKassa API v3 для проверки клиента без реального магазина.
+
+Поддерживает POST/GET /v3/payments, GET /v3/payments/{id},
+POST /v3/payments/{id}/capture, проверку Basic-авторизации и повтор ответа
+по Idempotence-Key. Задержку и долю ответов 500 можно задать, чтобы увидеть
+работу повторов. POST /mock/pay/{id} переводит платеж в succeeded и, если
+указан --webhook, отправляет уведомление payment.succeeded на вебхук бота.
+
+Запуск сервера:  python -m app.tools.yookassa_mock_server serve [--port 8099] [--latency 0.05] [--fail-rate 0.1] [--webhook URL]
+Бот направляется на mock через YOOKASSA_API_URL=http://127.0.0.1:8099/v3
+
+Замер клиента:   python -m app.tools.yookassa_mock_server bench [--requests 500] [--concurrency 50] [--latency 0.05] [--fail-rate 0.1]
+Поднимает mock в том же процессе и создает платежи параллельно через
+YooKassaService, затем проверяет, что повторы не породили дублей.
+"""
+import argparse
+import asyncio
+import base64
+import random
+import time
+import uuid
+from datetime import datetime
+
+import aiohttp
+from aiohttp import web
+
+SHOP_ID = "123456"
+SECRET_KEY = "test_secret"
+
+
+class MockYooKassa:
+
+    def __init__(self, latency: float = 0.0, fail_rate: float = 0.0, webhook_url: str = None):
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.webhook_url = webhook_url
+        self.payments = {}
+        self.idempotence = {}
+        self.requests = 0
+        self.failures = 0
+
+    def build_app(self) -> web.Application:
+        app = web.Application(middlewares=[self.auth_middleware])
+        app.router.add_post("/v3/payments", self.create_payment)
+        app.router.add_get("/v3/payments", self.list_payments)
+        app.router.add_get("/v3/payments/{payment_id}", self.get_payment)
+        app.router.add_post("/v3/payments/{payment_id}/capture", self.capture_payment)
+        app.router.add_post("/mock/pay/{payment_id}", self.mock_pay)
+        return app
+
+    @web.middleware
+    async def auth_middleware(self, request: web.Request, handler):
+        if request.path.startswith("/v3/"):
+            self.requests += 1
+            expected = "Basic " + base64.b64encode(f"{SHOP_ID}:{SECRET_KEY}".encode()).decode()
+            if request.headers.get("Authorization") != expected:
+                return self.error(401, "invalid_credentials", "Authentication by given credentials failed")
+
+            if self.latency:
+                await asyncio.sleep(self.latency * random.uniform(0.5, 1.5))
+            if random.random() < self.fail_rate:
+                self.failures += 1
+                return self.error(500, "internal_server_error", "Mock failure")
+
+        return await handler(request)
+
+    @staticmethod
+    def error(status: int, code: str, description: str) -> web.Response:
+        return web.json_response(
+            {"type": "error", "id": str(uuid.uuid4()), "code": code, "description": description},
+            status=status
+        )
+
+    @staticmethod
+    def now() -> str:
+        return datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+
+    async def idempotent(self, request: web.Request, build) -> web.Response:
+        key = request.headers.get("Idempotence-Key")
+        if not key:
+            return self.error(400, "invalid_request", "Idempotence-Key header is required")
+
+        if key not in self.idempotence:
+            self.idempotence[key] = await build()
+        status, body = self.idempotence[key]
+        return web.json_response(body, status=status)
+
+    async def create_payment(self, request: web.Request) -> web.Response:
+        data = await request.json()
+
+        async def build():
+            payment_id = str(uuid.uuid4())
+            payment = {
+                "id": payment_id,
+                "status": "pending",
+                "paid": False,
+                "amount": data["amount"],
+                "confirmation": {
+                    "type": "redirect",
+                    "confirmation_url": f"https://yoomoney.ru/checkout/payments/v2/contract?orderId={payment_id}"
+                },
+                "created_at": self.now(),
+                "description": data.get("description"),
+                "metadata": data.get("metadata", {}),
+                "recipient": {"account_id": SHOP_ID, "gateway_id": "1"},
+                "refundable": False,
+                "test": True,
+                "_capture": data.get("capture", False),
+            }
+            self.payments[payment_id] = payment
+            return 200, self.public(payment)
+
+        return await self.idempotent(request, build)
+
+    @staticmethod
+    def public(payment: dict) -> dict:
+        return {key: value for key, value in payment.items() if not key.startswith("_")}
+
+    async def get_payment(self, request: web.Request) -> web.Response:
+        payment = self.payments.get(request.match_info["payment_id"])
+        if not payment:
+            return self.error(404, "not_found", "Payment not found")
+        return web.json_response(self.public(payment))
+
+    async def list_payments(self, request: web.Request) -> web.Response:
+        limit = int(request.query.get("limit", 10))
+        status = request.query.get("status")
+        created_gte = request.query.get("created_at.gte")
+        offset = int(request.query.get("cursor", 0))
+
+        items = [
+            self.public(payment) for payment in sorted(
+                self.payments.values(), key=lambda item: item["created_at"], reverse=True
+            )
+            if (not status or payment["status"] == status)
+            and (not created_gte or payment["created_at"] >= created_gte)
+        ]
+        page = items[offset:offset + limit]
+        body = {"type": "list", "items": page}
+        if offset + limit < len(items):
+            body["next_cursor"] = str(offset + limit)
+        return web.json_response(body)
+
+    async def capture_payment(self, request: web.Request) -> web.Response:
+        payment = self.payments.get(request.match_info["payment_id"])
+        if not payment:
+            return self.error(404, "not_found", "Payment not found")
+        data = await request.json() if request.can_read_body else {}
+
+        async def build():
+            if payment["status"] != "waiting_for_capture":
+                return 400, {"type": "error", "code": "invalid_request",
+                             "description": f"Payment is in {payment['status']} status"}
+            if data.get("amount"):
+                payment["amount"] = data["amount"]
+            payment.update(status="succeeded", captured_at=self.now(), refundable=True)
+            return 200, self.public(payment)
+
+        return await self.idempotent(request, build)
+
+    async def mock_pay(self, request: web.Request) -> web.Response:
+        payment = self.payments.get(request.match_info["payment_id"])
+        if not payment:
+            return self.error(404, "not_found", "Payment not found")
+
+        if payment["_capture"]:
+            payment.update(status="succeeded", captured_at=self.now(), refundable=True)
+        else:
+            payment["status"] = "waiting_for_capture"
+        payment.update(paid=True, payment_method={"type": "bank_card", "id": str(uuid.uuid4()), "saved": False})
+
+        if self.webhook_url:
+            notification = {"type": "notification", "event": f"payment.{payment['status']}",
+                            "object": self.public(payment)}
+            async with aiohttp.ClientSession() as session:
+                async with session.post(self.webhook_url, json=notification) as response:
+                    print(f"Вебхук {notification['event']} {payment['id']}: HTTP {response.status}")
+
+        return web.json_response(self.public(payment))
+
+
+async def serve(args):
+    mock = MockYooKassa(args.latency, args.fail_rate, args.webhook)
+    runner = web.AppRunner(mock.build_app())
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", args.port).start()
+
+    print(f"Mock YooKassa: http://127.0.0.1:{args.port}/v3 (shop_id={SHOP_ID}, secret_key={SECRET_KEY})")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+async def bench(args):
+    mock = MockYooKassa(args.latency, args.fail_rate)
+    runner = web.AppRunner(mock.build_app())
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", args.port).start()
+
+    from app.config import settings
+    from app.external.yookassa_api import YooKassaAPI
+    from app.services.yookassa_service import YooKassaService
+
+    settings.YOOKASSA_DEFAULT_RECEIPT_EMAIL = settings.YOOKASSA_DEFAULT_RECEIPT_EMAIL or "mock@example.com"
+    service = YooKassaService(SHOP_ID, SECRET_KEY, "https://t.me/mock_bot")
+    service.api = YooKassaAPI(SHOP_ID, SECRET_KEY, f"http://127.0.0.1:{args.port}/v3")
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+
+    async def create(index: int):
+        async with semaphore:
+            started = time.perf_counter()
+            result = await service.create_payment(
+                amount=100 + index, currency="RUB", description=f"Mock #{index}",
+                metadata={"user_id": str(index)}
+            )
+            latencies.append(time.perf_counter() - started)
+            return result
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(create(index) for index in range(args.requests)))
+    elapsed = time.perf_counter() - started
+
+    created = [result for result in results if result]
+    info = await service.get_payment_info(created[0]["id"]) if created else None
+
+    await service.api.close()
+    await runner.cleanup()
+
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1] if latencies else 0
+    print(f"Запросов: {args.requests}, параллельно {args.concurrency}, задержка mock {args.latency}с, отказов {args.fail_rate:.0%}")
+    print(f"Создано платежей: {len(created)}/{args.requests}, в mock: {len(mock.payments)}, "
+          f"HTTP-запросов: {mock.requests}, ответов 500: {mock.failures}")
+    print(f"Время: {elapsed:.2f}с, {args.requests / elapsed:.0f} rps, p95 {p95 * 1000:.0f} мс")
+    print(f"Дублей из-за повторов: {len(mock.payments) - len(created)}, get_payment_info: {bool(info)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock YooKassa API")
+    parser.add_argument("mode", choices=("serve", "bench"), nargs="?", default="serve")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--webhook", default=None)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    asyncio.run(serve(args) if args.mode == "serve" else bench(args))
+
+
+if __name__ == "__main__":
+    main()